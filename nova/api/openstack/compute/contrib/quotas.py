@@ -13,25 +13,22 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-# import keystoneclient.middleware.auth_token as auth_token
-import keystonemiddleware.auth_token as auth_token
 import nova.context
 import webob
 
-from keystoneclient.v3 import client
 from nova.api.openstack import extensions
 from nova.api.openstack import wsgi
 from nova import db
 from nova import exception
 from nova.i18n import _
 from nova import objects
+from nova import project_hierarchy
 from nova import quota
 from nova import utils
 from oslo.utils import strutils
 import six.moves.urllib.parse as urlparse
 
-KEYSTONE_CONF = auth_token.CONF
-
+HIERARCHY = project_hierarchy.HIERARCHY
 QUOTAS = quota.QUOTAS
 NON_QUOTA_KEYS = ['tenant_id', 'id', 'force']
 
@@ -112,53 +109,31 @@ class QuotaSetsController(wsgi.Controller):
         else:
             return {k: v['limit'] for k, v in values.items()}
 
-    """ Function for finding the parent_id of a project.
-        For root project ,parent_id is NULL"""
-
-    def _get_parent_id(self, token, project_id):
-        auth_host = KEYSTONE_CONF.keystone_authtoken.auth_host
-        auth_port = int(KEYSTONE_CONF.keystone_authtoken.auth_port)
-        auth_prcl = 'http'
-        auth_url = '%s://%s:%s/%s' % (auth_prcl, auth_host, auth_port, "v3/")
-        keystone = client.Client(token=token, auth_url=auth_url,
-                                 project_id=project_id)
+    def _get_parent_id(self, context, project_id):
+        """Return the parent of a project, or None for a root project."""
         try:
-            data = keystone.projects.get(project_id).__dict__
-        except Exception:
+            return HIERARCHY.get_parent(context, project_id)
+        except (exception.Forbidden, exception.ProjectNotFound):
             raise webob.exc.HTTPForbidden()
-        parent_id = None
-        try:
-            parent_id = data["parent_id"]
-        except Exception:
-            pass
-        return parent_id
 
-    def _get_immediate_child_list(self, token, parent_id):
-        child_list = []
-        auth_host = KEYSTONE_CONF.keystone_authtoken.auth_host
-        auth_port = int(KEYSTONE_CONF.keystone_authtoken.auth_port)
-        auth_prcl = 'http'
-        auth_url = '%s://%s:%s/%s' % (auth_prcl, auth_host, auth_port, "v3/")
-        keystone = client.Client(token=token, auth_url=auth_url,
-                                 project_id=parent_id)
+    def _get_immediate_child_list(self, context, parent_id):
         try:
-            data = keystone.projects.get(parent_id,
-                                        subtree_as_list=True).__dict__
-        except Exception:
+            return HIERARCHY.get_children(context, parent_id)
+        except (exception.Forbidden, exception.ProjectNotFound):
             raise webob.exc.HTTPForbidden()
-        subtree = []
+
+    def _set_limit(self, context, parent_id, project_id, key, value,
+                   user_id):
+        if parent_id:
+            db.quota_child_update(context, parent_id, project_id, key, value,
+                                  user_id=user_id)
+            return
         try:
-            subtree = data["subtree"]
-        except Exception:
-            pass
-        for item in subtree:
-            project_info = item["project"]
-            try:
-                if project_info["parent_id"] == parent_id:
-                    child_list.append(project_info["id"])
-            except Exception:
-                pass
-        return child_list
+            objects.Quotas.create_limit(context, project_id, key, value,
+                                        user_id=user_id)
+        except exception.QuotaExists:
+            objects.Quotas.update_limit(context, project_id, key, value,
+                                        user_id=user_id)
 
     def _delete_project_quota(self, req, id, body):
         context = req.environ['nova.context']
@@ -168,8 +143,7 @@ class QuotaSetsController(wsgi.Controller):
         parent_id = None
         if hasattr(context, 'auth_token') and hasattr(context, 'project_id'):
             if(context.auth_token and context.project_id):
-                token = context.auth_token
-                parent_id = self._get_parent_id(token, project_id)
+                parent_id = self._get_parent_id(context, project_id)
                 target = {"project_id": parent_id}
                 try:
                     if parent_id:
@@ -187,10 +161,10 @@ class QuotaSetsController(wsgi.Controller):
 
                 if parent_id:
                     child_list =\
-                        self._get_immediate_child_list(token, parent_id)
+                        self._get_immediate_child_list(context, parent_id)
                 else:
                     child_list =\
-                        self._get_immediate_child_list(token, project_id)
+                        self._get_immediate_child_list(context, project_id)
 
         if parent_id is not None:
             if id not in child_list:
@@ -222,17 +196,11 @@ class QuotaSetsController(wsgi.Controller):
                 maximum = settable_quotas[key]['maximum']
                 self._validate_quota_limit(key, value, minimum, maximum)
             try:
-                objects.Quotas.create_limit(context, project_id,
-                                            key, value, user_id=user_id)
-            except exception.QuotaExists:
-                objects.Quotas.update_limit(context, project_id,
-                                            key, value, user_id=user_id)
+                self._set_limit(context, parent_id, project_id, key, value,
+                                user_id)
             except exception.AdminRequired:
                 raise webob.exc.HTTPForbidden()
 
-            if parent_id:
-                db.quota_allocated_update(context, parent_id, child_list)
-
     def show(self, req, id):
         context = req.environ['nova.context']
         """ id is made equivalent to project_id for better readability"""
@@ -242,8 +210,7 @@ class QuotaSetsController(wsgi.Controller):
         parent_id = None
         if hasattr(context, 'auth_token') and hasattr(context, 'project_id'):
             if(context.auth_token and context.project_id):
-                token = context.auth_token
-                parent_id = self._get_parent_id(token, project_id)
+                parent_id = self._get_parent_id(context, project_id)
         try:
             if user_id:
                 authorize_show(context)
@@ -278,8 +245,7 @@ class QuotaSetsController(wsgi.Controller):
         user_id = params.get('user_id', [None])[0]
         if hasattr(context, 'auth_token') and hasattr(context, 'project_id'):
             if(context.auth_token and context.project_id):
-                token = context.auth_token
-                parent_id = self._get_parent_id(token, project_id)
+                parent_id = self._get_parent_id(context, project_id)
                 target = {"project_id": parent_id}
                 try:
                     if user_id:
@@ -302,10 +268,10 @@ class QuotaSetsController(wsgi.Controller):
 
                 if parent_id:
                     child_list =\
-                        self._get_immediate_child_list(token, parent_id)
+                        self._get_immediate_child_list(context, parent_id)
                 else:
                     child_list =\
-                        self._get_immediate_child_list(token, project_id)
+                        self._get_immediate_child_list(context, project_id)
 
         if parent_id is not None:
             if id not in child_list:
@@ -336,14 +302,8 @@ class QuotaSetsController(wsgi.Controller):
                 minimum = settable_quotas[key]['minimum']
                 maximum = settable_quotas[key]['maximum']
                 self._validate_quota_limit(key, value, minimum, maximum)
-            try:
-                objects.Quotas.create_limit(context, project_id,
-                                      key, value, user_id=user_id)
-            except exception.QuotaExists:
-                objects.Quotas.update_limit(context, project_id,
-                                      key, value, user_id=user_id)
-            if parent_id:
-                db.quota_allocated_update(context, parent_id, child_list)
+            self._set_limit(context, parent_id, project_id, key, value,
+                            user_id)
 
         return self._format_quota_set(id, self._get_quotas(context, id,
                                                            user_id=user_id))
@@ -15,6 +15,7 @@
 
 """The Server Group API Extension."""
 
+from oslo_utils import excutils
 import webob
 from webob import exc
 
@@ -192,12 +193,12 @@ class ServerGroupController(wsgi.Controller):
         except nova.exception.InvalidInput as e:
             raise exc.HTTPBadRequest(explanation=e.format_message())
 
-        quotas = None
-        if self.ext_mgr.is_loaded('os-server-group-quotas'):
-            quotas = objects.Quotas()
+        server_group_quotas = self.ext_mgr.is_loaded('os-server-group-quotas')
+        if server_group_quotas:
             try:
-                quotas.reserve(context, project_id=context.project_id,
-                               user_id=context.user_id, server_groups=1)
+                objects.Quotas.consume(context, project_id=context.project_id,
+                                       user_id=context.user_id,
+                                       server_groups=1)
             except nova.exception.OverQuota:
                 msg = _("Quota exceeded, too many server groups.")
                 raise exc.HTTPForbidden(explanation=msg)
@@ -207,16 +208,20 @@ class ServerGroupController(wsgi.Controller):
         sg.project_id = context.project_id
         sg.user_id = context.user_id
         try:
-            sg.name = vals.get('name')
-            sg.policies = vals.get('policies')
-            sg.create()
-        except ValueError as e:
-            if quotas:
-                quotas.rollback()
-            raise exc.HTTPBadRequest(explanation=e)
-
-        if quotas:
-            quotas.commit()
+            try:
+                sg.name = vals.get('name')
+                sg.policies = vals.get('policies')
+                sg.create()
+            except ValueError as e:
+                raise exc.HTTPBadRequest(explanation=e)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                if server_group_quotas:
+                    # Give the quota back
+                    objects.Quotas.consume(context,
+                                           project_id=context.project_id,
+                                           user_id=context.user_id,
+                                           server_groups=-1)
 
         return {'server_group': self._format_server_group(context, sg)}
 
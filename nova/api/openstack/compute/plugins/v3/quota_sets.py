@@ -14,9 +14,6 @@
 #    under the License.
 
 import httplib
-#import keystoneclient.middleware.auth_token as auth_token
-import keystonemiddleware.auth_token as auth_token
-from keystoneclient.v3 import client
 import nova.context
 import six.moves.urllib.parse as urlparse
 import webob
@@ -29,12 +26,13 @@ from nova import db
 from nova import exception
 from nova.i18n import _
 from nova import objects
+from nova import project_hierarchy
 from nova import quota
 from novaclient.openstack.common import jsonutils
 from oslo.utils import strutils
 
-KEYSTONE_CONF = auth_token.CONF
 ALIAS = "os-quota-sets"
+HIERARCHY = project_hierarchy.HIERARCHY
 QUOTAS = quota.QUOTAS
 
 """Checks whether the user is allowed to update the quota of root project"""
@@ -57,6 +55,8 @@ authorize_delete = extensions.extension_authorizer('compute',
                                                    'v3:%s:delete' % ALIAS)
 authorize_detail = extensions.extension_authorizer('compute',
                                                    'v3:%s:detail' % ALIAS)
+authorize_subtree = extensions.extension_authorizer('compute',
+                                                    'v3:%s:subtree' % ALIAS)
 
 
 class QuotaSetsController(wsgi.Controller):
@@ -101,47 +101,31 @@ class QuotaSetsController(wsgi.Controller):
         else:
             return {k: v['limit'] for k, v in values.items()}
 
-    def _get_parent_id(self, token , project_id):
-        auth_host = KEYSTONE_CONF.keystone_authtoken.auth_host
-        auth_port = int(KEYSTONE_CONF.keystone_authtoken.auth_port)
-        auth_prcl = 'http'
-        auth_url = '%s://%s:%s/%s' % (auth_prcl, auth_host,auth_port, "v3/")
-        keystone = client.Client(token=token,auth_url=auth_url,project_id=project_id)
-        try: 
-            data = keystone.projects.get(project_id).__dict__
-        except Exception:
-            raise webob.exc.HTTPForbidden()
-        parent_id = None
+    def _get_parent_id(self, context, project_id):
+        """Return the parent of a project, or None for a root project."""
         try:
-            parent_id = data["parent_id"]
-        except Exception:
-            pass
-        return parent_id
+            return HIERARCHY.get_parent(context, project_id)
+        except (exception.Forbidden, exception.ProjectNotFound):
+            raise webob.exc.HTTPForbidden()
 
-    def _get_immediate_child_list(self, token , parent_id):
-        child_list = []
-        auth_host = KEYSTONE_CONF.keystone_authtoken.auth_host
-        auth_port = int(KEYSTONE_CONF.keystone_authtoken.auth_port)
-        auth_prcl = 'http'
-        auth_url = '%s://%s:%s/%s' % (auth_prcl, auth_host,auth_port, "v3/")
-        keystone = client.Client(token=token,auth_url=auth_url,project_id=parent_id)
+    def _get_immediate_child_list(self, context, parent_id):
         try:
-            data = keystone.projects.get(parent_id,subtree_as_list=True).__dict__
-        except Exception:
+            return HIERARCHY.get_children(context, parent_id)
+        except (exception.Forbidden, exception.ProjectNotFound):
             raise webob.exc.HTTPForbidden()
-        subtree = []
+
+    def _set_limit(self, context, parent_id, project_id, key, value,
+                   user_id):
+        if parent_id:
+            db.quota_child_update(context, parent_id, project_id, key, value,
+                                  user_id=user_id)
+            return
         try:
-            subtree = data["subtree"]
-        except Exception:
-            pass
-        for item in subtree:
-            project_info = item["project"]
-            try:
-                if project_info["parent_id"] == parent_id:
-                    child_list.append(project_info["id"])
-            except Exception:
-                pass
-        return child_list
+            objects.Quotas.create_limit(context, project_id, key, value,
+                                        user_id=user_id)
+        except exception.QuotaExists:
+            objects.Quotas.update_limit(context, project_id, key, value,
+                                        user_id=user_id)
 
     def _delete_project_quota(self, req, id, body):
         context = req.environ['nova.context']
@@ -151,8 +135,7 @@ class QuotaSetsController(wsgi.Controller):
         parent_id = None
         if hasattr(context, 'auth_token') and hasattr(context, 'project_id'):
             if(context.auth_token and context.project_id):
-                token = context.auth_token
-                parent_id = self._get_parent_id(token, project_id)
+                parent_id = self._get_parent_id(context, project_id)
                 target = {"project_id": parent_id}
                 try:
                     if parent_id:
@@ -169,10 +152,10 @@ class QuotaSetsController(wsgi.Controller):
                     raise webob.exc.HTTPForbidden()
 
                 if parent_id:
-                    child_list = self._get_immediate_child_list(token,
+                    child_list = self._get_immediate_child_list(context,
                                                               parent_id)
                 else:
-                    child_list = self._get_immediate_child_list(token,
+                    child_list = self._get_immediate_child_list(context,
                                                              project_id)
 
         if parent_id is not None:
@@ -205,29 +188,27 @@ class QuotaSetsController(wsgi.Controller):
                 maximum = settable_quotas[key]['maximum']
                 self._validate_quota_limit(key, value, minimum, maximum)
             try:
-                objects.Quotas.create_limit(context, project_id,
-                                            key, value, user_id=user_id)
-            except exception.QuotaExists:
-                objects.Quotas.update_limit(context, project_id,
-                                            key, value, user_id=user_id)
+                self._set_limit(context, parent_id, project_id, key, value,
+                                user_id)
             except exception.AdminRequired:
                 raise webob.exc.HTTPForbidden()
 
-            if parent_id:
-                db.quota_allocated_update(context, parent_id, child_list)
-
-    @extensions.expected_errors(403)
+    @extensions.expected_errors((400, 403, 404))
     def show(self, req, id):
         context = req.environ['nova.context']
         """ id is made equivalent to project_id for better readability"""
         project_id = id
         params = urlparse.parse_qs(req.environ.get('QUERY_STRING', ''))
         user_id = params.get('user_id', [None])[0]
+        usages = params.get('usages', [None])[0]
+        if usages not in (None, 'subtree') or (usages and user_id):
+            msg = _("The only supported value of usages is 'subtree', "
+                    "which cannot be combined with user_id.")
+            raise webob.exc.HTTPBadRequest(explanation=msg)
         parent_id = None
         if hasattr(context, 'auth_token') and hasattr(context, 'project_id'):
             if(context.auth_token and context.project_id):
-                token = context.auth_token
-                parent_id = self._get_parent_id(token, project_id)
+                parent_id = self._get_parent_id(context, project_id)
         try:
             if user_id:
                 authorize_show(context)
@@ -246,10 +227,17 @@ class QuotaSetsController(wsgi.Controller):
                                                               project_id)
                 else:
                     nova.context.authorize_project_context(context, project_id)
+            if usages == 'subtree':
+                # One read of the subtree usages maintained by the
+                # reservations, rather than one per descendant.
+                return self._format_quota_set(id,
+                        QUOTAS.get_subtree_quotas(context, id))
             return self._format_quota_set(id,
                     self._get_quotas(context, id, user_id=user_id))
         except exception.Forbidden:
             raise webob.exc.HTTPForbidden()
+        except exception.ProjectNotFound as e:
+            raise webob.exc.HTTPNotFound(explanation=e.format_message())
 
     @extensions.expected_errors(403)
     def detail(self, req, id):
@@ -264,6 +252,22 @@ class QuotaSetsController(wsgi.Controller):
         except exception.Forbidden:
             raise webob.exc.HTTPForbidden()
 
+    @extensions.expected_errors(403)
+    def subtree(self, req, id):
+        """List the quota sets, with usages, of a project and of every
+        project below it in the hierarchy.
+        """
+        context = req.environ['nova.context']
+        authorize_subtree(context)
+        try:
+            project_ids = [id] + HIERARCHY.get_subtree(context, id)
+        except (exception.Forbidden, exception.ProjectNotFound):
+            raise webob.exc.HTTPForbidden()
+        projects_quotas = QUOTAS.get_projects_quotas(context, project_ids)
+        return {'quota_sets': [dict(projects_quotas[project_id],
+                                    id=str(project_id))
+                               for project_id in project_ids]}
+
     @extensions.expected_errors((400, 403))
     @validation.schema(quota_sets.update)
     def update(self, req, id, body):
@@ -276,8 +280,7 @@ class QuotaSetsController(wsgi.Controller):
         user_id = params.get('user_id', [None])[0]
         if hasattr(context, 'auth_token') and hasattr(context, 'project_id'):
             if(context.auth_token and context.project_id):
-                token = context.auth_token
-                parent_id = self._get_parent_id(token, project_id)
+                parent_id = self._get_parent_id(context, project_id)
                 target = {"project_id": parent_id}
                 try:
                     if user_id:
@@ -298,10 +301,10 @@ class QuotaSetsController(wsgi.Controller):
                     raise webob.exc.HTTPForbidden()
 
                 if parent_id:
-                    child_list = self._get_immediate_child_list(token,
+                    child_list = self._get_immediate_child_list(context,
                                                               parent_id)
                 else:
-                    child_list = self._get_immediate_child_list(token,
+                    child_list = self._get_immediate_child_list(context,
                                                               project_id)
 
         if parent_id is not None:
@@ -331,14 +334,9 @@ class QuotaSetsController(wsgi.Controller):
                 minimum = settable_quotas[key]['minimum']
                 maximum = settable_quotas[key]['maximum']
                 self._validate_quota_limit(key, value, minimum, maximum)
-            try:
-                objects.Quotas.create_limit(context, project_id,
-                                      key, value, user_id=user_id)
-            except exception.QuotaExists:
-                objects.Quotas.update_limit(context, project_id,
-                                      key, value, user_id=user_id)
-            if parent_id:
-                db.quota_allocated_update(context, parent_id, child_list)
+            self._set_limit(context, parent_id, project_id, key, value,
+                            user_id)
+
         return self._format_quota_set(id, self._get_quotas(context, id,
                                                            user_id=user_id))
 
@@ -398,7 +396,8 @@ class QuotaSets(extensions.V3APIExtensionBase):
         res = extensions.ResourceExtension(ALIAS,
                                             QuotaSetsController(),
                                             member_actions={'defaults': 'GET',
-                                                            'detail': 'GET'})
+                                                            'detail': 'GET',
+                                                            'subtree': 'GET'})
         resources.append(res)
 
         return resources
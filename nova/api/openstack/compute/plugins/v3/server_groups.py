@@ -15,6 +15,7 @@
 
 """The Server Group API Extension."""
 
+from oslo_utils import excutils
 import webob
 from webob import exc
 
@@ -131,10 +132,9 @@ class ServerGroupController(wsgi.Controller):
         """Creates a new server group."""
         context = _authorize_context(req)
 
-        quotas = objects.Quotas()
         try:
-            quotas.reserve(context, project_id=context.project_id,
-                           user_id=context.user_id, server_groups=1)
+            objects.Quotas.consume(context, project_id=context.project_id,
+                                   user_id=context.user_id, server_groups=1)
         except nova.exception.OverQuota:
             msg = _("Quota exceeded, too many server groups.")
             raise exc.HTTPForbidden(explanation=msg)
@@ -144,14 +144,19 @@ class ServerGroupController(wsgi.Controller):
         sg.project_id = context.project_id
         sg.user_id = context.user_id
         try:
-            sg.name = vals.get('name')
-            sg.policies = vals.get('policies')
-            sg.create()
-        except ValueError as e:
-            quotas.rollback()
-            raise exc.HTTPBadRequest(explanation=e)
-
-        quotas.commit()
+            try:
+                sg.name = vals.get('name')
+                sg.policies = vals.get('policies')
+                sg.create()
+            except ValueError as e:
+                raise exc.HTTPBadRequest(explanation=e)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                # Give the quota back
+                objects.Quotas.consume(context,
+                                       project_id=context.project_id,
+                                       user_id=context.user_id,
+                                       server_groups=-1)
 
         return {'server_group': self._format_server_group(context, sg)}
 
@@ -62,6 +62,7 @@ import decorator
 import netaddr
 from oslo_config import cfg
 import oslo_messaging as messaging
+from oslo_serialization import jsonutils
 from oslo_utils import importutils
 import six
 
@@ -78,6 +79,8 @@ from nova.openstack.common import cliutils
 from nova.openstack.common import log as logging
 from nova import quota
 from nova import rpc
+from nova.scheduler import rpcapi as scheduler_rpcapi
+from nova.scheduler import trace as scheduler_trace
 from nova import servicegroup
 from nova import utils
 from nova import version
@@ -310,6 +313,130 @@ class ProjectCommands(object):
 AccountCommands = ProjectCommands
 
 
+class QuotaCommands(object):
+    """Class for managing quota usages and reservations."""
+
+    @args('--batch-size', metavar='<number>', dest='batch_size',
+          help='Number of reservations rolled back per transaction')
+    def expire_reservations(self, batch_size=None):
+        """Roll back the expired reservations, in batches of batch_size."""
+        if batch_size is None:
+            batch_size = 1000
+        batch_size = int(batch_size)
+        if batch_size <= 0:
+            print(_('Must supply a positive value for batch_size'))
+            return(1)
+        admin_context = context.get_admin_context()
+        expired = db.reservation_expire(admin_context, batch_size=batch_size)
+        print(_('%d expired reservations rolled back') % expired)
+
+
+class SchedulerCommands(object):
+    """Class for inspecting the decisions of the schedulers."""
+
+    def _print_steps(self, steps):
+        fmt = '%-8s %-36s %5s %9s %9s %10s %5s'
+        print(fmt % (_('Kind'), _('Name'), _('Index'), _('Hosts in'),
+                     _('Hosts out'), _('Time (ms)'), _('SQL')))
+        for step in steps:
+            print(fmt % (step['kind'], step['name'],
+                         '-' if step['index'] is None else step['index'],
+                         step['hosts_in'], step['hosts_out'],
+                         '%.2f' % (step['duration'] * 1000.0),
+                         step['db_queries']))
+
+    def _print_trace(self, trace):
+        print(_('Request %(request_id)s at %(started_at)s: %(num)d '
+                'instance(s) in %(duration).2f ms, %(db_queries)d SQL '
+                'queries') %
+              {'request_id': trace['request_id'],
+               'started_at': trace['started_at'],
+               'num': trace['num_instances'],
+               'duration': trace['duration'] * 1000.0,
+               'db_queries': trace['db_queries']})
+        if trace['error']:
+            print(_('Failed: %s') % trace['error'])
+        for dest in trace['selected']:
+            print(_('Selected %(host)s (%(node)s)') % dest)
+        self._print_steps(trace['steps'])
+        for rejection in trace['rejections']:
+            print(_('%(host)s (%(node)s) rejected by %(filter)s for '
+                    'instance %(index)s') % rejection)
+
+    def _print_summary(self, summary):
+        print(_('%(requests)d requests, %(errors)d failed') % summary)
+        if summary['requests']:
+            print(_('Time (ms): mean %(mean).2f, p50 %(p50).2f, '
+                    'p99 %(p99).2f; SQL queries: mean %(sql).1f') %
+                  {'mean': summary['duration_mean'] * 1000.0,
+                   'p50': summary['duration_p50'] * 1000.0,
+                   'p99': summary['duration_p99'] * 1000.0,
+                   'sql': summary['db_queries_mean']})
+        fmt = '%-8s %-36s %7s %10s %10s %7s %9s'
+        print(fmt % (_('Kind'), _('Name'), _('Calls'), _('Mean (ms)'),
+                     _('Max (ms)'), _('SQL'), _('Rejected')))
+        for stats in summary['steps']:
+            print(fmt % (stats['kind'], stats['name'], stats['calls'],
+                         '%.2f' % (stats['duration_mean'] * 1000.0),
+                         '%.2f' % (stats['duration_max'] * 1000.0),
+                         stats['db_queries'], stats['hosts_rejected']))
+
+    @args('--host', metavar='<host>',
+          help='Scheduler host to ask, any of them by default')
+    @args('--limit', metavar='<number>',
+          help='Number of the latest traces to show')
+    @args('--request-id', metavar='<request id>', dest='request_id',
+          help='Only show the trace of this request, in detail')
+    @args('--summary', action='store_true', dest='summary',
+          help='Show statistics over the traces instead of the traces')
+    @args('--json', action='store_true', dest='as_json',
+          help='Print the traces or statistics as JSON')
+    def trace(self, host=None, limit=None, request_id=None, summary=False,
+              as_json=False):
+        """Show the traces of the latest scheduling requests sampled by
+        a scheduler, see scheduler_trace_sample_rate.
+        """
+        if limit is not None:
+            limit = int(limit)
+            if limit <= 0:
+                print(_('Must supply a positive value for limit'))
+                return(1)
+        admin_context = context.get_admin_context()
+        traces = scheduler_rpcapi.SchedulerAPI().get_traces(
+            admin_context, host=host, limit=limit)
+        if request_id is not None:
+            traces = [trace for trace in traces
+                      if trace['request_id'] == request_id]
+            if not traces:
+                print(_('No trace of request %s') % request_id)
+                return(1)
+
+        if summary:
+            result = scheduler_trace.summarize(traces)
+        else:
+            result = traces
+        if as_json:
+            print(jsonutils.dumps(result, indent=4))
+        elif summary:
+            self._print_summary(result)
+        elif request_id is not None:
+            self._print_trace(traces[0])
+        else:
+            fmt = '%-40s %-20s %9s %10s %5s  %s'
+            print(fmt % (_('Request'), _('Started at'), _('Instances'),
+                         _('Time (ms)'), _('SQL'), _('Result')))
+            for trace in traces:
+                if trace['error']:
+                    outcome = trace['error']
+                else:
+                    outcome = ', '.join(dest['host']
+                                        for dest in trace['selected'])
+                print(fmt % (trace['request_id'], trace['started_at'],
+                             trace['num_instances'],
+                             '%.2f' % (trace['duration'] * 1000.0),
+                             trace['db_queries'], outcome))
+
+
 class FixedIpCommands(object):
     """Class for managing fixed ip."""
 
@@ -1235,6 +1362,8 @@ CATEGORIES = {
     'logs': GetLogCommands,
     'network': NetworkCommands,
     'project': ProjectCommands,
+    'quota': QuotaCommands,
+    'scheduler': SchedulerCommands,
     'service': ServiceCommands,
     'shell': ShellCommands,
     'vm': VmCommands,
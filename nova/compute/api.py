@@ -3838,9 +3838,8 @@ class SecurityGroupAPI(base.Base, security_group_base.SecurityGroupBase):
         self.db.security_group_ensure_default(context)
 
     def create_security_group(self, context, name, description):
-        quotas = objects.Quotas(context)
         try:
-            quotas.reserve(security_groups=1)
+            objects.Quotas.consume(context, security_groups=1)
         except exception.OverQuota:
             msg = _("Quota exceeded, too many security groups.")
             self.raise_over_quota(msg)
@@ -3859,11 +3858,10 @@ class SecurityGroupAPI(base.Base, security_group_base.SecurityGroupBase):
             except exception.SecurityGroupExists:
                 msg = _('Security group %s already exists') % name
                 self.raise_group_already_exists(msg)
-            # Commit the reservation
-            quotas.commit()
         except Exception:
             with excutils.save_and_reraise_exception():
-                quotas.rollback()
+                # Give the quota back
+                objects.Quotas.consume(context, security_groups=-1)
 
         return group_ref
 
@@ -239,6 +239,7 @@ CONF.import_opt('enabled', 'nova.rdp', group='rdp')
 CONF.import_opt('html5_proxy_base_url', 'nova.rdp', group='rdp')
 CONF.import_opt('enabled', 'nova.console.serial', group='serial_console')
 CONF.import_opt('base_url', 'nova.console.serial', group='serial_console')
+CONF.import_opt('scheduler_track_server_groups', 'nova.scheduler.group_index')
 
 LOG = logging.getLogger(__name__)
 
@@ -831,6 +832,9 @@ class ComputeManager(manager.Manager):
         self._notify_about_instance_usage(context, instance, "delete.end",
                 system_metadata=system_meta)
 
+        if CONF.scheduler_track_server_groups:
+            self.scheduler_rpcapi.delete_instance_info(context, instance.uuid)
+
         if CONF.vnc_enabled or CONF.spice.enabled:
             if CONF.cells.enable:
                 self.cells_rpcapi.consoleauth_delete_tokens(context,
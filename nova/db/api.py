@@ -212,6 +212,19 @@ def compute_node_get_all(context, no_date_fields=False):
     return IMPL.compute_node_get_all(context, no_date_fields)
 
 
+def compute_node_get_all_changed_since(context, changed_since):
+    """Get the computeNodes created, updated or deleted since a time.
+
+    :param context: The security context
+    :param changed_since: Datetime; rows whose created_at, updated_at or
+                          deleted_at is not older than it are returned
+
+    :returns: List of dictionaries each containing compute node properties,
+              deleted compute nodes included, without their service
+    """
+    return IMPL.compute_node_get_all_changed_since(context, changed_since)
+
+
 def compute_node_get_all_by_host(context, host, use_slave=False):
     """Get compute nodes by host name
 
@@ -1077,11 +1090,28 @@ def quota_allocated_get_all_by_project(context, project_id):
     return IMPL.quota_allocated_get_all_by_project(context, project_id)
 
 
+def quota_get_all_by_projects(context, project_ids):
+    """Retrieve the quotas of several projects, keyed by project."""
+    return IMPL.quota_get_all_by_projects(context, project_ids)
+
+
+def quota_and_allocated_get_all_by_projects(context, project_ids):
+    """Retrieve the quotas and the allocated quotas of several projects,
+    as a pair of dicts keyed by project.
+    """
+    return IMPL.quota_and_allocated_get_all_by_projects(context, project_ids)
+
+
 def quota_get_all(context, project_id):
     """Retrieve all user quotas associated with a given project."""
     return IMPL.quota_get_all(context, project_id)
 
 
+def quota_generation_get(context):
+    """Return a counter bumped by every change of a quota limit."""
+    return IMPL.quota_generation_get(context)
+
+
 def quota_update(context, project_id, resource, limit, user_id=None):
     """Update a quota or raise if it does not exist."""
     return IMPL.quota_update(context, project_id, resource, limit,
@@ -1089,9 +1119,25 @@ def quota_update(context, project_id, resource, limit, user_id=None):
 
 
 def quota_allocated_update(context, project_id, child_list):
-    """Update a quota or raise if it does not exist."""
+    """Recompute the quotas a project allocated to its children.
+
+    The allocated value of every quota of the project is set to the sum
+    of the hard limits of that resource over child_list.
+    """
     return IMPL.quota_allocated_update(context, project_id, child_list)
 
+
+def quota_child_update(context, parent_id, project_id, resource, limit,
+                       user_id=None):
+    """Create or update the quota of a child project.
+
+    The quota its parent allocated is moved by the change of the limit
+    in the same transaction.  The limits of users do not change it.
+    """
+    return IMPL.quota_child_update(context, parent_id, project_id, resource,
+                                   limit, user_id=user_id)
+
+
 ###################
 
 
@@ -1139,21 +1185,86 @@ def quota_usage_get_all_by_project(context, project_id):
     return IMPL.quota_usage_get_all_by_project(context, project_id)
 
 
+def quota_usage_get_all_by_projects(context, project_ids):
+    """Retrieve the usages of several projects, keyed by project."""
+    return IMPL.quota_usage_get_all_by_projects(context, project_ids)
+
+
+def quota_subtree_lineage_get(context, project_id):
+    """Retrieve the lineage of a project recorded in its subtree usages.
+
+    The result is a list of (project_id, parent_id) pairs from the project
+    up to the last ancestor which has subtree usages, or an empty list.
+    """
+    return IMPL.quota_subtree_lineage_get(context, project_id)
+
+
+def quota_subtree_usage_get_all_by_project(context, project_id):
+    """Retrieve the usages of a project and of all its descendants."""
+    return IMPL.quota_subtree_usage_get_all_by_project(context, project_id)
+
+
+def quota_subtree_usage_create_missing(context, project_id, parent_id,
+                                       subtree, resources):
+    """Create the missing subtree usages of a project from the usages of
+    the project and of subtree, the IDs of all its descendants, and
+    retrieve them all.
+    """
+    return IMPL.quota_subtree_usage_create_missing(context, project_id,
+                                                   parent_id, subtree,
+                                                   resources)
+
+
 def quota_usage_update(context, project_id, user_id, resource, **kwargs):
     """Update a quota usage or raise if it does not exist."""
     return IMPL.quota_usage_update(context, project_id, user_id, resource,
                                    **kwargs)
 
 
+def quota_usage_reconcile(context, resources, until_refresh):
+    """Refresh the quota usages marked for a refresh by quota_reserve."""
+    return IMPL.quota_usage_reconcile(context, resources, until_refresh)
+
+
 ###################
 
 
 def quota_reserve(context, resources, quotas, user_quotas, deltas, expire,
-                  until_refresh, max_age, project_id=None, user_id=None):
-    """Check quotas and create appropriate reservations."""
+                  until_refresh, max_age, project_id=None, user_id=None,
+                  hierarchy=None, sync_usages=True, subtrees=None):
+    """Check quotas and create appropriate reservations.
+
+    If hierarchy is given, it is a list of (project_id, parent_id, quotas)
+    tuples from the project up to its root, and the usage of the subtree
+    of each of them is checked against its limits as well.  The subtree
+    usage of a project is counted from the usages of all its descendants
+    the first time it is needed, from subtrees, a dict of project ID to
+    the IDs of its descendants; QuotaSubtreeUsageMissing is raised with
+    the projects whose descendants must be given.
+
+    If sync_usages is False, usages which need a refresh are only marked
+    for quota_usage_reconcile instead of being synced here.
+    """
     return IMPL.quota_reserve(context, resources, quotas, user_quotas, deltas,
                               expire, until_refresh, max_age,
-                              project_id=project_id, user_id=user_id)
+                              project_id=project_id, user_id=user_id,
+                              hierarchy=hierarchy, sync_usages=sync_usages,
+                              subtrees=subtrees)
+
+
+def quota_consume(context, resources, quotas, user_quotas, deltas,
+                  until_refresh, max_age, project_id=None, user_id=None,
+                  hierarchy=None, sync_usages=True, subtrees=None):
+    """Check quotas and apply the deltas to the usages at once.
+
+    The arguments are those of quota_reserve, but no reservation is
+    created, so there is nothing to commit or roll back.
+    """
+    return IMPL.quota_consume(context, resources, quotas, user_quotas,
+                              deltas, until_refresh, max_age,
+                              project_id=project_id, user_id=user_id,
+                              hierarchy=hierarchy, sync_usages=sync_usages,
+                              subtrees=subtrees)
 
 
 def reservation_commit(context, reservations, project_id=None, user_id=None):
@@ -1181,9 +1292,12 @@ def quota_destroy_all_by_project(context, project_id):
     return IMPL.quota_destroy_all_by_project(context, project_id)
 
 
-def reservation_expire(context):
-    """Roll back any expired reservations."""
-    return IMPL.reservation_expire(context)
+def reservation_expire(context, batch_size=1000):
+    """Roll back any expired reservations, batch_size at a time.
+
+    Returns the number of reservations rolled back.
+    """
+    return IMPL.reservation_expire(context, batch_size=batch_size)
 
 
 ###################
@@ -192,6 +192,27 @@ def _retry_on_deadlock(f):
     return wrapped
 
 
+def _retry_on_duplicate_entry(f):
+    """Decorator to retry a DB API call which lost a race to create a row.
+
+    The call is retried a few times, and then fails with the
+    DBDuplicateEntry.
+    """
+    @functools.wraps(f)
+    def wrapped(*args, **kwargs):
+        attempts = 3
+        while True:
+            try:
+                return f(*args, **kwargs)
+            except db_exc.DBDuplicateEntry:
+                attempts -= 1
+                if not attempts:
+                    raise
+                LOG.debug("Duplicate entry when running '%(func_name)s': "
+                          "Retrying...", dict(func_name=f.__name__))
+    return wrapped
+
+
 def model_query(context, model,
                 args=None,
                 session=None,
@@ -576,6 +597,23 @@ def compute_node_get_all(context, no_date_fields):
     return compute_nodes
 
 
+@require_admin_context
+def compute_node_get_all_changed_since(context, changed_since):
+    changed_since = timeutils.normalize_time(changed_since)
+    compute_node = models.ComputeNode.__table__
+
+    # NOTE: Deleted rows are returned too, so that callers keeping their
+    #       own copy of the compute nodes can drop them.
+    query = sql.select([compute_node]).\
+                where(or_(compute_node.c.created_at >= changed_since,
+                          compute_node.c.updated_at >= changed_since,
+                          compute_node.c.deleted_at >= changed_since)).\
+                order_by(compute_node.c.service_id)
+    with get_engine().begin() as conn:
+        return [dict(proxy.items())
+                for proxy in conn.execute(query).fetchall()]
+
+
 @require_admin_context
 def compute_node_search_by_hypervisor(context, hypervisor_match):
     field = models.ComputeNode.hypervisor_hostname
@@ -3011,6 +3049,43 @@ def quota_allocated_get_all_by_project(context, project_id):
     return result
 
 
+# NOTE: Keeps the IN clauses below the bind parameter limit of SQLite.
+_QUOTA_CHUNK_SIZE = 500
+
+
+def _quota_rows_by_projects(context, model, project_ids, args=None,
+                            session=None):
+    """Yield the rows of a quota model for a list of projects, with one
+    query per _QUOTA_CHUNK_SIZE projects.
+    """
+    project_ids = sorted(set(project_ids))
+    for i in range(0, len(project_ids), _QUOTA_CHUNK_SIZE):
+        chunk = project_ids[i:i + _QUOTA_CHUNK_SIZE]
+        query = model_query(context, model, args, read_deleted="no",
+                            session=session).\
+                    filter(model.project_id.in_(chunk))
+        for row in query.all():
+            yield row
+
+
+def quota_get_all_by_projects(context, project_ids):
+    return quota_and_allocated_get_all_by_projects(context, project_ids)[0]
+
+
+def quota_and_allocated_get_all_by_projects(context, project_ids):
+    quotas = {project_id: {'project_id': project_id}
+              for project_id in project_ids}
+    allocated = {project_id: {'project_id': project_id}
+                 for project_id in project_ids}
+    columns = (models.Quota.project_id, models.Quota.resource,
+               models.Quota.hard_limit, models.Quota.allocated)
+    for row in _quota_rows_by_projects(context, models.Quota, project_ids,
+                                       args=columns):
+        quotas[row.project_id][row.resource] = row.hard_limit
+        allocated[row.project_id][row.resource] = row.allocated
+    return quotas, allocated
+
+
 def quota_get_all(context, project_id):
 
     result = model_query(context, models.ProjectUserQuota).\
@@ -3020,6 +3095,26 @@ def quota_get_all(context, project_id):
     return result
 
 
+def _quota_generation_bump(context, session=None):
+    """Bump the generation of the quota limits after any of them changed."""
+    result = model_query(context, models.QuotaGeneration, read_deleted="no",
+                         session=session).\
+                 update({'generation': models.QuotaGeneration.generation + 1},
+                        synchronize_session=False)
+    if not result:
+        generation_ref = models.QuotaGeneration()
+        generation_ref.generation = 1
+        generation_ref.save(session=session)
+
+
+def quota_generation_get(context):
+    row = model_query(context, models.QuotaGeneration,
+                      (models.QuotaGeneration.generation,),
+                      read_deleted="no").\
+                  first()
+    return row[0] if row else 0
+
+
 def quota_create(context, project_id, resource, limit, user_id=None):
     per_user = user_id and resource not in PER_PROJECT_QUOTAS
     quota_ref = models.ProjectUserQuota() if per_user else models.Quota()
@@ -3033,6 +3128,7 @@ def quota_create(context, project_id, resource, limit, user_id=None):
         quota_ref.save()
     except db_exc.DBDuplicateEntry:
         raise exception.QuotaExists(project_id=project_id, resource=resource)
+    _quota_generation_bump(context)
     return quota_ref
 
 
@@ -3052,26 +3148,95 @@ def quota_update(context, project_id, resource, limit, user_id=None):
                                                      user_id=user_id)
         else:
             raise exception.ProjectQuotaNotFound(project_id=project_id)
+    _quota_generation_bump(context)
 
 
+@require_context
+@_retry_on_deadlock
 def quota_allocated_update(context, project_id, child_list):
-    allocated_quota = {}
-    for child_id in child_list:
-        quota_limit = quota_get_all_by_project(context, child_id)
-        del quota_limit["project_id"]
-        for resource in quota_limit:
-            try:
-                allocated_quota[resource] += quota_limit[resource]
-            except KeyError:
-                allocated_quota[resource] = quota_limit[resource]
-    for resource, allocated in allocated_quota.items():
-        query = model_query(context, models.Quota).\
-                     filter_by(project_id=project_id).\
-                     filter_by(resource=resource)
+    session = get_session()
+    with session.begin():
+        # NOTE: The quotas of the project are locked before the limits of
+        # the children are read, so that concurrent updates are applied in
+        # turn and the last one counts every limit committed before it.
+        model_query(context, models.Quota, (models.Quota.id,),
+                    read_deleted="no", session=session).\
+                filter_by(project_id=project_id).\
+                with_lockmode('update').\
+                all()
+        child_list = sorted(set(child_list))
+        allocated = {}
+        for i in range(0, len(child_list), _QUOTA_CHUNK_SIZE):
+            chunk = child_list[i:i + _QUOTA_CHUNK_SIZE]
+            rows = model_query(context, models.Quota,
+                               (models.Quota.resource,
+                                func.sum(models.Quota.hard_limit)),
+                               read_deleted="no", session=session).\
+                           filter(models.Quota.project_id.in_(chunk)).\
+                           group_by(models.Quota.resource).\
+                           all()
+            for resource, hard_limit in rows:
+                allocated[resource] = (allocated.get(resource, 0) +
+                                       int(hard_limit or 0))
+
+        if allocated:
+            value = sql.case(allocated, value=models.Quota.resource,
+                             else_=0)
+        else:
+            value = 0
+        model_query(context, models.Quota, read_deleted="no",
+                    session=session).\
+                filter_by(project_id=project_id).\
+                update({'allocated': value}, synchronize_session=False)
+
+
+@require_context
+@_retry_on_deadlock
+@_retry_on_duplicate_entry
+def quota_child_update(context, parent_id, project_id, resource, limit,
+                       user_id=None):
+    if user_id and resource not in PER_PROJECT_QUOTAS:
+        # NOTE: The limits of users are not part of what the parent
+        # allocated.
         try:
-            query.update({"allocated": allocated})
-        except Exception:
-            pass
+            return quota_create(context, project_id, resource, limit,
+                                user_id=user_id)
+        except exception.QuotaExists:
+            return quota_update(context, project_id, resource, limit,
+                                user_id=user_id)
+
+    session = get_session()
+    with session.begin():
+        # NOTE: The quota of the parent is locked before the limit of the
+        # child is read, so that concurrent changes of its children move
+        # it in turn, each by the change it made.
+        parent_ref = model_query(context, models.Quota, read_deleted="no",
+                                 session=session).\
+                         filter_by(project_id=parent_id).\
+                         filter_by(resource=resource).\
+                         with_lockmode('update').\
+                         first()
+        quota_ref = model_query(context, models.Quota, read_deleted="no",
+                                session=session).\
+                        filter_by(project_id=project_id).\
+                        filter_by(resource=resource).\
+                        with_lockmode('update').\
+                        first()
+        if quota_ref is None:
+            quota_ref = models.Quota()
+            quota_ref.project_id = project_id
+            quota_ref.resource = resource
+            quota_ref.allocated = 0
+            session.add(quota_ref)
+            old_limit = 0
+        else:
+            old_limit = quota_ref.hard_limit or 0
+        quota_ref.hard_limit = limit
+        if parent_ref is not None:
+            parent_ref.allocated = ((parent_ref.allocated or 0) +
+                                    (limit or 0) - old_limit)
+        _quota_generation_bump(context, session=session)
+    return quota_ref
 
 
 ###################
@@ -3121,6 +3286,7 @@ def quota_class_create(context, class_name, resource, limit):
     quota_class_ref.resource = resource
     quota_class_ref.hard_limit = limit
     quota_class_ref.save()
+    _quota_generation_bump(context)
     return quota_class_ref
 
 
@@ -3133,6 +3299,7 @@ def quota_class_update(context, class_name, resource, limit):
 
     if not result:
         raise exception.QuotaClassNotFound(class_name=class_name)
+    _quota_generation_bump(context)
 
 
 ###################
@@ -3185,6 +3352,72 @@ def quota_usage_get_all_by_project(context, project_id):
     return _quota_usage_get_all(context, project_id)
 
 
+def quota_usage_get_all_by_projects(context, project_ids):
+    result = {project_id: {'project_id': project_id}
+              for project_id in project_ids}
+    for row in _quota_rows_by_projects(context, models.QuotaUsage,
+                                       project_ids):
+        usages = result[row.project_id]
+        if row.resource in usages:
+            usages[row.resource]['in_use'] += row.in_use
+            usages[row.resource]['reserved'] += row.reserved
+        else:
+            usages[row.resource] = dict(in_use=row.in_use,
+                                        reserved=row.reserved)
+    return result
+
+
+@require_context
+def quota_subtree_lineage_get(context, project_id):
+    session = get_session()
+    lineage = _get_quota_subtree_lineage(context, session, project_id)
+    if not lineage:
+        return []
+    rows = model_query(context, models.QuotaSubtreeUsage,
+                       (models.QuotaSubtreeUsage.project_id,
+                        models.QuotaSubtreeUsage.parent_id),
+                       read_deleted="no", session=session).\
+                   filter(models.QuotaSubtreeUsage.project_id.in_(lineage)).\
+                   all()
+    parents = {row.project_id: row.parent_id for row in rows}
+    return [(node, parents[node]) for node in lineage]
+
+
+def quota_subtree_usage_get_all_by_project(context, project_id):
+    rows = model_query(context, models.QuotaSubtreeUsage,
+                       read_deleted="no").\
+                   filter_by(project_id=project_id).\
+                   all()
+    result = {'project_id': project_id}
+    for row in rows:
+        result[row.resource] = dict(in_use=row.in_use, reserved=row.reserved)
+    return result
+
+
+@require_context
+@_retry_on_deadlock
+@_retry_on_duplicate_entry
+def quota_subtree_usage_create_missing(context, project_id, parent_id,
+                                       subtree, resources):
+    session = get_session()
+    with session.begin():
+        rows = _get_quota_subtree_usages(context, session, [project_id],
+                                         resources).get(project_id, {})
+        missing = [res for res in resources if res not in rows]
+        if missing:
+            usages = _sum_quota_usages(context, session,
+                                       [project_id] + list(subtree), missing)
+            for res in missing:
+                usage = usages.get(res, {})
+                rows[res] = _quota_subtree_usage_create(
+                    project_id, parent_id, res, usage.get('in_use', 0),
+                    usage.get('reserved', 0), session=session)
+        result = {'project_id': project_id}
+        for res, row in rows.items():
+            result[res] = dict(in_use=row.in_use, reserved=row.reserved)
+    return result
+
+
 def _quota_usage_create(project_id, user_id, resource, in_use,
                         reserved, until_refresh, session=None):
     quota_usage_ref = models.QuotaUsage()
@@ -3375,11 +3608,210 @@ def _calculate_overquota(project_quotas, user_quotas, deltas,
     return overs
 
 
+def _get_quota_subtree_lineage(context, session, project_id):
+    """Return the project and its ancestors as recorded in the subtree
+    usage rows, walking parent_id links from the project to the root.
+    """
+    lineage = []
+    while project_id is not None and project_id not in lineage:
+        row = model_query(context, models.QuotaSubtreeUsage,
+                          (models.QuotaSubtreeUsage.parent_id,),
+                          read_deleted="no", session=session).\
+                      filter_by(project_id=project_id).\
+                      first()
+        if not row:
+            break
+        lineage.append(project_id)
+        project_id = row.parent_id
+    return lineage
+
+
+def _get_quota_subtree_usages(context, session, project_ids, resources):
+    """Lock and return the subtree usage rows of a set of projects.
+
+    The rows are locked in a single query ordered by project and
+    resource, so concurrent reservations in overlapping subtrees always
+    take the locks in the same order.
+
+    :return: dict of project_id to dict of resource to QuotaSubtreeUsage
+    """
+    result = {}
+    if not project_ids or not resources:
+        return result
+    rows = model_query(context, models.QuotaSubtreeUsage,
+                       read_deleted="no", session=session).\
+                   filter(models.QuotaSubtreeUsage.project_id.in_(
+                       list(project_ids))).\
+                   filter(models.QuotaSubtreeUsage.resource.in_(
+                       list(resources))).\
+                   order_by(models.QuotaSubtreeUsage.project_id,
+                            models.QuotaSubtreeUsage.resource).\
+                   with_lockmode('update').\
+                   all()
+    for row in rows:
+        result.setdefault(row.project_id, {})[row.resource] = row
+    return result
+
+
+def _quota_subtree_usage_create(project_id, parent_id, resource, in_use,
+                                reserved, session=None):
+    subtree_usage_ref = models.QuotaSubtreeUsage()
+    subtree_usage_ref.project_id = project_id
+    subtree_usage_ref.parent_id = parent_id
+    subtree_usage_ref.resource = resource
+    subtree_usage_ref.in_use = in_use
+    subtree_usage_ref.reserved = reserved
+    subtree_usage_ref.save(session=session)
+    return subtree_usage_ref
+
+
+def _sum_quota_usages(context, session, project_ids, resources):
+    """Sum the usages of a set of projects over all of their users."""
+    rows = model_query(context, models.QuotaUsage,
+                       (models.QuotaUsage.project_id,
+                        models.QuotaUsage.resource,
+                        func.sum(models.QuotaUsage.in_use),
+                        func.sum(models.QuotaUsage.reserved)),
+                       read_deleted="no", session=session).\
+                   filter(models.QuotaUsage.project_id.in_(
+                       list(project_ids))).\
+                   filter(models.QuotaUsage.resource.in_(list(resources))).\
+                   group_by(models.QuotaUsage.project_id,
+                            models.QuotaUsage.resource).\
+                   all()
+    result = {}
+    for _project_id, resource, in_use, reserved in rows:
+        usage = result.setdefault(resource, dict(in_use=0, reserved=0))
+        usage['in_use'] += max(int(in_use or 0), 0)
+        usage['reserved'] += int(reserved or 0)
+    return result
+
+
+def _sync_quota_subtree_usages(context, session, hierarchy, resources,
+                               in_use_changes, subtrees):
+    """Lock, create and refresh the subtree usage rows of a lineage.
+
+    :param hierarchy:      list of (project_id, parent_id, quotas) tuples
+                           from the reserving project up to its root.
+    :param resources:      The resources whose rows are needed.
+    :param in_use_changes: dict of resource to the change of the reserving
+                           project's in_use made by a usage refresh in
+                           this transaction.
+    :param subtrees:       dict of project_id to the IDs of all of its
+                           descendants, for the projects of the lineage
+                           whose rows may be missing.
+    :return:               dict of project_id to dict of resource to
+                           QuotaSubtreeUsage.
+    :raises:               QuotaSubtreeUsageMissing if rows are missing
+                           for projects which are not in subtrees.
+    """
+    lineage = [node for node, _parent, _quotas in hierarchy]
+    subtree_usages = _get_quota_subtree_usages(context, session, lineage,
+                                               resources)
+
+    # Rows which already exist counted the old usage of the reserving
+    # project; move them by what the refresh changed.
+    for node in lineage:
+        for res, change in in_use_changes.items():
+            row = subtree_usages.get(node, {}).get(res)
+            if row is not None and change:
+                row.in_use += change
+
+    missing = {}
+    for node in lineage:
+        node_missing = [res for res in resources
+                        if res not in subtree_usages.get(node, {})]
+        if node_missing:
+            missing[node] = node_missing
+    subtrees = subtrees or {}
+    unknown = [node for node in lineage
+               if node in missing and node not in subtrees]
+    if unknown:
+        raise exception.QuotaSubtreeUsageMissing(project_ids=unknown)
+
+    # Missing rows start with the usage of the whole subtree of their
+    # project, including the refresh made in this transaction.
+    if missing:
+        session.flush()
+    for node, parent, _quotas in hierarchy:
+        node_usages = subtree_usages.setdefault(node, {})
+        if node in missing:
+            usages = _sum_quota_usages(context, session,
+                                       [node] + list(subtrees[node]),
+                                       missing[node])
+            for res in missing[node]:
+                usage = usages.get(res, {})
+                node_usages[res] = _quota_subtree_usage_create(
+                    node, parent, res, usage.get('in_use', 0),
+                    usage.get('reserved', 0), session=session)
+        for res, row in node_usages.items():
+            if row.parent_id != parent:
+                row.parent_id = parent
+    return subtree_usages
+
+
+def _calculate_subtree_overquota(hierarchy, deltas, subtree_usages):
+    """Checks if any ancestor will go over quota based on the request.
+
+    :param hierarchy:      list of (project_id, parent_id, quotas) tuples
+                           from the reserving project up to its root.
+    :param deltas:         dict of resource keys to positive/negative quota
+                           changes for the resources in a given operation.
+    :param subtree_usages: dict of project_id to dict of resource keys to
+                           QuotaSubtreeUsage records.
+    :return:               dict of over-quota resources to the
+                           (project_id, limit, QuotaSubtreeUsage) with the
+                           least headroom.
+    """
+    overs = {}
+    for node, _parent, quotas in hierarchy:
+        for res, delta in deltas.items():
+            limit = quotas.get(res, -1)
+            if limit < 0 or delta <= 0:
+                continue
+            usage = subtree_usages[node][res]
+            headroom = limit - usage.total
+            if headroom < delta and (res not in overs or headroom <
+                    overs[res][1] - overs[res][2].total):
+                overs[res] = (node, limit, usage)
+    return overs
+
+
 @require_context
 @_retry_on_deadlock
+@_retry_on_duplicate_entry
 def quota_reserve(context, resources, project_quotas, user_quotas, deltas,
                   expire, until_refresh, max_age, project_id=None,
-                  user_id=None):
+                  user_id=None, hierarchy=None, sync_usages=True,
+                  subtrees=None):
+    return _quota_reserve(context, resources, project_quotas, user_quotas,
+                          deltas, expire, until_refresh, max_age,
+                          project_id=project_id, user_id=user_id,
+                          hierarchy=hierarchy, sync_usages=sync_usages,
+                          subtrees=subtrees)
+
+
+@require_context
+@_retry_on_deadlock
+@_retry_on_duplicate_entry
+def quota_consume(context, resources, project_quotas, user_quotas, deltas,
+                  until_refresh, max_age, project_id=None, user_id=None,
+                  hierarchy=None, sync_usages=True, subtrees=None):
+    """Check quotas and apply the deltas to in_use in one transaction.
+
+    The checks are those of quota_reserve, but no reservation is
+    created: the usages are changed right away.
+    """
+    _quota_reserve(context, resources, project_quotas, user_quotas, deltas,
+                   None, until_refresh, max_age, project_id=project_id,
+                   user_id=user_id, hierarchy=hierarchy,
+                   sync_usages=sync_usages, subtrees=subtrees, consume=True)
+
+
+def _quota_reserve(context, resources, project_quotas, user_quotas, deltas,
+                   expire, until_refresh, max_age, project_id=None,
+                   user_id=None, hierarchy=None, sync_usages=True,
+                   subtrees=None, consume=False):
     elevated = context.elevated()
     session = get_session()
     with session.begin():
@@ -3393,6 +3825,11 @@ def quota_reserve(context, resources, project_quotas, user_quotas, deltas,
         project_usages, user_usages = _get_project_user_quota_usages(
                 context, session, project_id, user_id)
 
+        # Remember the tracked usages so that the subtree usages can be
+        # moved by whatever the refresh below changes.
+        old_in_use = {res: max(usage.in_use, 0)
+                      for res, usage in user_usages.items()}
+
         # Handle usage refresh
         work = set(deltas.keys())
         while work:
@@ -3405,6 +3842,13 @@ def quota_reserve(context, resources, project_quotas, user_quotas, deltas,
             refresh = created or _is_quota_refresh_needed(
                                         user_usages[resource], max_age)
 
+            # NOTE: Without sync_usages the usage is only marked, and
+            # quota_usage_reconcile refreshes it later, so that the sync
+            # routine does not run while the usages are locked.
+            if refresh and not sync_usages:
+                user_usages[resource].until_refresh = 0
+                refresh = False
+
             # OK, refresh the usage
             if refresh:
                 # Grab the sync routine
@@ -3448,6 +3892,21 @@ def quota_reserve(context, resources, project_quotas, user_quotas, deltas,
         overs = _calculate_overquota(project_quotas, user_quotas, deltas,
                                      project_usages, user_usages)
 
+        # Check the whole subtree of the project and of each ancestor
+        # against their limits, in this same transaction.
+        subtree_overs = {}
+        subtree_usages = {}
+        if hierarchy:
+            in_use_changes = {res: usage.in_use - old_in_use.get(res, 0)
+                              for res, usage in user_usages.items()}
+            subtree_usages = _sync_quota_subtree_usages(
+                context, session, hierarchy,
+                set(deltas.keys()) | set(in_use_changes.keys()),
+                in_use_changes, subtrees)
+            subtree_overs = _calculate_subtree_overquota(
+                hierarchy, deltas, subtree_usages)
+            overs = sorted(set(overs) | set(subtree_overs))
+
         # NOTE(Vek): The quota check needs to be in the transaction,
         #            but the transaction doesn't fail just because
         #            we're over quota, so the OverQuota raise is
@@ -3455,8 +3914,16 @@ def quota_reserve(context, resources, project_quotas, user_quotas, deltas,
         #            here, our usage updates would be discarded, but
         #            they're not invalidated by being over-quota.
 
+        # Consume the deltas straight away
+        if not overs and consume:
+            reservations = []
+            for res, delta in deltas.items():
+                user_usages[res].in_use += delta
+                for node_usages in subtree_usages.values():
+                    node_usages[res].in_use += delta
+
         # Create the reservations
-        if not overs:
+        elif not overs:
             reservations = []
             for res, delta in deltas.items():
                 reservation = _reservation_create(
@@ -3482,6 +3949,8 @@ def quota_reserve(context, resources, project_quotas, user_quotas, deltas,
                 #            reserved value if the delta is positive.
                 if delta > 0:
                     user_usages[res].reserved += delta
+                    for node_usages in subtree_usages.values():
+                        node_usages[res].reserved += delta
 
         # Apply updates to the usages table
         for usage_ref in user_usages.values():
@@ -3498,22 +3967,119 @@ def quota_reserve(context, resources, project_quotas, user_quotas, deltas,
             usages = user_usages
         usages = {k: dict(in_use=v['in_use'], reserved=v['reserved'])
                   for k, v in usages.items()}
+        quotas = user_quotas
+        if subtree_overs:
+            # Report the tightest ancestor so that callers compute the
+            # right headroom.
+            quotas = dict(user_quotas)
+            for res, (node, limit, usage) in subtree_overs.items():
+                quotas[res] = limit
+                usages[res] = dict(in_use=usage.in_use,
+                                   reserved=usage.reserved)
         LOG.debug('Raise OverQuota exception because: '
                   'project_quotas: %(project_quotas)s, '
                   'user_quotas: %(user_quotas)s, deltas: %(deltas)s, '
                   'overs: %(overs)s, project_usages: %(project_usages)s, '
-                  'user_usages: %(user_usages)s',
+                  'user_usages: %(user_usages)s, '
+                  'subtree_overs: %(subtree_overs)s',
                   {'project_quotas': project_quotas,
                    'user_quotas': user_quotas,
                    'overs': overs, 'deltas': deltas,
                    'project_usages': project_usages,
-                   'user_usages': user_usages})
-        raise exception.OverQuota(overs=sorted(overs), quotas=user_quotas,
+                   'user_usages': user_usages,
+                   'subtree_overs': {res: node for res, (node, _l, _u)
+                                     in subtree_overs.items()}})
+        raise exception.OverQuota(overs=sorted(overs), quotas=quotas,
                                   usages=usages)
 
     return reservations
 
 
+@require_admin_context
+def quota_usage_reconcile(context, resources, until_refresh):
+    """Refresh the quota usages marked by quota_reserve.
+
+    The sync routines run without any lock held.  The refreshed counts
+    are then applied in a short transaction; usages whose in_use changed
+    while counting are counted again in that transaction, under their
+    row lock.
+
+    :return: The number of usages refreshed.
+    """
+    elevated = context.elevated()
+    marked = model_query(context, models.QuotaUsage,
+                         (models.QuotaUsage.project_id,
+                          models.QuotaUsage.user_id,
+                          models.QuotaUsage.resource),
+                         read_deleted="no").\
+                     filter(or_(models.QuotaUsage.until_refresh <= 0,
+                                models.QuotaUsage.in_use < 0)).\
+                     all()
+    pending = {}
+    for project_id, user_id, resource in marked:
+        if resource in resources and hasattr(resources[resource], 'sync'):
+            pending.setdefault((project_id, user_id), set()).add(
+                resources[resource].sync)
+
+    refreshed = 0
+    for (project_id, user_id), syncs in pending.items():
+        counted = {row.resource: row.in_use for row in
+                   model_query(context, models.QuotaUsage,
+                               (models.QuotaUsage.resource,
+                                models.QuotaUsage.in_use),
+                               read_deleted="no").
+                   filter_by(project_id=project_id).
+                   filter_by(user_id=user_id).
+                   all()}
+        session = get_session()
+        updates = {}
+        for sync in syncs:
+            updates.update(QUOTA_SYNC_FUNCTIONS[sync](elevated, project_id,
+                                                      user_id, session))
+
+        with session.begin():
+            usages = model_query(context, models.QuotaUsage,
+                                 read_deleted="no", session=session).\
+                             filter_by(project_id=project_id).\
+                             filter_by(user_id=user_id).\
+                             with_lockmode('update').\
+                             all()
+            # NOTE: A commit or a consume moved in_use while the
+            # resources were counted, so the count may or may not hold
+            # it.  Count those resources again now that nothing else can
+            # move their usage.
+            stale = set(resources[usage.resource].sync for usage in usages
+                        if usage.resource in updates and
+                        usage.in_use != counted.get(usage.resource))
+            for sync in stale:
+                updates.update(QUOTA_SYNC_FUNCTIONS[sync](
+                    elevated, project_id, user_id, session))
+
+            in_use_changes = {}
+            for usage in usages:
+                if usage.resource not in updates:
+                    continue
+                change = (max(updates[usage.resource], 0) -
+                          max(usage.in_use, 0))
+                _refresh_quota_usages(usage, until_refresh,
+                                      updates[usage.resource])
+                if change:
+                    in_use_changes[usage.resource] = change
+                refreshed += 1
+
+            # Move the subtree usages of the project and its ancestors
+            # by what the refresh changed, as quota_reserve does.
+            if in_use_changes:
+                lineage = _get_quota_subtree_lineage(context, session,
+                                                     project_id)
+                subtree_usages = _get_quota_subtree_usages(
+                    context, session, lineage, in_use_changes.keys())
+                for node_usages in subtree_usages.values():
+                    for res, row in node_usages.items():
+                        row.in_use += in_use_changes[res]
+    return refreshed
+
+
 def _quota_reservations_query(session, context, reservations):
     """Return the relevant reservations."""
 
@@ -3525,6 +4091,34 @@ def _quota_reservations_query(session, context, reservations):
                    with_lockmode('update')
 
 
+def _get_reservations_subtree_usages(context, session, reservations):
+    """Lock the subtree usage rows affected by a list of reservations.
+
+    :return: dict of (project_id, resource) to the list of
+             QuotaSubtreeUsage rows of the project and its ancestors.
+    """
+    lineages = {}
+    for reservation in reservations:
+        if reservation.project_id not in lineages:
+            lineages[reservation.project_id] = _get_quota_subtree_lineage(
+                context, session, reservation.project_id)
+    project_ids = set()
+    for lineage in lineages.values():
+        project_ids.update(lineage)
+    rows = _get_quota_subtree_usages(
+        context, session, project_ids,
+        set(reservation.resource for reservation in reservations))
+
+    result = {}
+    for reservation in reservations:
+        key = (reservation.project_id, reservation.resource)
+        if key not in result:
+            result[key] = [rows[node][reservation.resource]
+                           for node in lineages[reservation.project_id]
+                           if reservation.resource in rows.get(node, {})]
+    return result
+
+
 @require_context
 @_retry_on_deadlock
 def reservation_commit(context, reservations, project_id=None, user_id=None):
@@ -3534,11 +4128,19 @@ def reservation_commit(context, reservations, project_id=None, user_id=None):
                 context, session, project_id, user_id)
         reservation_query = _quota_reservations_query(session, context,
                                                       reservations)
-        for reservation in reservation_query.all():
+        reservation_rows = reservation_query.all()
+        subtree_usages = _get_reservations_subtree_usages(
+            context, session, reservation_rows)
+        for reservation in reservation_rows:
             usage = user_usages[reservation.resource]
             if reservation.delta >= 0:
                 usage.reserved -= reservation.delta
             usage.in_use += reservation.delta
+            for subtree_usage in subtree_usages.get(
+                    (reservation.project_id, reservation.resource), []):
+                if reservation.delta >= 0:
+                    subtree_usage.reserved -= reservation.delta
+                subtree_usage.in_use += reservation.delta
         reservation_query.soft_delete(synchronize_session=False)
 
 
@@ -3551,10 +4153,16 @@ def reservation_rollback(context, reservations, project_id=None, user_id=None):
                 context, session, project_id, user_id)
         reservation_query = _quota_reservations_query(session, context,
                                                       reservations)
-        for reservation in reservation_query.all():
+        reservation_rows = reservation_query.all()
+        subtree_usages = _get_reservations_subtree_usages(
+            context, session, reservation_rows)
+        for reservation in reservation_rows:
             usage = user_usages[reservation.resource]
             if reservation.delta >= 0:
                 usage.reserved -= reservation.delta
+                for subtree_usage in subtree_usages.get(
+                        (reservation.project_id, reservation.resource), []):
+                    subtree_usage.reserved -= reservation.delta
         reservation_query.soft_delete(synchronize_session=False)
 
 
@@ -3579,6 +4187,8 @@ def quota_destroy_all_by_project_and_user(context, project_id, user_id):
                 filter_by(user_id=user_id).\
                 soft_delete(synchronize_session=False)
 
+        _quota_generation_bump(context, session=session)
+
 
 def quota_destroy_all_by_project(context, project_id):
     session = get_session()
@@ -3603,23 +4213,102 @@ def quota_destroy_all_by_project(context, project_id):
                 filter_by(project_id=project_id).\
                 soft_delete(synchronize_session=False)
 
+        _quota_generation_bump(context, session=session)
+
 
-@require_admin_context
 @_retry_on_deadlock
-def reservation_expire(context):
+def _reservation_expire_batch(context, expire_before, batch_size):
+    """Roll back up to batch_size reservations which expired before
+    expire_before, in a transaction of their own.
+
+    :return: The number of reservations read as expired and the number
+             actually rolled back; the others were committed, rolled back
+             or expired by someone else in the meantime.
+    """
+    candidates = model_query(context, models.Reservation,
+                             (models.Reservation.id,
+                              models.Reservation.usage_id),
+                             read_deleted="no").\
+                     filter(models.Reservation.expire < expire_before).\
+                     order_by(models.Reservation.id).\
+                     limit(batch_size).\
+                     all()
+    if not candidates:
+        return 0, 0
+
     session = get_session()
     with session.begin():
-        current_time = timeutils.utcnow()
-        reservation_query = model_query(context, models.Reservation,
-                                        session=session, read_deleted="no").\
-                            filter(models.Reservation.expire < current_time)
+        # Lock the usages before the reservations, like quota_reserve,
+        # reservation_commit and reservation_rollback do.
+        usage_ids = sorted(set(usage_id for _id, usage_id in candidates))
+        model_query(context, models.QuotaUsage, (models.QuotaUsage.id,),
+                    read_deleted="no", session=session).\
+                filter(models.QuotaUsage.id.in_(usage_ids)).\
+                order_by(models.QuotaUsage.id).\
+                with_lockmode('update').\
+                all()
+        rows = model_query(context, models.Reservation,
+                           (models.Reservation.id,),
+                           read_deleted="no", session=session).\
+                       filter(models.Reservation.id.in_(
+                           [id for id, _usage_id in candidates])).\
+                       with_lockmode('update').\
+                       all()
+        ids = [row.id for row in rows]
+        if not ids:
+            return len(candidates), 0
+
+        deltas = model_query(context, models.Reservation,
+                             (models.Reservation.usage_id,
+                              models.Reservation.project_id,
+                              models.Reservation.resource,
+                              func.sum(models.Reservation.delta).
+                              label('delta')),
+                             read_deleted="no", session=session).\
+                         filter(models.Reservation.id.in_(ids)).\
+                         filter(models.Reservation.delta > 0).\
+                         group_by(models.Reservation.usage_id,
+                                  models.Reservation.project_id,
+                                  models.Reservation.resource).\
+                         all()
+        if deltas:
+            reserved = {row.usage_id: int(row.delta) for row in deltas}
+            model_query(context, models.QuotaUsage, read_deleted="no",
+                        session=session).\
+                    filter(models.QuotaUsage.id.in_(reserved.keys())).\
+                    update({'reserved': models.QuotaUsage.reserved -
+                            sql.case(reserved, value=models.QuotaUsage.id)},
+                           synchronize_session=False)
+
+            subtree_usages = _get_reservations_subtree_usages(
+                context, session, deltas)
+            for row in deltas:
+                for subtree_usage in subtree_usages.get(
+                        (row.project_id, row.resource), []):
+                    subtree_usage.reserved -= int(row.delta)
+
+        model_query(context, models.Reservation, read_deleted="no",
+                    session=session).\
+                filter(models.Reservation.id.in_(ids)).\
+                soft_delete(synchronize_session=False)
+    return len(candidates), len(ids)
 
-        for reservation in reservation_query.join(models.QuotaUsage).all():
-            if reservation.delta >= 0:
-                reservation.usage.reserved -= reservation.delta
-                session.add(reservation.usage)
 
-        reservation_query.soft_delete(synchronize_session=False)
+@require_admin_context
+def reservation_expire(context, batch_size=1000):
+    """Roll back the expired reservations, batch_size at a time.
+
+    Each batch is committed on its own, so the job can be interrupted
+    and resumed, and several of them may run at once.
+    """
+    expire_before = timeutils.utcnow()
+    expired = 0
+    while True:
+        candidates, batch_expired = _reservation_expire_batch(
+            context, expire_before, batch_size)
+        expired += batch_expired
+        if candidates < batch_size:
+            return expired
 
 
 ###################
@@ -537,6 +537,46 @@ class QuotaUsage(BASE, NovaBase):
     until_refresh = Column(Integer)
 
 
+class QuotaSubtreeUsage(BASE, NovaBase):
+    """Represents the usage of a resource by a project and its subtree.
+
+    The counters are the sum of the project's own usage and of the usage
+    of every descendant, and are kept up to date by the nested quota
+    driver so that ancestors can be checked without walking the subtree.
+    """
+
+    __tablename__ = 'quota_subtree_usages'
+    __table_args__ = (
+        schema.UniqueConstraint("project_id", "resource", "deleted",
+        name="uniq_quota_subtree_usages0project_id0resource0deleted"
+        ),
+    )
+    id = Column(Integer, primary_key=True)
+
+    project_id = Column(String(255), nullable=False)
+    parent_id = Column(String(255))
+    resource = Column(String(255), nullable=False)
+
+    in_use = Column(Integer, nullable=False)
+    reserved = Column(Integer, nullable=False)
+
+    @property
+    def total(self):
+        return self.in_use + self.reserved
+
+
+class QuotaGeneration(BASE, NovaBase):
+    """Represents the generation of all quota limits.
+
+    The single row is bumped whenever a quota or quota class limit
+    changes, so that processes caching limits know when to drop them.
+    """
+
+    __tablename__ = 'quota_generations'
+    id = Column(Integer, primary_key=True)
+    generation = Column(Integer, nullable=False, default=0)
+
+
 class Reservation(BASE, NovaBase):
     """Represents a resource reservation for quotas."""
 
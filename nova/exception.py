@@ -953,6 +953,10 @@ class OverQuota(NovaException):
     msg_fmt = _("Quota exceeded for resources: %(overs)s")
 
 
+class QuotaSubtreeUsageMissing(NovaException):
+    msg_fmt = _("The subtree usages of projects %(project_ids)s are missing.")
+
+
 class SecurityGroupNotFound(NotFound):
     msg_fmt = _("Security group %(security_group_id)s not found.")
 
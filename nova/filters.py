@@ -32,6 +32,16 @@ class BaseFilter(object):
         """
         return True
 
+    def filter_vectorized(self, table, filter_properties):
+        """Return a boolean array with True for each row of a table of
+        objects which passes the filter.
+
+        Return None, as this default does, if the filter cannot work on
+        whole tables; filter_all() is then used instead.  Override this
+        in a subclass whose handler builds tables.
+        """
+        return None
+
     def filter_all(self, filter_obj_list, filter_properties):
         """Yield objects that pass the filter.
 
@@ -64,17 +74,51 @@ class BaseFilterHandler(loadables.BaseLoader):
     This class should be subclassed where one needs to use filters.
     """
 
+    def _get_table(self, objs):
+        """Return a columnar table of objs to hand to the filters'
+        filter_vectorized(), or None to always filter object by object.
+        Override this in a subclass.
+        """
+        return None
+
+    def _start_step(self):
+        """Return what _end_step() needs to trace the run of a filter, or
+        None if it is not traced.  Override this in a subclass.
+        """
+        return None
+
+    def _end_step(self, step, filter, index, objs_in, objs_out):
+        """Trace the run of a filter started by _start_step().  Override
+        this in a subclass.
+        """
+        pass
+
     def get_filtered_objects(self, filters, objs, filter_properties, index=0):
         list_objs = list(objs)
+        table = self._get_table(list_objs)
         LOG.debug("Starting with %d host(s)", len(list_objs))
         for filter in filters:
             if filter.run_filter_for_index(index):
                 cls_name = filter.__class__.__name__
-                objs = filter.filter_all(list_objs, filter_properties)
-                if objs is None:
-                    LOG.debug("Filter %s says to stop filtering", cls_name)
-                    return
-                list_objs = list(objs)
+                step = self._start_step()
+                objs_in = list_objs
+                mask = None
+                if table is not None:
+                    mask = filter.filter_vectorized(table, filter_properties)
+                if mask is not None:
+                    table = table.select(mask)
+                    list_objs = table.objects
+                else:
+                    objs = filter.filter_all(list_objs, filter_properties)
+                    if objs is None:
+                        LOG.debug("Filter %s says to stop filtering",
+                                  cls_name)
+                        return
+                    list_objs = list(objs)
+                    if table is not None:
+                        table = table.select_objects(list_objs)
+                if step is not None:
+                    self._end_step(step, filter, index, objs_in, list_objs)
                 if not list_objs:
                     LOG.info(_LI("Filter %s returned 0 hosts"), cls_name)
                     break
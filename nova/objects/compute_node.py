@@ -13,6 +13,7 @@
 #    under the License.
 
 from oslo_serialization import jsonutils
+from oslo_utils import timeutils
 
 from nova import db
 from nova import exception
@@ -283,7 +284,8 @@ class ComputeNodeList(base.ObjectListBase, base.NovaObject):
     # Version 1.8 ComputeNode version 1.8 + add get_all_by_host()
     # Version 1.9 ComputeNode version 1.9
     # Version 1.10 ComputeNode version 1.10
-    VERSION = '1.10'
+    # Version 1.11 Add get_all_changed_since()
+    VERSION = '1.11'
     fields = {
         'objects': fields.ListOfObjectsField('ComputeNode'),
         }
@@ -300,6 +302,7 @@ class ComputeNodeList(base.ObjectListBase, base.NovaObject):
         '1.8': '1.8',
         '1.9': '1.9',
         '1.10': '1.10',
+        '1.11': '1.10',
         }
 
     @base.remotable_classmethod
@@ -308,6 +311,25 @@ class ComputeNodeList(base.ObjectListBase, base.NovaObject):
         return base.obj_make_list(context, cls(context), objects.ComputeNode,
                                   db_computes)
 
+    @base.remotable_classmethod
+    def _get_all_changed_since(cls, context, changed_since):
+        changed_since = timeutils.parse_isotime(changed_since)
+        db_computes = db.compute_node_get_all_changed_since(context,
+                                                            changed_since)
+        return base.obj_make_list(context, cls(context), objects.ComputeNode,
+                                  db_computes)
+
+    @classmethod
+    def get_all_changed_since(cls, context, changed_since):
+        """Get the compute nodes created, updated or deleted since a time.
+
+        Deleted compute nodes are included, with their deleted field set.
+        """
+        # NOTE: Convert the datetime to a string primitive for the remote
+        #       call.
+        return cls._get_all_changed_since(context,
+                                          timeutils.isotime(changed_since))
+
     @base.remotable_classmethod
     def get_by_hypervisor(cls, context, hypervisor_match):
         db_computes = db.compute_node_search_by_hypervisor(context,
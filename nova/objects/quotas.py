@@ -52,7 +52,8 @@ class Quotas(base.NovaObject,
     # Version 1.0: initial version
     # Version 1.1: Added create_limit() and update_limit()
     # Version 1.2: Added limit_check() and count()
-    VERSION = '1.2'
+    # Version 1.3: Added consume()
+    VERSION = '1.3'
 
     fields = {
         'reservations': fields.ListOfStringsField(nullable=True),
@@ -121,6 +122,12 @@ class Quotas(base.NovaObject,
         self.reservations = None
         self.obj_reset_changes()
 
+    @base.remotable_classmethod
+    def consume(cls, context, project_id=None, user_id=None, **deltas):
+        """Check quotas and apply the deltas without a reservation."""
+        quota.QUOTAS.consume(context, project_id=project_id,
+                             user_id=user_id, **deltas)
+
     @base.remotable_classmethod
     def limit_check(cls, context, project_id=None, user_id=None, **values):
         """Check quota limits."""
@@ -158,3 +165,7 @@ class QuotasNoOp(Quotas):
 
     def rollback(self, context=None):
         pass
+
+    @classmethod
+    def consume(cls, context, project_id=None, user_id=None, **deltas):
+        pass
@@ -58,6 +58,13 @@ class PciDeviceStats(object):
         self.pools = [pci_pool.to_dict()
                       for pci_pool in stats] if stats else []
         self.pools.sort(self.pool_cmp)
+        # Called without arguments whenever the pools change.
+        self.listener = None
+
+    def pools_changed(self):
+        """Tell the listener, if any, that the pools changed."""
+        if self.listener is not None:
+            self.listener()
 
     def _equal_properties(self, dev, entry, matching_keys):
         return all(dev.get(prop) == entry.get(prop)
@@ -103,6 +110,7 @@ class PciDeviceStats(object):
                 pool = dev_pool
             pool['count'] += 1
             pool['devices'].append(dev)
+            self.pools_changed()
 
     @staticmethod
     def _decrease_pool_count(pool_list, pool, count=1):
@@ -128,6 +136,7 @@ class PciDeviceStats(object):
                     compute_node_id=dev.compute_node_id, address=dev.address)
             pool['devices'].remove(dev)
             self._decrease_pool_count(self.pools, pool)
+            self.pools_changed()
 
     def get_free_devs(self):
         free_devs = []
@@ -171,6 +180,7 @@ class PciDeviceStats(object):
                     alloc_devices.append(pci_dev)
                 if count == 0:
                     break
+        self.pools_changed()
         return alloc_devices
 
     @staticmethod
@@ -228,9 +238,12 @@ class PciDeviceStats(object):
         If numa_cells is provided then only devices contained in
         those nodes are considered.
         """
-        if not all([self._apply_request(self.pools, r, numa_cells)
-                                            for r in requests]):
-            raise exception.PciDeviceRequestFailed(requests=requests)
+        try:
+            if not all([self._apply_request(self.pools, r, numa_cells)
+                                                for r in requests]):
+                raise exception.PciDeviceRequestFailed(requests=requests)
+        finally:
+            self.pools_changed()
 
     @staticmethod
     def pool_cmp(dev1, dev2):
@@ -247,3 +260,4 @@ class PciDeviceStats(object):
     def clear(self):
         """Clear all the stats maintained."""
         self.pools = []
+        self.pools_changed()
@@ -0,0 +1,380 @@
+# Copyright 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Cache of the project hierarchy used by nested quotas.
+
+The nested quota API needs to know the parent and the children of a
+project on every request.  Rather than asking Keystone each time, the
+edges of the tree are kept in a process-local cache which is refreshed
+from a pluggable driver once its entries are older than
+project_hierarchy_cache_ttl, or as soon as the driver reports that the
+hierarchy has changed.
+
+Keystone only shows a user the projects the user may see, so the edges
+it returns are cached apart for every scope of token, and are only used
+to answer about the projects Keystone was asked about with that scope.
+"""
+
+import os
+
+from keystoneclient.v3 import client
+import keystonemiddleware.auth_token as auth_token
+from oslo_config import cfg
+from oslo_serialization import jsonutils
+from oslo_utils import importutils
+from oslo_utils import timeutils
+import six
+
+from nova import exception
+from nova.i18n import _LE
+from nova.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+project_hierarchy_opts = [
+    cfg.StrOpt('project_hierarchy_driver',
+               default='nova.project_hierarchy.KeystoneHierarchyDriver',
+               help='Driver used to load the project hierarchy for nested '
+                    'quotas'),
+    cfg.IntOpt('project_hierarchy_cache_ttl',
+               default=300,
+               help='Number of seconds a cached project hierarchy entry is '
+                    'trusted before it is reloaded from the driver. 0 '
+                    'disables the cache'),
+    cfg.StrOpt('project_hierarchy_file',
+               default='',
+               help='Absolute path to a JSON file mapping each project ID '
+                    'to its parent project ID, used by '
+                    'FileHierarchyDriver'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(project_hierarchy_opts)
+
+KEYSTONE_CONF = auth_token.CONF
+
+
+class KeystoneHierarchyDriver(object):
+    """Load the project hierarchy from the Keystone v3 API."""
+
+    def _get_client(self, context, project_id):
+        auth_host = KEYSTONE_CONF.keystone_authtoken.auth_host
+        auth_port = int(KEYSTONE_CONF.keystone_authtoken.auth_port)
+        auth_url = 'http://%s:%s/v3/' % (auth_host, auth_port)
+        return client.Client(token=context.auth_token, auth_url=auth_url,
+                             project_id=project_id)
+
+    def get_scope(self, context):
+        """Return the scope of the hierarchy the driver shows to context.
+
+        Keystone filters the projects it returns by the roles of the
+        token, so each user, project and set of roles has a scope of its
+        own.
+        """
+        return (context.user_id, context.project_id,
+                tuple(sorted(context.roles)))
+
+    def get_version(self, context):
+        """Return a token which changes whenever the hierarchy changes.
+
+        Keystone does not publish such a token, so the cache relies on
+        its TTL alone.
+        """
+        return None
+
+    def get_hierarchy(self, context, project_id):
+        """Return the lineage and the subtree of a project.
+
+        Both are lists of (project_id, parent_id) pairs.  The lineage
+        starts with the project itself and walks up to the root; the
+        subtree holds every descendant of the project.
+        """
+        try:
+            keystone = self._get_client(context, project_id)
+            project = keystone.projects.get(project_id,
+                                            parents_as_list=True,
+                                            subtree_as_list=True)
+        except Exception:
+            raise exception.Forbidden()
+
+        def _edges(items):
+            edges = []
+            for item in items or []:
+                info = item['project']
+                edges.append((info['id'], info.get('parent_id')))
+            return edges
+
+        data = project.__dict__
+        lineage = [(project_id, data.get('parent_id'))]
+        lineage.extend(_edges(data.get('parents')))
+        return lineage, _edges(data.get('subtree'))
+
+
+class FileHierarchyDriver(object):
+    """Load the project hierarchy from a local JSON file.
+
+    The file holds a single object mapping every project ID to the ID
+    of its parent, or null for root projects.  All API workers on a
+    node share the file; its modification time is used as the version
+    of the hierarchy so a rewrite invalidates every worker's cache.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.last_modified = None
+
+    def _get_file_handle(self, filename):
+        """Get file handle. Broken out for testing."""
+        return open(filename)
+
+    def _get_file_timestamp(self, filename):
+        """Get the last modified time. Broken out for testing."""
+        try:
+            return os.path.getmtime(filename)
+        except os.error as e:
+            LOG.error(_LE("Could not stat project hierarchy file "
+                          "%(filename)s: '%(e)s'"),
+                      {'filename': filename, 'e': e})
+
+    def _load(self):
+        filename = CONF.project_hierarchy_file
+        if not filename:
+            return self.data
+        last_modified = self._get_file_timestamp(filename)
+        if last_modified is None or last_modified == self.last_modified:
+            return self.data
+        try:
+            self.data = jsonutils.load(self._get_file_handle(filename))
+        except ValueError as e:
+            LOG.error(_LE("Could not decode project hierarchy file "
+                          "%(filename)s: '%(e)s'"),
+                      {'filename': filename, 'e': e})
+            self.data = {}
+        self.last_modified = last_modified
+        return self.data
+
+    def get_scope(self, context):
+        """Every caller sees the whole hierarchy of the file."""
+        return None
+
+    def get_version(self, context):
+        self._load()
+        return self.last_modified
+
+    def get_hierarchy(self, context, project_id):
+        data = self._load()
+        if project_id not in data:
+            raise exception.ProjectNotFound(project_id=project_id)
+
+        lineage = []
+        seen = set()
+        node = project_id
+        while node is not None and node not in seen:
+            seen.add(node)
+            lineage.append((node, data.get(node)))
+            node = data.get(node)
+
+        children = {}
+        for node, parent in six.iteritems(data):
+            children.setdefault(parent, []).append(node)
+        subtree = []
+        pending = [project_id]
+        while pending:
+            parent = pending.pop()
+            for node in children.get(parent, []):
+                subtree.append((node, parent))
+                pending.append(node)
+        return lineage, subtree
+
+
+class _Edges(object):
+    """Cached edges of the hierarchy as seen from one scope."""
+
+    def __init__(self):
+        self.parents = {}
+        self.children = {}
+        self.parent_expires = {}
+        self.children_expires = {}
+        # Expiry of the projects the driver was asked about, if the scope
+        # limits the projects the cache answers about.
+        self.loaded = {}
+        self.expires = 0
+
+
+class ProjectHierarchy(object):
+    """Process-local cache of parent/child edges between projects.
+
+    Every edge carries its own expiry time.  Lookups walk the cached
+    edges and only go to the driver when one of the edges they need is
+    missing or stale; a single driver call then refreshes the lineage
+    and the whole subtree of the project being looked up.
+
+    The edges are cached by the scope the driver returns for the
+    context.  Unless that scope is None, a lookup is only answered from
+    the cache if the driver was asked about the same project with the
+    same scope within project_hierarchy_cache_ttl, so that the driver
+    keeps checking the access of each scope to each project.
+    """
+
+    def __init__(self, hierarchy_driver_class=None):
+        self._driver_cls = hierarchy_driver_class
+        self.__driver = None
+        self._version = None
+        self.invalidate()
+
+    @property
+    def _driver(self):
+        if self.__driver:
+            return self.__driver
+        if not self._driver_cls:
+            self._driver_cls = CONF.project_hierarchy_driver
+        if isinstance(self._driver_cls, six.string_types):
+            self._driver_cls = importutils.import_object(self._driver_cls)
+        self.__driver = self._driver_cls
+        return self.__driver
+
+    def invalidate(self, project_id=None):
+        """Drop cached edges.
+
+        :param project_id: If given, only the entries of this project
+                           and of its cached ancestors are dropped, which
+                           is enough after the project has been created,
+                           moved or deleted.  Otherwise the whole cache
+                           is flushed.
+        """
+        if project_id is None:
+            self._scopes = {}
+            return
+        for edges in self._scopes.values():
+            node = project_id
+            seen = set()
+            while node is not None and node not in seen:
+                seen.add(node)
+                edges.parent_expires.pop(node, None)
+                edges.children_expires.pop(node, None)
+                edges.loaded.pop(node, None)
+                node = edges.parents.get(node)
+
+    def _check_version(self, context):
+        version = self._driver.get_version(context)
+        if version != self._version:
+            self.invalidate()
+            self._version = version
+
+    def _is_fresh(self, expires, project_id, now):
+        # NOTE: now is None right after a load from the driver, when the
+        # entries are known to be current even if the TTL is 0.
+        if now is None:
+            return project_id in expires
+        return project_id in expires and expires[project_id] > now
+
+    def _load(self, edges, scope, context, project_id):
+        lineage, subtree = self._driver.get_hierarchy(context, project_id)
+        now = timeutils.utcnow_ts()
+        expires = now + CONF.project_hierarchy_cache_ttl
+
+        # NOTE: Drop the scopes whose entries have all expired, so that
+        # the cache does not grow with every token it has seen.
+        for other in list(self._scopes):
+            if other != scope and self._scopes[other].expires <= now:
+                del self._scopes[other]
+
+        edges.expires = expires
+        if scope is not None:
+            edges.loaded[project_id] = expires
+
+        for node, parent in lineage:
+            edges.parents[node] = parent
+            edges.parent_expires[node] = expires
+            if parent in edges.children:
+                edges.children[parent].add(node)
+
+        # NOTE: The subtree is complete, so the children of every node in
+        # it are rebuilt from scratch to forget projects which are gone.
+        for node in [project_id] + [n for n, _p in subtree]:
+            edges.children[node] = set()
+            edges.children_expires[node] = expires
+        for node, parent in subtree:
+            edges.parents[node] = parent
+            edges.parent_expires[node] = expires
+            edges.children.setdefault(parent, set()).add(node)
+
+    def _lookup(self, context, project_id, walk):
+        """Run walk against the cache, loading from the driver if needed.
+
+        walk is called with the edges of the scope of context and the
+        current time, and returns a (result, complete) tuple; complete is
+        False when it met a stale entry.
+        """
+        self._check_version(context)
+        scope = self._driver.get_scope(context)
+        edges = self._scopes.setdefault(scope, _Edges())
+        now = timeutils.utcnow_ts()
+        if scope is None or self._is_fresh(edges.loaded, project_id, now):
+            result, complete = walk(edges, now)
+            if complete:
+                return result
+        self._load(edges, scope, context, project_id)
+        result, complete = walk(edges, None)
+        return result
+
+    def get_parent(self, context, project_id):
+        """Return the parent ID of a project, or None for a root project."""
+        def walk(edges, now):
+            return (edges.parents.get(project_id),
+                    self._is_fresh(edges.parent_expires, project_id, now))
+
+        return self._lookup(context, project_id, walk)
+
+    def get_ancestors(self, context, project_id):
+        """Return the IDs of the ancestors of a project, parent first."""
+        def walk(edges, now):
+            ancestors = []
+            node = project_id
+            while self._is_fresh(edges.parent_expires, node, now):
+                node = edges.parents.get(node)
+                if node is None or node in ancestors:
+                    return ancestors, True
+                ancestors.append(node)
+            return ancestors, False
+
+        return self._lookup(context, project_id, walk)
+
+    def get_children(self, context, project_id):
+        """Return the IDs of the immediate children of a project."""
+        def walk(edges, now):
+            return (sorted(edges.children.get(project_id, ())),
+                    self._is_fresh(edges.children_expires, project_id, now))
+
+        return self._lookup(context, project_id, walk)
+
+    def get_subtree(self, context, project_id):
+        """Return the IDs of every descendant of a project."""
+        def walk(edges, now):
+            subtree = []
+            pending = [project_id]
+            while pending:
+                node = pending.pop()
+                if not self._is_fresh(edges.children_expires, node, now):
+                    return subtree, False
+                children = sorted(edges.children.get(node, ()))
+                subtree.extend(children)
+                pending.extend(children)
+            return subtree, True
+
+        return self._lookup(context, project_id, walk)
+
+
+HIERARCHY = ProjectHierarchy()
@@ -16,15 +16,19 @@
 
 """Quotas for instances, and floating ips."""
 
+import collections
 import datetime
 import six
 
 from nova import db
 from nova import exception
 from nova.i18n import _LE
+from nova.i18n import _LW
 from nova import objects
 from nova.openstack.common import log as logging
+from nova import project_hierarchy
 from oslo.config import cfg
+from oslo.utils import excutils
 from oslo.utils import importutils
 from oslo.utils import timeutils
 
@@ -83,15 +87,97 @@ quota_opts = [
     cfg.IntOpt('max_age',
                default=0,
                help='Number of seconds between subsequent usage refreshes'),
+    cfg.BoolOpt('quota_usage_refresh_in_background',
+                default=False,
+                help='Leave the usage refreshes triggered by until_refresh '
+                     'and max_age to a periodic task of the scheduler '
+                     'instead of counting the resources while the usages '
+                     'are locked by a reservation. Usages are then only '
+                     'moved by the deltas of committed reservations '
+                     'between two runs of that task'),
     cfg.StrOpt('quota_driver',
                default='nova.quota.NestedQuotaDriver',
                help='Driver to use for nested quota checks'),
+    cfg.IntOpt('quota_limits_cache_size',
+               default=1000,
+               help='Maximum number of quota limit sets kept in the '
+                    'process-local limits cache. 0 disables the cache'),
+    cfg.IntOpt('quota_limits_cache_ttl',
+               default=60,
+               help='Number of seconds a cached quota limit set is trusted '
+                    'before it is read again from the database'),
+    cfg.IntOpt('quota_limits_generation_interval',
+               default=1,
+               help='Minimum number of seconds between two checks of the '
+                    'quota generation counter, which is bumped in the '
+                    'database whenever a quota limit changes'),
     ]
 
 CONF = cfg.CONF
 CONF.register_opts(quota_opts)
 
 
+class QuotaLimitsCache(object):
+    """Process-local LRU cache of quota limits.
+
+    Limits change rarely compared with the reservations checked against
+    them, so the quota drivers keep the limits they read in this cache.
+    An entry is dropped once it is older than quota_limits_cache_ttl, and
+    the whole cache is flushed as soon as the quota generation counter
+    stored in the database changes.  The counter is read at most once
+    every quota_limits_generation_interval seconds, so a lookup which
+    hits the cache costs no database query.
+
+    Usages are never cached; they are always read inside the
+    reservation transaction.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.invalidate()
+
+    def invalidate(self):
+        """Drop every cached entry."""
+        self._entries = collections.OrderedDict()
+        self._generation = None
+        self._next_check = 0
+
+    def _check_generation(self, context, now):
+        if now < self._next_check:
+            return
+        generation = db.quota_generation_get(context)
+        if generation != self._generation:
+            self._entries.clear()
+            self._generation = generation
+        self._next_check = now + CONF.quota_limits_generation_interval
+
+    def get(self, context, key, loader):
+        """Return the cached value of key, calling loader on a miss.
+
+        The value returned is a copy, so callers may modify it.
+        """
+        if CONF.quota_limits_cache_size <= 0:
+            self.misses += 1
+            return loader()
+
+        now = timeutils.utcnow_ts()
+        self._check_generation(context, now)
+        entry = self._entries.pop(key, None)
+        if entry is not None and entry[0] > now:
+            self.hits += 1
+        else:
+            self.misses += 1
+            entry = (now + CONF.quota_limits_cache_ttl, loader())
+        self._entries[key] = entry
+        while len(self._entries) > CONF.quota_limits_cache_size:
+            self._entries.popitem(last=False)
+        return dict(entry[1])
+
+
+LIMITS_CACHE = QuotaLimitsCache()
+
+
 class DbQuotaDriver(object):
     """Driver to perform necessary checks to enforce quotas and obtain
     quota information.  The default driver utilizes the local
@@ -154,22 +240,39 @@ class DbQuotaDriver(object):
 
         return quotas
 
+    def _get_class_quotas_for_project(self, context, project_id,
+                                      quota_class=None, cache=None):
+        """Return the class quotas which apply to a project.
+
+        :param cache: Optional dict of class name to class quotas, used
+                      to load each class only once for many projects.
+        """
+        if project_id == context.project_id:
+            quota_class = context.quota_class
+        if not quota_class:
+            return {}
+        if cache is None:
+            return db.quota_class_get_all_by_name(context, quota_class)
+        if quota_class not in cache:
+            cache[quota_class] = db.quota_class_get_all_by_name(context,
+                                                                quota_class)
+        return cache[quota_class]
+
     def _process_quotas(self, context, resources, project_id, quotas,
                         quota_class=None, defaults=True, usages=None,
-                        remains=False):
+                        remains=False, class_quotas=None,
+                        default_quotas=None):
         modified_quotas = {}
         # Get the quotas for the appropriate class.  If the project ID
         # matches the one in the context, we use the quota_class from
         # the context, otherwise, we use the provided quota_class (if
         # any)
-        if project_id == context.project_id:
-            quota_class = context.quota_class
-        if quota_class:
-            class_quotas = db.quota_class_get_all_by_name(context, quota_class)
-        else:
-            class_quotas = {}
+        if class_quotas is None:
+            class_quotas = self._get_class_quotas_for_project(
+                context, project_id, quota_class)
 
-        default_quotas = self.get_defaults(context, resources)
+        if default_quotas is None:
+            default_quotas = self.get_defaults(context, resources)
         for resource in resources.values():
             # Omit default/quota class values
             if not defaults and resource.name not in quotas:
@@ -282,6 +385,60 @@ class DbQuotaDriver(object):
                                     defaults=defaults, usages=project_usages,
                                     remains=remains)
 
+    def get_projects_quotas(self, context, resources, project_ids,
+                            quota_class=None, defaults=True, usages=True):
+        """Given a list of resources, retrieve the quotas for several
+        projects at once.
+
+        The limits, class quotas, defaults and usages of all the projects
+        are loaded with a fixed number of queries, however many projects
+        are requested.
+
+        :param context: The request context, for access checks.
+        :param resources: A dictionary of the registered resources.
+        :param project_ids: The IDs of the projects to return quotas for.
+        :param quota_class: The quota class of the projects other than
+                            context.project_id.
+        :param defaults: If True, the quota class value (or the
+                         default value, if there is no value from the
+                         quota class) will be reported if there is no
+                         specific value for the resource.
+        :param usages: If True, the current in_use and reserved counts
+                       will also be returned.
+        :return: A dict of project ID to the quotas of the project, as
+                 returned by get_project_quotas.
+        """
+        project_ids = list(project_ids)
+        projects_quotas = db.quota_get_all_by_projects(context, project_ids)
+        projects_usages = {}
+        if usages:
+            projects_usages = db.quota_usage_get_all_by_projects(context,
+                                                                 project_ids)
+        default_quotas = self.get_defaults(context, resources)
+        class_cache = {}
+
+        result = {}
+        for project_id in project_ids:
+            class_quotas = self._get_class_quotas_for_project(
+                context, project_id, quota_class, cache=class_cache)
+            result[project_id] = self._process_quotas(
+                context, resources, project_id, projects_quotas[project_id],
+                quota_class, defaults=defaults,
+                usages=projects_usages.get(project_id),
+                class_quotas=class_quotas, default_quotas=default_quotas)
+        return result
+
+    def get_subtree_quotas(self, context, resources, project_id,
+                           quota_class=None, defaults=True):
+        """Given a list of resources, retrieve the quotas of a project
+        with the usages of its whole subtree.
+
+        Projects are flat with this driver, so these are the project's
+        own usages.
+        """
+        return self.get_project_quotas(context, resources, project_id,
+                                       quota_class, defaults=defaults)
+
     def _is_unlimited_value(self, v):
         """A helper method to check for unlimited value.
         """
@@ -380,21 +537,27 @@ class DbQuotaDriver(object):
             unknown = desired - set(sub_resources.keys())
             raise exception.QuotaResourceUnknown(unknown=sorted(unknown))
 
-        if user_id:
-            # Grab and return the quotas (without usages)
-            quotas = self.get_user_quotas(context, sub_resources,
-                                          project_id, user_id,
-                                          context.quota_class, usages=False,
-                                          project_quotas=project_quotas)
-        else:
-            # Grab and return the quotas (without usages)
-            quotas = self.get_project_quotas(context, sub_resources,
-                                             project_id,
-                                             context.quota_class,
-                                             usages=False,
-                                             project_quotas=project_quotas)
-
-        return {k: v['limit'] for k, v in quotas.items()}
+        def _load():
+            if user_id:
+                # Grab and return the quotas (without usages)
+                quotas = self.get_user_quotas(context, sub_resources,
+                                              project_id, user_id,
+                                              context.quota_class,
+                                              usages=False,
+                                              project_quotas=project_quotas)
+            else:
+                # Grab and return the quotas (without usages)
+                quotas = self.get_project_quotas(context, sub_resources,
+                                                 project_id,
+                                                 context.quota_class,
+                                                 usages=False,
+                                                 project_quotas=project_quotas)
+
+            return {k: v['limit'] for k, v in quotas.items()}
+
+        key = ('limits', project_id, user_id, context.quota_class,
+               tuple(sorted(sub_resources)))
+        return LIMITS_CACHE.get(context, key, _load)
 
     def limit_check(self, context, resources, values, project_id=None,
                     user_id=None):
@@ -439,7 +602,9 @@ class DbQuotaDriver(object):
             user_id = context.user_id
 
         # Get the applicable quotas
-        project_quotas = db.quota_get_all_by_project(context, project_id)
+        project_quotas = LIMITS_CACHE.get(
+            context, ('project', project_id),
+            lambda: db.quota_get_all_by_project(context, project_id))
         quotas = self._get_quotas(context, resources, values.keys(),
                                   has_sync=False, project_id=project_id,
                                   project_quotas=project_quotas)
@@ -524,7 +689,9 @@ class DbQuotaDriver(object):
         # NOTE(Vek): We're not worried about races at this point.
         #            Yes, the admin may be in the process of reducing
         #            quotas, but that's a pretty rare thing.
-        project_quotas = db.quota_get_all_by_project(context, project_id)
+        project_quotas = LIMITS_CACHE.get(
+            context, ('project', project_id),
+            lambda: db.quota_get_all_by_project(context, project_id))
         quotas = self._get_quotas(context, resources, deltas.keys(),
                                   has_sync=True, project_id=project_id,
                                   project_quotas=project_quotas)
@@ -538,10 +705,62 @@ class DbQuotaDriver(object):
         #            which means access to the session.  Since the
         #            session isn't available outside the DBAPI, we
         #            have to do the work there.
-        return db.quota_reserve(context, resources, quotas, user_quotas,
-                                deltas, expire,
-                                CONF.until_refresh, CONF.max_age,
-                                project_id=project_id, user_id=user_id)
+        return db.quota_reserve(
+            context, resources, quotas, user_quotas, deltas, expire,
+            CONF.until_refresh, CONF.max_age,
+            project_id=project_id, user_id=user_id,
+            sync_usages=not CONF.quota_usage_refresh_in_background)
+
+    def consume(self, context, resources, deltas, project_id=None,
+                user_id=None):
+        """Check quotas and apply the deltas to the usages at once.
+
+        This is reserve() followed by commit() in a single transaction,
+        without any reservation, for operations which are complete as
+        soon as their quota is taken, such as creating a security
+        group.  A failed operation gives its quota back by consuming
+        the opposite deltas.
+
+        This method will raise a QuotaResourceUnknown exception if a
+        given resource is unknown or if it does not have a usage
+        synchronization function, and an OverQuota exception if any of
+        the proposed values is over the defined quota.
+
+        :param context: The request context, for access checks.
+        :param resources: A dictionary of the registered resources.
+        :param deltas: A dictionary of the proposed delta changes.
+        :param project_id: Specify the project_id if current context
+                           is admin and admin wants to impact on
+                           common user's tenant.
+        :param user_id: Specify the user_id if current context
+                        is admin and admin wants to impact on
+                        common user.
+        """
+        _valid_method_call_check_resources(deltas, 'reserve')
+
+        # If project_id is None, then we use the project_id in context
+        if project_id is None:
+            project_id = context.project_id
+        # If user_id is None, then we use the user_id in context
+        if user_id is None:
+            user_id = context.user_id
+
+        project_quotas = LIMITS_CACHE.get(
+            context, ('project', project_id),
+            lambda: db.quota_get_all_by_project(context, project_id))
+        quotas = self._get_quotas(context, resources, deltas.keys(),
+                                  has_sync=True, project_id=project_id,
+                                  project_quotas=project_quotas)
+        user_quotas = self._get_quotas(context, resources, deltas.keys(),
+                                       has_sync=True, project_id=project_id,
+                                       user_id=user_id,
+                                       project_quotas=project_quotas)
+
+        db.quota_consume(
+            context, resources, quotas, user_quotas, deltas,
+            CONF.until_refresh, CONF.max_age,
+            project_id=project_id, user_id=user_id,
+            sync_usages=not CONF.quota_usage_refresh_in_background)
 
     def commit(self, context, reservations, project_id=None, user_id=None):
         """Commit reservations.
@@ -650,6 +869,17 @@ class DbQuotaDriver(object):
 
         db.reservation_expire(context)
 
+    def usage_reconcile(self, context, resources):
+        """Refresh the usages which reservations marked for a refresh.
+
+        :param context: The request context, for access checks.
+        :param resources: A dictionary of the registered resources.
+        :return: The number of usages refreshed.
+        """
+
+        return db.quota_usage_reconcile(context, resources,
+                                        CONF.until_refresh)
+
 
 class NestedQuotaDriver(object):
     """Driver to perform necessary checks to enforce nested quotas and
@@ -713,23 +943,40 @@ class NestedQuotaDriver(object):
 
         return quotas
 
+    def _get_class_quotas_for_project(self, context, project_id,
+                                      quota_class=None, cache=None):
+        """Return the class quotas which apply to a project.
+
+        :param cache: Optional dict of class name to class quotas, used
+                      to load each class only once for many projects.
+        """
+        if project_id == context.project_id:
+            quota_class = context.quota_class
+        if not quota_class:
+            return {}
+        if cache is None:
+            return db.quota_class_get_all_by_name(context, quota_class)
+        if quota_class not in cache:
+            cache[quota_class] = db.quota_class_get_all_by_name(context,
+                                                                quota_class)
+        return cache[quota_class]
+
     def _process_quotas(self, context, resources, project_id, quotas,
                         quota_class=None, defaults=True,
-                        usages=None, remains=False):
+                        usages=None, remains=False, class_quotas=None,
+                        default_quotas=None):
         modified_quotas = {}
 
         # Get the quotas for the appropriate class.  If the project ID
         # matches the one in the context, we use the quota_class from
         # the context, otherwise, we use the provided quota_class (if
         # any)
-        if project_id == context.project_id:
-            quota_class = context.quota_class
-        if quota_class:
-            class_quotas = db.quota_class_get_all_by_name(context, quota_class)
-        else:
-            class_quotas = {}
+        if class_quotas is None:
+            class_quotas = self._get_class_quotas_for_project(
+                context, project_id, quota_class)
 
-        default_quotas = self.get_defaults(context, resources)
+        if default_quotas is None:
+            default_quotas = self.get_defaults(context, resources)
         for resource in resources.values():
             # Omit default/quota class values
             if not defaults and resource.name not in quotas:
@@ -844,6 +1091,90 @@ class NestedQuotaDriver(object):
                                     defaults=defaults, usages=project_usages,
                                     remains=remains)
 
+    def get_projects_quotas(self, context, resources, project_ids,
+                            quota_class=None, defaults=True, usages=True):
+        """Given a list of resources, retrieve the quotas for several
+        projects at once.
+
+        The limits, class quotas, defaults and usages of all the projects
+        are loaded with a fixed number of queries, however many projects
+        are requested.
+
+        :param context: The request context, for access checks.
+        :param resources: A dictionary of the registered resources.
+        :param project_ids: The IDs of the projects to return quotas for.
+        :param quota_class: The quota class of the projects other than
+                            context.project_id.
+        :param defaults: If True, the quota class value (or the
+                         default value, if there is no value from the
+                         quota class) will be reported if there is no
+                         specific value for the resource.
+        :param usages: If True, the current in_use and reserved counts
+                       will also be returned.
+        :return: A dict of project ID to the quotas of the project, as
+                 returned by get_project_quotas, with the quota each
+                 project allocated to its children as 'allocated'.
+        """
+        project_ids = list(project_ids)
+        projects_quotas, projects_allocated = (
+            db.quota_and_allocated_get_all_by_projects(context, project_ids))
+        projects_usages = {}
+        if usages:
+            projects_usages = db.quota_usage_get_all_by_projects(context,
+                                                                 project_ids)
+        default_quotas = self.get_defaults(context, resources)
+        class_cache = {}
+
+        result = {}
+        for project_id in project_ids:
+            class_quotas = self._get_class_quotas_for_project(
+                context, project_id, quota_class, cache=class_cache)
+            result[project_id] = self._process_quotas(
+                context, resources, project_id, projects_quotas[project_id],
+                quota_class, defaults=defaults,
+                usages=projects_usages.get(project_id),
+                class_quotas=class_quotas, default_quotas=default_quotas)
+            allocated = projects_allocated[project_id]
+            for key, value in result[project_id].items():
+                value['allocated'] = allocated.get(key, 0)
+        return result
+
+    def get_subtree_quotas(self, context, resources, project_id,
+                           quota_class=None, defaults=True):
+        """Given a list of resources, retrieve the quotas of a project
+        with the usages of its whole subtree.
+
+        The usages are read from the subtree usages kept up to date by
+        reservations.  Those the project does not have yet are first
+        built from the usages of the project and of its descendants.
+
+        :param context: The request context, for access checks.
+        :param resources: A dictionary of the registered resources.
+        :param project_id: The ID of the project to return quotas for.
+        :param quota_class: If project_id != context.project_id, the
+                            quota class cannot be determined.  This
+                            parameter allows it to be specified.
+        :param defaults: If True, the quota class value (or the
+                         default value, if there is no value from the
+                         quota class) will be reported if there is no
+                         specific value for the resource.
+        """
+        project_quotas = db.quota_get_all_by_project(context, project_id)
+        keys = [key for key, resource in resources.items()
+                if hasattr(resource, 'sync')]
+        subtree_usages = db.quota_subtree_usage_get_all_by_project(
+            context, project_id)
+        if any(key not in subtree_usages for key in keys):
+            parent_id = project_hierarchy.HIERARCHY.get_parent(context,
+                                                               project_id)
+            subtree = project_hierarchy.HIERARCHY.get_subtree(context,
+                                                              project_id)
+            subtree_usages = db.quota_subtree_usage_create_missing(
+                context, project_id, parent_id, subtree, keys)
+        return self._process_quotas(context, resources, project_id,
+                                    project_quotas, quota_class,
+                                    defaults=defaults, usages=subtree_usages)
+
     def _is_unlimited_value(self, v):
         """A helper method to check for unlimited value.
         """
@@ -963,21 +1294,74 @@ class NestedQuotaDriver(object):
             unknown = desired - set(sub_resources.keys())
             raise exception.QuotaResourceUnknown(unknown=sorted(unknown))
 
-        if user_id:
-            # Grab and return the quotas (without usages)
-            quotas = self.get_user_quotas(context, sub_resources,
-                                          project_id, user_id,
-                                          context.quota_class, usages=False,
-                                          project_quotas=project_quotas)
-        else:
-            # Grab and return the quotas (without usages)
-            quotas = self.get_project_quotas(context, sub_resources,
-                                             project_id,
-                                             context.quota_class,
-                                             usages=False,
-                                             project_quotas=project_quotas)
-
-        return {k: v['limit'] for k, v in quotas.items()}
+        def _load():
+            if user_id:
+                # Grab and return the quotas (without usages)
+                quotas = self.get_user_quotas(context, sub_resources,
+                                              project_id, user_id,
+                                              context.quota_class,
+                                              usages=False,
+                                              project_quotas=project_quotas)
+            else:
+                # Grab and return the quotas (without usages)
+                quotas = self.get_project_quotas(context, sub_resources,
+                                                 project_id,
+                                                 context.quota_class,
+                                                 usages=False,
+                                                 project_quotas=project_quotas)
+
+            return {k: v['limit'] for k, v in quotas.items()}
+
+        key = ('limits', project_id, user_id, context.quota_class,
+               tuple(sorted(sub_resources)))
+        return LIMITS_CACHE.get(context, key, _load)
+
+    def _get_hierarchy(self, context, resources, keys, project_id,
+                       quotas):
+        """Return the lineage of a project with the limits of each node.
+
+        The result is a list of (project_id, parent_id, quotas) tuples
+        from the project itself up to its root, as expected by
+        db.quota_reserve.  If the hierarchy cannot be loaded, the lineage
+        recorded in the subtree usages of the project is used instead,
+        and the error is raised if no complete lineage was recorded.
+        """
+        try:
+            ancestors = project_hierarchy.HIERARCHY.get_ancestors(
+                context, project_id)
+        except (exception.Forbidden, exception.ProjectNotFound):
+            with excutils.save_and_reraise_exception() as ctxt:
+                lineage = db.quota_subtree_lineage_get(context, project_id)
+                if lineage and lineage[-1][1] is None:
+                    LOG.warning(_LW("Could not load the hierarchy of "
+                                    "project %s, using the lineage recorded "
+                                    "in its subtree usages."), project_id)
+                    ancestors = [node for node, _parent in lineage[1:]]
+                    ctxt.reraise = False
+
+        parents = ancestors + [None]
+        hierarchy = [(project_id, parents[0], quotas)]
+        for node, parent in zip(ancestors, parents[1:]):
+            node_quotas = self._get_quotas(context, resources, keys,
+                                           has_sync=True, project_id=node)
+            hierarchy.append((node, parent, node_quotas))
+        return hierarchy
+
+    def _call_with_subtrees(self, context, func, *args, **kwargs):
+        """Call db.quota_reserve or db.quota_consume, giving it the
+        subtrees of the projects whose subtree usages it has yet to count.
+
+        The subtree usages of those projects cannot be counted without
+        their subtrees, so the call fails if they cannot be loaded.
+        """
+        try:
+            return func(*args, **kwargs)
+        except exception.QuotaSubtreeUsageMissing as e:
+            project_ids = e.kwargs['project_ids']
+        subtrees = {node: project_hierarchy.HIERARCHY.get_subtree(context,
+                                                                  node)
+                    for node in project_ids}
+        return func(*args, subtrees=subtrees, **kwargs)
 
     def limit_check(self, context, resources, values, project_id=None,
                     user_id=None):
@@ -1022,7 +1406,9 @@ class NestedQuotaDriver(object):
             user_id = context.user_id
 
         # Get the applicable quotas
-        project_quotas = db.quota_get_all_by_project(context, project_id)
+        project_quotas = LIMITS_CACHE.get(
+            context, ('project', project_id),
+            lambda: db.quota_get_all_by_project(context, project_id))
         quotas = self._get_quotas(context, resources, values.keys(),
                                   has_sync=False, project_id=project_id,
                                   project_quotas=project_quotas)
@@ -1107,7 +1493,9 @@ class NestedQuotaDriver(object):
         # NOTE(Vek): We're not worried about races at this point.
         #            Yes, the admin may be in the process of reducing
         #            quotas, but that's a pretty rare thing.
-        project_quotas = db.quota_get_all_by_project(context, project_id)
+        project_quotas = LIMITS_CACHE.get(
+            context, ('project', project_id),
+            lambda: db.quota_get_all_by_project(context, project_id))
         quotas = self._get_quotas(context, resources, deltas.keys(),
                                   has_sync=True, project_id=project_id,
                                   project_quotas=project_quotas)
@@ -1115,16 +1503,54 @@ class NestedQuotaDriver(object):
                                        has_sync=True, project_id=project_id,
                                        user_id=user_id,
                                        project_quotas=project_quotas)
+        hierarchy = self._get_hierarchy(context, resources, deltas.keys(),
+                                        project_id, quotas)
 
         # NOTE(Vek): Most of the work here has to be done in the DB
         #            API, because we have to do it in a transaction,
         #            which means access to the session.  Since the
         #            session isn't available outside the DBAPI, we
         #            have to do the work there.
-        return db.quota_reserve(context, resources, quotas, user_quotas,
-                                deltas, expire,
-                                CONF.until_refresh, CONF.max_age,
-                                project_id=project_id, user_id=user_id)
+        return self._call_with_subtrees(
+            context, db.quota_reserve,
+            context, resources, quotas, user_quotas, deltas, expire,
+            CONF.until_refresh, CONF.max_age,
+            project_id=project_id, user_id=user_id, hierarchy=hierarchy,
+            sync_usages=not CONF.quota_usage_refresh_in_background)
+
+    def consume(self, context, resources, deltas, project_id=None,
+                user_id=None):
+        """Like DbQuotaDriver.consume(), checking the quotas of the
+        ancestors of the project as well.
+        """
+        _valid_method_call_check_resources(deltas, 'reserve')
+
+        # If project_id is None, then we use the project_id in context
+        if project_id is None:
+            project_id = context.project_id
+        # If user_id is None, then we use the user_id in context
+        if user_id is None:
+            user_id = context.user_id
+
+        project_quotas = LIMITS_CACHE.get(
+            context, ('project', project_id),
+            lambda: db.quota_get_all_by_project(context, project_id))
+        quotas = self._get_quotas(context, resources, deltas.keys(),
+                                  has_sync=True, project_id=project_id,
+                                  project_quotas=project_quotas)
+        user_quotas = self._get_quotas(context, resources, deltas.keys(),
+                                       has_sync=True, project_id=project_id,
+                                       user_id=user_id,
+                                       project_quotas=project_quotas)
+        hierarchy = self._get_hierarchy(context, resources, deltas.keys(),
+                                        project_id, quotas)
+
+        self._call_with_subtrees(
+            context, db.quota_consume,
+            context, resources, quotas, user_quotas, deltas,
+            CONF.until_refresh, CONF.max_age,
+            project_id=project_id, user_id=user_id, hierarchy=hierarchy,
+            sync_usages=not CONF.quota_usage_refresh_in_background)
 
     def commit(self, context, reservations, project_id=None, user_id=None):
         """Commit reservations.
@@ -1233,6 +1659,17 @@ class NestedQuotaDriver(object):
 
         db.reservation_expire(context)
 
+    def usage_reconcile(self, context, resources):
+        """Refresh the usages which reservations marked for a refresh.
+
+        :param context: The request context, for access checks.
+        :param resources: A dictionary of the registered resources.
+        :return: The number of usages refreshed.
+        """
+
+        return db.quota_usage_reconcile(context, resources,
+                                        CONF.until_refresh)
+
 
 class NoopQuotaDriver(object):
     """Driver that turns quotas calls into no-ops and pretends that quotas
@@ -1347,6 +1784,44 @@ class NoopQuotaDriver(object):
         """
         return self._get_noop_quotas(resources, usages=usages, remains=remains)
 
+    def get_projects_quotas(self, context, resources, project_ids,
+                            quota_class=None, defaults=True, usages=True):
+        """Given a list of resources, retrieve the quotas for several
+        projects at once.
+
+        :param context: The request context, for access checks.
+        :param resources: A dictionary of the registered resources.
+        :param project_ids: The IDs of the projects to return quotas for.
+        :param quota_class: The quota class of the projects other than
+                            context.project_id.
+        :param defaults: If True, the quota class value (or the
+                         default value, if there is no value from the
+                         quota class) will be reported if there is no
+                         specific value for the resource.
+        :param usages: If True, the current in_use and reserved counts
+                       will also be returned.
+        """
+        return {project_id: self._get_noop_quotas(resources, usages=usages)
+                for project_id in project_ids}
+
+    def get_subtree_quotas(self, context, resources, project_id,
+                           quota_class=None, defaults=True):
+        """Given a list of resources, retrieve the quotas of a project
+        with the usages of its whole subtree.
+
+        :param context: The request context, for access checks.
+        :param resources: A dictionary of the registered resources.
+        :param project_id: The ID of the project to return quotas for.
+        :param quota_class: If project_id != context.project_id, the
+                            quota class cannot be determined.  This
+                            parameter allows it to be specified.
+        :param defaults: If True, the quota class value (or the
+                         default value, if there is no value from the
+                         quota class) will be reported if there is no
+                         specific value for the resource.
+        """
+        return self._get_noop_quotas(resources, usages=True)
+
     def get_settable_quotas(self, context, resources, project_id,
                             user_id=None):
         """Given a list of resources, retrieve the range of settable quotas for
@@ -1432,6 +1907,11 @@ class NoopQuotaDriver(object):
         """
         return []
 
+    def consume(self, context, resources, deltas, project_id=None,
+                user_id=None):
+        """Consume nothing."""
+        pass
+
     def commit(self, context, reservations, project_id=None, user_id=None):
         """Commit reservations.
 
@@ -1506,6 +1986,14 @@ class NoopQuotaDriver(object):
         """
         pass
 
+    def usage_reconcile(self, context, resources):
+        """Refresh the usages which reservations marked for a refresh.
+
+        :param context: The request context, for access checks.
+        :param resources: A dictionary of the registered resources.
+        """
+        return 0
+
 
 class BaseResource(object):
     """Describe a single resource for quota checking."""
@@ -1782,6 +2270,49 @@ class QuotaEngine(object):
                                               usages=usages,
                                               remains=remains)
 
+    def get_projects_quotas(self, context, project_ids, quota_class=None,
+                            defaults=True, usages=True):
+        """Retrieve the quotas for several projects at once.
+
+        :param context: The request context, for access checks.
+        :param project_ids: The IDs of the projects to return quotas for.
+        :param quota_class: The quota class of the projects other than
+                            context.project_id.
+        :param defaults: If True, the quota class value (or the
+                         default value, if there is no value from the
+                         quota class) will be reported if there is no
+                         specific value for the resource.
+        :param usages: If True, the current in_use and reserved counts
+                       will also be returned.
+        """
+
+        return self._driver.get_projects_quotas(context, self._resources,
+                                                project_ids,
+                                                quota_class=quota_class,
+                                                defaults=defaults,
+                                                usages=usages)
+
+    def get_subtree_quotas(self, context, project_id, quota_class=None,
+                           defaults=True):
+        """Retrieve the quotas of a project, with the usages of the project
+        and of all its descendants.
+
+        :param context: The request context, for access checks.
+        :param project_id: The ID of the project to return quotas for.
+        :param quota_class: If project_id != context.project_id, the
+                            quota class cannot be determined.  This
+                            parameter allows it to be specified.
+        :param defaults: If True, the quota class value (or the
+                         default value, if there is no value from the
+                         quota class) will be reported if there is no
+                         specific value for the resource.
+        """
+
+        return self._driver.get_subtree_quotas(context, self._resources,
+                                               project_id,
+                                               quota_class=quota_class,
+                                               defaults=defaults)
+
     def get_settable_quotas(self, context, project_id, parent_id=None,
                                                         user_id=None):
         """Given a list of resources, retrieve the range of settable quotas for
@@ -1893,6 +2424,36 @@ class QuotaEngine(object):
 
         return reservations
 
+    def consume(self, context, project_id=None, user_id=None, **deltas):
+        """Check quotas and apply the deltas to the usages at once.
+
+        This is the single-transaction equivalent of reserve() followed
+        by commit(), for operations which do not need to hold their
+        quota while they run.  No reservation is created, so there is
+        nothing to commit or roll back; an operation which fails after
+        consuming its quota gives it back by consuming the opposite
+        deltas.
+
+        This method will raise a QuotaResourceUnknown exception if a
+        given resource is unknown or if it does not have a usage
+        synchronization function, and an OverQuota exception with the
+        sorted list of the resources which are too high if any of the
+        proposed values is over the defined quota.
+
+        :param context: The request context, for access checks.
+        :param project_id: Specify the project_id if current context
+                           is admin and admin wants to impact on
+                           common user's tenant.
+        :param user_id: Specify the user_id if current context
+                        is admin and admin wants to impact on
+                        common user.
+        """
+
+        self._driver.consume(context, self._resources, deltas,
+                             project_id=project_id, user_id=user_id)
+
+        LOG.debug("Consumed quota %s", deltas)
+
     def commit(self, context, reservations, project_id=None, user_id=None):
         """Commit reservations.
 
@@ -1990,6 +2551,17 @@ class QuotaEngine(object):
 
         self._driver.expire(context)
 
+    def usage_reconcile(self, context):
+        """Refresh the usages left to be refreshed by reservations.
+
+        Only needed with quota_usage_refresh_in_background, where
+        reserve() never runs the sync functions itself.
+
+        :param context: The request context, for access checks.
+        """
+
+        return self._driver.usage_reconcile(context, self._resources)
+
     @property
     def resources(self):
         return sorted(self._resources.keys())
@@ -43,7 +43,8 @@ class CachingScheduler(filter_scheduler.FilterScheduler):
     Please note, the way this works, each scheduler worker has its own
     copy of the cache. So if you run multiple schedulers, you will get
     more retries, because the data stored on any additional scheduler will
-    be more out of date, than if it was fetched from the database.
+    be more out of date, than if it was fetched from the database, unless
+    the schedulers share their claims with scheduler_shared_claims.
 
     In a similar way, if you have a high number of server deletes, the
     extra capacity from those deletes will not show up until the cache is
@@ -69,6 +70,8 @@ class CachingScheduler(filter_scheduler.FilterScheduler):
             # comes in before the first run of the periodic task.
             # Rather than raise an error, we fetch the list of hosts.
             self.all_host_states = self._get_up_hosts(context)
+        else:
+            self.host_manager.consume_claims(self.all_host_states)
 
         return self.all_host_states
 
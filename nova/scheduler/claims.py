@@ -0,0 +1,165 @@
+# Copyright (c) 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Claims on host resources shared between scheduler workers.
+
+A scheduler worker consumes the resources of the hosts it picks from its
+own HostStates, so that the following requests it schedules take them
+into account.  Other workers only see them once the compute nodes report
+them, and meanwhile may pick the same resources, causing retries.
+
+With scheduler_shared_claims, every consumption is also published as a
+claim in memcached, expiring after scheduler_claim_ttl seconds, and
+every worker consumes the claims of the others from its HostStates
+before filtering.  Claims are numbered from a shared counter, so that
+a worker only reads the claims published since it last looked.  Without
+memcached_servers, claims are only shared within the process.
+"""
+
+import collections
+import datetime
+import uuid
+
+from oslo_config import cfg
+from oslo_serialization import jsonutils
+from oslo_utils import timeutils
+
+from nova.i18n import _LW
+from nova.openstack.common import log as logging
+from nova.openstack.common import memorycache
+from nova.virt import hardware
+
+claims_opts = [
+    cfg.BoolOpt('scheduler_shared_claims',
+                default=False,
+                help='Share the resources consumed by the instances each '
+                     'scheduler worker places with the other workers, '
+                     'through the memcached_servers, until the compute '
+                     'nodes report them.'),
+    cfg.IntOpt('scheduler_claim_ttl',
+               default=60,
+               help='Number of seconds a shared claim is kept for. Should '
+                    'be longer than it takes for a compute node to report '
+                    'a new instance.'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(claims_opts)
+CONF.import_opt('memcached_servers', 'nova.openstack.common.memorycache')
+
+LOG = logging.getLogger(__name__)
+
+SEQUENCE_KEY = 'scheduler-claims-sequence'
+CLAIM_KEY = 'scheduler-claim-%d'
+
+
+def _claimed_resources(instance):
+    """Return the parts of an instance a HostState consumes."""
+    resources = {key: instance[key]
+                 for key in ('memory_mb', 'root_gb', 'ephemeral_gb',
+                             'vcpus')}
+    numa_topology = hardware.instance_topology_from_instance(instance)
+    if numa_topology:
+        numa_topology = jsonutils.dumps(numa_topology.obj_to_primitive())
+    resources['numa_topology'] = numa_topology
+    return resources
+
+
+class SharedClaims(object):
+    """The claims published by all scheduler workers."""
+
+    def __init__(self):
+        self.mc = memorycache.get_client()
+        # Number of the newest claim read.
+        self.sequence = 0
+        # Claims numbered but not published yet when last looked for.
+        self.missing = set()
+        self.claims = {}
+
+    def publish(self, host_state, instance):
+        """Publish that instance was placed on host_state, which already
+        consumed it.
+        """
+        claim = {'id': str(uuid.uuid4()),
+                 'host': host_state.host,
+                 'node': host_state.nodename,
+                 'created_at': timeutils.utcnow(),
+                 'instance': _claimed_resources(instance)}
+        self.mc.add(SEQUENCE_KEY, '0')
+        number = self.mc.incr(SEQUENCE_KEY)
+        if number is None:
+            LOG.warning(_LW("Could not publish the claim of %(host_state)s, "
+                            "the claims sequence is missing"),
+                        {'host_state': host_state})
+            return
+        self.mc.set(CLAIM_KEY % number, claim, time=CONF.scheduler_claim_ttl)
+        host_state.claims.add(claim['id'])
+
+    def refresh(self):
+        """Read the claims published since the last refresh and forget the
+        expired ones.
+        """
+        sequence = int(self.mc.get(SEQUENCE_KEY) or 0)
+        if sequence < self.sequence:
+            # NOTE: The sequence was lost, e.g. memcached restarted; start
+            #       over.  Claims are identified by their id, not their
+            #       number.  Claims numbered again up to the previous
+            #       sequence before this worker looks are missed.
+            self.sequence = 0
+            self.missing = set()
+
+        retried = self.missing
+        self.missing = set()
+        for number in sorted(retried) + range(self.sequence + 1,
+                                              sequence + 1):
+            claim = self.mc.get(CLAIM_KEY % number)
+            if claim is not None:
+                self.claims[claim['id']] = claim
+            elif number not in retried:
+                # NOTE: The claim may be numbered but not published yet;
+                #       look for it once more on the next refresh.
+                self.missing.add(number)
+        self.sequence = sequence
+
+        expired = timeutils.utcnow() - datetime.timedelta(
+            seconds=CONF.scheduler_claim_ttl)
+        for claim_id, claim in self.claims.items():
+            if claim['created_at'] < expired:
+                del self.claims[claim_id]
+
+    def consume(self, host_states):
+        """Consume the claims not reported by their compute node yet from
+        host_states.
+        """
+        self.refresh()
+        claims_by_node = collections.defaultdict(list)
+        for claim in sorted(self.claims.values(),
+                            key=lambda claim: claim['created_at']):
+            claims_by_node[claim['host'], claim['node']].append(claim)
+
+        for host_state in host_states:
+            claims = claims_by_node.get(
+                (host_state.host, host_state.nodename), ())
+            reported_at = host_state.claims_since
+            if reported_at is not None:
+                reported_at = timeutils.normalize_time(reported_at)
+            for claim in claims:
+                if (claim['id'] in host_state.claims or
+                        reported_at is not None and
+                        claim['created_at'] <= reported_at):
+                    continue
+                host_state.consume_from_instance(claim['instance'])
+                host_state.claims.add(claim['id'])
@@ -19,6 +19,7 @@ You can customize this scheduler by specifying your own Host Filters and
 Weighing Functions.
 """
 
+import heapq
 import random
 
 from oslo_config import cfg
@@ -44,7 +45,14 @@ filter_scheduler_opts = [
                     'chosen from. A value of 1 chooses the '
                     'first host returned by the weighing functions. '
                     'This value must be at least 1. Any value less than 1 '
-                    'will be ignored, and 1 will be used instead')
+                    'will be ignored, and 1 will be used instead'),
+    cfg.BoolOpt('scheduler_batch_placement',
+                default=False,
+                help='Place the instances of a multi-instance request from '
+                     'a single filtering and weighing pass over the hosts, '
+                     'checking and weighing again only the hosts chosen '
+                     'from, instead of filtering and weighing every host '
+                     'again for each instance.'),
 ]
 
 CONF.register_opts(filter_scheduler_opts)
@@ -79,6 +87,14 @@ class FilterScheduler(driver.Scheduler):
             reason = _('There are not enough hosts available.')
             raise exception.NoValidHost(reason=reason)
 
+        group_uuid = filter_properties.get('group_uuid')
+        if group_uuid:
+            for instance_uuid, host in zip(
+                    request_spec.get('instance_uuids') or [],
+                    selected_hosts):
+                self.host_manager.group_index.add(group_uuid, instance_uuid,
+                                                  host.obj.host)
+
         dests = [dict(host=host.obj.host, nodename=host.obj.nodename,
                       limits=host.obj.limits) for host in selected_hosts]
 
@@ -108,8 +124,6 @@ class FilterScheduler(driver.Scheduler):
         instance_properties = request_spec['instance_properties']
         instance_type = request_spec.get("instance_type", None)
 
-        update_group_hosts = filter_properties.get('group_updated', False)
-
         config_options = self._get_configuration_options()
 
         filter_properties.update({'context': context,
@@ -120,6 +134,20 @@ class FilterScheduler(driver.Scheduler):
         self.populate_filter_properties(request_spec,
                                         filter_properties)
 
+        group_uuid = filter_properties.get('group_uuid')
+        if group_uuid:
+            # NOTE: The conductor left the hosts of the group to us, see
+            #       nova.scheduler.group_index.  A retry may come from a
+            #       compute node which found the policy of the group
+            #       violated by another scheduler, so read the group again.
+            retry = filter_properties.get('retry') or {}
+            refresh = retry.get('num_attempts', 1) > 1
+            filter_properties['group_hosts'] = (
+                set(filter_properties.get('group_hosts') or []) |
+                self.host_manager.group_index.get_hosts(elevated,
+                                                        group_uuid,
+                                                        refresh=refresh))
+
         # Find our local list of acceptable hosts by repeatedly
         # filtering and weighing our options. Each time we choose a
         # host, we virtually consume resources on it so subsequent
@@ -130,8 +158,13 @@ class FilterScheduler(driver.Scheduler):
         # are being scanned in a filter or weighing function.
         hosts = self._get_all_host_states(elevated)
 
-        selected_hosts = []
         num_instances = request_spec.get('num_instances', 1)
+        if CONF.scheduler_batch_placement and num_instances > 1:
+            return self._schedule_batch(hosts, num_instances,
+                                        instance_properties,
+                                        filter_properties)
+
+        selected_hosts = []
         for num in xrange(num_instances):
             # Filter local hosts based on requirements ...
             hosts = self.host_manager.get_filtered_hosts(hosts,
@@ -142,16 +175,16 @@ class FilterScheduler(driver.Scheduler):
 
             LOG.debug("Filtered %(hosts)s", {'hosts': hosts})
 
+            # Only the hosts a choice is made from need to be sorted.
+            scheduler_host_subset_size = max(
+                CONF.scheduler_host_subset_size, 1)
             weighed_hosts = self.host_manager.get_weighed_hosts(hosts,
-                    filter_properties)
+                    filter_properties, limit=scheduler_host_subset_size)
 
             LOG.debug("Weighed %(hosts)s", {'hosts': weighed_hosts})
 
-            scheduler_host_subset_size = CONF.scheduler_host_subset_size
             if scheduler_host_subset_size > len(weighed_hosts):
                 scheduler_host_subset_size = len(weighed_hosts)
-            if scheduler_host_subset_size < 1:
-                scheduler_host_subset_size = 1
 
             chosen_host = random.choice(
                 weighed_hosts[0:scheduler_host_subset_size])
@@ -159,17 +192,110 @@ class FilterScheduler(driver.Scheduler):
 
             # Now consume the resources so the filter/weights
             # will change for the next instance.
-            chosen_host.obj.consume_from_instance(instance_properties)
-            if update_group_hosts is True:
-                # NOTE(sbauza): Group details are serialized into a list now
-                # that they are populated by the conductor, we need to
-                # deserialize them
-                if isinstance(filter_properties['group_hosts'], list):
-                    filter_properties['group_hosts'] = set(
-                        filter_properties['group_hosts'])
-                filter_properties['group_hosts'].add(chosen_host.obj.host)
+            self._consume_chosen_host(chosen_host.obj, instance_properties,
+                                      filter_properties)
         return selected_hosts
 
+    def _schedule_batch(self, hosts, num_instances, instance_properties,
+                        filter_properties):
+        """Returns a list of hosts for num_instances instances, like
+        _schedule(), from a single filtering and weighing pass.
+
+        The hosts passing the filters for the first instance are kept in
+        a heap by weight.  For each following instance only the best
+        hosts are filtered again, one at a time, and only the chosen
+        host is weighed again once its resources are consumed, so that
+        placing N instances on H hosts takes about H + N log H filter
+        and weigher calls rather than N * H.  The other hosts are only
+        weighed again when the chosen host's new weight moves the bounds
+        the weights are normalized against.
+
+        A host which no longer passes the filters is dropped, which
+        assumes, as holds for the filters in tree, that only consuming
+        resources from a host or adding it to the group can change
+        whether it passes.
+        """
+        hosts = self.host_manager.get_filtered_hosts(hosts,
+                filter_properties, index=0)
+        if not hosts:
+            return []
+
+        LOG.debug("Filtered %(hosts)s", {'hosts': hosts})
+
+        # NOTE: Equal weights are ordered as the hosts were filtered, as
+        #       sorted() does.
+        positions = {host_state: i for i, host_state in enumerate(hosts)}
+        heap = self._weighed_heap(
+            self.host_manager.get_weighed_hosts(hosts, filter_properties),
+            positions)
+
+        scheduler_host_subset_size = max(CONF.scheduler_host_subset_size, 1)
+        selected_hosts = []
+        for num in xrange(num_instances):
+            candidates = []
+            while heap and len(candidates) < scheduler_host_subset_size:
+                weighed_host = heapq.heappop(heap)[2]
+                # Every host in the heap passed the filters for the first
+                # instance already.
+                if num == 0 or self.host_manager.get_filtered_hosts(
+                        [weighed_host.obj], filter_properties, index=num):
+                    candidates.append(weighed_host)
+            if not candidates:
+                # Can't get any more locally.
+                break
+
+            chosen_host = random.choice(candidates)
+            selected_hosts.append(chosen_host)
+            self._consume_chosen_host(chosen_host.obj, instance_properties,
+                                      filter_properties)
+
+            bounds = self._weigher_bounds()
+            reweighed_host = self.host_manager.get_weighed_hosts(
+                [chosen_host.obj], filter_properties)[0]
+            candidates[candidates.index(chosen_host)] = reweighed_host
+            if self._weigher_bounds() != bounds:
+                weighed_hosts = self.host_manager.get_weighed_hosts(
+                    [entry[2].obj for entry in heap] +
+                    [candidate.obj for candidate in candidates],
+                    filter_properties)
+                heap = self._weighed_heap(weighed_hosts, positions)
+            else:
+                for weighed_host in candidates:
+                    heapq.heappush(heap, (-weighed_host.weight,
+                                          positions[weighed_host.obj],
+                                          weighed_host))
+        return selected_hosts
+
+    @staticmethod
+    def _weighed_heap(weighed_hosts, positions):
+        """Return a heap of weighed_hosts, the heaviest first."""
+        heap = [(-weighed_host.weight, positions[weighed_host.obj],
+                 weighed_host)
+                for weighed_host in weighed_hosts]
+        heapq.heapify(heap)
+        return heap
+
+    def _weigher_bounds(self):
+        """Return the bounds the weighers normalize weights against."""
+        return [(weigher.minval, weigher.maxval)
+                for weigher in self.host_manager.weighers]
+
+    def _consume_chosen_host(self, host_state, instance_properties,
+                             filter_properties):
+        """Consume the resources of an instance from the host chosen for
+        it, so the filter/weights will change for the next instance.
+        """
+        host_state.consume_from_instance(instance_properties)
+        self.host_manager.claim(host_state, instance_properties)
+        if filter_properties.get('group_updated', False) is True:
+            # NOTE(sbauza): Group details are serialized into a list now
+            # that they are populated by the conductor, we need to
+            # deserialize them
+            if isinstance(filter_properties['group_hosts'], list):
+                filter_properties['group_hosts'] = set(
+                    filter_properties['group_hosts'])
+            filter_properties['group_hosts'].add(host_state.host)
+
     def _get_all_host_states(self, context):
         """Template method, so a subclass can implement caching."""
         return self.host_manager.get_all_host_states(context)
@@ -18,10 +18,18 @@ Scheduler host filters
 """
 
 from nova import filters
+from nova.scheduler import host_table
+from nova.scheduler import trace
 
 
 class BaseHostFilter(filters.BaseFilter):
     """Base class for host filters."""
+
+    # Set to true in a subclass if host_passes() only looks at the
+    # aggregates of the host, so that it may be run once for all the hosts
+    # in the same aggregates.
+    uses_aggregates_only = False
+
     def _filter_one(self, obj, filter_properties):
         """Return True if the object passes the filter, otherwise False."""
         return self.host_passes(obj, filter_properties)
@@ -32,11 +40,33 @@ class BaseHostFilter(filters.BaseFilter):
         """
         raise NotImplementedError()
 
+    def preselection(self, filter_properties):
+        """Return a function of a HostState which is False for the hosts
+        which cannot pass the filter, checked cheaply before any filter
+        is run; or None, as this default does, if the filter has no such
+        check.
+
+        The function must neither log nor set limits: host_passes() is
+        still run on the hosts it lets through.
+        """
+        return None
+
 
 class HostFilterHandler(filters.BaseFilterHandler):
     def __init__(self):
         super(HostFilterHandler, self).__init__(BaseHostFilter)
 
+    def _get_table(self, objs):
+        if host_table.enabled():
+            return host_table.HostStateTable(objs)
+
+    def _start_step(self):
+        return trace.start_step()
+
+    def _end_step(self, step, filter, index, objs_in, objs_out):
+        trace.end_step(step, 'filter', filter.__class__.__name__, index,
+                       objs_in, objs_out)
+
 
 def all_filters():
     """Return a list of filter classes found in this directory.
@@ -38,6 +38,7 @@ class AggregateImagePropertiesIsolation(filters.BaseHostFilter):
 
     # Aggregate data and instance type does not change within a request
     run_filter_once_per_request = True
+    uses_aggregates_only = True
 
     def host_passes(self, host_state, filter_properties):
         """Checks a host in an aggregate that metadata key/value match
@@ -48,9 +49,7 @@ class AggregateImagePropertiesIsolation(filters.BaseHostFilter):
 
         spec = filter_properties.get('request_spec', {})
         image_props = spec.get('image', {}).get('properties', {})
-        context = filter_properties['context']
-        metadata = utils.aggregate_metadata_get_by_host(context,
-                                                        host_state.host)
+        metadata = utils.aggregate_metadata_get_by_host(host_state)
 
         for key, options in metadata.iteritems():
             if (cfg_namespace and
@@ -30,6 +30,7 @@ class AggregateInstanceExtraSpecsFilter(filters.BaseHostFilter):
 
     # Aggregate data and instance type does not change within a request
     run_filter_once_per_request = True
+    uses_aggregates_only = True
 
     def host_passes(self, host_state, filter_properties):
         """Return a list of hosts that can create instance_type
@@ -41,9 +42,7 @@ class AggregateInstanceExtraSpecsFilter(filters.BaseHostFilter):
         if 'extra_specs' not in instance_type:
             return True
 
-        context = filter_properties['context']
-        metadata = utils.aggregate_metadata_get_by_host(context,
-                                                        host_state.host)
+        metadata = utils.aggregate_metadata_get_by_host(host_state)
 
         for key, req in instance_type['extra_specs'].iteritems():
             # Either not scope format, or aggregate_instance_extra_specs scope
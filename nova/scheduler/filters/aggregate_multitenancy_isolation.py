@@ -26,6 +26,7 @@ class AggregateMultiTenancyIsolation(filters.BaseHostFilter):
 
     # Aggregate data and tenant do not change within a request
     run_filter_once_per_request = True
+    uses_aggregates_only = True
 
     def host_passes(self, host_state, filter_properties):
         """If a host is in an aggregate that has the metadata key
@@ -39,9 +40,7 @@ class AggregateMultiTenancyIsolation(filters.BaseHostFilter):
         props = spec.get('instance_properties', {})
         tenant_id = props.get('project_id')
 
-        context = filter_properties['context']
-        metadata = utils.aggregate_metadata_get_by_host(context,
-                                                        host_state.host,
+        metadata = utils.aggregate_metadata_get_by_host(host_state,
                                                         key="filter_tenant_id")
 
         if metadata != {}:
@@ -35,6 +35,7 @@ class AvailabilityZoneFilter(filters.BaseHostFilter):
 
     # Availability zones do not change within a request
     run_filter_once_per_request = True
+    uses_aggregates_only = True
 
     def host_passes(self, host_state, filter_properties):
         spec = filter_properties.get('request_spec', {})
@@ -44,9 +45,8 @@ class AvailabilityZoneFilter(filters.BaseHostFilter):
         if not availability_zone:
             return True
 
-        context = filter_properties['context']
         metadata = utils.aggregate_metadata_get_by_host(
-                context, host_state.host, key='availability_zone')
+                host_state, key='availability_zone')
 
         if 'availability_zone' in metadata:
             hosts_passes = availability_zone in metadata['availability_zone']
@@ -48,3 +48,20 @@ class ComputeFilter(filters.BaseHostFilter):
                                 "while"), {'host_state': host_state})
                 return False
         return True
+
+    def filter_vectorized(self, table, filter_properties):
+        """Select only active compute nodes.
+
+        Disabled services are dropped at once; whether a service is up
+        depends on the servicegroup driver, so it is only checked for
+        the enabled ones.
+        """
+        passes = ~table.column('service_disabled')
+        for i, host_state in enumerate(table.objects):
+            if (passes[i] and
+                    not self.servicegroup_api.service_is_up(
+                        host_state.service)):
+                LOG.warning(_LW("%(host_state)s has not been heard from in a "
+                                "while"), {'host_state': host_state})
+                passes[i] = False
+        return passes
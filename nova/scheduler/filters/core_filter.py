@@ -40,6 +40,14 @@ class BaseCoreFilter(filters.BaseHostFilter):
     def _get_cpu_allocation_ratio(self, host_state, filter_properties):
         raise NotImplementedError
 
+    def _get_cpu_allocation_ratios(self, table, filter_properties):
+        """Return the ratio of each host of a HostStateTable, or a single
+        ratio shared by all of them.
+        """
+        return table.column_from(
+            lambda host_state: self._get_cpu_allocation_ratio(
+                host_state, filter_properties))
+
     def host_passes(self, host_state, filter_properties):
         """Return True if host has sufficient CPU cores."""
         instance_type = filter_properties.get('instance_type')
@@ -73,6 +81,29 @@ class BaseCoreFilter(filters.BaseHostFilter):
 
         return True
 
+    def filter_vectorized(self, table, filter_properties):
+        """Select the hosts with sufficient CPU cores."""
+        instance_type = filter_properties.get('instance_type')
+        if not instance_type:
+            return table.all()
+
+        # Fail safe: hosts which do not report their VCPUs pass.
+        installed_vcpus = table.column('vcpus_total')
+        unknown = ~(installed_vcpus > 0)
+        if unknown.any():
+            LOG.warning(_LW("VCPUs not set; assuming CPU collection broken"))
+
+        instance_vcpus = instance_type['vcpus']
+        cpu_allocation_ratio = self._get_cpu_allocation_ratios(
+            table, filter_properties)
+        vcpus_total = installed_vcpus * cpu_allocation_ratio
+
+        free_vcpus = vcpus_total - table.column('vcpus_used')
+        passes = unknown | (free_vcpus >= instance_vcpus)
+
+        table.set_limits('vcpu', vcpus_total, passes & (vcpus_total > 0))
+        return passes
+
 
 class CoreFilter(BaseCoreFilter):
     """CoreFilter filters based on CPU core utilization."""
@@ -80,6 +111,27 @@ class CoreFilter(BaseCoreFilter):
     def _get_cpu_allocation_ratio(self, host_state, filter_properties):
         return CONF.cpu_allocation_ratio
 
+    def _get_cpu_allocation_ratios(self, table, filter_properties):
+        return CONF.cpu_allocation_ratio
+
+    def preselection(self, filter_properties):
+        instance_type = filter_properties.get('instance_type')
+        if not instance_type:
+            return None
+        instance_vcpus = instance_type['vcpus']
+        cpu_allocation_ratio = CONF.cpu_allocation_ratio
+
+        def has_free_vcpus(host_state):
+            vcpus_total = host_state.vcpus_total
+            # Fail safe, as in host_passes()
+            if not vcpus_total:
+                return True
+            free_vcpus = (vcpus_total * cpu_allocation_ratio -
+                          host_state.vcpus_used)
+            return not free_vcpus < instance_vcpus
+
+        return has_free_vcpus
+
 
 class AggregateCoreFilter(BaseCoreFilter):
     """AggregateCoreFilter with per-aggregate CPU subscription flag.
@@ -88,12 +140,8 @@ class AggregateCoreFilter(BaseCoreFilter):
     """
 
     def _get_cpu_allocation_ratio(self, host_state, filter_properties):
-        # TODO(uni): DB query in filter is a performance hit, especially for
-        # system with lots of hosts. Will need a general solution here to fix
-        # all filters with aggregate DB call things.
-        aggregate_vals = utils.aggregate_values_from_db(
-            filter_properties['context'],
-            host_state.host,
+        aggregate_vals = utils.aggregate_values_from_key(
+            host_state,
             'cpu_allocation_ratio')
         try:
             ratio = utils.validate_num_values(
@@ -35,6 +35,12 @@ class DiskFilter(filters.BaseHostFilter):
     def _get_disk_allocation_ratio(self, host_state, filter_properties):
         return CONF.disk_allocation_ratio
 
+    def _get_disk_allocation_ratios(self, table, filter_properties):
+        """Return the ratio of each host of a HostStateTable, or a single
+        ratio shared by all of them.
+        """
+        return CONF.disk_allocation_ratio
+
     def host_passes(self, host_state, filter_properties):
         """Filter based on disk usage."""
         instance_type = filter_properties.get('instance_type')
@@ -64,6 +70,44 @@ class DiskFilter(filters.BaseHostFilter):
         host_state.limits['disk_gb'] = disk_gb_limit
         return True
 
+    def preselection(self, filter_properties):
+        instance_type = filter_properties.get('instance_type')
+        if not instance_type:
+            return None
+        requested_disk = (1024 * (instance_type['root_gb'] +
+                                 instance_type['ephemeral_gb']) +
+                         instance_type['swap'])
+        disk_allocation_ratio = CONF.disk_allocation_ratio
+
+        def has_usable_disk(host_state):
+            total_usable_disk_mb = host_state.total_usable_disk_gb * 1024
+            usable_disk_mb = (total_usable_disk_mb * disk_allocation_ratio -
+                              (total_usable_disk_mb - host_state.free_disk_mb))
+            return usable_disk_mb >= requested_disk
+
+        return has_usable_disk
+
+    def filter_vectorized(self, table, filter_properties):
+        """Select hosts based on disk usage."""
+        instance_type = filter_properties.get('instance_type')
+        requested_disk = (1024 * (instance_type['root_gb'] +
+                                 instance_type['ephemeral_gb']) +
+                         instance_type['swap'])
+
+        free_disk_mb = table.column('free_disk_mb')
+        total_usable_disk_mb = table.column('total_usable_disk_gb') * 1024
+
+        disk_allocation_ratio = self._get_disk_allocation_ratios(
+            table, filter_properties)
+
+        disk_mb_limit = total_usable_disk_mb * disk_allocation_ratio
+        used_disk_mb = total_usable_disk_mb - free_disk_mb
+        usable_disk_mb = disk_mb_limit - used_disk_mb
+        passes = usable_disk_mb >= requested_disk
+
+        table.set_limits('disk_gb', disk_mb_limit / 1024, passes)
+        return passes
+
 
 class AggregateDiskFilter(DiskFilter):
     """AggregateDiskFilter with per-aggregate disk allocation ratio flag.
@@ -73,12 +117,8 @@ class AggregateDiskFilter(DiskFilter):
     """
 
     def _get_disk_allocation_ratio(self, host_state, filter_properties):
-        # TODO(uni): DB query in filter is a performance hit, especially for
-        # system with lots of hosts. Will need a general solution here to fix
-        # all filters with aggregate DB call things.
-        aggregate_vals = utils.aggregate_values_from_db(
-            filter_properties['context'],
-            host_state.host,
+        aggregate_vals = utils.aggregate_values_from_key(
+            host_state,
             'disk_allocation_ratio')
         try:
             ratio = utils.validate_num_values(
@@ -88,3 +128,12 @@ class AggregateDiskFilter(DiskFilter):
             ratio = CONF.disk_allocation_ratio
 
         return ratio
+
+    def _get_disk_allocation_ratios(self, table, filter_properties):
+        return table.column_from(
+            lambda host_state: self._get_disk_allocation_ratio(
+                host_state, filter_properties))
+
+    def preselection(self, filter_properties):
+        # The ratio of each host depends on its aggregates.
+        return None
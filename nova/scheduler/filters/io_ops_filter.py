@@ -39,6 +39,12 @@ class IoOpsFilter(filters.BaseHostFilter):
     def _get_max_io_ops_per_host(self, host_state, filter_properties):
         return CONF.max_io_ops_per_host
 
+    def _get_max_io_ops_per_hosts(self, table, filter_properties):
+        """Return the maximum of each host of a HostStateTable, or a
+        single maximum shared by all of them.
+        """
+        return CONF.max_io_ops_per_host
+
     def host_passes(self, host_state, filter_properties):
         """Use information about current vm and task states collected from
         compute node statistics to decide whether to filter.
@@ -54,6 +60,10 @@ class IoOpsFilter(filters.BaseHostFilter):
                          'max_io_ops': max_io_ops})
         return passes
 
+    def filter_vectorized(self, table, filter_properties):
+        max_io_ops = self._get_max_io_ops_per_hosts(table, filter_properties)
+        return table.column('num_io_ops') < max_io_ops
+
 
 class AggregateIoOpsFilter(IoOpsFilter):
     """AggregateIoOpsFilter with per-aggregate the max io operations.
@@ -62,12 +72,8 @@ class AggregateIoOpsFilter(IoOpsFilter):
     """
 
     def _get_max_io_ops_per_host(self, host_state, filter_properties):
-        # TODO(uni): DB query in filter is a performance hit, especially for
-        # system with lots of hosts. Will need a general solution here to fix
-        # all filters with aggregate DB call things.
-        aggregate_vals = utils.aggregate_values_from_db(
-            filter_properties['context'],
-            host_state.host,
+        aggregate_vals = utils.aggregate_values_from_key(
+            host_state,
             'max_io_ops_per_host')
         try:
             value = utils.validate_num_values(
@@ -77,3 +83,8 @@ class AggregateIoOpsFilter(IoOpsFilter):
             value = CONF.max_io_ops_per_host
 
         return value
+
+    def _get_max_io_ops_per_hosts(self, table, filter_properties):
+        return table.column_from(
+            lambda host_state: self._get_max_io_ops_per_host(
+                host_state, filter_properties))
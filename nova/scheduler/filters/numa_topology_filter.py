@@ -11,6 +11,7 @@
 #    under the License.
 
 from oslo_config import cfg
+import six
 
 from nova.scheduler import filters
 from nova.virt import hardware
@@ -20,21 +21,93 @@ CONF.import_opt('cpu_allocation_ratio', 'nova.scheduler.filters.core_filter')
 CONF.import_opt('ram_allocation_ratio', 'nova.scheduler.filters.ram_filter')
 
 
+def _host_signature(host_topology):
+    """Return what a fit of an instance onto host_topology depends on: its
+    cells and their usage.
+    """
+    return tuple((cell.id, tuple(sorted(cell.cpuset)), cell.memory,
+                  cell.cpu_usage, cell.memory_usage,
+                  tuple(sorted(cell.pinned_cpus)),
+                  tuple(tuple(sorted(siblings))
+                        for siblings in cell.siblings),
+                  tuple((pages.size_kb, pages.total, pages.used)
+                        for pages in cell.mempages))
+                 for cell in host_topology.cells)
+
+
+def _instance_signature(instance_topology):
+    """Return what a fit of instance_topology depends on: its cells, but
+    not the host cells a previous fit assigned them to.
+    """
+    return tuple((tuple(sorted(cell.cpuset)), cell.memory, cell.pagesize,
+                  cell.cpu_pinning_requested,
+                  cell.cpu_topology and (cell.cpu_topology.sockets,
+                                         cell.cpu_topology.cores,
+                                         cell.cpu_topology.threads))
+                 for cell in instance_topology.cells)
+
+
+def _pci_signature(pci_stats):
+    if pci_stats is None:
+        return None
+    return tuple(tuple(sorted((key, value) for key, value in pool.items()
+                              if key != 'devices'))
+                 for pool in pci_stats.pools)
+
+
 class NUMATopologyFilter(filters.BaseHostFilter):
     """Filter on requested NUMA topology."""
 
+    def filter_all(self, filter_obj_list, filter_properties):
+        # NOTE: Hosts of a fleet mostly share a few NUMA topologies and
+        #       usages, so the fits found are kept for the rest of the
+        #       pass and reused for the hosts in the same state.
+        fit_cache = {}
+        for host_state in filter_obj_list:
+            if self._host_passes(host_state, filter_properties, fit_cache):
+                yield host_state
+
     def host_passes(self, host_state, filter_properties):
+        return self._host_passes(host_state, filter_properties, {})
+
+    def _host_topology(self, host_state, fit_cache):
+        """Return the NUMA topology of a host and its signature, or None
+        and None if it has none.
+
+        The topology is only deserialized and its signature computed
+        once for all the hosts reporting the same JSON.
+        """
+        host_topology = host_state.numa_topology
+        if not isinstance(host_topology, six.string_types):
+            if not host_topology:
+                return None, None
+            return host_topology, _host_signature(host_topology)
+        key = ('json', host_topology)
+        if key not in fit_cache:
+            host_topology, _fmt = hardware.host_topology_and_format_from_host(
+                host_state)
+            fit_cache[key] = host_topology, _host_signature(host_topology)
+        return fit_cache[key]
+
+    def _host_passes(self, host_state, filter_properties, fit_cache):
         ram_ratio = CONF.ram_allocation_ratio
         cpu_ratio = CONF.cpu_allocation_ratio
         request_spec = filter_properties.get('request_spec', {})
         instance = request_spec.get('instance_properties', {})
         requested_topology = hardware.instance_topology_from_instance(instance)
-        host_topology, _fmt = hardware.host_topology_and_format_from_host(
-                host_state)
+        if not requested_topology:
+            return True
+        host_topology, host_signature = self._host_topology(host_state,
+                                                            fit_cache)
+        if not host_topology:
+            return False
         pci_requests = filter_properties.get('pci_requests')
         if pci_requests:
             pci_requests = pci_requests.requests
-        if requested_topology and host_topology:
+
+        key = (host_signature, _instance_signature(requested_topology),
+               pci_requests and _pci_signature(host_state.pci_stats))
+        if key not in fit_cache:
             limit_cells = []
             for cell in host_topology.cells:
                 max_cell_memory = int(cell.memory * ram_ratio)
@@ -48,12 +121,14 @@ class NUMATopologyFilter(filters.BaseHostFilter):
                         limits_topology=limits,
                         pci_requests=pci_requests,
                         pci_stats=host_state.pci_stats))
-            if not instance_topology:
-                return False
-            host_state.limits['numa_topology'] = limits.to_json()
-            instance['numa_topology'] = instance_topology
-            return True
-        elif requested_topology:
+            # NOTE: The next fits change the cells of the requested
+            #       topology, which may be those of this fit: keep a copy.
+            fit_cache[key] = (instance_topology and
+                              instance_topology.obj_clone(),
+                              limits.to_json())
+        instance_topology, limits = fit_cache[key]
+        if not instance_topology:
             return False
-        else:
-            return True
+        host_state.limits['numa_topology'] = limits
+        instance['numa_topology'] = instance_topology.obj_clone()
+        return True
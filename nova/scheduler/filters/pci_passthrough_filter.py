@@ -37,8 +37,41 @@ class PciPassthroughFilter(filters.BaseHostFilter):
 
     The filter checks if the host passes or not based on this information.
 
+    Hosts indexed by the HostManager are first looked up in its index of
+    the PCI pools of all the hosts, so that those without enough matching
+    devices are rejected without walking their pools.
+
     """
 
+    def filter_all(self, filter_obj_list, filter_properties):
+        pci_requests = filter_properties.get('pci_requests')
+        if not pci_requests:
+            for host_state in filter_obj_list:
+                yield host_state
+            return
+        requests = pci_requests.requests
+        index = supporting = None
+        for host_state in filter_obj_list:
+            if host_state.pci_index is None:
+                passes = self.host_passes(host_state, filter_properties)
+            else:
+                if host_state.pci_index is not index:
+                    index = host_state.pci_index
+                    supporting = index.hosts_supporting(requests)
+                if (host_state.host, host_state.nodename) not in supporting:
+                    LOG.debug("%(host_state)s doesn't have the required PCI "
+                              "devices (%(requests)s)",
+                              {'host_state': host_state,
+                               'requests': pci_requests})
+                    passes = False
+                elif len(requests) == 1:
+                    passes = True
+                else:
+                    # NOTE: The requests may compete for the same devices.
+                    passes = self.host_passes(host_state, filter_properties)
+            if passes:
+                yield host_state
+
     def host_passes(self, host_state, filter_properties):
         """Return true if the host has the required PCI devices."""
         pci_requests = filter_properties.get('pci_requests')
@@ -39,6 +39,14 @@ class BaseRamFilter(filters.BaseHostFilter):
     def _get_ram_allocation_ratio(self, host_state, filter_properties):
         raise NotImplementedError
 
+    def _get_ram_allocation_ratios(self, table, filter_properties):
+        """Return the ratio of each host of a HostStateTable, or a single
+        ratio shared by all of them.
+        """
+        return table.column_from(
+            lambda host_state: self._get_ram_allocation_ratio(
+                host_state, filter_properties))
+
     def host_passes(self, host_state, filter_properties):
         """Only return hosts with sufficient available RAM."""
         instance_type = filter_properties.get('instance_type')
@@ -64,6 +72,24 @@ class BaseRamFilter(filters.BaseHostFilter):
         host_state.limits['memory_mb'] = memory_mb_limit
         return True
 
+    def filter_vectorized(self, table, filter_properties):
+        """Only select hosts with sufficient available RAM."""
+        instance_type = filter_properties.get('instance_type')
+        requested_ram = instance_type['memory_mb']
+        free_ram_mb = table.column('free_ram_mb')
+        total_usable_ram_mb = table.column('total_usable_ram_mb')
+
+        ram_allocation_ratio = self._get_ram_allocation_ratios(
+            table, filter_properties)
+
+        memory_mb_limit = total_usable_ram_mb * ram_allocation_ratio
+        used_ram_mb = total_usable_ram_mb - free_ram_mb
+        usable_ram = memory_mb_limit - used_ram_mb
+        passes = usable_ram >= requested_ram
+
+        table.set_limits('memory_mb', memory_mb_limit, passes)
+        return passes
+
 
 class RamFilter(BaseRamFilter):
     """Ram Filter with over subscription flag."""
@@ -72,6 +98,24 @@ class RamFilter(BaseRamFilter):
     def _get_ram_allocation_ratio(self, host_state, filter_properties):
         return self.ram_allocation_ratio
 
+    def _get_ram_allocation_ratios(self, table, filter_properties):
+        return self.ram_allocation_ratio
+
+    def preselection(self, filter_properties):
+        instance_type = filter_properties.get('instance_type')
+        if not instance_type:
+            return None
+        requested_ram = instance_type['memory_mb']
+        ram_allocation_ratio = self.ram_allocation_ratio
+
+        def has_usable_ram(host_state):
+            total_usable_ram_mb = host_state.total_usable_ram_mb
+            usable_ram = (total_usable_ram_mb * ram_allocation_ratio -
+                          (total_usable_ram_mb - host_state.free_ram_mb))
+            return usable_ram >= requested_ram
+
+        return has_usable_ram
+
 
 class AggregateRamFilter(BaseRamFilter):
     """AggregateRamFilter with per-aggregate ram subscription flag.
@@ -80,12 +124,8 @@ class AggregateRamFilter(BaseRamFilter):
     """
 
     def _get_ram_allocation_ratio(self, host_state, filter_properties):
-        # TODO(uni): DB query in filter is a performance hit, especially for
-        # system with lots of hosts. Will need a general solution here to fix
-        # all filters with aggregate DB call things.
-        aggregate_vals = utils.aggregate_values_from_db(
-            filter_properties['context'],
-            host_state.host,
+        aggregate_vals = utils.aggregate_values_from_key(
+            host_state,
             'ram_allocation_ratio')
 
         try:
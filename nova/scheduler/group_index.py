@@ -0,0 +1,134 @@
+# Copyright (c) 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Hosts of the members of server groups, kept by the scheduler.
+
+The ServerGroupAffinityFilter and ServerGroupAntiAffinityFilter need the
+hosts of the other members of the group of the instance being scheduled,
+which the conductor reads by loading all the members for every request.
+With scheduler_track_server_groups, the conductor only passes the uuid
+of the group and the scheduler looks its hosts up in a
+ServerGroupIndex.  A group is read from the database the first time it
+is needed and then every scheduler_server_group_refresh_interval
+seconds; in between, the index follows the instances the scheduler
+places and those the compute nodes report deleted.
+
+The index of a scheduler does not see the instances other schedulers
+place until it reads the group again, so with several schedulers two
+members of an anti-affinity group may be sent to the same host.  The
+compute node then reschedules the later one, and since a retried
+request reads its group again, that retry sees the other placement.
+"""
+
+import collections
+
+from oslo_config import cfg
+from oslo_utils import timeutils
+
+from nova import objects
+
+group_index_opts = [
+    cfg.BoolOpt('scheduler_track_server_groups',
+                default=False,
+                help='Keep the hosts of the members of server groups in the '
+                     'schedulers, updated as they place instances and as '
+                     'compute nodes delete them, instead of having the '
+                     'conductor read them for every request. Must be set '
+                     'alike on the conductor and compute nodes.'),
+    cfg.IntOpt('scheduler_server_group_refresh_interval',
+               default=600,
+               help='Number of seconds after which the scheduler reads the '
+                    'hosts of the members of a server group again, to '
+                    'catch up with the moves it did not see. With several '
+                    'scheduler workers, each only sees the placements of '
+                    'the others when it reads the group again, or when a '
+                    'compute node reschedules a request which violated '
+                    'the policy of its group.'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(group_index_opts)
+
+
+class ServerGroupIndex(object):
+    """Number of members of each server group on each host."""
+
+    def __init__(self):
+        # {group uuid: {host: number of members}}
+        self.hosts = {}
+        # {instance uuid: (group uuid, host)}
+        self.members = {}
+        # {group uuid: instance uuids}
+        self.group_members = {}
+        # {group uuid: when it was read}
+        self.loaded_at = {}
+
+    def _load(self, context, group_uuid):
+        group = objects.InstanceGroup.get_by_uuid(context, group_uuid)
+        instances = objects.InstanceList.get_by_filters(
+            context, filters={'uuid': group.members, 'deleted': False},
+            expected_attrs=[])
+        self._forget(group_uuid)
+        self.hosts[group_uuid] = collections.Counter()
+        self.group_members[group_uuid] = set()
+        for instance in instances:
+            if instance.host:
+                self._add(group_uuid, instance.uuid, instance.host)
+        self.loaded_at[group_uuid] = timeutils.utcnow()
+
+    def _forget(self, group_uuid):
+        for instance_uuid in self.group_members.pop(group_uuid, ()):
+            del self.members[instance_uuid]
+        self.hosts.pop(group_uuid, None)
+        self.loaded_at.pop(group_uuid, None)
+
+    def _add(self, group_uuid, instance_uuid, host):
+        self.remove(instance_uuid)
+        self.hosts[group_uuid][host] += 1
+        self.members[instance_uuid] = (group_uuid, host)
+        self.group_members[group_uuid].add(instance_uuid)
+
+    def get_hosts(self, context, group_uuid, refresh=False):
+        """Return the set of the hosts of the members of a group, reading
+        them from the database if they were not, long ago, or refresh is
+        set.
+        """
+        loaded_at = self.loaded_at.get(group_uuid)
+        if refresh or loaded_at is None or timeutils.is_older_than(
+                loaded_at, CONF.scheduler_server_group_refresh_interval):
+            self._load(context, group_uuid)
+        return set(self.hosts[group_uuid])
+
+    def add(self, group_uuid, instance_uuid, host):
+        """Record that a member of a group was placed on host, if the
+        group is indexed.
+        """
+        if group_uuid in self.hosts:
+            self._add(group_uuid, instance_uuid, host)
+
+    def remove(self, instance_uuid):
+        """Forget a deleted instance, if it is a member of an indexed
+        group.
+        """
+        member = self.members.pop(instance_uuid, None)
+        if member is None:
+            return
+        group_uuid, host = member
+        self.group_members[group_uuid].discard(instance_uuid)
+        hosts = self.hosts[group_uuid]
+        hosts[host] -= 1
+        if not hosts[host]:
+            del hosts[host]
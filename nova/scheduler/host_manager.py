@@ -18,6 +18,8 @@ Manage hosts in the current zone.
 """
 
 import collections
+import datetime
+import functools
 import UserDict
 
 import iso8601
@@ -32,7 +34,12 @@ from nova.i18n import _, _LI, _LW
 from nova import objects
 from nova.openstack.common import log as logging
 from nova.pci import stats as pci_stats
+from nova.scheduler import claims
 from nova.scheduler import filters
+from nova.scheduler import group_index
+from nova.scheduler import pci_index
+from nova.scheduler import shards
+from nova.scheduler import trace
 from nova.scheduler import weights
 from nova.virt import hardware
 
@@ -59,6 +66,31 @@ host_manager_opts = [
     cfg.ListOpt('scheduler_weight_classes',
                 default=['nova.scheduler.weights.all_weighers'],
                 help='Which weight class names to use for weighing hosts'),
+    cfg.BoolOpt('scheduler_incremental_host_refresh',
+                default=False,
+                help='Only load the compute nodes created, updated or '
+                     'deleted since the previous scheduling request, '
+                     'instead of all of them for every request.'),
+    cfg.IntOpt('scheduler_full_host_refresh_interval',
+               default=300,
+               help='Number of seconds between two loads of all the compute '
+                    'nodes when scheduler_incremental_host_refresh is set. '
+                    'Catches up with changes the incremental loads missed, '
+                    'e.g. because of clock skew between compute hosts.'),
+    cfg.BoolOpt('scheduler_preselect_hosts',
+                default=False,
+                help='Before running the filters, reject in a single pass '
+                     'the hosts without enough RAM, disk or vCPUs for the '
+                     'instance, as checked by the RamFilter, DiskFilter '
+                     'and CoreFilter if they are enabled, so that the other '
+                     'filters only see the hosts which may fit it.'),
+    cfg.BoolOpt('scheduler_prune_by_aggregates',
+                default=False,
+                help='Run the filters which only look at the aggregates of '
+                     'the hosts, such as the AvailabilityZoneFilter and '
+                     'AggregateInstanceExtraSpecsFilter, once for all the '
+                     'hosts in the same aggregates instead of once for each '
+                     'host.'),
     ]
 
 CONF = cfg.CONF
@@ -67,6 +99,12 @@ CONF.import_opt('compute_topic', 'nova.compute.rpcapi')
 
 LOG = logging.getLogger(__name__)
 
+# NOTE: The timestamps of the compute nodes come from the clocks of the
+#       processes which wrote them, so a row written just before a refresh
+#       may carry a time slightly older than the newest one seen.  The
+#       incremental loads look back this far past it.
+HOST_REFRESH_OVERLAP = datetime.timedelta(seconds=10)
+
 
 class ReadOnlyDict(UserDict.IterableUserDict):
     """A read-only dict."""
@@ -111,6 +149,18 @@ class HostState(object):
     previously used and lock down access.
     """
 
+    # NOTE: The scheduler keeps a HostState per compute node, which slots
+    #       make several times smaller than an instance dict.
+    __slots__ = ('host', 'nodename', 'total_usable_ram_mb',
+                 'total_usable_disk_gb', 'disk_mb_used', 'free_ram_mb',
+                 'free_disk_mb', 'vcpus_total', 'vcpus_used', 'numa_topology',
+                 'num_instances', 'num_io_ops', 'host_ip', 'hypervisor_type',
+                 'hypervisor_version', 'hypervisor_hostname', 'cpu_info',
+                 '_supported_instances', '_supported_hv_specs', 'limits',
+                 'aggregates', 'pci_index', 'pci_stats', 'stats', 'service',
+                 '_metrics', '_metrics_json', '_decoded_metrics_json',
+                 'updated', 'claims', 'claims_since')
+
     def __init__(self, host, node, compute=None):
         self.host = host
         self.nodename = node
@@ -136,27 +186,80 @@ class HostState(object):
         self.hypervisor_version = None
         self.hypervisor_hostname = None
         self.cpu_info = None
-        self.supported_instances = None
+        self._supported_instances = None
+        # The HVSpecs of the compute node, until supported_instances is
+        # first read.
+        self._supported_hv_specs = None
 
         # Resource oversubscription values for the compute host:
         self.limits = {}
 
-        # Generic metrics from compute nodes
-        self.metrics = {}
+        # Aggregates the host belongs to, set by the HostManager.
+        self.aggregates = []
+
+        # Index of the PCI pools of all the hosts, this one's included,
+        # set by the HostManager.
+        self.pci_index = None
+
+        # Generic metrics from compute nodes, and the JSON they were last
+        # reported and decoded as.
+        self._metrics = {}
+        self._metrics_json = None
+        self._decoded_metrics_json = None
 
         self.updated = None
+
+        # Ids of the shared claims consumed since the compute node was last
+        # read, and when it was updated, see nova.scheduler.claims.
+        self.claims = set()
+        self.claims_since = None
         if compute:
             self.update_from_compute_node(compute)
 
     def update_service(self, service):
         self.service = ReadOnlyDict(service)
 
+    @property
+    def metrics(self):
+        """Generic metrics from compute nodes, decoded on first access
+        after the compute node reported them changed.
+        """
+        if self._metrics_json != self._decoded_metrics_json:
+            self._decode_metrics()
+        return self._metrics
+
+    @metrics.setter
+    def metrics(self, metrics):
+        self._metrics = metrics
+        self._decoded_metrics_json = self._metrics_json
+
+    @property
+    def supported_instances(self):
+        """The [arch, hypervisor_type, vm_mode] lists of the hypervisor
+        specs of the compute node, converted on first access.
+        """
+        if self._supported_hv_specs is not None:
+            self._supported_instances = [spec.to_list() for spec
+                                         in self._supported_hv_specs]
+            self._supported_hv_specs = None
+        return self._supported_instances
+
+    @supported_instances.setter
+    def supported_instances(self, supported_instances):
+        self._supported_instances = supported_instances
+        self._supported_hv_specs = None
+
     def _update_metrics_from_compute_node(self, compute):
         """Update metrics from a ComputeNode object."""
         # NOTE(llu): The 'or []' is to avoid json decode failure of None
         #            returned from compute.get, because DB schema allows
         #            NULL in the metrics column
-        metrics = compute.metrics or []
+        self._metrics_json = compute.metrics or []
+
+    def _decode_metrics(self):
+        """Merge the metrics last reported into the decoded ones."""
+        metrics = self._metrics_json
+        self._decoded_metrics_json = metrics
         if metrics:
             metrics = jsonutils.loads(metrics)
         for metric in metrics:
@@ -168,7 +271,7 @@ class HostState(object):
                               timestamp=metric['timestamp'],
                               source=metric['source'])
             if name:
-                self.metrics[name] = item
+                self._metrics[name] = item
             else:
                 LOG.warning(_LW("Metric name unknown of %r"), item)
 
@@ -203,6 +306,8 @@ class HostState(object):
         self.vcpus_total = compute.vcpus
         self.vcpus_used = compute.vcpus_used
         self.updated = compute.updated_at
+        self.claims = set()
+        self.claims_since = compute.updated_at
         self.numa_topology = compute.numa_topology
         if compute.pci_device_pools is not None:
             self.pci_stats = pci_stats.PciDeviceStats(
@@ -216,11 +321,7 @@ class HostState(object):
         self.hypervisor_version = compute.hypervisor_version
         self.hypervisor_hostname = compute.hypervisor_hostname
         self.cpu_info = compute.cpu_info
-        if compute.supported_hv_specs:
-            self.supported_instances = [spec.to_list() for spec
-                                        in compute.supported_hv_specs]
-        else:
-            self.supported_instances = []
+        self._supported_hv_specs = compute.supported_hv_specs or []
 
         # Don't store stats directly in host_state to make sure these don't
         # overwrite any values, or get overwritten themselves. Store in self so
@@ -295,6 +396,16 @@ class HostManager(object):
 
     def __init__(self):
         self.host_state_map = {}
+        # ComputeNodes by (host, node), kept between requests for the
+        # incremental refreshes.
+        self.compute_nodes = collections.OrderedDict()
+        self._compute_nodes_watermark = None
+        self._last_full_refresh = None
+        self.shared_claims = None
+        if CONF.scheduler_shared_claims:
+            self.shared_claims = claims.SharedClaims()
+        self.pci_index = pci_index.PciPoolIndex()
+        self.group_index = group_index.ServerGroupIndex()
         self.filter_handler = filters.HostFilterHandler()
         filter_classes = self.filter_handler.get_matching_classes(
                 CONF.scheduler_available_filters)
@@ -402,13 +513,174 @@ class HostManager(object):
                     return name_to_cls_map.values()
             hosts = name_to_cls_map.itervalues()
 
+        if CONF.scheduler_prune_by_aggregates:
+            hosts, filters = self._prune_by_aggregates(
+                filters, hosts, filter_properties, index)
+        if CONF.scheduler_preselect_hosts:
+            hosts = self._preselect_hosts(filters, hosts, filter_properties,
+                                          index)
+
+        if CONF.scheduler_filter_workers > 1 and trace.current() is None:
+            return shards.get_filtered_objects(self.filter_handler, filters,
+                    hosts, filter_properties, index)
         return self.filter_handler.get_filtered_objects(filters,
                 hosts, filter_properties, index)
 
-    def get_weighed_hosts(self, hosts, weight_properties):
-        """Weigh the hosts."""
+    def _prune_by_aggregates(self, filters, hosts, filter_properties,
+                             index):
+        """Run the filters which only look at the aggregates of the hosts
+        on a single host of each set of aggregates.
+
+        Return the hosts in the sets of aggregates passing them, and the
+        other filters.
+        """
+        aggregate_filters = [filter for filter in filters
+                             if filter.uses_aggregates_only]
+        if not aggregate_filters:
+            return hosts, filters
+
+        # NOTE: The hosts in the same aggregates share their list of
+        #       aggregates, see _update_aggregates().
+        partitions = collections.OrderedDict()
+        hosts = list(hosts)
+        for host_state in hosts:
+            partitions.setdefault(id(host_state.aggregates), host_state)
+        for filter in aggregate_filters:
+            if not filter.run_filter_for_index(index):
+                continue
+            step = trace.start_step()
+            partitions = collections.OrderedDict(
+                (key, host_state)
+                for key, host_state in partitions.iteritems()
+                if filter.host_passes(host_state, filter_properties))
+            hosts_in = hosts
+            hosts = [host_state for host_state in hosts
+                     if id(host_state.aggregates) in partitions]
+            if step is not None:
+                trace.end_step(step, 'filter', filter.__class__.__name__,
+                               index, hosts_in, hosts)
+            LOG.debug("Filter %(cls_name)s returned %(obj_len)d host(s) "
+                      "in %(partitions)d set(s) of aggregates",
+                      {'cls_name': filter.__class__.__name__,
+                       'obj_len': len(hosts),
+                       'partitions': len(partitions)})
+
+        return hosts, [filter for filter in filters
+                       if not filter.uses_aggregates_only]
+
+    def _preselect_hosts(self, filters, hosts, filter_properties, index):
+        """Return the hosts passing the preselection checks of filters,
+        which are much cheaper than running the filters over all of them.
+        """
+        checks = []
+        for filter in filters:
+            if filter.run_filter_for_index(index):
+                check = filter.preselection(filter_properties)
+                if check is not None:
+                    checks.append(check)
+        if not checks:
+            return hosts
+
+        step = trace.start_step()
+        hosts_in = list(hosts)
+        selected = hosts_in
+        for check in checks:
+            selected = [host_state for host_state in selected
+                        if check(host_state)]
+        if step is not None:
+            trace.end_step(step, 'filter', 'preselection', index, hosts_in,
+                           selected)
+        LOG.debug("Preselected %(selected)d of %(hosts)d host(s)",
+                  {'selected': len(selected), 'hosts': len(hosts_in)})
+        return selected
+
+    def consume_claims(self, host_states):
+        """Consume the resources claimed by the other scheduler workers
+        from host_states, if they are shared.
+        """
+        if self.shared_claims:
+            self.shared_claims.consume(host_states)
+
+    def claim(self, host_state, instance):
+        """Share with the other scheduler workers that instance was placed
+        on host_state, if claims are shared.
+        """
+        if self.shared_claims:
+            self.shared_claims.publish(host_state, instance)
+
+    def get_weighed_hosts(self, hosts, weight_properties, limit=None):
+        """Weigh the hosts, returning only the limit best ones if given."""
         return self.weight_handler.get_weighed_objects(self.weighers,
-                hosts, weight_properties)
+                hosts, weight_properties, limit=limit)
+
+    def _update_aggregates(self, context):
+        """Give every HostState the aggregates of its host, all read in a
+        single query instead of by each aggregate-aware filter for each
+        host.
+        """
+        aggregates_by_host = collections.defaultdict(list)
+        for aggregate in objects.AggregateList.get_all(context):
+            for host in aggregate.hosts:
+                aggregates_by_host[host].append(aggregate)
+        # The hosts in the same aggregates share the same list.
+        aggregate_lists = {}
+        for host_state in self.host_state_map.itervalues():
+            aggregates = aggregates_by_host.get(host_state.host, [])
+            host_state.aggregates = aggregate_lists.setdefault(
+                tuple(aggregate.id for aggregate in aggregates), aggregates)
+
+    def _index_pci_pools(self, host_state):
+        """Index the PCI pools of host_state, now and whenever they
+        change.
+        """
+        host_state.pci_index = self.pci_index
+        # NOTE: Ironic nodes have no PCI stats.
+        if getattr(host_state, 'pci_stats', None) is not None:
+            host_state.pci_stats.listener = functools.partial(
+                self.pci_index.update, host_state)
+        self.pci_index.update(host_state)
+
+    def _refresh_compute_nodes(self, context):
+        """Bring self.compute_nodes up to date and return the keys of the
+        compute nodes which may have changed since the previous refresh.
+        """
+        incremental = (CONF.scheduler_incremental_host_refresh and
+                       self._compute_nodes_watermark is not None and
+                       not timeutils.is_older_than(
+                           self._last_full_refresh,
+                           CONF.scheduler_full_host_refresh_interval))
+        if incremental:
+            computes = objects.ComputeNodeList.get_all_changed_since(
+                context,
+                self._compute_nodes_watermark - HOST_REFRESH_OVERLAP)
+            # Drop the deleted compute nodes first, in case one was
+            # recreated with the same host and node.
+            for compute in computes:
+                if compute.deleted:
+                    self.compute_nodes.pop(
+                        (compute.host, compute.hypervisor_hostname), None)
+        else:
+            computes = objects.ComputeNodeList.get_all(context)
+            self.compute_nodes = collections.OrderedDict()
+            self._last_full_refresh = timeutils.utcnow()
+
+        changed = set()
+        for compute in computes:
+            if incremental and compute.deleted:
+                continue
+            state_key = (compute.host, compute.hypervisor_hostname)
+            self.compute_nodes[state_key] = compute
+            changed.add(state_key)
+
+        if CONF.scheduler_incremental_host_refresh:
+            for compute in computes:
+                for timestamp in (compute.created_at, compute.updated_at,
+                                  compute.deleted_at):
+                    if timestamp and (
+                            self._compute_nodes_watermark is None or
+                            timestamp > self._compute_nodes_watermark):
+                        self._compute_nodes_watermark = timestamp
+        return changed
 
     def get_all_host_states(self, context):
         """Returns a list of HostStates that represents all the hosts
@@ -420,9 +692,9 @@ class HostManager(object):
                         for service in objects.ServiceList.get_by_topic(
                             context, CONF.compute_topic)}
         # Get resource usage across the available compute nodes:
-        compute_nodes = objects.ComputeNodeList.get_all(context)
+        changed_nodes = self._refresh_compute_nodes(context)
         seen_nodes = set()
-        for compute in compute_nodes:
+        for state_key, compute in self.compute_nodes.iteritems():
             service = service_refs.get(compute.host)
 
             if not service:
@@ -431,15 +703,16 @@ class HostManager(object):
                     "on %(topic)s topic"),
                     {'host': compute.host, 'topic': CONF.compute_topic})
                 continue
-            host = compute.host
-            node = compute.hypervisor_hostname
-            state_key = (host, node)
+            host, node = state_key
             host_state = self.host_state_map.get(state_key)
             if host_state:
-                host_state.update_from_compute_node(compute)
+                if state_key in changed_nodes:
+                    host_state.update_from_compute_node(compute)
+                    self._index_pci_pools(host_state)
             else:
                 host_state = self.host_state_cls(host, node, compute=compute)
                 self.host_state_map[state_key] = host_state
+                self._index_pci_pools(host_state)
             host_state.update_service(dict(service.iteritems()))
             seen_nodes.add(state_key)
 
@@ -450,5 +723,8 @@ class HostManager(object):
             LOG.info(_LI("Removing dead compute node %(host)s:%(node)s "
                          "from scheduler"), {'host': host, 'node': node})
             del self.host_state_map[state_key]
+            self.pci_index.remove(state_key)
 
+        self._update_aggregates(context)
+        self.consume_claims(self.host_state_map.itervalues())
         return self.host_state_map.itervalues()
@@ -0,0 +1,169 @@
+# Copyright (c) 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Columnar view of HostStates for vectorized filtering and weighing.
+
+Filters and weighers which implement filter_vectorized() or
+_weigh_vectorized() work on whole NumPy columns of a HostStateTable
+instead of being called once per HostState.  NumPy is optional: when it
+is not installed, or scheduler_vectorized_filters is off, no table is
+built and every filter and weigher runs host by host as before.
+"""
+
+import operator
+
+from oslo_config import cfg
+from oslo_utils import importutils
+
+np = importutils.try_import('numpy')
+
+host_table_opts = [
+    cfg.BoolOpt('scheduler_vectorized_filters',
+                default=False,
+                help='Run the filters and weighers which support it over '
+                     'columns of the host states at once, using NumPy. '
+                     'Ignored if NumPy is not installed.'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(host_table_opts)
+
+
+def _service_disabled(host_state):
+    return host_state.service['disabled']
+
+
+# Columns which are not plain HostState attributes, with their dtype.
+# Every other column is read from the attribute of the same name as a
+# float, so that a missing value becomes NaN.
+SPECIAL_COLUMNS = {
+    'service_disabled': (_service_disabled, bool),
+}
+
+
+def enabled():
+    """Return True if host state tables should be used."""
+    return np is not None and CONF.scheduler_vectorized_filters
+
+
+class HostStateTable(object):
+    """Columns of attributes of a list of HostStates.
+
+    Columns are extracted from the host states the first time they are
+    asked for and kept for the life of the table.  A table is a
+    snapshot: it is built for one filtering or weighing pass and must
+    not outlive changes made to its host states.
+    """
+
+    def __init__(self, host_states, columns=None):
+        self.objects = list(host_states)
+        self._columns = columns or {}
+
+    def __len__(self):
+        return len(self.objects)
+
+    def column(self, name):
+        """Return an array of the named attribute of every host state."""
+        values = self._columns.get(name)
+        if values is None:
+            getter, dtype = SPECIAL_COLUMNS.get(
+                name, (operator.attrgetter(name), float))
+            values = np.array([getter(obj) for obj in self.objects],
+                              dtype=dtype)
+            self._columns[name] = values
+        return values
+
+    def metric_columns(self, names):
+        """Return a column for each of the named metrics, with its value
+        for every host state or NaN where a host state lacks it.
+
+        The metrics not extracted yet are all read in a single pass over
+        the host states.
+        """
+        missing = [name for name in names
+                   if ('metrics', name) not in self._columns]
+        if missing:
+            rows = []
+            for obj in self.objects:
+                metrics = obj.metrics
+                row = []
+                for name in missing:
+                    item = metrics.get(name)
+                    row.append(np.nan if item is None else item.value)
+                rows.append(row)
+            values = np.array(rows, dtype=float).reshape(
+                len(self.objects), len(missing))
+            for i, name in enumerate(missing):
+                self._columns[('metrics', name)] = values[:, i]
+        return [self._columns[('metrics', name)] for name in names]
+
+    def column_from(self, func, dtype=float):
+        """Return an array of func(host_state) for every host state.
+
+        The values are not cached, as func may depend on the request.
+        """
+        return np.array([func(obj) for obj in self.objects], dtype=dtype)
+
+    def all(self):
+        """Return a mask selecting every row."""
+        return np.ones(len(self.objects), dtype=bool)
+
+    def zeros(self):
+        """Return a column of zeros."""
+        return np.zeros(len(self.objects))
+
+    def array(self, values, dtype=float):
+        """Return a column from a list with a value for each row."""
+        return np.array(values, dtype=dtype)
+
+    def select(self, mask):
+        """Return a table of the rows selected by a boolean mask."""
+        rows = np.flatnonzero(mask)
+        columns = {name: values[rows]
+                   for name, values in self._columns.items()}
+        return HostStateTable([self.objects[i] for i in rows], columns)
+
+    def select_objects(self, objs):
+        """Return a table of the given host states, which must all be
+        rows of this table, in their order.
+        """
+        index = {id(obj): i for i, obj in enumerate(self.objects)}
+        rows = np.array([index[id(obj)] for obj in objs], dtype=int)
+        columns = {name: values[rows]
+                   for name, values in self._columns.items()}
+        return HostStateTable(objs, columns)
+
+    def set_limits(self, key, values, mask):
+        """Store values[i] as limits[key] of each host state selected by
+        mask, as the host-by-host filters do for the hosts they pass.
+        """
+        for i in np.flatnonzero(mask):
+            self.objects[i].limits[key] = float(values[i])
+
+    def order(self, weights, limit=None):
+        """Return the row numbers sorted by decreasing weight.
+
+        Rows of equal weight keep their order, as with sorted().  If
+        limit is given, only the first limit rows are returned, and
+        only those are sorted.
+        """
+        keys = -weights
+        if limit is None or limit >= len(keys):
+            return np.argsort(keys, kind='mergesort')
+        kth = np.partition(keys, limit - 1)[limit - 1]
+        candidates = np.flatnonzero(keys <= kth)
+        ordered = np.argsort(keys[candidates], kind='mergesort')
+        return candidates[ordered[:limit]]
@@ -61,6 +61,8 @@ class IronicNodeState(host_manager.HostState):
     previously used and lock down access.
     """
 
+    __slots__ = ()
+
     def update_from_compute_node(self, compute):
         """Update information about a host from a ComputeNode object."""
         self.vcpus_total = compute.vcpus
@@ -77,11 +79,7 @@ class IronicNodeState(host_manager.HostState):
         self.hypervisor_version = compute.hypervisor_version
         self.hypervisor_hostname = compute.hypervisor_hostname
         self.cpu_info = compute.cpu_info
-        if compute.supported_hv_specs:
-            self.supported_instances = [spec.to_list() for spec
-                                        in compute.supported_hv_specs]
-        else:
-            self.supported_instances = []
+        self._supported_hv_specs = compute.supported_hv_specs or []
         self.updated = compute.updated_at
 
     def consume_from_instance(self, instance):
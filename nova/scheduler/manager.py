@@ -19,6 +19,8 @@
 Scheduler Service
 """
 
+import collections
+
 from oslo_config import cfg
 import oslo_messaging as messaging
 from oslo_serialization import jsonutils
@@ -30,6 +32,7 @@ from nova import objects
 from nova.openstack.common import log as logging
 from nova.openstack.common import periodic_task
 from nova import quota
+from nova.scheduler import trace
 
 
 LOG = logging.getLogger(__name__)
@@ -55,12 +58,14 @@ QUOTAS = quota.QUOTAS
 class SchedulerManager(manager.Manager):
     """Chooses a host to run instances on."""
 
-    target = messaging.Target(version='4.0')
+    target = messaging.Target(version='4.2')
 
     def __init__(self, scheduler_driver=None, *args, **kwargs):
         if not scheduler_driver:
             scheduler_driver = CONF.scheduler_driver
         self.driver = importutils.import_object(scheduler_driver)
+        self.traces = collections.deque(
+            maxlen=CONF.scheduler_trace_buffer_size)
         super(SchedulerManager, self).__init__(service_name='scheduler',
                                                *args, **kwargs)
         self.additional_endpoints.append(_SchedulerManagerV3Proxy(self))
@@ -69,6 +74,11 @@ class SchedulerManager(manager.Manager):
     def _expire_reservations(self, context):
         QUOTAS.expire(context)
 
+    @periodic_task.periodic_task
+    def _reconcile_quota_usages(self, context):
+        if CONF.quota_usage_refresh_in_background:
+            QUOTAS.usage_reconcile(context)
+
     @periodic_task.periodic_task(spacing=CONF.scheduler_driver_task_period,
                                  run_immediately=True)
     def _run_periodic_tasks(self, context):
@@ -82,10 +92,30 @@ class SchedulerManager(manager.Manager):
         The result should be a list of dicts with 'host', 'nodename' and
         'limits' as keys.
         """
-        dests = self.driver.select_destinations(context, request_spec,
-            filter_properties)
+        with trace.tracing(context, request_spec, self.traces) as tracer:
+            dests = self.driver.select_destinations(context, request_spec,
+                filter_properties)
+            if tracer is not None:
+                tracer.selected = [dict(host=dest['host'],
+                                        node=dest['nodename'])
+                                   for dest in dests]
         return jsonutils.to_primitive(dests)
 
+    def get_traces(self, context, limit=None):
+        """Returns the latest traces of scheduling requests, newest first,
+        as dicts.
+        """
+        traces = list(reversed(self.traces))
+        if limit is not None:
+            traces = traces[:limit]
+        return jsonutils.to_primitive(traces)
+
+    def delete_instance_info(self, context, instance_uuid):
+        """Forget a deleted instance in the hosts of the server groups
+        kept by the driver's host manager.
+        """
+        self.driver.host_manager.group_index.remove(instance_uuid)
+
 
 class _SchedulerManagerV3Proxy(object):
 
@@ -0,0 +1,92 @@
+# Copyright (c) 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Index of the PCI device pools of all the hosts.
+
+The PCI devices of a cloud fall in a few kinds of pools, given by their
+vendor_id, product_id, NUMA node and tags such as physical_network.  The
+HostManager indexes the pools of every HostState by kind, with the
+number of free devices of each host, and keeps the index up to date as
+the pci_stats of the hosts change.  The PciPassthroughFilter then finds
+the hosts with enough devices matching a request by matching the request
+against each kind of pool once, instead of against the pools of every
+host.
+"""
+
+import collections
+
+from nova.pci import utils as pci_utils
+
+
+def _pool_kind(pool):
+    """Return the properties of a pool a request may match: all but its
+    count and devices.
+    """
+    return frozenset((key, value) for key, value in pool.iteritems()
+                     if key not in ('count', 'devices'))
+
+
+class PciPoolIndex(object):
+    """Number of free PCI devices of each kind of pool on each host."""
+
+    def __init__(self):
+        # {pool kind: {(host, node): count}}
+        self.counts = collections.defaultdict(dict)
+        # {(host, node): pool kinds}
+        self.host_kinds = {}
+
+    def update(self, host_state):
+        """Index the pools of host_state anew."""
+        state_key = (host_state.host, host_state.nodename)
+        self.remove(state_key)
+        stats = getattr(host_state, 'pci_stats', None)
+        if not stats or not stats.pools:
+            return
+        kinds = set()
+        for pool in stats.pools:
+            kind = _pool_kind(pool)
+            counts = self.counts[kind]
+            counts[state_key] = counts.get(state_key, 0) + pool['count']
+            kinds.add(kind)
+        self.host_kinds[state_key] = kinds
+
+    def remove(self, state_key):
+        """Forget the pools of a host."""
+        for kind in self.host_kinds.pop(state_key, ()):
+            counts = self.counts[kind]
+            del counts[state_key]
+            if not counts:
+                del self.counts[kind]
+
+    def hosts_supporting(self, requests):
+        """Return the keys of the hosts with enough devices for each of
+        the PCI requests taken alone.
+
+        Requests may compete for the same devices: the hosts returned
+        for more than one request may still not support them all.
+        """
+        hosts = None
+        for request in requests:
+            totals = collections.Counter()
+            for kind, counts in self.counts.iteritems():
+                if pci_utils.pci_device_prop_match(dict(kind),
+                                                   request.spec):
+                    totals.update(counts)
+            supporting = set(state_key
+                             for state_key, count in totals.iteritems()
+                             if count >= request.count)
+            hosts = supporting if hosts is None else hosts & supporting
+        return hosts if hosts is not None else set()
@@ -87,6 +87,8 @@ class SchedulerAPI(object):
         * 3.1 - Made select_destinations() send flavor object
 
         * 4.0 - Removed backwards compat for Icehouse
+        * 4.1 - Add get_traces()
+        * 4.2 - Add delete_instance_info()
 
 
     '''
@@ -112,3 +114,17 @@ class SchedulerAPI(object):
         cctxt = self.client.prepare(version='4.0')
         return cctxt.call(ctxt, 'select_destinations',
             request_spec=request_spec, filter_properties=filter_properties)
+
+    def get_traces(self, ctxt, host=None, limit=None):
+        kwargs = {'version': '4.1'}
+        if host is not None:
+            kwargs['server'] = host
+        cctxt = self.client.prepare(**kwargs)
+        return cctxt.call(ctxt, 'get_traces', limit=limit)
+
+    def delete_instance_info(self, ctxt, instance_uuid):
+        # NOTE: Every scheduler keeps the hosts of the server groups.
+        if not self.client.can_send_version('4.2'):
+            return
+        cctxt = self.client.prepare(version='4.2', fanout=True)
+        cctxt.cast(ctxt, 'delete_instance_info', instance_uuid=instance_uuid)
@@ -0,0 +1,291 @@
+# Copyright (c) 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Filtering of the hosts over shards run in parallel by child processes.
+
+With scheduler_filter_workers set, the hosts of a request are split into
+contiguous shards of at least scheduler_filter_shard_size hosts, and a
+child process is forked to run the filters over each shard.  A child
+sees the host states as they were when it was forked, without anything
+being copied or serialized for it, and sends back which hosts of its
+shard passed, along with the limits and instance properties the filters
+set, which the scheduler then applies to its own host states.  The hosts
+which passed are weighed by the scheduler, as before.  Anything else a
+filter keeps, such as the attestation cache of the TrustedFilter, is
+only updated in the child and lost with it.
+
+A child starts with an event hub of its own, so that none of the
+greenthreads of the scheduler, such as its RPC consumers, ever run in
+it, and with the sockets it inherits, such as the AMQP, memcached and
+database connections, replaced by /dev/null.  A filter which needs the
+database opens a connection of its own.  Children which do not finish
+within scheduler_filter_timeout seconds, e.g. because they inherited a
+lock held by another greenthread of the scheduler, are killed and the
+request is filtered by the scheduler itself.
+
+Requests over too few hosts to fill two shards are filtered by the
+scheduler itself.
+"""
+
+import os
+import select
+import signal
+import stat
+import time
+
+from eventlet import hubs
+from oslo_config import cfg
+import six
+from six.moves import cPickle
+
+from nova.db.sqlalchemy import api as sqlalchemy_api
+from nova import exception
+from nova.i18n import _, _LW
+from nova.openstack.common import log as logging
+
+shard_opts = [
+    cfg.IntOpt('scheduler_filter_workers',
+               default=0,
+               help='Number of child processes the scheduler runs the '
+                    'filters of a request in, each over a shard of the '
+                    'hosts. 0 or 1 runs the filters in the scheduler '
+                    'process.'),
+    cfg.IntOpt('scheduler_filter_shard_size',
+               default=500,
+               help='Minimum number of hosts in the shard of a child '
+                    'process. Requests over fewer hosts than two shards '
+                    'are filtered in the scheduler process.'),
+    cfg.IntOpt('scheduler_filter_timeout',
+               default=60,
+               help='Number of seconds after which the child processes '
+                    'still filtering the shards of a request are killed, '
+                    'and the request is filtered in the scheduler '
+                    'process.'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(shard_opts)
+
+LOG = logging.getLogger(__name__)
+
+
+def split(hosts, workers, shard_size):
+    """Split hosts into at most workers contiguous shards of at least
+    shard_size hosts each, or a single shard of them all.
+    """
+    count = min(workers, len(hosts) // max(shard_size, 1))
+    if count < 2:
+        return [hosts]
+    size, extra = divmod(len(hosts), count)
+    shards = []
+    start = 0
+    for i in range(count):
+        end = start + size + (1 if i < extra else 0)
+        shards.append(hosts[start:end])
+        start = end
+    return shards
+
+
+def _instance_properties(filter_properties):
+    request_spec = filter_properties.get('request_spec') or {}
+    return request_spec.get('instance_properties')
+
+
+def filter_shard(filter_handler, filters, hosts, filter_properties, index):
+    """Run the filters over the hosts of a shard.
+
+    Return None if a filter stopped the filtering, or the rows of the
+    hosts which passed, the limits the filters changed by row, and the
+    instance properties the filters changed.
+    """
+    limits = [dict(host_state.limits) for host_state in hosts]
+    instance = _instance_properties(filter_properties) or {}
+    instance_before = dict(instance)
+
+    passed = filter_handler.get_filtered_objects(filters, hosts,
+                                                 filter_properties, index)
+    if passed is None:
+        return None
+
+    rows = {id(host_state): row for row, host_state in enumerate(hosts)}
+    changed_limits = {row: host_state.limits
+                      for row, host_state in enumerate(hosts)
+                      if host_state.limits != limits[row]}
+    missing = object()
+    changed_instance = {key: value for key, value in instance.iteritems()
+                        if instance_before.get(key, missing) is not value}
+    return ([rows[id(host_state)] for host_state in passed],
+            changed_limits, changed_instance)
+
+
+def _inherited_fds():
+    try:
+        return [int(fd) for fd in os.listdir('/proc/self/fd')]
+    except OSError:
+        return range(os.sysconf('SC_OPEN_MAX'))
+
+
+def _start_clean(keep_fd):
+    """Leave a forked child without the greenthreads and the connections
+    of the scheduler.
+    """
+    # NOTE: The greenthreads of the scheduler are scheduled by its hub,
+    #       which the child never switches to once it uses a hub of its
+    #       own.
+    hubs.use_hub()
+    sqlalchemy_api._ENGINE_FACADE = None
+    # NOTE: The sockets are replaced rather than closed, so that their
+    #       descriptors are not reused by the connections the child opens
+    #       while objects of the scheduler still refer to them.
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in _inherited_fds():
+        if fd in (keep_fd, devnull):
+            continue
+        try:
+            if stat.S_ISSOCK(os.fstat(fd).st_mode):
+                os.dup2(devnull, fd)
+        except OSError:
+            pass
+    os.close(devnull)
+
+
+def _fork(func, *args):
+    """Run func(*args) in a child process.
+
+    Return the pid of the child and the file descriptor its pickled
+    result, or the exception it raised, is read from.
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid:
+        os.close(write_fd)
+        return pid, read_fd
+
+    # NOTE: The child exits without running any cleanup, which would
+    #       otherwise act on the resources it shares with the scheduler.
+    status = 0
+    try:
+        os.close(read_fd)
+        _start_clean(write_fd)
+        try:
+            result = func(*args)
+        except Exception as e:
+            result = e
+        try:
+            data = cPickle.dumps(result, cPickle.HIGHEST_PROTOCOL)
+        except Exception:
+            data = cPickle.dumps(exception.NovaException(
+                six.text_type(result)), cPickle.HIGHEST_PROTOCOL)
+        while data:
+            written = os.write(write_fd, data)
+            data = data[written:]
+    except BaseException:
+        status = 1
+    finally:
+        os._exit(status)
+
+
+def _wait(children, timeout):
+    """Return the unpickled results of the children started by _fork(),
+    in order, or an exception for those which exited without one.
+
+    The children which are still running after timeout seconds are
+    killed, and None is returned instead of the results.
+    """
+    chunks = {read_fd: [] for pid, read_fd in children}
+    running = set(chunks)
+    deadline = time.time() + timeout
+    try:
+        while running:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            readable = select.select(list(running), [], [], remaining)[0]
+            for read_fd in readable:
+                chunk = os.read(read_fd, 65536)
+                if chunk:
+                    chunks[read_fd].append(chunk)
+                else:
+                    running.discard(read_fd)
+    finally:
+        for pid, read_fd in children:
+            if read_fd in running:
+                os.kill(pid, signal.SIGKILL)
+            os.close(read_fd)
+            os.waitpid(pid, 0)
+    if running:
+        return None
+
+    results = []
+    for pid, read_fd in children:
+        if chunks[read_fd]:
+            results.append(cPickle.loads(b''.join(chunks[read_fd])))
+        else:
+            results.append(exception.NovaException(
+                _('Filter process %d exited without a result') % pid))
+    return results
+
+
+def get_filtered_objects(filter_handler, filters, hosts, filter_properties,
+                         index=0):
+    """Return the hosts passing the filters, like
+    filter_handler.get_filtered_objects(), with the shards of the hosts
+    filtered in parallel by child processes.
+    """
+    hosts = list(hosts)
+    shards = split(hosts, CONF.scheduler_filter_workers,
+                   CONF.scheduler_filter_shard_size)
+    if len(shards) < 2:
+        return filter_handler.get_filtered_objects(filters, hosts,
+                                                   filter_properties, index)
+
+    children = []
+    try:
+        for shard in shards:
+            children.append(_fork(filter_shard, filter_handler, filters,
+                                  shard, filter_properties, index))
+    except OSError as e:
+        LOG.warning(_LW("Filtering the hosts in the scheduler process, as "
+                        "no child process could be forked: %s"), e)
+        for pid, read_fd in children:
+            os.close(read_fd)
+            os.waitpid(pid, 0)
+        return filter_handler.get_filtered_objects(filters, hosts,
+                                                   filter_properties, index)
+    results = _wait(children, CONF.scheduler_filter_timeout)
+    if results is None:
+        LOG.warning(_LW("Filtering the hosts in the scheduler process, as "
+                        "the child processes did not finish within %d "
+                        "seconds"), CONF.scheduler_filter_timeout)
+        return filter_handler.get_filtered_objects(filters, hosts,
+                                                   filter_properties, index)
+
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+    if any(result is None for result in results):
+        return None
+
+    instance = _instance_properties(filter_properties)
+    passed = []
+    for shard, (rows, changed_limits, changed_instance) in zip(shards,
+                                                             results):
+        for row, limits in changed_limits.iteritems():
+            shard[row].limits.update(limits)
+        if changed_instance and instance is not None:
+            instance.update(changed_instance)
+        passed.extend(shard[row] for row in rows)
+    return passed
@@ -0,0 +1,219 @@
+# Copyright (c) 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Traces of scheduling decisions.
+
+A sample of the select_destinations requests, scheduler_trace_sample_rate
+of them, is traced: the wall time and database queries of the whole
+request and of each filter and weigher run, the number of hosts each
+filter was given and passed, and the filter which rejected each host.
+The scheduler manager keeps the last scheduler_trace_buffer_size traces
+in memory and returns them through its get_traces() RPC method, which
+`nova-manage scheduler trace` calls.
+"""
+
+import collections
+import contextlib
+import random
+import threading
+import time
+
+from oslo_config import cfg
+from oslo_utils import timeutils
+from sqlalchemy import event
+
+from nova.db.sqlalchemy import api as sqlalchemy_api
+
+trace_opts = [
+    cfg.FloatOpt('scheduler_trace_sample_rate',
+                 default=0.0,
+                 help='Fraction of the scheduling requests to trace, from '
+                      '0.0 for none to 1.0 for all of them.'),
+    cfg.IntOpt('scheduler_trace_buffer_size',
+               default=100,
+               help='Number of the latest traces each scheduler keeps in '
+                    'memory.'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(trace_opts)
+
+# The trace of the request being scheduled by the current thread.
+_local = threading.local()
+# The database engine the queries are counted from.
+_engine = None
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    trace = current()
+    # NOTE: oslo.db pings the database with SELECT 1 whenever a connection
+    #       is checked out, which is not a query of the scheduler's.
+    if trace is not None and statement != 'SELECT 1':
+        trace.db_queries += 1
+
+
+def _listen_for_queries():
+    global _engine
+    engine = sqlalchemy_api.get_engine()
+    if engine is not _engine:
+        event.listen(engine, 'before_cursor_execute', _count_query)
+        _engine = engine
+
+
+def current():
+    """Return the trace of the request being scheduled, or None if it is
+    not traced.
+    """
+    return getattr(_local, 'trace', None)
+
+
+def start_step():
+    """Return what end_step() needs to trace a filter or weigher run, or
+    None if the request is not traced.
+    """
+    trace = current()
+    if trace is not None:
+        return trace, time.time(), trace.db_queries
+
+
+def end_step(step, kind, name, index, hosts_in, hosts_out):
+    """Record the run of a filter or weigher started by start_step(), and
+    the hosts it rejected if it is a filter.
+    """
+    trace, start, db_queries = step
+    trace.add_step(kind, name, index, len(hosts_in), len(hosts_out),
+                   time.time() - start, trace.db_queries - db_queries)
+    if len(hosts_out) < len(hosts_in):
+        passed = set(id(host_state) for host_state in hosts_out)
+        for host_state in hosts_in:
+            if id(host_state) not in passed:
+                trace.add_rejection(host_state.host, host_state.nodename,
+                                    name, index)
+
+
+class Trace(object):
+    """The trace of one scheduling request."""
+
+    def __init__(self, request_id, num_instances):
+        self.request_id = request_id
+        self.num_instances = num_instances
+        self.started_at = timeutils.utcnow()
+        self.duration = None
+        self.db_queries = 0
+        self.steps = []
+        self.rejections = []
+        self.selected = []
+        self.error = None
+
+    def add_step(self, kind, name, index, hosts_in, hosts_out, duration,
+                 db_queries):
+        """Record that a filter or weigher was run for the index-th
+        instance of the request.
+        """
+        self.steps.append({'kind': kind,
+                           'name': name,
+                           'index': index,
+                           'hosts_in': hosts_in,
+                           'hosts_out': hosts_out,
+                           'duration': duration,
+                           'db_queries': db_queries})
+
+    def add_rejection(self, host, node, name, index):
+        """Record that the named filter rejected a host for the index-th
+        instance of the request.
+        """
+        self.rejections.append({'host': host,
+                                'node': node,
+                                'filter': name,
+                                'index': index})
+
+    def to_dict(self):
+        return {'request_id': self.request_id,
+                'num_instances': self.num_instances,
+                'started_at': timeutils.isotime(self.started_at),
+                'duration': self.duration,
+                'db_queries': self.db_queries,
+                'steps': self.steps,
+                'rejections': self.rejections,
+                'selected': self.selected,
+                'error': self.error}
+
+
+@contextlib.contextmanager
+def tracing(context, request_spec, traces):
+    """Trace the scheduling of request_spec, if it is sampled, into the
+    traces buffer.
+
+    Yields the Trace, or None if the request is not traced.
+    """
+    if random.random() >= CONF.scheduler_trace_sample_rate:
+        yield None
+        return
+
+    _listen_for_queries()
+    trace = Trace(context.request_id, request_spec.get('num_instances', 1))
+    _local.trace = trace
+    start = time.time()
+    try:
+        yield trace
+    except Exception as e:
+        trace.error = '%s: %s' % (e.__class__.__name__, e)
+        raise
+    finally:
+        trace.duration = time.time() - start
+        _local.trace = None
+        traces.append(trace.to_dict())
+
+
+def summarize(traces):
+    """Return statistics over a list of trace dicts, as returned by
+    Trace.to_dict(): those of the requests and those of each filter and
+    weigher.
+    """
+    durations = sorted(trace['duration'] for trace in traces)
+    summary = {'requests': len(traces),
+               'errors': len([trace for trace in traces if trace['error']]),
+               'duration_mean': None,
+               'duration_p50': None,
+               'duration_p99': None,
+               'db_queries_mean': None,
+               'steps': []}
+    if traces:
+        summary.update(
+            duration_mean=sum(durations) / len(durations),
+            duration_p50=durations[len(durations) // 2],
+            duration_p99=durations[int(len(durations) * 0.99)],
+            db_queries_mean=float(sum(trace['db_queries']
+                                      for trace in traces)) / len(traces))
+
+    steps = collections.OrderedDict()
+    for trace in traces:
+        for step in trace['steps']:
+            stats = steps.setdefault(
+                (step['kind'], step['name']),
+                {'kind': step['kind'], 'name': step['name'], 'calls': 0,
+                 'duration_total': 0.0, 'duration_max': 0.0,
+                 'db_queries': 0, 'hosts_rejected': 0})
+            stats['calls'] += 1
+            stats['duration_total'] += step['duration']
+            stats['duration_max'] = max(stats['duration_max'],
+                                        step['duration'])
+            stats['db_queries'] += step['db_queries']
+            stats['hosts_rejected'] += step['hosts_in'] - step['hosts_out']
+    for stats in steps.values():
+        stats['duration_mean'] = stats['duration_total'] / stats['calls']
+        summary['steps'].append(stats)
+    return summary
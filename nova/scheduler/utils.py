@@ -46,6 +46,7 @@ CONF = cfg.CONF
 CONF.register_opts(scheduler_opts)
 
 CONF.import_opt('scheduler_default_filters', 'nova.scheduler.host_manager')
+CONF.import_opt('scheduler_track_server_groups', 'nova.scheduler.group_index')
 
 GroupDetails = collections.namedtuple('GroupDetails', ['hosts', 'policies'])
 
@@ -251,15 +252,13 @@ _SUPPORTS_AFFINITY = None
 _SUPPORTS_ANTI_AFFINITY = None
 
 
-def _get_group_details(context, instance_uuid, user_group_hosts=None):
-    """Provide group_hosts and group_policies sets related to instances if
-    those instances are belonging to a group and if corresponding filters are
-    enabled.
+def _get_group(context, instance_uuid):
+    """Provide the group of an instance if it has an affinity or
+    anti-affinity policy and the corresponding filters are enabled.
 
     :param instance_uuid: UUID of the instance to check
-    :param user_group_hosts: Hosts from the group or empty set
 
-    :returns: None or namedtuple GroupDetails
+    :returns: None or InstanceGroup
     """
     global _SUPPORTS_AFFINITY
     if _SUPPORTS_AFFINITY is None:
@@ -290,6 +289,21 @@ def _get_group_details(context, instance_uuid, user_group_hosts=None):
             msg = _("ServerGroupAntiAffinityFilter not configured")
             LOG.error(msg)
             raise exception.UnsupportedPolicyException(reason=msg)
+        return group
+
+
+def _get_group_details(context, instance_uuid, user_group_hosts=None):
+    """Provide group_hosts and group_policies sets related to instances if
+    those instances are belonging to a group and if corresponding filters are
+    enabled.
+
+    :param instance_uuid: UUID of the instance to check
+    :param user_group_hosts: Hosts from the group or empty set
+
+    :returns: None or namedtuple GroupDetails
+    """
+    group = _get_group(context, instance_uuid)
+    if group is not None:
         group_hosts = set(group.get_hosts(context))
         user_hosts = set(user_group_hosts) if user_group_hosts else set()
         return GroupDetails(hosts=user_hosts | group_hosts,
@@ -301,6 +315,9 @@ def setup_instance_group(context, request_spec, filter_properties):
     based on instance uuids provided in request_spec, if those instances are
     belonging to a group.
 
+    With scheduler_track_server_groups, group_uuid is added instead of the
+    hosts of the group, which the scheduler keeps.
+
     :param request_spec: Request spec
     :param filter_properties: Filter properties
     """
@@ -309,6 +326,14 @@ def setup_instance_group(context, request_spec, filter_properties):
     # request and they will all be in the same group, so it's safe to
     # only check the first one.
     instance_uuid = request_spec.get('instance_properties', {}).get('uuid')
+    if CONF.scheduler_track_server_groups:
+        group = _get_group(context, instance_uuid)
+        if group is not None:
+            filter_properties['group_updated'] = True
+            filter_properties['group_uuid'] = group.uuid
+            filter_properties['group_hosts'] = set(group_hosts or [])
+            filter_properties['group_policies'] = group.policies
+        return
     group_info = _get_group_details(context, instance_uuid, group_hosts)
     if group_info is not None:
         filter_properties['group_updated'] = True
@@ -17,6 +17,8 @@
 Scheduler host weights
 """
 
+from nova.scheduler import host_table
+from nova.scheduler import trace
 from nova import weights
 
 
@@ -42,6 +44,17 @@ class HostWeightHandler(weights.BaseWeightHandler):
     def __init__(self):
         super(HostWeightHandler, self).__init__(BaseHostWeigher)
 
+    def _get_table(self, objs):
+        if host_table.enabled():
+            return host_table.HostStateTable(objs)
+
+    def _start_step(self):
+        return trace.start_step()
+
+    def _end_step(self, step, weigher, objs):
+        trace.end_step(step, 'weigher', weigher.__class__.__name__, None,
+                       objs, objs)
+
 
 def all_weighers():
     """Return a list of weight plugin classes found in this directory."""
@@ -27,6 +27,7 @@ in the configuration file as the followings:
 """
 
 from oslo_config import cfg
+from oslo_utils import importutils
 
 from nova import exception
 from nova.scheduler import utils
@@ -66,6 +67,8 @@ metrics_weight_opts = [
 CONF = cfg.CONF
 CONF.register_opts(metrics_weight_opts, group='metrics')
 
+np = importutils.try_import('numpy')
+
 
 class MetricsWeigher(weights.BaseHostWeigher):
     def __init__(self):
@@ -102,3 +105,44 @@ class MetricsWeigher(weights.BaseHostWeigher):
                         return CONF.metrics.weight_of_unavailable
 
         return value
+
+    def _weigh_vectorized(self, table, weight_properties):
+        names = [name for (name, ratio) in self.setting]
+        columns = table.metric_columns(names)
+        value = table.zeros()
+        unavailable = None
+
+        for (name, ratio), column in zip(self.setting, columns):
+            missing = np.isnan(column)
+            if not missing.any():
+                value += column * ratio
+                continue
+            if CONF.metrics.required:
+                # Report the first host lacking a metric, as
+                # _weigh_object() would have.
+                row = np.flatnonzero(self._missing(columns))[0]
+                host_state = table.objects[row]
+                name = next(name for name, column in zip(names, columns)
+                            if np.isnan(column[row]))
+                raise exception.ComputeHostMetricNotFound(
+                        host=host_state.host,
+                        node=host_state.nodename,
+                        name=name)
+            value += np.where(missing, 0.0, column * ratio)
+            if ratio * self.weight_multiplier() != 0:
+                if unavailable is None:
+                    unavailable = missing
+                else:
+                    unavailable = unavailable | missing
+
+        if unavailable is not None:
+            value[unavailable] = CONF.metrics.weight_of_unavailable
+        return value
+
+    @staticmethod
+    def _missing(columns):
+        """Return a mask of the rows lacking any of the metric columns."""
+        missing = np.zeros(len(columns[0]), dtype=bool)
+        for column in columns:
+            missing |= np.isnan(column)
+        return missing
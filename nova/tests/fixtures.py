@@ -285,3 +285,27 @@ class PoisonFunctions(fixtures.Fixture):
         self.useFixture(fixtures.MonkeyPatch(
             'nova.virt.libvirt.host.Host._init_events',
             evloop))
+
+
+class FlatProjectHierarchy(fixtures.Fixture):
+    """Make every project a root project without children.
+
+    Keystone cannot be reached from the tests, and the nested quota
+    driver fails a reservation when the hierarchy of its project cannot
+    be loaded.  Tests which need a deeper hierarchy mock it themselves.
+    """
+
+    def setUp(self):
+        super(FlatProjectHierarchy, self).setUp()
+
+        # explicit import because MonkeyPatch doesn't magic import
+        # correctly if we are patching a method on a class in a
+        # module.
+        import nova.project_hierarchy  # noqa
+
+        def get_hierarchy(driver, context, project_id):
+            return [(project_id, None)], []
+
+        self.useFixture(fixtures.MonkeyPatch(
+            'nova.project_hierarchy.KeystoneHierarchyDriver.get_hierarchy',
+            get_hierarchy))
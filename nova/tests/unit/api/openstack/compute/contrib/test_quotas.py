@@ -623,3 +623,112 @@ class UserQuotasTestV2WithoutServerGroupQuotas(UserQuotasTestV2):
         req = fakes.HTTPRequest.blank(url, use_admin_context=True)
         self.assertRaises(webob.exc.HTTPBadRequest, self.controller.update,
                           req, 'update_me', body=body)
+
+
+class QuotaSetsSubtreeTestV21(test.NoDBTestCase):
+
+    def setUp(self):
+        super(QuotaSetsSubtreeTestV21, self).setUp()
+        self.controller = quotas_v21.QuotaSetsController()
+
+    @mock.patch.object(quotas_v21.QUOTAS, 'get_projects_quotas')
+    @mock.patch.object(quotas_v21.HIERARCHY, 'get_subtree',
+                       return_value=['child1', 'child2'])
+    def test_quotas_subtree(self, mock_subtree, mock_quotas):
+        mock_quotas.return_value = {
+            'root': {'instances': {'limit': 10, 'in_use': 1,
+                                   'reserved': 0, 'allocated': 5}},
+            'child1': {'instances': {'limit': 5, 'in_use': 2,
+                                     'reserved': 1, 'allocated': 0}},
+            'child2': {'instances': {'limit': 0, 'in_use': 0,
+                                     'reserved': 0, 'allocated': 0}}}
+        req = fakes.HTTPRequest.blank('/v2/fake4/os-quota-sets/root/subtree',
+                                      use_admin_context=True)
+        res_dict = self.controller.subtree(req, 'root')
+
+        context = req.environ['nova.context']
+        mock_subtree.assert_called_once_with(context, 'root')
+        mock_quotas.assert_called_once_with(context,
+                                            ['root', 'child1', 'child2'])
+        self.assertEqual(['root', 'child1', 'child2'],
+                         [qs['id'] for qs in res_dict['quota_sets']])
+        self.assertEqual({'limit': 5, 'in_use': 2, 'reserved': 1,
+                          'allocated': 0},
+                         res_dict['quota_sets'][1]['instances'])
+
+    @mock.patch.object(quotas_v21.HIERARCHY, 'get_subtree',
+                       side_effect=exception.Forbidden())
+    def test_quotas_subtree_hierarchy_forbidden(self, mock_subtree):
+        req = fakes.HTTPRequest.blank('/v2/fake4/os-quota-sets/root/subtree',
+                                      use_admin_context=True)
+        self.assertRaises(webob.exc.HTTPForbidden, self.controller.subtree,
+                          req, 'root')
+
+    def test_quotas_subtree_as_user(self):
+        rules = {'compute_extension:v3:os-quota-sets:subtree':
+                 'rule:admin_api'}
+        self.policy.set_rules(rules)
+        req = fakes.HTTPRequest.blank('/v2/fake4/os-quota-sets/root/subtree')
+        self.assertRaises(exception.PolicyNotAuthorized,
+                          self.controller.subtree, req, 'root')
+
+    @mock.patch.object(quotas_v21.QUOTAS, 'get_subtree_quotas')
+    @mock.patch.object(quotas_v21.HIERARCHY, 'get_parent', return_value=None)
+    def test_show_subtree_usages(self, mock_parent, mock_quotas):
+        mock_quotas.return_value = {'instances': {'limit': 10, 'in_use': 3,
+                                                  'reserved': 1}}
+        req = fakes.HTTPRequest.blank(
+            '/v2/fake4/os-quota-sets/root?usages=subtree',
+            use_admin_context=True)
+        res_dict = self.controller.show(req, 'root')
+
+        mock_quotas.assert_called_once_with(req.environ['nova.context'],
+                                            'root')
+        self.assertEqual({'id': 'root',
+                          'instances': {'limit': 10, 'in_use': 3,
+                                        'reserved': 1}},
+                         res_dict['quota_set'])
+
+    @mock.patch.object(quotas_v21.QUOTAS, 'get_subtree_quotas',
+                       side_effect=exception.ProjectNotFound(
+                           project_id='root'))
+    @mock.patch.object(quotas_v21.HIERARCHY, 'get_parent', return_value=None)
+    def test_show_subtree_usages_project_not_found(self, mock_parent,
+                                                   mock_quotas):
+        req = fakes.HTTPRequest.blank(
+            '/v2/fake4/os-quota-sets/root?usages=subtree',
+            use_admin_context=True)
+        self.assertRaises(webob.exc.HTTPNotFound, self.controller.show,
+                          req, 'root')
+
+    @mock.patch.object(quotas_v21.db, 'quota_child_update')
+    @mock.patch.object(quotas_v21.QUOTAS, 'get_settable_quotas',
+                       return_value={'instances': {'minimum': 0,
+                                                   'maximum': 10}})
+    @mock.patch.object(quotas_v21.HIERARCHY, 'get_children',
+                       return_value=['child', 'sibling'])
+    @mock.patch.object(quotas_v21.HIERARCHY, 'get_parent',
+                       return_value='parent')
+    def test_update_child_moves_allocated(self, mock_parent, mock_children,
+                                          mock_settable, mock_child_update):
+        req = fakes.HTTPRequest.blank('/v2/parent/os-quota-sets/child',
+                                      use_admin_context=True)
+        context = req.environ['nova.context']
+        context.auth_token = 'token'
+        context.project_id = 'parent'
+        with mock.patch.object(self.controller, '_get_quotas',
+                               return_value={}):
+            self.controller.update(req, 'child',
+                                   body={'quota_set': {'instances': 5}})
+
+        mock_child_update.assert_called_once_with(context, 'parent', 'child',
+                                                  'instances', 5,
+                                                  user_id=None)
+
+    def test_show_invalid_usages(self):
+        for query in ('usages=all', 'usages=subtree&user_id=1'):
+            req = fakes.HTTPRequest.blank(
+                '/v2/fake4/os-quota-sets/root?%s' % query,
+                use_admin_context=True)
+            self.assertRaises(webob.exc.HTTPBadRequest,
+                              self.controller.show, req, 'root')
@@ -13,6 +13,9 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+
+import mock
 from oslo_config import cfg
 import webob
 
@@ -21,6 +24,7 @@ from nova.api.openstack.compute.plugins.v3 import server_groups as sg_v3
 from nova.api.openstack import extensions
 from nova import context
 import nova.db
+from nova import objects
 from nova.openstack.common import uuidutils
 from nova import quota
 from nova import test
@@ -114,6 +118,30 @@ class ServerGroupQuotasTestV21(test.TestCase):
                           self.controller.create,
                           self.req, body={'server_group': sgroup})
 
+    def test_create_server_group_failure_gives_quota_back(self):
+        self._setup_quotas()
+        sgroup = server_group_template()
+        sgroup['policies'] = ['anti-affinity']
+        context = self.req.environ['nova.context']
+        with contextlib.nested(
+            mock.patch.object(objects.Quotas, 'consume'),
+            mock.patch.object(objects.InstanceGroup, 'create',
+                              side_effect=test.TestingException()),
+        ) as (mock_consume, mock_create):
+            # NOTE: v2.1 turns unexpected errors into a 500.
+            self.assertRaises((test.TestingException,
+                               webob.exc.HTTPInternalServerError),
+                              self.controller.create, self.req,
+                              body={'server_group': sgroup})
+
+        self.assertEqual([mock.call(context, project_id=context.project_id,
+                                    user_id=context.user_id,
+                                    server_groups=1),
+                          mock.call(context, project_id=context.project_id,
+                                    user_id=context.user_id,
+                                    server_groups=-1)],
+                         mock_consume.call_args_list)
+
     def test_delete_server_group_by_admin(self):
         self._setup_quotas()
         sgroup = server_group_template()
@@ -566,6 +566,21 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
         self.mox.ReplayAll()
         self.compute._init_instance(self.context, instance)
 
+    def test_complete_deletion_tracked_server_groups(self):
+        self.flags(scheduler_track_server_groups=True)
+        instance = fake_instance.fake_instance_obj(self.context)
+        with contextlib.nested(
+            mock.patch.object(self.compute, '_notify_about_instance_usage'),
+            mock.patch.object(self.compute.scheduler_rpcapi,
+                              'delete_instance_info'),
+            mock.patch.object(self.compute.consoleauth_rpcapi,
+                              'delete_tokens_for_instance'),
+        ) as (notify, delete_instance_info, delete_tokens):
+            self.compute._complete_deletion(self.context, instance, [],
+                                            None, {})
+        delete_instance_info.assert_called_once_with(self.context,
+                                                     instance.uuid)
+
     def _test_init_instance_reverts_crashed_migrations(self,
                                                        old_vm_state=None):
         power_on = True if (not old_vm_state or
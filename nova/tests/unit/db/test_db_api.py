@@ -1397,6 +1397,207 @@ class ReservationTestCase(test.TestCase, ModelsObjectComparatorMixin):
         self.assertEqual(expected, db.quota_usage_get_all_by_project_and_user(
                                             self.ctxt, 'project1', 'user1'))
 
+    def test_reservation_expire_in_batches(self):
+        _quota_reserve(self.ctxt, 'project2', 'user2')
+        self.assertEqual(6, db.reservation_expire(self.ctxt, batch_size=2))
+        self.assertEqual(0, db.reservation_expire(self.ctxt, batch_size=2))
+
+        for project_id, user_id in (('project1', 'user1'),
+                                    ('project2', 'user2')):
+            usages = db.quota_usage_get_all_by_project_and_user(
+                self.ctxt, project_id, user_id)
+            self.assertEqual([0, 0, 0],
+                             [usages[res]['reserved'] for res in
+                              ('resource0', 'resource1', 'fixed_ips')])
+        self.assertRaises(exception.ReservationNotFound,
+            _reservation_get, self.ctxt, self.reservations[0])
+
+
+class QuotaSubtreeUsageTestCase(test.TestCase):
+
+    """Tests for the subtree usages kept by db.api.quota_reserve."""
+
+    def setUp(self):
+        super(QuotaSubtreeUsageTestCase, self).setUp()
+        self.ctxt = context.get_admin_context()
+        self.in_use = {'root': 2, 'child': 1}
+
+        def sync(elevated, project_id, user_id, session):
+            return {'subtree_res': self.in_use[project_id]}
+        patcher = mock.patch.dict(sqlalchemy_api.QUOTA_SYNC_FUNCTIONS,
+                                  {'_sync_subtree_res': sync})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.resources = {'subtree_res': quota.ReservableResource(
+            'subtree_res', '_sync_subtree_res', 'quota_subtree_res')}
+        self.root_quotas = {'subtree_res': 10}
+
+    def _hierarchy(self, project_id):
+        if project_id == 'root':
+            return [('root', None, self.root_quotas)]
+        return [('child', 'root', {'subtree_res': 10}),
+                ('root', None, self.root_quotas)]
+
+    def _reserve(self, project_id, delta, expire=None, sync_usages=True,
+                 nested=True):
+        if expire is None:
+            expire = timeutils.utcnow() + datetime.timedelta(days=1)
+        limits = {'subtree_res': 10}
+        hierarchy = self._hierarchy(project_id) if nested else None
+        return db.quota_reserve(self.ctxt, self.resources, limits, limits,
+                                {'subtree_res': delta}, expire, 0, 0,
+                                project_id, 'user1',
+                                hierarchy=hierarchy,
+                                sync_usages=sync_usages,
+                                subtrees={'root': ['child'], 'child': []})
+
+    def _get_usage(self, project_id):
+        usage = sqlalchemy_api.model_query(self.ctxt, models.QuotaUsage).\
+                    filter_by(project_id=project_id).\
+                    first()
+        return usage.in_use, usage.until_refresh
+
+    def _get_subtree_usages(self):
+        rows = sqlalchemy_api.model_query(self.ctxt,
+                                          models.QuotaSubtreeUsage).all()
+        return {row.project_id: (row.parent_id, row.in_use, row.reserved)
+                for row in rows}
+
+    def test_reserve_creates_subtree_usages(self):
+        self._reserve('root', 1)
+        self._reserve('child', 3)
+        self.assertEqual({'root': (None, 3, 4), 'child': ('root', 1, 3)},
+                         self._get_subtree_usages())
+
+    def test_reserve_counts_whole_subtree(self):
+        # The usage of child predates the subtree usages of root.
+        self._reserve('child', 3, nested=False)
+        self._reserve('root', 1)
+        self.assertEqual({'root': (None, 3, 4)},
+                         self._get_subtree_usages())
+
+    def test_reserve_without_subtrees(self):
+        self._reserve('root', 1)
+        limits = {'subtree_res': 10}
+        exc = self.assertRaises(exception.QuotaSubtreeUsageMissing,
+                                db.quota_reserve, self.ctxt, self.resources,
+                                limits, limits, {'subtree_res': 1},
+                                timeutils.utcnow(), 0, 0, 'child', 'user1',
+                                hierarchy=self._hierarchy('child'))
+        self.assertEqual(['child'], exc.kwargs['project_ids'])
+        self.assertEqual({'root': (None, 2, 1)},
+                         self._get_subtree_usages())
+
+    @mock.patch.object(sqlalchemy_api, '_quota_reserve',
+                       side_effect=[db_exc.DBDuplicateEntry(), ['resv-1']])
+    def test_reserve_retries_duplicate_entry(self, mock_reserve):
+        self.assertEqual(['resv-1'], self._reserve('root', 1))
+        self.assertEqual(2, mock_reserve.call_count)
+
+    def test_reserve_over_ancestor_quota(self):
+        self.root_quotas = {'subtree_res': 6}
+        self._reserve('root', 1)
+        self._reserve('child', 2)
+        exc = self.assertRaises(exception.OverQuota,
+                                self._reserve, 'child', 1)
+        self.assertEqual(['subtree_res'], exc.kwargs['overs'])
+        self.assertEqual(6, exc.kwargs['quotas']['subtree_res'])
+        self.assertEqual(dict(in_use=3, reserved=3),
+                         exc.kwargs['usages']['subtree_res'])
+        self.assertEqual({'root': (None, 3, 3), 'child': ('root', 1, 2)},
+                         self._get_subtree_usages())
+
+    def test_quota_subtree_lineage_get(self):
+        self._reserve('child', 3)
+        self.assertEqual([('child', 'root'), ('root', None)],
+                         db.quota_subtree_lineage_get(self.ctxt, 'child'))
+        self.assertEqual([], db.quota_subtree_lineage_get(self.ctxt, 'other'))
+
+    def test_quota_subtree_usage_get_all_by_project(self):
+        self._reserve('root', 1)
+        self._reserve('child', 3)
+        self.assertEqual({'project_id': 'root',
+                          'subtree_res': dict(in_use=3, reserved=4)},
+                         db.quota_subtree_usage_get_all_by_project(self.ctxt,
+                                                                   'root'))
+        self.assertEqual({'project_id': 'other'},
+                         db.quota_subtree_usage_get_all_by_project(self.ctxt,
+                                                                   'other'))
+
+    def test_quota_subtree_usage_create_missing(self):
+        self._reserve('child', 3, nested=False)
+        self._reserve('root', 1, nested=False)
+        self.assertEqual({'project_id': 'root',
+                          'subtree_res': dict(in_use=3, reserved=4)},
+                         db.quota_subtree_usage_create_missing(
+                             self.ctxt, 'root', None, ['child'],
+                             ['subtree_res']))
+        self.assertEqual({'root': (None, 3, 4)}, self._get_subtree_usages())
+
+        # Existing rows are left as they are.
+        self._reserve('child', 2)
+        self.assertEqual({'project_id': 'root',
+                          'subtree_res': dict(in_use=3, reserved=6)},
+                         db.quota_subtree_usage_create_missing(
+                             self.ctxt, 'root', None, ['child'],
+                             ['subtree_res']))
+
+    def test_reservation_commit(self):
+        self._reserve('root', 1)
+        reservations = self._reserve('child', 3)
+        db.reservation_commit(self.ctxt, reservations, 'child', 'user1')
+        self.assertEqual({'root': (None, 6, 1), 'child': ('root', 4, 0)},
+                         self._get_subtree_usages())
+
+    def test_reservation_rollback(self):
+        self._reserve('root', 1)
+        reservations = self._reserve('child', 3)
+        db.reservation_rollback(self.ctxt, reservations, 'child', 'user1')
+        self.assertEqual({'root': (None, 3, 1), 'child': ('root', 1, 0)},
+                         self._get_subtree_usages())
+
+    def test_reservation_expire(self):
+        self._reserve('root', 1)
+        self._reserve('child', 3, expire=timeutils.utcnow())
+        db.reservation_expire(self.ctxt)
+        self.assertEqual({'root': (None, 3, 1), 'child': ('root', 1, 0)},
+                         self._get_subtree_usages())
+
+    def test_reserve_without_sync_marks_usages(self):
+        self._reserve('root', 1, sync_usages=False)
+        self._reserve('child', 3, sync_usages=False)
+        self.assertEqual((0, 0), self._get_usage('root'))
+        self.assertEqual({'root': (None, 0, 4), 'child': ('root', 0, 3)},
+                         self._get_subtree_usages())
+
+    def test_usage_reconcile(self):
+        self._reserve('root', 1, sync_usages=False)
+        self._reserve('child', 3, sync_usages=False)
+        self.assertEqual(2, db.quota_usage_reconcile(self.ctxt,
+                                                     self.resources, 0))
+        self.assertEqual((2, None), self._get_usage('root'))
+        self.assertEqual((1, None), self._get_usage('child'))
+        self.assertEqual({'root': (None, 3, 4), 'child': ('root', 1, 3)},
+                         self._get_subtree_usages())
+        self.assertEqual(0, db.quota_usage_reconcile(self.ctxt,
+                                                     self.resources, 0))
+
+    def test_usage_reconcile_recounts_usage_changed_while_counting(self):
+        self._reserve('root', 1, sync_usages=False)
+        counts = [2, 3]
+
+        def sync(elevated, project_id, user_id, session):
+            if len(counts) == 2:
+                db.quota_usage_update(self.ctxt, project_id, user_id,
+                                      'subtree_res', in_use=1)
+            return {'subtree_res': counts.pop(0)}
+        sqlalchemy_api.QUOTA_SYNC_FUNCTIONS['_sync_subtree_res'] = sync
+
+        self.assertEqual(1, db.quota_usage_reconcile(self.ctxt,
+                                                     self.resources, 0))
+        self.assertEqual([], counts)
+        self.assertEqual((3, None), self._get_usage('root'))
+
 
 class SecurityGroupRuleTestCase(test.TestCase, ModelsObjectComparatorMixin):
     def setUp(self):
@@ -5947,6 +6148,86 @@ class QuotaTestCase(test.TestCase, ModelsObjectComparatorMixin):
         self.assertRaises(exception.ProjectQuotaNotFound,
             db.quota_update, self.ctxt, 'project1', 'resource1', 42)
 
+    def test_quota_generation(self):
+        self.assertEqual(0, db.quota_generation_get(self.ctxt))
+        db.quota_create(self.ctxt, 'project1', 'resource1', 41)
+        self.assertEqual(1, db.quota_generation_get(self.ctxt))
+        db.quota_update(self.ctxt, 'project1', 'resource1', 42)
+        self.assertEqual(2, db.quota_generation_get(self.ctxt))
+        db.quota_destroy_all_by_project_and_user(self.ctxt, 'project1',
+                                                 'user1')
+        self.assertEqual(3, db.quota_generation_get(self.ctxt))
+        db.quota_destroy_all_by_project(self.ctxt, 'project1')
+        self.assertEqual(4, db.quota_generation_get(self.ctxt))
+
+    def test_quota_update_nonexistent_keeps_generation(self):
+        self.assertRaises(exception.ProjectQuotaNotFound,
+            db.quota_update, self.ctxt, 'project1', 'resource1', 42)
+        self.assertEqual(0, db.quota_generation_get(self.ctxt))
+
+    def test_quota_allocated_update(self):
+        for resource in ('resource0', 'resource1', 'resource2'):
+            db.quota_create(self.ctxt, 'parent', resource, 100)
+        db.quota_create(self.ctxt, 'other', 'resource2', 7)
+        db.quota_allocated_update(self.ctxt, 'parent', ['other'])
+        for i in range(3):
+            db.quota_create(self.ctxt, 'child%d' % i, 'resource0', i)
+            db.quota_create(self.ctxt, 'child%d' % i, 'resource1', 10)
+        db.quota_create(self.ctxt, 'other', 'resource0', 50)
+        db.quota_create(self.ctxt, 'child2', 'resource2', None)
+        with mock.patch.object(sqlalchemy_api,
+                               '_QUOTA_CHUNK_SIZE', 2):
+            db.quota_allocated_update(self.ctxt, 'parent',
+                                      ['child0', 'child1', 'child2'])
+        self.assertEqual({'project_id': 'parent', 'resource0': 3,
+                          'resource1': 30, 'resource2': 0},
+                         db.quota_allocated_get_all_by_project(self.ctxt,
+                                                               'parent'))
+
+    def test_quota_child_update(self):
+        db.quota_create(self.ctxt, 'parent', 'resource0', 100)
+        db.quota_create(self.ctxt, 'child0', 'resource0', 10)
+        db.quota_create(self.ctxt, 'child1', 'resource0', 20)
+        db.quota_allocated_update(self.ctxt, 'parent', ['child0', 'child1'])
+
+        db.quota_child_update(self.ctxt, 'parent', 'child0', 'resource0', 15)
+        db.quota_child_update(self.ctxt, 'parent', 'child2', 'resource0', 5)
+        db.quota_child_update(self.ctxt, 'parent', 'child1', 'resource1', 5)
+        db.quota_child_update(self.ctxt, 'parent', 'child1', 'resource0', 7,
+                              user_id='user1')
+
+        self.assertEqual(15, db.quota_get(self.ctxt, 'child0',
+                                          'resource0').hard_limit)
+        self.assertEqual(5, db.quota_get(self.ctxt, 'child2',
+                                         'resource0').hard_limit)
+        self.assertEqual(7, db.quota_get(self.ctxt, 'child1', 'resource0',
+                                         user_id='user1').hard_limit)
+        self.assertEqual({'project_id': 'parent', 'resource0': 40},
+                         db.quota_allocated_get_all_by_project(self.ctxt,
+                                                               'parent'))
+
+    def test_quota_get_all_by_projects(self):
+        for i in range(3):
+            for j in range(2):
+                db.quota_create(self.ctxt, 'proj%d' % i, 'resource%d' % j,
+                                i + j)
+        db.quota_allocated_update(self.ctxt, 'proj1', ['proj2'])
+        with mock.patch.object(sqlalchemy_api, '_QUOTA_CHUNK_SIZE', 1):
+            quotas, allocated = db.quota_and_allocated_get_all_by_projects(
+                self.ctxt, ['proj1', 'proj2', 'proj3'])
+            self.assertEqual(quotas, db.quota_get_all_by_projects(
+                self.ctxt, ['proj1', 'proj2', 'proj3']))
+        self.assertEqual({'proj1': {'project_id': 'proj1',
+                                    'resource0': 1, 'resource1': 2},
+                          'proj2': {'project_id': 'proj2',
+                                    'resource0': 2, 'resource1': 3},
+                          'proj3': {'project_id': 'proj3'}}, quotas)
+        self.assertEqual({'proj1': {'project_id': 'proj1',
+                                    'resource0': 2, 'resource1': 3},
+                          'proj2': {'project_id': 'proj2',
+                                    'resource0': 0, 'resource1': 0},
+                          'proj3': {'project_id': 'proj3'}}, allocated)
+
     def test_quota_get_nonexistent(self):
         self.assertRaises(exception.ProjectQuotaNotFound,
             db.quota_get, self.ctxt, 'project1', 'resource1')
@@ -6007,6 +6288,34 @@ class QuotaTestCase(test.TestCase, ModelsObjectComparatorMixin):
             resources_names.remove(reservation.resource)
         self.assertEqual(len(resources_names), 0)
 
+    def test_quota_consume(self):
+        quotas = {'security_groups': 2}
+        resources = {'security_groups':
+                     quota.QUOTAS._resources['security_groups']}
+        db.security_group_create(self.ctxt, {'project_id': 'project1',
+                                             'user_id': 'user1'})
+
+        db.quota_consume(self.ctxt, resources, quotas, quotas,
+                         {'security_groups': 1}, None, None,
+                         project_id='project1', user_id='user1')
+        usage = db.quota_usage_get(self.ctxt, 'project1', 'security_groups',
+                                   'user1')
+        self.assertEqual(2, usage.in_use)
+        self.assertEqual(0, usage.reserved)
+        self.assertEqual(0, sqlalchemy_api.model_query(
+            self.ctxt, models.Reservation).count())
+
+        self.assertRaises(exception.OverQuota, db.quota_consume, self.ctxt,
+                          resources, quotas, quotas, {'security_groups': 1},
+                          None, None, project_id='project1', user_id='user1')
+
+        db.quota_consume(self.ctxt, resources, quotas, quotas,
+                         {'security_groups': -1}, None, None,
+                         project_id='project1', user_id='user1')
+        usage = db.quota_usage_get(self.ctxt, 'project1', 'security_groups',
+                                   'user1')
+        self.assertEqual(1, usage.in_use)
+
     def test_quota_destroy_all_by_project(self):
         reservations = _quota_reserve(self.ctxt, 'project1', 'user1')
         db.quota_destroy_all_by_project(self.ctxt, 'project1')
@@ -6060,6 +6369,18 @@ class QuotaTestCase(test.TestCase, ModelsObjectComparatorMixin):
         self.assertEqual(expected, db.quota_usage_get_all_by_project(
                          self.ctxt, 'p1'))
 
+    def test_quota_usage_get_all_by_projects(self):
+        _quota_reserve(self.ctxt, 'p1', 'u1')
+        _quota_reserve(self.ctxt, 'p2', 'u2')
+        usages = {'resource0': {'in_use': 0, 'reserved': 0},
+                  'resource1': {'in_use': 1, 'reserved': 1},
+                  'fixed_ips': {'in_use': 2, 'reserved': 2}}
+        expected = {'p1': dict(usages, project_id='p1'),
+                    'p2': dict(usages, project_id='p2'),
+                    'p3': {'project_id': 'p3'}}
+        self.assertEqual(expected, db.quota_usage_get_all_by_projects(
+                         self.ctxt, ['p1', 'p2', 'p3']))
+
     def test_quota_usage_get_all_by_project_and_user(self):
         _quota_reserve(self.ctxt, 'p1', 'u1')
         expected = {'project_id': 'p1',
@@ -6270,6 +6591,11 @@ class QuotaClassTestCase(test.TestCase, ModelsObjectComparatorMixin):
         self.assertEqual(db.quota_class_get(self.ctxt, 'class name',
                                     'resource').hard_limit, 43)
 
+    def test_quota_class_generation(self):
+        db.quota_class_create(self.ctxt, 'class name', 'resource', 42)
+        db.quota_class_update(self.ctxt, 'class name', 'resource', 43)
+        self.assertEqual(2, db.quota_generation_get(self.ctxt))
+
     def test_quota_class_update_nonexistent(self):
         self.assertRaises(exception.QuotaClassNotFound, db.quota_class_update,
                                 self.ctxt, 'class name', 'resource', 42)
@@ -6374,6 +6700,30 @@ class ComputeNodeTestCase(test.TestCase, ModelsObjectComparatorMixin):
             new_stats = jsonutils.loads(node['stats'])
             self.assertEqual(self.stats, new_stats)
 
+    def test_compute_node_get_all_changed_since(self):
+        since = self.item['created_at'] + datetime.timedelta(minutes=1)
+        nodes = db.compute_node_get_all_changed_since(self.ctxt,
+                                                      self.item['created_at'])
+        self.assertEqual([self.item['id']], [node['id'] for node in nodes])
+        self.assertEqual([],
+                         db.compute_node_get_all_changed_since(self.ctxt,
+                                                               since))
+
+        timeutils.set_time_override(since)
+        self.addCleanup(timeutils.clear_time_override)
+        db.compute_node_update(self.ctxt, self.item['id'], {'vcpus_used': 1})
+        nodes = db.compute_node_get_all_changed_since(self.ctxt, since)
+        self.assertEqual(1, len(nodes))
+        self.assertEqual(1, nodes[0]['vcpus_used'])
+        self.assertEqual(0, nodes[0]['deleted'])
+
+        timeutils.advance_time_seconds(60)
+        since = timeutils.utcnow()
+        db.compute_node_delete(self.ctxt, self.item['id'])
+        nodes = db.compute_node_get_all_changed_since(self.ctxt, since)
+        self.assertEqual([self.item['id']], [node['id'] for node in nodes])
+        self.assertNotEqual(0, nodes[0]['deleted'])
+
     def test_compute_node_get_all_deleted_compute_node(self):
         # Create a service and compute node and ensure we can find its stats;
         # delete the service and compute node when done and loop again
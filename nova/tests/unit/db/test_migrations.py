@@ -804,6 +804,25 @@ class NovaMigrationsCheckers(test_migrations.ModelsMigrationsSync,
         self.assertColumnNotExists(engine, 'shadow_instance_extra',
                                    'vcpu_model')
 
+    def _check_278(self, engine, data):
+        for table_name in ('quota_subtree_usages',
+                           'shadow_quota_subtree_usages'):
+            for column in ('project_id', 'parent_id', 'resource',
+                           'in_use', 'reserved'):
+                self.assertColumnExists(engine, table_name, column)
+
+    def _post_downgrade_278(self, engine):
+        self.assertTableNotExists(engine, 'quota_subtree_usages')
+        self.assertTableNotExists(engine, 'shadow_quota_subtree_usages')
+
+    def _check_279(self, engine, data):
+        for table_name in ('quota_generations', 'shadow_quota_generations'):
+            self.assertColumnExists(engine, table_name, 'generation')
+
+    def _post_downgrade_279(self, engine):
+        self.assertTableNotExists(engine, 'quota_generations')
+        self.assertTableNotExists(engine, 'shadow_quota_generations')
+
 
 class TestNovaMigrationsSQLite(NovaMigrationsCheckers,
                                test.TestCase,
@@ -277,6 +277,7 @@ policy_data = """
     "compute_extension:v3:os-quota-sets:update": "",
     "compute_extension:v3:os-quota-sets:delete": "",
     "compute_extension:v3:os-quota-sets:detail": "",
+    "compute_extension:v3:os-quota-sets:subtree": "",
     "compute_extension:quota_classes": "",
     "compute_extension:v3:os-quota-class-sets": "",
     "compute_extension:rescue": "",
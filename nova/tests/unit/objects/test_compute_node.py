@@ -12,6 +12,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import iso8601
 import mock
 from oslo_serialization import jsonutils
 from oslo_utils import timeutils
@@ -346,6 +347,19 @@ class _TestComputeNodeObject(object):
                          subs=self.subs(),
                          comparators=self.comparators())
 
+    def test_get_all_changed_since(self):
+        now = NOW.replace(tzinfo=iso8601.iso8601.Utc())
+        self.mox.StubOutWithMock(db, 'compute_node_get_all_changed_since')
+        db.compute_node_get_all_changed_since(self.context, now).AndReturn(
+            [fake_compute_node])
+        self.mox.ReplayAll()
+        computes = compute_node.ComputeNodeList.get_all_changed_since(
+            self.context, now)
+        self.assertEqual(1, len(computes))
+        self.compare_obj(computes[0], fake_compute_node,
+                         subs=self.subs(),
+                         comparators=self.comparators())
+
     def test_get_by_hypervisor(self):
         self.mox.StubOutWithMock(db, 'compute_node_search_by_hypervisor')
         db.compute_node_search_by_hypervisor(self.context, 'hyper').AndReturn(
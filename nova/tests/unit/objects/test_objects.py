@@ -1147,7 +1147,7 @@ object_data = {
     'BlockDeviceMapping': '1.8-c53f09c7f969e0222d9f6d67a950a08e',
     'BlockDeviceMappingList': '1.9-0faaeebdca213010c791bc37a22546e3',
     'ComputeNode': '1.10-70202a38b858977837b313d94475a26b',
-    'ComputeNodeList': '1.10-4ae1f844c247029fbcdb5fdccbe9e619',
+    'ComputeNodeList': '1.11-de8ce0e8b87d685727954a7b321e563e',
     'DNSDomain': '1.0-5bdc288d7c3b723ce86ede998fd5c9ba',
     'DNSDomainList': '1.0-cfb3e7e82be661501c31099523154db4',
     'EC2InstanceMapping': '1.0-627baaf4b12c9067200979bdc4558a99',
@@ -1193,8 +1193,8 @@ object_data = {
     'PciDeviceList': '1.1-38cbe2d3c23b9e46f7a74b486abcad85',
     'PciDevicePool': '1.0-d6ed1abe611c9947345a44155abe6f11',
     'PciDevicePoolList': '1.0-d31e08e0ff620a4df7cc2014b6c50da8',
-    'Quotas': '1.2-36098cf2143e6535873c3fa3d6fe56f7',
-    'QuotasNoOp': '1.2-164c628906b170fd946a7672e85e4935',
+    'Quotas': '1.3-1892cb3ba87ca2983e0ccb488dd64b29',
+    'QuotasNoOp': '1.3-164c628906b170fd946a7672e85e4935',
     'S3ImageMapping': '1.0-9225943a44a91ad0349b9fd8bd3f3ce2',
     'SecurityGroup': '1.1-bba0e72865e0953793e796571692453b',
     'SecurityGroupList': '1.0-528e6448adfeeb78921ebeda499ab72f',
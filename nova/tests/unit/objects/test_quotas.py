@@ -144,6 +144,15 @@ class _TestQuotasObject(object):
         self.mox.ReplayAll()
         quotas.rollback()
 
+    def test_consume(self):
+        self.mox.StubOutWithMock(QUOTAS, 'consume')
+        QUOTAS.consume(self.context, project_id='project_id',
+                       user_id='user_id', moo='cow')
+
+        self.mox.ReplayAll()
+        quotas_obj.Quotas.consume(self.context, project_id='project_id',
+                                  user_id='user_id', moo='cow')
+
     @mock.patch('nova.db.quota_create')
     def test_create_limit(self, mock_create):
         quotas_obj.Quotas.create_limit(self.context, 'fake-project',
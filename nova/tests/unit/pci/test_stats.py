@@ -132,6 +132,17 @@ class PciDeviceStatsTestCase(test.NoDBTestCase):
             self.pci_stats.apply_requests,
             pci_requests_multiple)
 
+    def test_apply_requests_pools_changed(self):
+        self.pci_stats.listener = mock.Mock()
+        self.pci_stats.apply_requests(pci_requests)
+        self.pci_stats.listener.assert_called_once_with()
+
+        self.pci_stats.listener.reset_mock()
+        self.assertRaises(exception.PciDeviceRequestFailed,
+            self.pci_stats.apply_requests,
+            pci_requests_multiple)
+        self.pci_stats.listener.assert_called_once_with()
+
     def test_consume_requests(self):
         devs = self.pci_stats.consume_requests(pci_requests)
         self.assertEqual(2, len(devs))
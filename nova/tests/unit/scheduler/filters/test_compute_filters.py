@@ -13,6 +13,7 @@
 import mock
 
 from nova.scheduler.filters import compute_filter
+from nova.scheduler import host_table
 from nova import test
 from nova.tests.unit.scheduler import fakes
 
@@ -48,3 +49,20 @@ class TestComputeFilter(test.NoDBTestCase):
         service_up_mock.return_value = False
         self.assertFalse(filt_cls.host_passes(host, filter_properties))
         service_up_mock.assert_called_once_with(service)
+
+    def test_compute_filter_vectorized(self, service_up_mock):
+        filt_cls = compute_filter.ComputeFilter()
+        filter_properties = {'instance_type': {'memory_mb': 1024}}
+        services = [{'disabled': True}, {'disabled': False},
+                    {'disabled': False, 'updated_at': 'now'}]
+        hosts = [fakes.FakeHostState('host%d' % i, 'node1',
+                                     {'free_ram_mb': 1024,
+                                      'service': service})
+                 for i, service in enumerate(services)]
+        service_up_mock.side_effect = [True, False]
+        table = host_table.HostStateTable(hosts)
+        self.assertEqual([False, True, False],
+                         list(filt_cls.filter_vectorized(
+                             table, filter_properties)))
+        self.assertEqual([mock.call(services[1]), mock.call(services[2])],
+                         service_up_mock.call_args_list)
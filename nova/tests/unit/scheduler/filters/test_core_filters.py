@@ -13,6 +13,7 @@
 import mock
 
 from nova.scheduler.filters import core_filter
+from nova.scheduler import host_table
 from nova import test
 from nova.tests.unit.scheduler import fakes
 
@@ -41,7 +42,38 @@ class TestCoreFilter(test.NoDBTestCase):
                 {'vcpus_total': 4, 'vcpus_used': 8})
         self.assertFalse(self.filt_cls.host_passes(host, filter_properties))
 
-    @mock.patch('nova.scheduler.filters.utils.aggregate_values_from_db')
+    def test_core_filter_vectorized(self):
+        self.filt_cls = core_filter.CoreFilter()
+        filter_properties = {'instance_type': {'vcpus': 1}}
+        self.flags(cpu_allocation_ratio=2)
+        hosts = [fakes.FakeHostState('host1', 'node1',
+                     {'vcpus_total': 4, 'vcpus_used': 7}),
+                 fakes.FakeHostState('host2', 'node2', {}),
+                 fakes.FakeHostState('host3', 'node3',
+                     {'vcpus_total': 4, 'vcpus_used': 8})]
+        table = host_table.HostStateTable(hosts)
+        self.assertEqual([True, True, False],
+                         list(self.filt_cls.filter_vectorized(
+                             table, filter_properties)))
+        self.assertEqual({'vcpu': 8.0}, hosts[0].limits)
+        self.assertEqual({}, hosts[1].limits)
+        self.assertEqual({}, hosts[2].limits)
+
+    def test_core_filter_preselection(self):
+        self.filt_cls = core_filter.CoreFilter()
+        filter_properties = {'instance_type': {'vcpus': 1}}
+        self.flags(cpu_allocation_ratio=2)
+        hosts = [fakes.FakeHostState('host1', 'node1',
+                     {'vcpus_total': 4, 'vcpus_used': 7}),
+                 fakes.FakeHostState('host2', 'node2', {}),
+                 fakes.FakeHostState('host3', 'node3',
+                     {'vcpus_total': 4, 'vcpus_used': 8})]
+        check = self.filt_cls.preselection(filter_properties)
+        self.assertEqual([True, True, False], map(check, hosts))
+        self.assertEqual({}, hosts[0].limits)
+        self.assertIsNone(self.filt_cls.preselection({}))
+
+    @mock.patch('nova.scheduler.filters.utils.aggregate_values_from_key')
     def test_aggregate_core_filter_value_error(self, agg_mock):
         self.filt_cls = core_filter.AggregateCoreFilter()
         filter_properties = {'context': mock.sentinel.ctx,
@@ -51,11 +83,10 @@ class TestCoreFilter(test.NoDBTestCase):
                 {'vcpus_total': 4, 'vcpus_used': 7})
         agg_mock.return_value = set(['XXX'])
         self.assertTrue(self.filt_cls.host_passes(host, filter_properties))
-        agg_mock.assert_called_once_with(mock.sentinel.ctx, 'host1',
-            'cpu_allocation_ratio')
+        agg_mock.assert_called_once_with(host, 'cpu_allocation_ratio')
         self.assertEqual(4 * 2, host.limits['vcpu'])
 
-    @mock.patch('nova.scheduler.filters.utils.aggregate_values_from_db')
+    @mock.patch('nova.scheduler.filters.utils.aggregate_values_from_key')
     def test_aggregate_core_filter_default_value(self, agg_mock):
         self.filt_cls = core_filter.AggregateCoreFilter()
         filter_properties = {'context': mock.sentinel.ctx,
@@ -66,14 +97,13 @@ class TestCoreFilter(test.NoDBTestCase):
         agg_mock.return_value = set([])
         # False: fallback to default flag w/o aggregates
         self.assertFalse(self.filt_cls.host_passes(host, filter_properties))
-        agg_mock.assert_called_once_with(mock.sentinel.ctx, 'host1',
-            'cpu_allocation_ratio')
+        agg_mock.assert_called_once_with(host, 'cpu_allocation_ratio')
         # True: use ratio from aggregates
         agg_mock.return_value = set(['3'])
         self.assertTrue(self.filt_cls.host_passes(host, filter_properties))
         self.assertEqual(4 * 3, host.limits['vcpu'])
 
-    @mock.patch('nova.scheduler.filters.utils.aggregate_values_from_db')
+    @mock.patch('nova.scheduler.filters.utils.aggregate_values_from_key')
     def test_aggregate_core_filter_conflict_values(self, agg_mock):
         self.filt_cls = core_filter.AggregateCoreFilter()
         filter_properties = {'context': mock.sentinel.ctx,
@@ -13,6 +13,7 @@
 import mock
 
 from nova.scheduler.filters import disk_filter
+from nova.scheduler import host_table
 from nova import test
 from nova.tests.unit.scheduler import fakes
 
@@ -61,7 +62,38 @@ class TestDiskFilter(test.NoDBTestCase):
                 {'free_disk_mb': 11 * 1024, 'total_usable_disk_gb': 12})
         self.assertFalse(filt_cls.host_passes(host, filter_properties))
 
-    @mock.patch('nova.scheduler.filters.utils.aggregate_values_from_db')
+    def test_disk_filter_vectorized(self):
+        self.flags(disk_allocation_ratio=10.0)
+        filt_cls = disk_filter.DiskFilter()
+        filter_properties = {'instance_type': {'root_gb': 100,
+            'ephemeral_gb': 18, 'swap': 1024}}
+        hosts = [fakes.FakeHostState('host1', 'node1',
+                     {'free_disk_mb': 11 * 1024, 'total_usable_disk_gb': 12}),
+                 fakes.FakeHostState('host2', 'node2',
+                     {'free_disk_mb': 10 * 1024, 'total_usable_disk_gb': 12})]
+        table = host_table.HostStateTable(hosts)
+        self.assertEqual([True, False],
+                         list(filt_cls.filter_vectorized(
+                             table, filter_properties)))
+        self.assertEqual({'disk_gb': 12 * 10.0}, hosts[0].limits)
+        self.assertEqual({}, hosts[1].limits)
+
+    def test_disk_filter_preselection(self):
+        self.flags(disk_allocation_ratio=10.0)
+        filt_cls = disk_filter.DiskFilter()
+        filter_properties = {'instance_type': {'root_gb': 100,
+            'ephemeral_gb': 18, 'swap': 1024}}
+        hosts = [fakes.FakeHostState('host1', 'node1',
+                     {'free_disk_mb': 11 * 1024, 'total_usable_disk_gb': 12}),
+                 fakes.FakeHostState('host2', 'node2',
+                     {'free_disk_mb': 10 * 1024, 'total_usable_disk_gb': 12})]
+        check = filt_cls.preselection(filter_properties)
+        self.assertEqual([True, False], map(check, hosts))
+        self.assertEqual({}, hosts[0].limits)
+        self.assertIsNone(disk_filter.AggregateDiskFilter().preselection(
+            filter_properties))
+
+    @mock.patch('nova.scheduler.filters.utils.aggregate_values_from_key')
     def test_aggregate_disk_filter_value_error(self, agg_mock):
         filt_cls = disk_filter.AggregateDiskFilter()
         self.flags(disk_allocation_ratio=1.0)
@@ -75,10 +107,9 @@ class TestDiskFilter(test.NoDBTestCase):
                                     'total_usable_disk_gb': 1})
         agg_mock.return_value = set(['XXX'])
         self.assertTrue(filt_cls.host_passes(host, filter_properties))
-        agg_mock.assert_called_once_with(mock.sentinel.ctx, 'host1',
-            'disk_allocation_ratio')
+        agg_mock.assert_called_once_with(host, 'disk_allocation_ratio')
 
-    @mock.patch('nova.scheduler.filters.utils.aggregate_values_from_db')
+    @mock.patch('nova.scheduler.filters.utils.aggregate_values_from_key')
     def test_aggregate_disk_filter_default_value(self, agg_mock):
         filt_cls = disk_filter.AggregateDiskFilter()
         self.flags(disk_allocation_ratio=1.0)
@@ -93,8 +124,7 @@ class TestDiskFilter(test.NoDBTestCase):
         # Uses global conf.
         agg_mock.return_value = set([])
         self.assertFalse(filt_cls.host_passes(host, filter_properties))
-        agg_mock.assert_called_once_with(mock.sentinel.ctx, 'host1',
-            'disk_allocation_ratio')
+        agg_mock.assert_called_once_with(host, 'disk_allocation_ratio')
 
         agg_mock.return_value = set(['2'])
         self.assertTrue(filt_cls.host_passes(host, filter_properties))
@@ -14,6 +14,7 @@
 import mock
 
 from nova.scheduler.filters import io_ops_filter
+from nova.scheduler import host_table
 from nova import test
 from nova.tests.unit.scheduler import fakes
 
@@ -36,7 +37,17 @@ class TestNumInstancesFilter(test.NoDBTestCase):
         filter_properties = {}
         self.assertFalse(self.filt_cls.host_passes(host, filter_properties))
 
-    @mock.patch('nova.scheduler.filters.utils.aggregate_values_from_db')
+    def test_filter_num_iops_vectorized(self):
+        self.flags(max_io_ops_per_host=8)
+        self.filt_cls = io_ops_filter.IoOpsFilter()
+        hosts = [fakes.FakeHostState('host%d' % num_io_ops, 'node1',
+                                     {'num_io_ops': num_io_ops})
+                 for num_io_ops in (7, 8, 9)]
+        table = host_table.HostStateTable(hosts)
+        self.assertEqual([True, False, False],
+                         list(self.filt_cls.filter_vectorized(table, {})))
+
+    @mock.patch('nova.scheduler.filters.utils.aggregate_values_from_key')
     def test_aggregate_filter_num_iops_value(self, agg_mock):
         self.flags(max_io_ops_per_host=7)
         self.filt_cls = io_ops_filter.AggregateIoOpsFilter()
@@ -45,12 +56,11 @@ class TestNumInstancesFilter(test.NoDBTestCase):
         filter_properties = {'context': mock.sentinel.ctx}
         agg_mock.return_value = set([])
         self.assertFalse(self.filt_cls.host_passes(host, filter_properties))
-        agg_mock.assert_called_once_with(mock.sentinel.ctx, 'host1',
-            'max_io_ops_per_host')
+        agg_mock.assert_called_once_with(host, 'max_io_ops_per_host')
         agg_mock.return_value = set(['8'])
         self.assertTrue(self.filt_cls.host_passes(host, filter_properties))
 
-    @mock.patch('nova.scheduler.filters.utils.aggregate_values_from_db')
+    @mock.patch('nova.scheduler.filters.utils.aggregate_values_from_key')
     def test_aggregate_filter_num_iops_value_error(self, agg_mock):
         self.flags(max_io_ops_per_host=8)
         self.filt_cls = io_ops_filter.AggregateIoOpsFilter()
@@ -59,5 +69,4 @@ class TestNumInstancesFilter(test.NoDBTestCase):
         agg_mock.return_value = set(['XXX'])
         filter_properties = {'context': mock.sentinel.ctx}
         self.assertTrue(self.filt_cls.host_passes(host, filter_properties))
-        agg_mock.assert_called_once_with(mock.sentinel.ctx, 'host1',
-            'max_io_ops_per_host')
+        agg_mock.assert_called_once_with(host, 'max_io_ops_per_host')
@@ -148,3 +148,55 @@ class TestNUMATopologyFilter(test.NoDBTestCase):
         self.assertEqual(limits_topology.cells[1].cpu_limit, 42)
         self.assertEqual(limits_topology.cells[0].memory_limit, 665)
         self.assertEqual(limits_topology.cells[1].memory_limit, 665)
+
+    def _filter_properties(self, memory=512):
+        instance_topology = objects.InstanceNUMATopology(
+            cells=[objects.InstanceNUMACell(id=0, cpuset=set([1]),
+                                            memory=memory)])
+        instance = fake_instance.fake_instance_obj(mock.sentinel.ctx)
+        instance.numa_topology = instance_topology
+        return {
+            'request_spec': {
+                'instance_properties': jsonutils.to_primitive(
+                    obj_base.obj_to_primitive(instance))}}
+
+    def test_numa_topology_filter_all_fits_once_per_state(self):
+        used_topology = fakes.NUMA_TOPOLOGY.obj_clone()
+        used_topology.cells[0].memory_usage = 512
+        used_topology.cells[1].memory_usage = 512
+        hosts = [fakes.FakeHostState('host%d' % i, 'node%d' % i,
+                                     {'numa_topology': topology,
+                                      'pci_stats': None})
+                 for i, topology in enumerate([
+                     fakes.NUMA_TOPOLOGY._to_json(),
+                     fakes.NUMA_TOPOLOGY._to_json(),
+                     used_topology._to_json(),
+                     fakes.NUMA_TOPOLOGY,
+                     used_topology._to_json()])]
+        filter_properties = self._filter_properties()
+
+        with mock.patch.object(hardware, 'numa_fit_instance_to_host',
+                               wraps=hardware.numa_fit_instance_to_host
+                               ) as fit:
+            result = list(self.filt_cls.filter_all(hosts, filter_properties))
+
+        self.assertEqual([hosts[0], hosts[1], hosts[3]], result)
+        self.assertEqual(2, fit.call_count)
+        for host in result:
+            self.assertIn('numa_topology', host.limits)
+        self.assertNotIn('numa_topology', hosts[2].limits)
+
+    def test_numa_topology_filter_all_same_as_host_passes(self):
+        hosts = [fakes.FakeHostState('host%d' % i, 'node%d' % i,
+                                     {'numa_topology': topology,
+                                      'pci_stats': None})
+                 for i, topology in enumerate([
+                     fakes.NUMA_TOPOLOGY._to_json(), None,
+                     fakes.NUMA_TOPOLOGY._to_json()])]
+        for memory in (256, 1024):
+            expected = [host for host in hosts
+                        if self.filt_cls.host_passes(
+                            host, self._filter_properties(memory))]
+            filter_properties = self._filter_properties(memory)
+            self.assertEqual(expected, list(self.filt_cls.filter_all(
+                hosts, filter_properties)))
@@ -13,7 +13,9 @@
 import mock
 
 from nova import objects
+from nova.pci import stats as pci_stats
 from nova.scheduler.filters import pci_passthrough_filter
+from nova.scheduler import pci_index
 from nova import test
 from nova.tests.unit.scheduler import fakes
 
@@ -65,3 +67,55 @@ class TestPCIPassthroughFilter(test.NoDBTestCase):
             attribute_dict={})
         self.assertRaises(AttributeError, self.filt_cls.host_passes,
                           host, filter_properties)
+
+    def _indexed_hosts(self):
+        index = pci_index.PciPoolIndex()
+        hosts = []
+        for i, count in enumerate([0, 1, 2]):
+            pools = objects.PciDevicePoolList(objects=[
+                objects.PciDevicePool(vendor_id='8086', product_id='1520',
+                                      tags={}, count=count)] if count else [])
+            host = fakes.FakeHostState(
+                'host%d' % i, 'node%d' % i,
+                {'pci_stats': pci_stats.PciDeviceStats(pools),
+                 'pci_index': index})
+            index.update(host)
+            hosts.append(host)
+        return hosts
+
+    def test_pci_passthrough_filter_all_indexed(self):
+        hosts = self._indexed_hosts()
+        request = objects.InstancePCIRequest(count=2,
+            spec=[{'vendor_id': '8086'}])
+        filter_properties = {
+            'pci_requests': objects.InstancePCIRequests(requests=[request])}
+
+        with mock.patch.object(pci_stats.PciDeviceStats,
+                               'support_requests') as support_requests:
+            result = list(self.filt_cls.filter_all(hosts, filter_properties))
+        self.assertEqual([hosts[2]], result)
+        self.assertFalse(support_requests.called)
+
+    def test_pci_passthrough_filter_all_indexed_requests_compete(self):
+        hosts = self._indexed_hosts()
+        requests = [objects.InstancePCIRequest(count=1,
+                        spec=[{'vendor_id': '8086'}]),
+                    objects.InstancePCIRequest(count=2,
+                        spec=[{'product_id': '1520'}])]
+        filter_properties = {
+            'pci_requests': objects.InstancePCIRequests(requests=requests)}
+
+        self.assertEqual([], list(self.filt_cls.filter_all(
+            hosts, filter_properties)))
+
+    def test_pci_passthrough_filter_all_not_indexed(self):
+        hosts = self._indexed_hosts()
+        hosts[0].pci_index = None
+        hosts[0].pci_stats.pools = hosts[2].pci_stats.pools
+        request = objects.InstancePCIRequest(count=2,
+            spec=[{'vendor_id': '8086'}])
+        filter_properties = {
+            'pci_requests': objects.InstancePCIRequests(requests=[request])}
+
+        self.assertEqual([hosts[0], hosts[2]], list(self.filt_cls.filter_all(
+            hosts, filter_properties)))
@@ -13,6 +13,7 @@
 import mock
 
 from nova.scheduler.filters import ram_filter
+from nova.scheduler import host_table
 from nova import test
 from nova.tests.unit.scheduler import fakes
 
@@ -45,8 +46,31 @@ class TestRamFilter(test.NoDBTestCase):
         self.assertTrue(self.filt_cls.host_passes(host, filter_properties))
         self.assertEqual(2048 * 2.0, host.limits['memory_mb'])
 
+    def test_ram_filter_vectorized(self):
+        ram_filter.RamFilter.ram_allocation_ratio = 2.0
+        filter_properties = {'instance_type': {'memory_mb': 1024}}
+        hosts = [fakes.FakeHostState('host%d' % i, 'node1',
+                    {'free_ram_mb': free_ram_mb, 'total_usable_ram_mb': 1024})
+                 for i, free_ram_mb in enumerate([-1025, 0, 512])]
+        table = host_table.HostStateTable(hosts)
+        self.assertEqual([False, True, True],
+                         list(self.filt_cls.filter_vectorized(
+                             table, filter_properties)))
+        self.assertEqual({}, hosts[0].limits)
+        self.assertEqual({'memory_mb': 2048.0}, hosts[1].limits)
+
+    def test_ram_filter_preselection(self):
+        ram_filter.RamFilter.ram_allocation_ratio = 2.0
+        filter_properties = {'instance_type': {'memory_mb': 1024}}
+        hosts = [fakes.FakeHostState('host%d' % i, 'node1',
+                    {'free_ram_mb': free_ram_mb, 'total_usable_ram_mb': 1024})
+                 for i, free_ram_mb in enumerate([-1025, 0, 512])]
+        check = self.filt_cls.preselection(filter_properties)
+        self.assertEqual([False, True, True], map(check, hosts))
+        self.assertEqual({}, hosts[1].limits)
+
 
-@mock.patch('nova.scheduler.filters.utils.aggregate_values_from_db')
+@mock.patch('nova.scheduler.filters.utils.aggregate_values_from_key')
 class TestAggregateRamFilter(test.NoDBTestCase):
 
     def setUp(self):
@@ -51,6 +51,17 @@ class CachingSchedulerTestCase(test_scheduler.SchedulerTestCase):
         self.assertFalse(mock_up_hosts.called)
         self.assertEqual([], self.driver.all_host_states)
 
+    @mock.patch.object(caching_scheduler.CachingScheduler,
+                       "_get_up_hosts")
+    def test_get_all_host_states_consumes_claims(self, mock_up_hosts):
+        self.driver.all_host_states = ["asdf"]
+
+        with mock.patch.object(self.driver.host_manager,
+                               "consume_claims") as mock_consume:
+            self.driver._get_all_host_states(self.context)
+
+        mock_consume.assert_called_once_with(["asdf"])
+
     @mock.patch.object(caching_scheduler.CachingScheduler,
                        "_get_up_hosts")
     def test_get_all_host_states_loads_hosts(self, mock_up_hosts):
@@ -0,0 +1,168 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For the claims shared between scheduler workers.
+"""
+
+import iso8601
+import mock
+from oslo_serialization import jsonutils
+from oslo_utils import timeutils
+
+from nova import objects
+from nova.scheduler import claims
+from nova.scheduler import host_manager
+from nova import test
+from nova.tests.unit.scheduler import fakes
+
+
+INSTANCE = {'memory_mb': 512, 'root_gb': 1, 'ephemeral_gb': 0, 'vcpus': 1,
+            'numa_topology': None}
+
+
+class SharedClaimsTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(SharedClaimsTestCase, self).setUp()
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.worker1 = claims.SharedClaims()
+        # Both workers share the in-process fake of memcached.
+        self.worker2 = claims.SharedClaims()
+        self.worker2.mc = self.worker1.mc
+
+    def _host_states(self):
+        return [host_manager.HostState(compute.host,
+                                       compute.hypervisor_hostname,
+                                       compute=compute)
+                for compute in fakes.COMPUTE_NODES[:2]]
+
+    def _place(self, host_state, instance=INSTANCE):
+        host_state.consume_from_instance(instance)
+        self.worker1.publish(host_state, instance)
+
+    def test_consume_claims_of_other_worker(self):
+        host_states1 = self._host_states()
+        host_states2 = self._host_states()
+        self._place(host_states1[0])
+        self._place(host_states1[0])
+
+        self.worker2.consume(host_states2)
+        self.assertEqual(2, len(self.worker2.claims))
+        self.assertEqual(host_states1[0].free_ram_mb,
+                         host_states2[0].free_ram_mb)
+        self.assertEqual(host_states1[0].vcpus_used,
+                         host_states2[0].vcpus_used)
+        self.assertEqual(host_states1[0].free_disk_mb,
+                         host_states2[0].free_disk_mb)
+        self.assertEqual(2, host_states2[0].num_instances)
+        self.assertEqual(fakes.COMPUTE_NODES[1].free_ram_mb,
+                         host_states2[1].free_ram_mb)
+
+        # Claims are only consumed once, and not by their own worker.
+        self.worker2.consume(host_states2)
+        self.worker1.consume(host_states1)
+        self.assertEqual(host_states1[0].free_ram_mb,
+                         host_states2[0].free_ram_mb)
+        self.assertEqual(fakes.COMPUTE_NODES[0].free_ram_mb - 1024,
+                         host_states2[0].free_ram_mb)
+
+    def test_publish_numa_topology(self):
+        host_state = self._host_states()[0]
+        numa_topology = objects.InstanceNUMATopology(cells=[
+            objects.InstanceNUMACell(id=0, cpuset=set([0]), memory=512)])
+        instance = dict(INSTANCE, numa_topology=numa_topology)
+        self.worker1.publish(host_state, instance)
+
+        claim = self.worker1.mc.get(claims.CLAIM_KEY % 1)
+        self.assertEqual(
+            numa_topology.cells[0].cpuset,
+            objects.InstanceNUMATopology.obj_from_primitive(
+                jsonutils.loads(
+                    claim['instance']['numa_topology'])).cells[0].cpuset)
+
+    def test_claims_reported_by_compute_node(self):
+        self._place(self._host_states()[0])
+        timeutils.advance_time_seconds(10)
+        compute = fakes.COMPUTE_NODES[0].obj_clone()
+        compute.updated_at = timeutils.utcnow().replace(
+            tzinfo=iso8601.iso8601.Utc())
+        host_state = host_manager.HostState('host1', 'node1',
+                                            compute=compute)
+
+        self.worker2.consume([host_state])
+        self.assertEqual(compute.free_ram_mb, host_state.free_ram_mb)
+
+    def test_expired_claims(self):
+        self._place(self._host_states()[0])
+        self.worker2.refresh()
+        self.assertEqual(1, len(self.worker2.claims))
+
+        timeutils.advance_time_seconds(61)
+        self.worker2.refresh()
+        self.assertEqual({}, self.worker2.claims)
+
+    def test_claim_not_published_yet(self):
+        self.worker1.mc.add(claims.SEQUENCE_KEY, '0')
+        self.worker1.mc.incr(claims.SEQUENCE_KEY)
+        self.worker2.refresh()
+        self.assertEqual(set([1]), self.worker2.missing)
+
+        self._place(self._host_states()[0])
+        self.worker1.mc.set(claims.CLAIM_KEY % 1,
+                            self.worker1.mc.get(claims.CLAIM_KEY % 2))
+        self.worker1.mc.delete(claims.CLAIM_KEY % 2)
+        self.worker2.refresh()
+        self.assertEqual(1, len(self.worker2.claims))
+        self.assertEqual(set([2]), self.worker2.missing)
+
+        self.worker2.refresh()
+        self.assertEqual(set(), self.worker2.missing)
+
+    def test_sequence_evicted(self):
+        self._place(self._host_states()[0])
+        self._place(self._host_states()[0])
+        self.worker2.refresh()
+        self.worker1.mc.delete(claims.SEQUENCE_KEY)
+        self._place(self._host_states()[1])
+
+        self.worker2.refresh()
+        self.assertEqual(3, len(self.worker2.claims))
+        self.assertEqual(1, self.worker2.sequence)
+
+
+class HostManagerSharedClaimsTestCase(test.NoDBTestCase):
+    def test_disabled(self):
+        manager = host_manager.HostManager()
+        self.assertIsNone(manager.shared_claims)
+        host_state = fakes.FakeHostState('host1', 'node1', {})
+        manager.claim(host_state, INSTANCE)
+        manager.consume_claims([host_state])
+
+    @mock.patch('nova.objects.AggregateList.get_all', return_value=[])
+    @mock.patch('nova.objects.ServiceList.get_by_topic',
+                return_value=fakes.SERVICES)
+    @mock.patch('nova.objects.ComputeNodeList.get_all',
+                return_value=fakes.COMPUTE_NODES)
+    def test_get_all_host_states(self, get_all, get_by_topic, get_aggs):
+        self.flags(scheduler_shared_claims=True)
+        manager1 = host_manager.HostManager()
+        manager2 = host_manager.HostManager()
+        manager2.shared_claims.mc = manager1.shared_claims.mc
+
+        host_state = manager1.host_state_cls(
+            'host1', 'node1', compute=fakes.COMPUTE_NODES[0])
+        manager1.claim(host_state, INSTANCE)
+        manager2.get_all_host_states('fake_context')
+
+        self.assertEqual(
+            fakes.COMPUTE_NODES[0].free_ram_mb - INSTANCE['memory_mb'],
+            manager2.host_state_map[('host1', 'node1')].free_ram_mb)
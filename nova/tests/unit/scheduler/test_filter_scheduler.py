@@ -16,10 +16,13 @@
 Tests For Filter Scheduler.
 """
 
+import contextlib
+
 import mock
 
 from nova import exception
 from nova.scheduler import filter_scheduler
+from nova.scheduler.filters import ram_filter
 from nova.scheduler import host_manager
 from nova.scheduler import utils as scheduler_utils
 from nova.scheduler import weights
@@ -36,6 +39,13 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
     driver_cls = filter_scheduler.FilterScheduler
 
+    def setUp(self):
+        super(FilterSchedulerTestCase, self).setUp()
+        patcher = mock.patch('nova.objects.AggregateList.get_all',
+                             return_value=[])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     @mock.patch('nova.objects.ServiceList.get_by_topic',
                 return_value=fakes.SERVICES)
     @mock.patch('nova.objects.ComputeNodeList.get_all',
@@ -51,7 +61,7 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
         self.next_weight = 1.0
 
-        def _fake_weigh_objects(_self, functions, hosts, options):
+        def _fake_weigh_objects(_self, functions, hosts, options, limit=None):
             self.next_weight += 2.0
             host_state = hosts[0]
             return [weights.WeighedHost(host_state, self.next_weight)]
@@ -200,7 +210,7 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
         self.next_weight = 50
 
-        def _fake_weigh_objects(_self, functions, hosts, options):
+        def _fake_weigh_objects(_self, functions, hosts, options, limit=None):
             this_weight = self.next_weight
             self.next_weight = 0
             host_state = hosts[0]
@@ -250,7 +260,7 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
         selected_hosts = []
         selected_nodes = []
 
-        def _fake_weigh_objects(_self, functions, hosts, options):
+        def _fake_weigh_objects(_self, functions, hosts, options, limit=None):
             self.next_weight += 2.0
             host_state = hosts[0]
             selected_hosts.append(host_state.host)
@@ -318,3 +328,123 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
                 # Make sure that we provided a reason why NoValidHost.
                 self.assertIn('reason', e.kwargs)
                 self.assertTrue(len(e.kwargs['reason']) > 0)
+
+    def test_select_destinations_tracked_group(self):
+        self.flags(scheduler_default_filters=['ServerGroupAntiAffinityFilter'])
+        driver = filter_scheduler.FilterScheduler()
+        group_index = driver.host_manager.group_index
+        hosts = [host_manager.HostState(compute.host,
+                                        compute.hypervisor_hostname,
+                                        compute=compute)
+                 for compute in fakes.COMPUTE_NODES[:4]]
+        instance_properties = {'project_id': 1, 'root_gb': 1,
+                               'memory_mb': 512, 'ephemeral_gb': 0,
+                               'vcpus': 1, 'os_type': 'Linux',
+                               'uuid': 'inst1', 'numa_topology': None}
+        request_spec = dict(instance_properties=instance_properties,
+                            instance_type={'memory_mb': 512, 'root_gb': 1,
+                                           'ephemeral_gb': 0, 'vcpus': 1},
+                            instance_uuids=['inst1', 'inst2'],
+                            num_instances=2)
+        filter_properties = {'group_updated': True,
+                             'group_uuid': 'group1',
+                             'group_hosts': set(),
+                             'group_policies': ['anti-affinity']}
+
+        with contextlib.nested(
+            mock.patch.object(driver, '_get_all_host_states',
+                              return_value=iter(hosts)),
+            mock.patch.object(group_index, 'get_hosts',
+                              return_value=set(['host1', 'host2'])),
+            mock.patch.object(group_index, 'add'),
+        ) as (get_all_host_states, get_hosts, add):
+            dests = driver.select_destinations(self.context, request_spec,
+                                               filter_properties)
+
+        get_hosts.assert_called_once_with(mock.ANY, 'group1', refresh=False)
+        self.assertEqual(set(['host3', 'host4']),
+                         set(dest['host'] for dest in dests))
+        self.assertEqual([mock.call('group1', 'inst1', dests[0]['host']),
+                          mock.call('group1', 'inst2', dests[1]['host'])],
+                         add.call_args_list)
+
+    def test_select_destinations_tracked_group_retry(self):
+        driver = filter_scheduler.FilterScheduler()
+        group_index = driver.host_manager.group_index
+        request_spec = dict(instance_properties={'project_id': 1,
+                                                 'os_type': 'Linux'},
+                            num_instances=1)
+        filter_properties = {'group_uuid': 'group1',
+                             'retry': {'num_attempts': 2,
+                                       'hosts': [['host1', 'node1']]}}
+
+        with contextlib.nested(
+            mock.patch.object(driver, '_get_all_host_states',
+                              return_value=iter([])),
+            mock.patch.object(group_index, 'get_hosts',
+                              return_value=set(['host1'])),
+        ) as (get_all_host_states, get_hosts):
+            self.assertRaises(exception.NoValidHost,
+                              driver.select_destinations, self.context,
+                              request_spec, filter_properties)
+
+        get_hosts.assert_called_once_with(mock.ANY, 'group1', refresh=True)
+
+    def _schedule_on_compute_nodes(self, driver, num_instances):
+        hosts = [host_manager.HostState(compute.host,
+                                        compute.hypervisor_hostname,
+                                        compute=compute)
+                 for compute in fakes.COMPUTE_NODES[:4]]
+        instance_properties = {'project_id': 1,
+                               'root_gb': 1,
+                               'memory_mb': 1024,
+                               'ephemeral_gb': 0,
+                               'vcpus': 1,
+                               'os_type': 'Linux',
+                               'uuid': 'fake-uuid',
+                               'numa_topology': None}
+        request_spec = dict(instance_properties=instance_properties,
+                            instance_type={'memory_mb': 1024,
+                                           'root_gb': 1,
+                                           'ephemeral_gb': 0,
+                                           'vcpus': 1},
+                            num_instances=num_instances)
+        with mock.patch.object(driver, '_get_all_host_states',
+                               return_value=iter(hosts)):
+            return [weighed_host.obj.host
+                    for weighed_host in driver._schedule(self.context,
+                                                         request_spec, {})]
+
+    def test_schedule_batch_placement(self):
+        self.flags(scheduler_default_filters=['RamFilter'])
+        ram_filter.RamFilter.ram_allocation_ratio = 1.0
+        expected = self._schedule_on_compute_nodes(
+            filter_scheduler.FilterScheduler(), 13)
+        # The hosts only have room for 12 instances of 1024MB, and the
+        # io_ops weigher spreads them.
+        self.assertEqual(12, len(expected))
+        self.assertEqual(['host4', 'host3', 'host2'], expected[:3])
+
+        self.flags(scheduler_batch_placement=True)
+        driver = filter_scheduler.FilterScheduler()
+        with mock.patch.object(driver.host_manager, 'get_filtered_hosts',
+                               wraps=driver.host_manager.get_filtered_hosts
+                               ) as get_filtered_hosts:
+            self.assertEqual(expected,
+                             self._schedule_on_compute_nodes(driver, 13))
+
+        # The hosts are only all filtered for the first instance.
+        for call in get_filtered_hosts.call_args_list[1:]:
+            self.assertEqual(1, len(call[0][0]))
+
+    def test_schedule_batch_placement_host_subset(self):
+        self.flags(scheduler_default_filters=['RamFilter'],
+                   scheduler_host_subset_size=3,
+                   scheduler_batch_placement=True)
+        ram_filter.RamFilter.ram_allocation_ratio = 1.0
+        hosts = self._schedule_on_compute_nodes(
+            filter_scheduler.FilterScheduler(), 13)
+        self.assertEqual(12, len(hosts))
+        self.assertEqual(8, hosts.count('host4'))
+        self.assertEqual(3, hosts.count('host3'))
+        self.assertEqual(1, hosts.count('host2'))
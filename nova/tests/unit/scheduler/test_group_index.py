@@ -0,0 +1,100 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For the ServerGroupIndex.
+"""
+
+import mock
+from oslo_utils import timeutils
+
+from nova import context
+from nova import objects
+from nova.scheduler import group_index
+from nova import test
+
+
+class ServerGroupIndexTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(ServerGroupIndexTestCase, self).setUp()
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.context = context.get_admin_context()
+        self.index = group_index.ServerGroupIndex()
+        self.group = objects.InstanceGroup(uuid='group1',
+                                           members=['inst1', 'inst2',
+                                                    'inst3', 'inst4'])
+        self.instances = [
+            objects.Instance(uuid='inst1', host='host1'),
+            objects.Instance(uuid='inst2', host='host1'),
+            objects.Instance(uuid='inst3', host='host2'),
+            objects.Instance(uuid='inst4', host=None),
+        ]
+        patcher = mock.patch.object(objects.InstanceGroup, 'get_by_uuid',
+                                    return_value=self.group)
+        self.get_group = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(objects.InstanceList, 'get_by_filters',
+                                    return_value=self.instances)
+        self.get_instances = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_get_hosts(self):
+        self.assertEqual(set(['host1', 'host2']),
+                         self.index.get_hosts(self.context, 'group1'))
+        self.get_group.assert_called_once_with(self.context, 'group1')
+        self.get_instances.assert_called_once_with(
+            self.context, filters={'uuid': self.group.members,
+                                   'deleted': False},
+            expected_attrs=[])
+
+        # The group is only read once.
+        self.index.get_hosts(self.context, 'group1')
+        self.assertEqual(1, self.get_instances.call_count)
+
+    def test_add_and_remove(self):
+        self.index.add('group1', 'inst5', 'host3')
+        self.assertNotIn('inst5', self.index.members)
+
+        self.index.get_hosts(self.context, 'group1')
+        self.index.add('group1', 'inst4', 'host3')
+        self.index.remove('inst3')
+        self.index.remove('inst1')
+        self.index.remove('unknown')
+        self.assertEqual(set(['host1', 'host3']),
+                         self.index.get_hosts(self.context, 'group1'))
+
+        # A member placed again moves to its new host.
+        self.index.add('group1', 'inst2', 'host2')
+        self.assertEqual(set(['host2', 'host3']),
+                         self.index.get_hosts(self.context, 'group1'))
+
+    def test_refresh(self):
+        self.flags(scheduler_server_group_refresh_interval=600)
+        self.index.get_hosts(self.context, 'group1')
+        self.index.remove('inst3')
+        self.instances[3].host = 'host3'
+
+        timeutils.advance_time_seconds(601)
+        self.assertEqual(set(['host1', 'host2', 'host3']),
+                         self.index.get_hosts(self.context, 'group1'))
+        self.assertEqual(2, self.get_instances.call_count)
+        self.assertEqual(set(['inst1', 'inst2', 'inst3', 'inst4']),
+                         self.index.group_members['group1'])
+
+    def test_get_hosts_refresh(self):
+        self.index.get_hosts(self.context, 'group1')
+        self.instances[3].host = 'host3'
+
+        self.assertEqual(set(['host1', 'host2', 'host3']),
+                         self.index.get_hosts(self.context, 'group1',
+                                              refresh=True))
+        self.assertEqual(2, self.get_instances.call_count)
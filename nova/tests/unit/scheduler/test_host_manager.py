@@ -16,9 +16,14 @@
 Tests For HostManager
 """
 
+import contextlib
+import datetime
+
+import iso8601
 import mock
 from oslo_config import cfg
 from oslo_serialization import jsonutils
+from oslo_utils import timeutils
 import six
 
 from nova.compute import task_states
@@ -28,6 +33,8 @@ from nova import objects
 from nova.objects import base as obj_base
 from nova.scheduler import filters
 from nova.scheduler import host_manager
+from nova.scheduler import shards
+from nova.scheduler import trace
 from nova import test
 from nova.tests.unit import matchers
 from nova.tests.unit.scheduler import fakes
@@ -273,7 +280,109 @@ class HostManagerTestCase(test.NoDBTestCase):
                 fake_properties)
         self._verify_result(info, result, False)
 
-    def test_get_all_host_states(self):
+    def test_get_filtered_hosts_with_preselection(self):
+        self.flags(scheduler_preselect_hosts=True)
+        fake_properties = {'moo': 1, 'cow': 2}
+
+        def fake_preselection(_self, filter_props):
+            self.assertEqual(fake_properties, filter_props)
+            return lambda host_state: host_state.nodename == 'fake-node'
+
+        self.stubs.Set(FakeFilterClass1, 'preselection', fake_preselection)
+        info = {'expected_objs': self.fake_hosts[:4],
+                'expected_fprops': fake_properties}
+        self._mock_get_filtered_hosts(info)
+
+        self.mox.ReplayAll()
+
+        result = self.host_manager.get_filtered_hosts(self.fake_hosts,
+                fake_properties)
+        self._verify_result(info, result)
+
+    def test_get_filtered_hosts_with_force_hosts_skips_preselection(self):
+        self.flags(scheduler_preselect_hosts=True)
+        fake_properties = {'force_hosts': ['fake_multihost']}
+        self.stubs.Set(FakeFilterClass1, 'preselection',
+                       lambda _self, filter_props: lambda host_state: False)
+        info = {'expected_objs': self.fake_hosts[4:],
+                'expected_fprops': fake_properties}
+        self._mock_get_filtered_hosts(info)
+
+        self.mox.ReplayAll()
+
+        result = self.host_manager.get_filtered_hosts(self.fake_hosts,
+                fake_properties)
+        self._verify_result(info, result, False)
+
+    @mock.patch.object(shards, 'get_filtered_objects')
+    def test_get_filtered_hosts_in_shards(self, mock_shards):
+        self.flags(scheduler_filter_workers=2)
+        fake_properties = {'moo': 1, 'cow': 2}
+        fake_filters = [FakeFilterClass1()]
+        with mock.patch.object(self.host_manager, '_choose_host_filters',
+                               return_value=fake_filters):
+            result = self.host_manager.get_filtered_hosts(self.fake_hosts,
+                    fake_properties)
+
+        self.assertEqual(mock_shards.return_value, result)
+        mock_shards.assert_called_once_with(self.host_manager.filter_handler,
+                fake_filters, self.fake_hosts, fake_properties, 0)
+
+    @mock.patch.object(shards, 'get_filtered_objects')
+    def test_get_filtered_hosts_traced_not_in_shards(self, mock_shards):
+        self.flags(scheduler_filter_workers=2)
+        fake_properties = {'moo': 1, 'cow': 2}
+        info = {'expected_objs': self.fake_hosts,
+                'expected_fprops': fake_properties}
+        self._mock_get_filtered_hosts(info)
+
+        self.mox.ReplayAll()
+
+        with contextlib.nested(
+                mock.patch.object(trace, 'current', return_value=mock.Mock()),
+                mock.patch.object(trace, 'start_step', return_value=None)):
+            result = self.host_manager.get_filtered_hosts(self.fake_hosts,
+                    fake_properties)
+        self._verify_result(info, result)
+        self.assertFalse(mock_shards.called)
+
+    def test_get_filtered_hosts_with_aggregate_pruning(self):
+        self.flags(scheduler_prune_by_aggregates=True)
+        fake_properties = {'moo': 1, 'cow': 2}
+        # fake_host1-4 are in one aggregate, fake_multihost in none.
+        aggregates = [objects.Aggregate(id=1, metadata={})]
+        for host_state in self.fake_hosts[:4]:
+            host_state.aggregates = aggregates
+        no_aggregates = []
+        for host_state in self.fake_hosts[4:]:
+            host_state.aggregates = no_aggregates
+
+        aggregate_filter = FakeFilterClass1()
+        aggregate_filter.uses_aggregates_only = True
+        other_filter = FakeFilterClass2()
+        filters = [aggregate_filter, other_filter]
+
+        with contextlib.nested(
+                mock.patch.object(self.host_manager, '_choose_host_filters',
+                                  return_value=filters),
+                mock.patch.object(aggregate_filter, 'host_passes',
+                                  side_effect=lambda host_state, props:
+                                      host_state.aggregates is aggregates),
+                mock.patch.object(other_filter, 'host_passes',
+                                  return_value=True)
+        ) as (choose_mock, aggregate_passes, other_passes):
+            result = self.host_manager.get_filtered_hosts(self.fake_hosts,
+                                                          fake_properties)
+
+        self.assertEqual(self.fake_hosts[:4], result)
+        self.assertEqual(
+            [mock.call(self.fake_hosts[0], fake_properties),
+             mock.call(self.fake_hosts[4], fake_properties)],
+            aggregate_passes.call_args_list)
+        self.assertEqual(4, other_passes.call_count)
+
+    @mock.patch('nova.objects.AggregateList.get_all', return_value=[])
+    def test_get_all_host_states(self, get_aggs):
 
         context = 'fake_context'
 
@@ -333,6 +442,62 @@ class HostManagerTestCase(test.NoDBTestCase):
         self.assertEqual(host_states_map[('host4', 'node4')].free_disk_mb,
                          8388608)
 
+    @mock.patch('nova.objects.AggregateList.get_all')
+    @mock.patch('nova.objects.ServiceList.get_by_topic',
+                return_value=fakes.SERVICES)
+    @mock.patch('nova.objects.ComputeNodeList.get_all',
+                return_value=fakes.COMPUTE_NODES)
+    def test_get_all_host_states_aggregates(self, get_all, get_by_topic,
+                                            get_aggs):
+        agg1 = objects.Aggregate(id=1, name='agg1', hosts=['host1', 'host2'],
+                                 metadata={'availability_zone': 'az1'})
+        agg2 = objects.Aggregate(id=2, name='agg2', hosts=['host2'],
+                                 metadata={})
+        get_aggs.return_value = [agg1, agg2]
+
+        self.host_manager.get_all_host_states('fake_context')
+
+        get_aggs.assert_called_once_with('fake_context')
+        host_states_map = self.host_manager.host_state_map
+        self.assertEqual([agg1],
+                         host_states_map[('host1', 'node1')].aggregates)
+        self.assertEqual([agg1, agg2],
+                         host_states_map[('host2', 'node2')].aggregates)
+        self.assertEqual([], host_states_map[('host3', 'node3')].aggregates)
+        # Hosts in the same aggregates share the list.
+        self.assertIs(host_states_map[('host3', 'node3')].aggregates,
+                      host_states_map[('host4', 'node4')].aggregates)
+
+    @mock.patch('nova.objects.AggregateList.get_all', return_value=[])
+    @mock.patch('nova.objects.ServiceList.get_by_topic',
+                return_value=fakes.SERVICES)
+    @mock.patch('nova.objects.ComputeNodeList.get_all')
+    def test_get_all_host_states_pci_index(self, get_all, get_by_topic,
+                                           get_aggs):
+        compute = fakes.COMPUTE_NODES[0].obj_clone()
+        compute.pci_device_pools = objects.PciDevicePoolList(objects=[
+            objects.PciDevicePool(vendor_id='8086', product_id='1520',
+                                  tags={}, count=2)])
+        get_all.return_value = [compute] + fakes.COMPUTE_NODES[1:4]
+        requests = [objects.InstancePCIRequest(count=2,
+                                               spec=[{'vendor_id': '8086'}])]
+
+        self.host_manager.get_all_host_states('fake_context')
+        host_state = self.host_manager.host_state_map[('host1', 'node1')]
+        self.assertIs(self.host_manager.pci_index, host_state.pci_index)
+        self.assertEqual(set([('host1', 'node1')]),
+                         self.host_manager.pci_index.hosts_supporting(
+                             requests))
+
+        # The index follows the PCI devices the scheduler consumes.
+        host_state.pci_stats.apply_requests(requests[:1])
+        self.assertEqual(set(), self.host_manager.pci_index.hosts_supporting(
+            requests))
+
+        get_all.return_value = fakes.COMPUTE_NODES[1:4]
+        self.host_manager.get_all_host_states('fake_context')
+        self.assertEqual({}, self.host_manager.pci_index.host_kinds)
+
 
 class HostManagerChangedNodesTestCase(test.NoDBTestCase):
     """Test case for HostManager class."""
@@ -340,6 +505,10 @@ class HostManagerChangedNodesTestCase(test.NoDBTestCase):
     def setUp(self):
         super(HostManagerChangedNodesTestCase, self).setUp()
         self.host_manager = host_manager.HostManager()
+        patcher = mock.patch('nova.objects.AggregateList.get_all',
+                             return_value=[])
+        patcher.start()
+        self.addCleanup(patcher.stop)
         self.fake_hosts = [
               host_manager.HostState('host1', 'node1'),
               host_manager.HostState('host2', 'node2'),
@@ -404,6 +573,108 @@ class HostManagerChangedNodesTestCase(test.NoDBTestCase):
         self.assertEqual(len(host_states_map), 0)
 
 
+class HostManagerIncrementalRefreshTestCase(test.NoDBTestCase):
+    """Test case for the incremental refreshes of HostManager."""
+
+    def setUp(self):
+        super(HostManagerIncrementalRefreshTestCase, self).setUp()
+        self.flags(scheduler_incremental_host_refresh=True)
+        self.host_manager = host_manager.HostManager()
+        self.context = 'fake_context'
+        self.start = datetime.datetime(2015, 1, 1,
+                                       tzinfo=iso8601.iso8601.Utc())
+        self.compute_nodes = [self._compute_node(compute, self.start)
+                              for compute in fakes.COMPUTE_NODES]
+        self._patch('nova.objects.ServiceList.get_by_topic',
+                    return_value=fakes.SERVICES)
+        self.get_all = self._patch('nova.objects.ComputeNodeList.get_all',
+                                   return_value=self.compute_nodes)
+        self.get_all_changed_since = self._patch(
+            'nova.objects.ComputeNodeList.get_all_changed_since')
+        self._patch('nova.objects.AggregateList.get_all', return_value=[])
+
+    def _patch(self, target, **kwargs):
+        patcher = mock.patch(target, **kwargs)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def _compute_node(self, compute, changed_at, deleted=False, **updates):
+        compute = compute.obj_clone()
+        compute.created_at = self.start
+        compute.updated_at = changed_at
+        compute.deleted_at = changed_at if deleted else None
+        compute.deleted = deleted
+        compute.update(updates)
+        return compute
+
+    def test_changed_and_deleted_nodes(self):
+        changed_at = self.start + datetime.timedelta(minutes=1)
+        self.get_all_changed_since.return_value = [
+            self._compute_node(self.compute_nodes[0], changed_at,
+                               free_ram_mb=256),
+            self._compute_node(self.compute_nodes[3], changed_at,
+                               deleted=True)]
+
+        self.host_manager.get_all_host_states(self.context)
+        self.assertEqual(4, len(self.host_manager.host_state_map))
+        with mock.patch.object(host_manager.HostState,
+                               'update_from_compute_node') as update_mock:
+            self.host_manager.get_all_host_states(self.context)
+
+        self.assertEqual(1, self.get_all.call_count)
+        self.get_all_changed_since.assert_called_once_with(
+            self.context, self.start - host_manager.HOST_REFRESH_OVERLAP)
+        update_mock.assert_called_once_with(
+            self.get_all_changed_since.return_value[0])
+        host_states_map = self.host_manager.host_state_map
+        self.assertEqual(3, len(host_states_map))
+        self.assertNotIn(('host4', 'node4'), host_states_map)
+
+        self.get_all_changed_since.return_value = []
+        self.host_manager.get_all_host_states(self.context)
+        self.get_all_changed_since.assert_called_with(
+            self.context, changed_at - host_manager.HOST_REFRESH_OVERLAP)
+
+    def test_recreated_node(self):
+        changed_at = self.start + datetime.timedelta(minutes=1)
+        self.get_all_changed_since.return_value = [
+            self._compute_node(self.compute_nodes[0], changed_at,
+                               free_ram_mb=256, vcpus=8),
+            self._compute_node(self.compute_nodes[0], changed_at,
+                               deleted=True)]
+
+        self.host_manager.get_all_host_states(self.context)
+        self.host_manager.get_all_host_states(self.context)
+
+        self.assertEqual(8, self.host_manager.compute_nodes[
+            ('host1', 'node1')].vcpus)
+        self.assertEqual(256, self.host_manager.host_state_map[
+            ('host1', 'node1')].free_ram_mb)
+
+    def test_full_refresh_interval(self):
+        self.flags(scheduler_full_host_refresh_interval=300)
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+
+        self.host_manager.get_all_host_states(self.context)
+        timeutils.advance_time_seconds(299)
+        self.host_manager.get_all_host_states(self.context)
+        self.assertEqual(1, self.get_all.call_count)
+        self.assertEqual(1, self.get_all_changed_since.call_count)
+
+        timeutils.advance_time_seconds(2)
+        self.host_manager.get_all_host_states(self.context)
+        self.assertEqual(2, self.get_all.call_count)
+        self.assertEqual(1, self.get_all_changed_since.call_count)
+
+    def test_disabled(self):
+        self.flags(scheduler_incremental_host_refresh=False)
+        self.host_manager.get_all_host_states(self.context)
+        self.host_manager.get_all_host_states(self.context)
+        self.assertEqual(2, self.get_all.call_count)
+        self.assertFalse(self.get_all_changed_since.called)
+
+
 class HostStateTestCase(test.NoDBTestCase):
     """Test case for HostState class."""
 
@@ -577,3 +848,43 @@ class HostStateTestCase(test.NoDBTestCase):
         self.assertEqual('string2', host.metrics['res2'].value)
         self.assertEqual('source2', host.metrics['res2'].source)
         self.assertIsInstance(host.numa_topology, six.string_types)
+
+        # Unchanged metrics are not decoded again.
+        with mock.patch.object(jsonutils, 'loads') as loads_mock:
+            host.update_from_compute_node(compute)
+        self.assertFalse(loads_mock.called)
+        self.assertEqual(2, len(host.metrics))
+
+    def test_lazy_decoding_from_compute_node(self):
+        metrics = [dict(name='res1', value=1.0, source='source1',
+                        timestamp=None)]
+        compute = fakes.COMPUTE_NODES[0].obj_clone()
+        compute.metrics = jsonutils.dumps(metrics)
+        compute.supported_hv_specs = [
+            objects.HVSpec.from_list(['x86_64', 'kvm', 'hvm'])]
+        host = host_manager.HostState("fakehost", "fakenode")
+
+        with contextlib.nested(
+                mock.patch.object(jsonutils, 'loads',
+                                  side_effect=jsonutils.loads),
+                mock.patch.object(objects.HVSpec, 'to_list',
+                                  autospec=True,
+                                  side_effect=objects.HVSpec.to_list)
+        ) as (loads_mock, to_list_mock):
+            host.update_from_compute_node(compute)
+            self.assertFalse(loads_mock.called)
+            self.assertFalse(to_list_mock.called)
+
+            self.assertEqual(1.0, host.metrics['res1'].value)
+            self.assertEqual(1.0, host.metrics['res1'].value)
+            self.assertEqual([['x86_64', 'kvm', 'hvm']],
+                             host.supported_instances)
+            self.assertEqual([['x86_64', 'kvm', 'hvm']],
+                             host.supported_instances)
+        self.assertEqual(1, loads_mock.call_count)
+        self.assertEqual(1, to_list_mock.call_count)
+
+    def test_slots(self):
+        host = host_manager.HostState("fakehost", "fakenode")
+        self.assertFalse(hasattr(host, '__dict__'))
+        self.assertRaises(AttributeError, setattr, host, 'unknown', 1)
@@ -0,0 +1,211 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For the columnar HostStateTable.
+"""
+
+import mock
+
+from nova.scheduler import filters
+from nova.scheduler.filters import core_filter
+from nova.scheduler.filters import ram_filter
+from nova.scheduler import host_manager
+from nova.scheduler import host_table
+from nova.scheduler import weights
+from nova.scheduler.weights import io_ops
+from nova.scheduler.weights import ram
+from nova import test
+from nova.tests.unit.scheduler import fakes
+
+
+class HostStateTableTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(HostStateTableTestCase, self).setUp()
+        self.hosts = [
+            fakes.FakeHostState('host1', 'node1',
+                                {'free_ram_mb': 512,
+                                 'service': {'disabled': False}}),
+            fakes.FakeHostState('host2', 'node2',
+                                {'free_ram_mb': None,
+                                 'service': {'disabled': True}}),
+            fakes.FakeHostState('host3', 'node3',
+                                {'free_ram_mb': 2048,
+                                 'service': {'disabled': False}}),
+        ]
+        self.table = host_table.HostStateTable(self.hosts)
+
+    def test_enabled(self):
+        self.assertFalse(host_table.enabled())
+        self.flags(scheduler_vectorized_filters=True)
+        self.assertTrue(host_table.enabled())
+
+    @mock.patch.object(host_table, 'np', None)
+    def test_enabled_without_numpy(self):
+        self.flags(scheduler_vectorized_filters=True)
+        self.assertFalse(host_table.enabled())
+
+    def test_column(self):
+        free_ram_mb = self.table.column('free_ram_mb')
+        self.assertEqual(512, free_ram_mb[0])
+        self.assertNotEqual(free_ram_mb[1], free_ram_mb[1])
+        self.assertEqual(2048, free_ram_mb[2])
+        self.assertIs(free_ram_mb, self.table.column('free_ram_mb'))
+
+    def test_metric_columns(self):
+        def fake_metric(value):
+            return host_manager.MetricItem(value=value, timestamp='fake-time',
+                                           source='fake-source')
+
+        self.hosts[0].metrics = {'foo': fake_metric(1), 'bar': fake_metric(2)}
+        self.hosts[2].metrics = {'foo': fake_metric(3)}
+        foo, bar = self.table.metric_columns(['foo', 'bar'])
+        self.assertEqual(1, foo[0])
+        self.assertNotEqual(foo[1], foo[1])
+        self.assertEqual(3, foo[2])
+        self.assertEqual(2, bar[0])
+        self.assertNotEqual(bar[2], bar[2])
+
+        selected = self.table.select(
+            self.table.array([False, True, True], dtype=bool))
+        self.hosts[2].metrics = {}
+        self.assertEqual(3, selected.metric_columns(['foo'])[0][1])
+
+    def test_service_disabled_column(self):
+        self.assertEqual([False, True, False],
+                         list(self.table.column('service_disabled')))
+
+    def test_select(self):
+        self.table.column('free_ram_mb')
+        table = self.table.select(self.table.column('service_disabled'))
+        self.assertEqual([self.hosts[1]], table.objects)
+        self.hosts[1].free_ram_mb = 1
+        self.assertNotEqual(1, table.column('free_ram_mb')[0])
+
+    def test_select_objects(self):
+        self.table.column('free_ram_mb')
+        table = self.table.select_objects([self.hosts[2], self.hosts[0]])
+        self.assertEqual([self.hosts[2], self.hosts[0]], table.objects)
+        self.assertEqual([2048, 512], list(table.column('free_ram_mb')))
+
+    def test_set_limits(self):
+        self.table.set_limits('memory_mb', self.table.array([1, 2, 3]),
+                              self.table.array([True, False, True],
+                                               dtype=bool))
+        self.assertEqual({'memory_mb': 1.0}, self.hosts[0].limits)
+        self.assertEqual({}, self.hosts[1].limits)
+        self.assertEqual({'memory_mb': 3.0}, self.hosts[2].limits)
+
+    def test_order(self):
+        weights = self.table.array([1.0, 3.0, 1.0, 2.0, 3.0])
+        self.assertEqual([1, 4, 3, 0, 2], list(self.table.order(weights)))
+        self.assertEqual([1, 4, 3], list(self.table.order(weights, 3)))
+        self.assertEqual([1], list(self.table.order(weights, 1)))
+        self.assertEqual([1, 4, 3, 0, 2],
+                         list(self.table.order(weights, 10)))
+
+
+class VectorizedFilterHandlerTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(VectorizedFilterHandlerTestCase, self).setUp()
+        self.flags(scheduler_vectorized_filters=True)
+        self.filter_handler = filters.HostFilterHandler()
+        self.hosts = [
+            fakes.FakeHostState('host%d' % i, 'node%d' % i,
+                                {'free_ram_mb': 512 * i,
+                                 'total_usable_ram_mb': 2048,
+                                 'vcpus_total': 4, 'vcpus_used': i})
+            for i in range(5)]
+        self.filter_properties = {'instance_type': {'memory_mb': 1024,
+                                                    'vcpus': 2}}
+
+    def test_filters_match_host_passes(self):
+        self.flags(cpu_allocation_ratio=1.0)
+        ram_filter.RamFilter.ram_allocation_ratio = 1.0
+        filter_objs = [ram_filter.RamFilter(), core_filter.CoreFilter()]
+
+        result = self.filter_handler.get_filtered_objects(
+            filter_objs, self.hosts, self.filter_properties)
+
+        expected = [host for host in self.hosts
+                    if all(filt.host_passes(host, self.filter_properties)
+                           for filt in filter_objs)]
+        self.assertEqual([self.hosts[2]], expected)
+        self.assertEqual(expected, result)
+        self.assertEqual({'memory_mb': 2048.0, 'vcpu': 4.0},
+                         result[0].limits)
+
+    def test_fallback_to_host_passes(self):
+        class OddHostFilter(filters.BaseHostFilter):
+            def host_passes(self, host_state, filter_properties):
+                return int(host_state.host[-1]) % 2 == 1
+
+        ram_filter.RamFilter.ram_allocation_ratio = 1.0
+        filter_objs = [OddHostFilter(), ram_filter.RamFilter()]
+
+        result = self.filter_handler.get_filtered_objects(
+            filter_objs, self.hosts, self.filter_properties)
+
+        self.assertEqual([self.hosts[3]], result)
+
+    def test_disabled(self):
+        self.flags(scheduler_vectorized_filters=False)
+        filt = ram_filter.RamFilter()
+        with mock.patch.object(filt, 'filter_vectorized') as vectorized:
+            self.filter_handler.get_filtered_objects(
+                [filt], self.hosts, self.filter_properties)
+        self.assertFalse(vectorized.called)
+
+
+class VectorizedWeightHandlerTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(VectorizedWeightHandlerTestCase, self).setUp()
+        self.weight_handler = weights.HostWeightHandler()
+        self.hosts = [
+            fakes.FakeHostState('host%d' % i, 'node%d' % i,
+                                {'free_ram_mb': ram, 'num_io_ops': io})
+            for i, (ram, io) in enumerate([(512, 2), (8192, 0), (1024, 1),
+                                           (8192, 0), (3072, 4)])]
+
+    def _weigh(self, limit=None):
+        weighers = [ram.RAMWeigher(), io_ops.IoOpsWeigher()]
+        return [(w.obj, w.weight)
+                for w in self.weight_handler.get_weighed_objects(
+                    weighers, self.hosts, {}, limit=limit)]
+
+    def test_weights_match_host_by_host(self):
+        expected = self._weigh()
+        self.flags(scheduler_vectorized_filters=True)
+        self.assertEqual(expected, self._weigh())
+        self.assertEqual(self.hosts[1], expected[0][0])
+        self.assertEqual(self.hosts[3], expected[1][0])
+
+    def test_limit(self):
+        expected = self._weigh()[:2]
+        self.assertEqual(expected, self._weigh(limit=2))
+        self.flags(scheduler_vectorized_filters=True)
+        self.assertEqual(expected, self._weigh(limit=2))
+
+    def test_mixed_weighers(self):
+        class HostNumberWeigher(weights.BaseHostWeigher):
+            def _weigh_object(self, host_state, weight_properties):
+                return int(host_state.host[-1])
+
+        weighers = [ram.RAMWeigher(), HostNumberWeigher()]
+        expected = [(w.obj, w.weight)
+                    for w in self.weight_handler.get_weighed_objects(
+                        weighers, self.hosts, {})]
+        self.flags(scheduler_vectorized_filters=True)
+        weighers = [ram.RAMWeigher(), HostNumberWeigher()]
+        self.assertEqual(expected,
+                         [(w.obj, w.weight)
+                          for w in self.weight_handler.get_weighed_objects(
+                              weighers, self.hosts, {})])
@@ -49,6 +49,10 @@ class IronicHostManagerTestCase(test.NoDBTestCase):
     def setUp(self):
         super(IronicHostManagerTestCase, self).setUp()
         self.host_manager = ironic_host_manager.IronicHostManager()
+        patcher = mock.patch('nova.objects.AggregateList.get_all',
+                             return_value=[])
+        patcher.start()
+        self.addCleanup(patcher.stop)
 
     def test_manager_public_api_signatures(self):
         self.assertPublicAPISignatures(host_manager.HostManager(),
@@ -100,6 +104,10 @@ class IronicHostManagerChangedNodesTestCase(test.NoDBTestCase):
     def setUp(self):
         super(IronicHostManagerChangedNodesTestCase, self).setUp()
         self.host_manager = ironic_host_manager.IronicHostManager()
+        patcher = mock.patch('nova.objects.AggregateList.get_all',
+                             return_value=[])
+        patcher.start()
+        self.addCleanup(patcher.stop)
         ironic_driver = "nova.virt.ironic.driver.IronicDriver"
         supported_instances = [
             objects.HVSpec.from_list(["i386", "baremetal", "baremetal"])]
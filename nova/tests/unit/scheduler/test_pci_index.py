@@ -0,0 +1,97 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For the PciPoolIndex.
+"""
+
+from nova import objects
+from nova.pci import stats as pci_stats
+from nova.scheduler import pci_index
+from nova import test
+from nova.tests.unit.scheduler import fakes
+
+
+def _pools(*pools):
+    return objects.PciDevicePoolList(objects=[
+        objects.PciDevicePool(vendor_id=vendor_id, product_id='p1',
+                              tags=tags, count=count)
+        for vendor_id, tags, count in pools])
+
+
+def _request(count, spec):
+    return objects.InstancePCIRequest(count=count, spec=spec)
+
+
+class PciPoolIndexTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(PciPoolIndexTestCase, self).setUp()
+        self.index = pci_index.PciPoolIndex()
+        self.hosts = [
+            fakes.FakeHostState('host1', 'node1', {
+                'pci_stats': pci_stats.PciDeviceStats(_pools(
+                    ('v1', {'physical_network': 'physnet1'}, 2),
+                    ('v2', {}, 1)))}),
+            fakes.FakeHostState('host2', 'node2', {
+                'pci_stats': pci_stats.PciDeviceStats(_pools(
+                    ('v1', {'physical_network': 'physnet2'}, 4)))}),
+            fakes.FakeHostState('host3', 'node3', {'pci_stats': None}),
+        ]
+        for host_state in self.hosts:
+            self.index.update(host_state)
+
+    def test_hosts_supporting(self):
+        self.assertEqual(
+            set([('host1', 'node1'), ('host2', 'node2')]),
+            self.index.hosts_supporting([_request(2, [{'vendor_id': 'v1'}])]))
+        self.assertEqual(
+            set([('host2', 'node2')]),
+            self.index.hosts_supporting([_request(3, [{'vendor_id': 'v1'}])]))
+        self.assertEqual(
+            set([('host1', 'node1')]),
+            self.index.hosts_supporting([
+                _request(1, [{'vendor_id': 'v1',
+                              'physical_network': 'physnet1'}])]))
+        self.assertEqual(
+            set([('host1', 'node1')]),
+            self.index.hosts_supporting([
+                _request(1, [{'vendor_id': 'v1'}]),
+                _request(1, [{'vendor_id': 'v2'}])]))
+        self.assertEqual(
+            set(), self.index.hosts_supporting([
+                _request(1, [{'vendor_id': 'v3'}])]))
+
+    def test_counts_summed_over_pools(self):
+        self.assertEqual(
+            set([('host1', 'node1'), ('host2', 'node2')]),
+            self.index.hosts_supporting([
+                _request(3, [{'vendor_id': 'v1'}, {'vendor_id': 'v2'}])]))
+
+    def test_update(self):
+        self.hosts[1].pci_stats.apply_requests(
+            [_request(3, [{'vendor_id': 'v1'}])])
+        self.index.update(self.hosts[1])
+        self.assertEqual(
+            set([('host1', 'node1')]),
+            self.index.hosts_supporting([_request(2, [{'vendor_id': 'v1'}])]))
+
+        self.hosts[1].pci_stats.apply_requests(
+            [_request(1, [{'vendor_id': 'v1'}])])
+        self.index.update(self.hosts[1])
+        self.assertNotIn(('host2', 'node2'), self.index.host_kinds)
+
+    def test_remove(self):
+        self.index.remove(('host1', 'node1'))
+        self.index.remove(('host3', 'node3'))
+        self.assertEqual(
+            set([('host2', 'node2')]),
+            self.index.hosts_supporting([_request(1, [{'vendor_id': 'v1'}])]))
+        self.assertEqual(1, len(self.index.counts))
@@ -68,3 +68,11 @@ class SchedulerRpcAPITestCase(test.NoDBTestCase):
                 request_spec='fake_request_spec',
                 filter_properties='fake_prop',
                 version='4.0')
+
+    def test_get_traces(self):
+        self._test_scheduler_api('get_traces', rpc_method='call',
+                limit=10, version='4.1')
+
+    def test_delete_instance_info(self):
+        self._test_scheduler_api('delete_instance_info', rpc_method='cast',
+                instance_uuid='fake_uuid', version='4.2', fanout=True)
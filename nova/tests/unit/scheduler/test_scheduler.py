@@ -56,6 +56,44 @@ class SchedulerManagerTestCase(test.NoDBTestCase):
             self.manager.select_destinations(None, None, {})
             select_destinations.assert_called_once_with(None, None, {})
 
+    def test_select_destinations_traced(self):
+        self.flags(scheduler_trace_sample_rate=1.0)
+        dests = [{'host': 'host1', 'nodename': 'node1', 'limits': {}}]
+        with mock.patch('nova.scheduler.trace._listen_for_queries'):
+            with mock.patch.object(self.manager.driver,
+                                   'select_destinations',
+                                   return_value=dests):
+                self.manager.select_destinations(
+                    self.context, {'num_instances': 1}, {})
+
+        traces = self.manager.get_traces(self.context)
+        self.assertEqual(1, len(traces))
+        self.assertEqual(self.context.request_id, traces[0]['request_id'])
+        self.assertEqual([{'host': 'host1', 'node': 'node1'}],
+                         traces[0]['selected'])
+
+    def test_get_traces(self):
+        self.manager.traces.extend([{'request_id': 'req-%d' % i}
+                                    for i in range(3)])
+        self.assertEqual(['req-2', 'req-1'],
+                         [result['request_id'] for result in
+                          self.manager.get_traces(self.context, limit=2)])
+
+    def test_delete_instance_info(self):
+        with mock.patch.object(self.manager.driver.host_manager.group_index,
+                               'remove') as remove:
+            self.manager.delete_instance_info(self.context, 'fake_uuid')
+        remove.assert_called_once_with('fake_uuid')
+
+    @mock.patch.object(manager.QUOTAS, 'usage_reconcile')
+    def test_reconcile_quota_usages(self, mock_reconcile):
+        self.manager._reconcile_quota_usages(self.context)
+        self.assertFalse(mock_reconcile.called)
+
+        self.flags(quota_usage_refresh_in_background=True)
+        self.manager._reconcile_quota_usages(self.context)
+        mock_reconcile.assert_called_once_with(self.context)
+
 
 class SchedulerV3PassthroughTestCase(test.TestCase):
     def setUp(self):
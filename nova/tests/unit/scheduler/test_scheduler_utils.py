@@ -330,6 +330,25 @@ class SchedulerUtilsTestCase(test.NoDBTestCase):
                                  'group_policies': ['policy']}
         self.assertEqual(expected_filter_props, filter_props)
 
+    @mock.patch.object(objects.InstanceGroup, 'get_hosts')
+    @mock.patch.object(scheduler_utils, '_get_group')
+    def test_setup_instance_group_tracked(self, mock_gg, mock_get_hosts):
+        self.flags(scheduler_track_server_groups=True)
+        group = self._create_server_group('anti-affinity')
+        mock_gg.return_value = group
+        spec = {'instance_properties': {'uuid': 'fake-uuid'}}
+        filter_props = {'group_hosts': ['hostC']}
+
+        scheduler_utils.setup_instance_group(self.context, spec, filter_props)
+
+        mock_gg.assert_called_once_with(self.context, 'fake-uuid')
+        self.assertFalse(mock_get_hosts.called)
+        expected_filter_props = {'group_updated': True,
+                                 'group_uuid': group.uuid,
+                                 'group_hosts': set(['hostC']),
+                                 'group_policies': ['anti-affinity']}
+        self.assertEqual(expected_filter_props, filter_props)
+
     @mock.patch.object(scheduler_utils, '_get_group_details')
     def test_setup_instance_group_with_no_group(self, mock_ggd):
         mock_ggd.return_value = None
@@ -0,0 +1,170 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For filtering the hosts over shards in child processes.
+"""
+
+import os
+import socket
+import stat
+import time
+
+from eventlet import hubs
+import mock
+
+from nova import exception
+from nova.scheduler import filters
+from nova.scheduler import shards
+from nova import test
+from nova.tests.unit.scheduler import fakes
+
+
+class EvenRamFilter(filters.BaseHostFilter):
+    """Pass the hosts with an even amount of free RAM, setting their
+    limit and the last one passed in the instance properties.
+    """
+
+    def host_passes(self, host_state, filter_properties):
+        if host_state.free_ram_mb % 2:
+            return False
+        host_state.limits['memory_mb'] = host_state.free_ram_mb * 1.5
+        instance = filter_properties['request_spec']['instance_properties']
+        instance['last_host'] = host_state.host
+        return True
+
+
+class FailingFilter(filters.BaseHostFilter):
+    def host_passes(self, host_state, filter_properties):
+        raise exception.NovaException('failed in %d' % os.getpid())
+
+
+class ChildStateFilter(filters.BaseHostFilter):
+    """Record the hub and whether the socket of the filter properties is
+    still one in the instance properties.
+    """
+
+    def host_passes(self, host_state, filter_properties):
+        instance = filter_properties['request_spec']['instance_properties']
+        instance['hub'] = id(hubs.get_hub())
+        instance['socket'] = stat.S_ISSOCK(
+            os.fstat(filter_properties['socket_fd']).st_mode)
+        return True
+
+
+class HangingFilter(filters.BaseHostFilter):
+    """Hang in the child processes only."""
+
+    def host_passes(self, host_state, filter_properties):
+        if os.getpid() != filter_properties['scheduler_pid']:
+            time.sleep(60)
+        return True
+
+
+class ShardsTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(ShardsTestCase, self).setUp()
+        self.flags(scheduler_filter_workers=3, scheduler_filter_shard_size=2)
+        self.filter_handler = filters.HostFilterHandler()
+        self.hosts = [fakes.FakeHostState('host%d' % i, 'node%d' % i,
+                                          {'free_ram_mb': 1000 + i,
+                                           'limits': {}})
+                      for i in range(7)]
+
+    def _filter_properties(self):
+        return {'request_spec': {'instance_properties': {'uuid': 'fake'}}}
+
+    def test_split(self):
+        hosts = range(7)
+        self.assertEqual([[0, 1, 2], [3, 4], [5, 6]],
+                         shards.split(hosts, 3, 2))
+        self.assertEqual([[0, 1, 2, 3], [4, 5, 6]],
+                         shards.split(hosts, 3, 3))
+        self.assertEqual([hosts], shards.split(hosts, 3, 4))
+        self.assertEqual([hosts], shards.split(hosts, 1, 1))
+        self.assertEqual([hosts], shards.split(hosts, 0, 0))
+
+    def test_get_filtered_objects_matches_serial(self):
+        filter_properties = self._filter_properties()
+        result = shards.get_filtered_objects(
+            self.filter_handler, [EvenRamFilter()], iter(self.hosts),
+            filter_properties)
+
+        self.assertEqual([self.hosts[i] for i in (0, 2, 4, 6)], result)
+        for host_state in self.hosts:
+            if host_state.free_ram_mb % 2:
+                self.assertEqual({}, host_state.limits)
+            else:
+                self.assertEqual({'memory_mb': host_state.free_ram_mb * 1.5},
+                                 host_state.limits)
+        self.assertEqual({'uuid': 'fake', 'last_host': 'host6'},
+                         filter_properties['request_spec'][
+                             'instance_properties'])
+
+    def test_get_filtered_objects_raises_child_exception(self):
+        exc = self.assertRaises(exception.NovaException,
+                                shards.get_filtered_objects,
+                                self.filter_handler, [FailingFilter()],
+                                self.hosts, self._filter_properties())
+        self.assertNotEqual('failed in %d' % os.getpid(),
+                            exc.format_message())
+
+    @mock.patch.object(shards, '_fork')
+    def test_get_filtered_objects_too_few_hosts(self, mock_fork):
+        self.flags(scheduler_filter_shard_size=4)
+        result = shards.get_filtered_objects(
+            self.filter_handler, [EvenRamFilter()], self.hosts,
+            self._filter_properties())
+
+        self.assertEqual([self.hosts[i] for i in (0, 2, 4, 6)], result)
+        self.assertFalse(mock_fork.called)
+
+    @mock.patch.object(os, 'fork', side_effect=OSError('no memory'))
+    def test_get_filtered_objects_fork_fails(self, mock_fork):
+        result = shards.get_filtered_objects(
+            self.filter_handler, [EvenRamFilter()], self.hosts,
+            self._filter_properties())
+
+        self.assertEqual([self.hosts[i] for i in (0, 2, 4, 6)], result)
+        self.assertEqual(1, mock_fork.call_count)
+
+    def test_get_filtered_objects_starts_clean(self):
+        sock = socket.socket()
+        self.addCleanup(sock.close)
+        filter_properties = self._filter_properties()
+        filter_properties['socket_fd'] = sock.fileno()
+        shards.get_filtered_objects(
+            self.filter_handler, [ChildStateFilter()], self.hosts,
+            filter_properties)
+
+        instance = filter_properties['request_spec']['instance_properties']
+        self.assertNotEqual(id(hubs.get_hub()), instance['hub'])
+        self.assertFalse(instance['socket'])
+        self.assertTrue(stat.S_ISSOCK(os.fstat(sock.fileno()).st_mode))
+
+    def test_get_filtered_objects_timeout(self):
+        self.flags(scheduler_filter_timeout=1)
+        filter_properties = self._filter_properties()
+        filter_properties['scheduler_pid'] = os.getpid()
+        with mock.patch.object(os, 'kill', wraps=os.kill) as mock_kill:
+            result = shards.get_filtered_objects(
+                self.filter_handler, [HangingFilter()], self.hosts,
+                filter_properties)
+
+        self.assertEqual(self.hosts, result)
+        self.assertEqual(3, mock_kill.call_count)
+
+    def test_filter_shard_stopped(self):
+        with mock.patch.object(self.filter_handler, 'get_filtered_objects',
+                               return_value=None):
+            self.assertIsNone(shards.filter_shard(
+                self.filter_handler, [EvenRamFilter()], self.hosts,
+                self._filter_properties(), 0))
@@ -0,0 +1,146 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For the traces of scheduling decisions.
+"""
+
+import collections
+
+import mock
+
+from nova import context
+from nova import db
+from nova import exception
+from nova.scheduler import filters
+from nova.scheduler.filters import ram_filter
+from nova.scheduler import trace
+from nova.scheduler import weights
+from nova.scheduler.weights import ram
+from nova import test
+from nova.tests.unit.scheduler import fakes
+
+
+class TraceTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(TraceTestCase, self).setUp()
+        self.flags(scheduler_trace_sample_rate=1.0)
+        patcher = mock.patch.object(trace, '_listen_for_queries')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.context = context.RequestContext('fake_user', 'fake_project')
+        self.request_spec = {'num_instances': 1}
+        self.traces = collections.deque(maxlen=2)
+
+    def test_not_sampled(self):
+        self.flags(scheduler_trace_sample_rate=0.0)
+        with trace.tracing(self.context, self.request_spec,
+                           self.traces) as tracer:
+            self.assertIsNone(tracer)
+            self.assertIsNone(trace.current())
+        self.assertEqual(0, len(self.traces))
+
+    def test_filters_and_weighers(self):
+        ram_filter.RamFilter.ram_allocation_ratio = 1.0
+        hosts = [fakes.FakeHostState('host%d' % i, 'node%d' % i,
+                                     {'free_ram_mb': 512 * i,
+                                      'total_usable_ram_mb': 2048})
+                 for i in range(4)]
+        filter_properties = {'instance_type': {'memory_mb': 1024}}
+
+        with trace.tracing(self.context, self.request_spec,
+                           self.traces) as tracer:
+            self.assertIs(tracer, trace.current())
+            hosts = filters.HostFilterHandler().get_filtered_objects(
+                [ram_filter.RamFilter()], hosts, filter_properties)
+            weights.HostWeightHandler().get_weighed_objects(
+                [ram.RAMWeigher()], hosts, filter_properties)
+        self.assertIsNone(trace.current())
+
+        result = self.traces[0]
+        self.assertEqual(self.context.request_id, result['request_id'])
+        self.assertIsNone(result['error'])
+        self.assertEqual(2, len(result['steps']))
+        filter_step, weigher_step = result['steps']
+        self.assertEqual(('filter', 'RamFilter', 0, 4, 2),
+                         (filter_step['kind'], filter_step['name'],
+                          filter_step['index'], filter_step['hosts_in'],
+                          filter_step['hosts_out']))
+        self.assertEqual(('weigher', 'RAMWeigher', None, 2, 2),
+                         (weigher_step['kind'], weigher_step['name'],
+                          weigher_step['index'], weigher_step['hosts_in'],
+                          weigher_step['hosts_out']))
+        self.assertEqual(
+            [{'host': 'host0', 'node': 'node0', 'filter': 'RamFilter',
+              'index': 0},
+             {'host': 'host1', 'node': 'node1', 'filter': 'RamFilter',
+              'index': 0}],
+            result['rejections'])
+
+    def test_error(self):
+        def _schedule():
+            with trace.tracing(self.context, self.request_spec,
+                               self.traces):
+                raise exception.NoValidHost(reason='')
+
+        self.assertRaises(exception.NoValidHost, _schedule)
+        self.assertTrue(self.traces[0]['error'].startswith('NoValidHost: '))
+        self.assertIsNone(trace.current())
+
+    def test_buffer_bounded(self):
+        for i in range(3):
+            with trace.tracing(context.RequestContext('fake_user',
+                                                      'fake_project',
+                                                      request_id=str(i)),
+                               self.request_spec, self.traces):
+                pass
+        self.assertEqual(['1', '2'],
+                         [result['request_id'] for result in self.traces])
+
+    def test_summarize(self):
+        step = {'kind': 'filter', 'name': 'RamFilter', 'index': 0,
+                'hosts_in': 4, 'hosts_out': 1, 'db_queries': 0}
+        traces = [
+            {'duration': 0.1, 'db_queries': 2, 'error': None,
+             'steps': [dict(step, duration=0.01)]},
+            {'duration': 0.3, 'db_queries': 4, 'error': 'NoValidHost: ',
+             'steps': [dict(step, duration=0.03, hosts_out=0)]},
+        ]
+        summary = trace.summarize(traces)
+        self.assertEqual(2, summary['requests'])
+        self.assertEqual(1, summary['errors'])
+        self.assertAlmostEqual(0.2, summary['duration_mean'])
+        self.assertEqual(0.3, summary['duration_p50'])
+        self.assertEqual(3.0, summary['db_queries_mean'])
+        self.assertEqual(1, len(summary['steps']))
+        stats = summary['steps'][0]
+        self.assertEqual(2, stats['calls'])
+        self.assertAlmostEqual(0.02, stats['duration_mean'])
+        self.assertEqual(0.03, stats['duration_max'])
+        self.assertEqual(7, stats['hosts_rejected'])
+
+    def test_summarize_empty(self):
+        summary = trace.summarize([])
+        self.assertEqual(0, summary['requests'])
+        self.assertIsNone(summary['duration_mean'])
+        self.assertEqual([], summary['steps'])
+
+
+class TraceDbQueriesTestCase(test.TestCase):
+    def test_db_queries(self):
+        self.flags(scheduler_trace_sample_rate=1.0)
+        ctxt = context.get_admin_context()
+        traces = []
+        with trace.tracing(ctxt, {'num_instances': 1}, traces):
+            db.service_get_all(ctxt)
+            db.service_get_all(ctxt)
+        db.service_get_all(ctxt)
+        self.assertEqual(2, traces[0]['db_queries'])
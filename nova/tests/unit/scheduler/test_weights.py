@@ -16,6 +16,8 @@
 Tests For Scheduler weights.
 """
 
+import six
+
 from nova import exception
 from nova.scheduler import host_manager
 from nova.scheduler import weights
@@ -265,6 +267,29 @@ class MetricsWeigherTestCase(test.NoDBTestCase):
         setting = ['foo=0.0001', 'zot=-1']
         self._do_test(setting, 1.0, 'host5')
 
+    def _weigh_all(self, setting):
+        self.flags(weight_setting=setting, group='metrics')
+        weighers = [metrics.MetricsWeigher()]
+        return [(w.obj.host, w.weight)
+                for w in self.weight_handler.get_weighed_objects(
+                    weighers, self._get_all_hosts(), {})]
+
+    def test_vectorized_matches_host_by_host(self):
+        self.flags(required=False, group='metrics')
+        for setting in (['foo=1'], ['foo=0.0001', 'bar=1'], ['foo=-1'],
+                        ['foo=0.0001', 'zot=-1'], ['zot=0', 'foo=1'], []):
+            self.flags(scheduler_vectorized_filters=False)
+            expected = self._weigh_all(setting)
+            self.flags(scheduler_vectorized_filters=True)
+            self.assertEqual(expected, self._weigh_all(setting))
+
+    def test_vectorized_metric_not_found_required(self):
+        self.flags(scheduler_vectorized_filters=True)
+        exc = self.assertRaises(exception.ComputeHostMetricNotFound,
+                                self._weigh_all, ['foo=1', 'zot=2'])
+        self.assertIn('Metric zot', six.text_type(exc))
+        self.assertIn('host1.node1', six.text_type(exc))
+
 
 class IoOpsWeigherTestCase(test.NoDBTestCase):
 
@@ -18,6 +18,7 @@ import sys
 
 import fixtures
 import mock
+from oslo_serialization import jsonutils
 
 from nova.cmd import manage
 from nova import context
@@ -331,6 +332,86 @@ class ProjectCommandsTestCase(test.TestCase):
         self.assertEqual(2, self.commands.quota('admin', 'volumes1', '10'))
 
 
+class QuotaCommandsTestCase(test.TestCase):
+    def setUp(self):
+        super(QuotaCommandsTestCase, self).setUp()
+        self.commands = manage.QuotaCommands()
+
+    def test_expire_reservations_negative(self):
+        self.assertEqual(1, self.commands.expire_reservations(-1))
+
+    @mock.patch.object(db, 'reservation_expire', return_value=3)
+    def test_expire_reservations(self, mock_expire):
+        self.useFixture(fixtures.MonkeyPatch('sys.stdout',
+                                             StringIO.StringIO()))
+        self.commands.expire_reservations('50')
+        self.assertEqual(50, mock_expire.call_args[1]['batch_size'])
+        self.assertIn('3 expired reservations', sys.stdout.getvalue())
+
+
+class SchedulerCommandsTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(SchedulerCommandsTestCase, self).setUp()
+        self.commands = manage.SchedulerCommands()
+        self.useFixture(fixtures.MonkeyPatch('sys.stdout',
+                                             StringIO.StringIO()))
+        step = {'kind': 'filter', 'name': 'RamFilter', 'index': 0,
+                'hosts_in': 2, 'hosts_out': 1, 'duration': 0.001,
+                'db_queries': 0}
+        self.traces = [
+            {'request_id': 'req-2', 'num_instances': 1,
+             'started_at': '2015-01-01T00:00:01Z', 'duration': 0.02,
+             'db_queries': 3, 'steps': [dict(step, hosts_out=0)],
+             'rejections': [{'host': 'host1', 'node': 'node1',
+                             'filter': 'RamFilter', 'index': 0}],
+             'selected': [], 'error': 'NoValidHost: No valid host'},
+            {'request_id': 'req-1', 'num_instances': 1,
+             'started_at': '2015-01-01T00:00:00Z', 'duration': 0.01,
+             'db_queries': 3, 'steps': [step],
+             'rejections': [{'host': 'host2', 'node': 'node2',
+                             'filter': 'RamFilter', 'index': 0}],
+             'selected': [{'host': 'host1', 'node': 'node1'}],
+             'error': None},
+        ]
+        patcher = mock.patch(
+            'nova.scheduler.rpcapi.SchedulerAPI.get_traces',
+            return_value=self.traces)
+        self.get_traces = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_trace(self):
+        self.commands.trace(host='scheduler1', limit='5')
+        self.assertEqual('scheduler1', self.get_traces.call_args[1]['host'])
+        self.assertEqual(5, self.get_traces.call_args[1]['limit'])
+        output = sys.stdout.getvalue()
+        self.assertIn('req-1', output)
+        self.assertIn('NoValidHost: No valid host', output)
+
+    def test_trace_negative_limit(self):
+        self.assertEqual(1, self.commands.trace(limit='0'))
+        self.assertFalse(self.get_traces.called)
+
+    def test_trace_request(self):
+        self.commands.trace(request_id='req-2')
+        output = sys.stdout.getvalue()
+        self.assertNotIn('req-1', output)
+        self.assertIn('host1 (node1) rejected by RamFilter', output)
+
+    def test_trace_unknown_request(self):
+        self.assertEqual(1, self.commands.trace(request_id='req-3'))
+
+    def test_trace_summary_json(self):
+        self.commands.trace(summary=True, as_json=True)
+        summary = jsonutils.loads(sys.stdout.getvalue())
+        self.assertEqual(2, summary['requests'])
+        self.assertEqual(1, summary['errors'])
+        self.assertEqual(2, summary['steps'][0]['calls'])
+
+    def test_trace_summary(self):
+        self.commands.trace(summary=True)
+        self.assertIn('2 requests, 1 failed', sys.stdout.getvalue())
+
+
 class VmCommandsTestCase(test.TestCase):
     def setUp(self):
         super(VmCommandsTestCase, self).setUp()
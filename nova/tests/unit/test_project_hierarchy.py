@@ -0,0 +1,224 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the project hierarchy cache."""
+
+import datetime
+import StringIO
+
+from oslo_serialization import jsonutils
+from oslo_utils import timeutils
+
+from nova import context
+from nova import exception
+from nova import project_hierarchy
+from nova import test
+
+#          root
+#         /    \
+#       a        b
+#     /   \
+#   a1     a2
+TREE = {'root': None, 'a': 'root', 'b': 'root', 'a1': 'a', 'a2': 'a'}
+
+
+class FakeFileHierarchyDriver(project_hierarchy.FileHierarchyDriver):
+    def __init__(self, tree):
+        super(FakeFileHierarchyDriver, self).__init__()
+        self.tree = tree
+        self.timestamp = 1
+        self.loads = 0
+
+    def _get_file_timestamp(self, filename):
+        return self.timestamp
+
+    def _get_file_handle(self, filename):
+        return StringIO.StringIO(jsonutils.dumps(self.tree))
+
+    def get_hierarchy(self, context, project_id):
+        self.loads += 1
+        return super(FakeFileHierarchyDriver, self).get_hierarchy(
+            context, project_id)
+
+
+class ProjectHierarchyTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(ProjectHierarchyTestCase, self).setUp()
+        # NOTE: Start from the real clock and an empty cache whatever
+        # the previous tests left behind.
+        timeutils.clear_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        project_hierarchy.HIERARCHY.invalidate()
+        self.flags(project_hierarchy_file='/fake/hierarchy.json',
+                   project_hierarchy_cache_ttl=60)
+        self.context = context.RequestContext('fake', 'fake')
+        self.driver = FakeFileHierarchyDriver(dict(TREE))
+        self.hierarchy = project_hierarchy.ProjectHierarchy(self.driver)
+
+    def test_get_parent(self):
+        self.assertEqual('a', self.hierarchy.get_parent(self.context, 'a1'))
+        self.assertIsNone(self.hierarchy.get_parent(self.context, 'root'))
+
+    def test_get_children(self):
+        self.assertEqual(['a', 'b'],
+                         self.hierarchy.get_children(self.context, 'root'))
+        self.assertEqual([], self.hierarchy.get_children(self.context, 'b'))
+
+    def test_get_ancestors(self):
+        self.assertEqual(['a', 'root'],
+                         self.hierarchy.get_ancestors(self.context, 'a1'))
+        self.assertEqual([],
+                         self.hierarchy.get_ancestors(self.context, 'root'))
+
+    def test_get_subtree(self):
+        self.assertEqual(['a', 'b', 'a1', 'a2'],
+                         sorted(self.hierarchy.get_subtree(self.context,
+                                                           'root'),
+                                key=lambda p: (len(p), p)))
+
+    def test_lookups_are_cached(self):
+        self.hierarchy.get_subtree(self.context, 'root')
+        self.hierarchy.get_parent(self.context, 'a2')
+        self.hierarchy.get_children(self.context, 'a')
+        self.hierarchy.get_ancestors(self.context, 'a1')
+        self.assertEqual(1, self.driver.loads)
+
+    def test_lineage_does_not_complete_siblings(self):
+        self.hierarchy.get_parent(self.context, 'a1')
+        self.assertEqual(1, self.driver.loads)
+        # Only the subtree of a1 is known, not the other children of a.
+        self.assertEqual(['a1', 'a2'],
+                         self.hierarchy.get_children(self.context, 'a'))
+        self.assertEqual(2, self.driver.loads)
+
+    def test_ttl_expiry(self):
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.hierarchy.get_children(self.context, 'root')
+        timeutils.advance_time_seconds(61)
+        self.hierarchy.get_children(self.context, 'root')
+        self.assertEqual(2, self.driver.loads)
+
+    def test_clock_before_epoch(self):
+        timeutils.set_time_override(datetime.datetime(1955, 11, 5))
+        self.assertEqual('a', self.hierarchy.get_parent(self.context, 'a1'))
+        self.assertEqual(1, self.driver.loads)
+
+    def test_zero_ttl_disables_cache(self):
+        self.flags(project_hierarchy_cache_ttl=0)
+        self.assertEqual(['a', 'b'],
+                         self.hierarchy.get_children(self.context, 'root'))
+        self.assertEqual(['a', 'root'],
+                         self.hierarchy.get_ancestors(self.context, 'a1'))
+        self.assertEqual(2, self.driver.loads)
+
+    def test_version_change_invalidates(self):
+        self.hierarchy.get_children(self.context, 'a')
+        self.driver.tree['a3'] = 'a'
+        self.driver.timestamp = 2
+        self.assertEqual(['a1', 'a2', 'a3'],
+                         self.hierarchy.get_children(self.context, 'a'))
+        self.assertEqual(2, self.driver.loads)
+
+    def test_invalidate_project(self):
+        self.hierarchy.get_subtree(self.context, 'root')
+        self.hierarchy.invalidate('a1')
+        self.hierarchy.get_children(self.context, 'b')
+        self.assertEqual(1, self.driver.loads)
+        self.hierarchy.get_children(self.context, 'a')
+        self.assertEqual(2, self.driver.loads)
+
+    def test_unknown_project(self):
+        self.assertRaises(exception.ProjectNotFound,
+                          self.hierarchy.get_parent, self.context, 'missing')
+
+
+class FakeScopedHierarchyDriver(FakeFileHierarchyDriver):
+    """Show each user only the projects in its visible list, like
+    Keystone does with the token of the caller.
+    """
+
+    def __init__(self, tree, visible):
+        super(FakeScopedHierarchyDriver, self).__init__(tree)
+        self.visible = visible
+
+    def get_scope(self, context):
+        return context.user_id
+
+    def get_hierarchy(self, context, project_id):
+        visible = self.visible[context.user_id]
+        if project_id not in visible:
+            raise exception.Forbidden()
+        lineage, subtree = super(FakeScopedHierarchyDriver,
+                                 self).get_hierarchy(context, project_id)
+        return ([(node, parent) for node, parent in lineage
+                 if node in visible],
+                [(node, parent) for node, parent in subtree
+                 if node in visible])
+
+
+class ScopedProjectHierarchyTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(ScopedProjectHierarchyTestCase, self).setUp()
+        # NOTE: Start from the real clock and an empty cache whatever
+        # the previous tests left behind.
+        timeutils.clear_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        project_hierarchy.HIERARCHY.invalidate()
+        self.flags(project_hierarchy_file='/fake/hierarchy.json',
+                   project_hierarchy_cache_ttl=60)
+        self.admin = context.RequestContext('admin', 'root')
+        self.user = context.RequestContext('user', 'a')
+        self.driver = FakeScopedHierarchyDriver(
+            dict(TREE), {'admin': set(TREE), 'user': {'a', 'a1'}})
+        self.hierarchy = project_hierarchy.ProjectHierarchy(self.driver)
+
+    def test_scopes_are_cached_apart(self):
+        self.assertEqual(['a1', 'a2'],
+                         self.hierarchy.get_children(self.admin, 'a'))
+        self.assertEqual(['a1'],
+                         self.hierarchy.get_children(self.user, 'a'))
+        self.assertEqual(2, self.driver.loads)
+
+    def test_cache_hit_is_checked_by_the_driver(self):
+        self.hierarchy.get_subtree(self.admin, 'root')
+        self.assertRaises(exception.Forbidden,
+                          self.hierarchy.get_parent, self.user, 'a2')
+        self.assertRaises(exception.Forbidden,
+                          self.hierarchy.get_children, self.user, 'root')
+
+    def test_lookups_are_cached_per_project(self):
+        self.hierarchy.get_subtree(self.user, 'a')
+        self.hierarchy.get_children(self.user, 'a')
+        self.assertEqual(1, self.driver.loads)
+        # a1 is cached from the subtree of a, but the driver has not been
+        # asked about it with this scope yet.
+        self.assertEqual('a', self.hierarchy.get_parent(self.user, 'a1'))
+        self.assertEqual('a', self.hierarchy.get_parent(self.user, 'a1'))
+        self.assertEqual(2, self.driver.loads)
+
+    def test_expired_scopes_are_dropped(self):
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.hierarchy.get_children(self.user, 'a')
+        timeutils.advance_time_seconds(61)
+        self.hierarchy.get_children(self.admin, 'a')
+        self.assertEqual(['admin'], self.hierarchy._scopes.keys())
+
+
+class KeystoneHierarchyDriverTestCase(test.NoDBTestCase):
+    def test_get_scope(self):
+        driver = project_hierarchy.KeystoneHierarchyDriver()
+        ctxt = context.RequestContext('user', 'project',
+                                      roles=['member', 'admin'])
+        self.assertEqual(('user', 'project', ('admin', 'member')),
+                         driver.get_scope(ctxt))
@@ -16,6 +16,7 @@
 
 import datetime
 
+import mock
 from oslo_config import cfg
 from oslo_utils import timeutils
 
@@ -26,6 +27,7 @@ from nova import db
 from nova.db.sqlalchemy import api as sqa_api
 from nova.db.sqlalchemy import models as sqa_models
 from nova import exception
+from nova import project_hierarchy
 from nova import quota
 from nova import test
 import nova.tests.unit.image.fake
@@ -303,6 +305,18 @@ class FakeDriver(object):
                             remains))
         return resources
 
+    def get_projects_quotas(self, context, resources, project_ids,
+                            quota_class=None, defaults=True, usages=True):
+        self.called.append(('get_projects_quotas', context, resources,
+                            project_ids, quota_class, defaults, usages))
+        return dict((project_id, resources) for project_id in project_ids)
+
+    def get_subtree_quotas(self, context, resources, project_id,
+                           quota_class=None, defaults=True):
+        self.called.append(('get_subtree_quotas', context, resources,
+                            project_id, quota_class, defaults))
+        return resources
+
     def limit_check(self, context, resources, values, project_id=None,
                     user_id=None):
         self.called.append(('limit_check', context, resources,
@@ -314,6 +328,11 @@ class FakeDriver(object):
                             expire, project_id, user_id))
         return self.reservations
 
+    def consume(self, context, resources, deltas, project_id=None,
+                user_id=None):
+        self.called.append(('consume', context, resources, deltas,
+                            project_id, user_id))
+
     def commit(self, context, reservations, project_id=None, user_id=None):
         self.called.append(('commit', context, reservations, project_id,
                             user_id))
@@ -335,6 +354,9 @@ class FakeDriver(object):
     def expire(self, context):
         self.called.append(('expire', context))
 
+    def usage_reconcile(self, context, resources):
+        self.called.append(('usage_reconcile', context, resources))
+
 
 class BaseResourceTestCase(test.TestCase):
     def test_no_flag(self):
@@ -634,6 +656,32 @@ class QuotaEngineTestCase(test.TestCase):
         self.assertEqual(result1, quota_obj._resources)
         self.assertEqual(result2, quota_obj._resources)
 
+    def test_get_projects_quotas(self):
+        context = FakeContext(None, None)
+        driver = FakeDriver()
+        quota_obj = self._make_quota_obj(driver)
+        result = quota_obj.get_projects_quotas(context, ['proj1', 'proj2'],
+                                               usages=False)
+
+        self.assertEqual(driver.called, [
+                ('get_projects_quotas', context, quota_obj._resources,
+                 ['proj1', 'proj2'], None, True, False),
+                ])
+        self.assertEqual(result, {'proj1': quota_obj._resources,
+                                  'proj2': quota_obj._resources})
+
+    def test_get_subtree_quotas(self):
+        context = FakeContext(None, None)
+        driver = FakeDriver()
+        quota_obj = self._make_quota_obj(driver)
+        result = quota_obj.get_subtree_quotas(context, 'test_project')
+
+        self.assertEqual(driver.called, [
+                ('get_subtree_quotas', context, quota_obj._resources,
+                 'test_project', None, True),
+                ])
+        self.assertEqual(result, quota_obj._resources)
+
     def test_count_no_resource(self):
         context = FakeContext(None, None)
         driver = FakeDriver()
@@ -727,6 +775,21 @@ class QuotaEngineTestCase(test.TestCase):
                 'resv-01', 'resv-02', 'resv-03', 'resv-04',
                 ])
 
+    def test_consume(self):
+        context = FakeContext(None, None)
+        driver = FakeDriver()
+        quota_obj = self._make_quota_obj(driver)
+        quota_obj.consume(context, test_resource1=1)
+        quota_obj.consume(context, project_id='fake_project',
+                          user_id='fake_user', test_resource1=-1)
+
+        self.assertEqual(driver.called, [
+                ('consume', context, quota_obj._resources,
+                 dict(test_resource1=1), None, None),
+                ('consume', context, quota_obj._resources,
+                 dict(test_resource1=-1), 'fake_project', 'fake_user'),
+                ])
+
     def test_commit(self):
         context = FakeContext(None, None)
         driver = FakeDriver()
@@ -791,6 +854,16 @@ class QuotaEngineTestCase(test.TestCase):
                 ('expire', context),
                 ])
 
+    def test_usage_reconcile(self):
+        context = FakeContext(None, None)
+        driver = FakeDriver()
+        quota_obj = self._make_quota_obj(driver)
+        quota_obj.usage_reconcile(context)
+
+        self.assertEqual(driver.called, [
+                ('usage_reconcile', context, quota_obj._resources),
+                ])
+
     def test_resources(self):
         quota_obj = self._make_quota_obj(None)
 
@@ -1185,6 +1258,43 @@ class DbQuotaDriverTestCase(test.TestCase):
                     ),
                 ))
 
+    def test_get_projects_quotas(self):
+        def fake_qgabps(context, project_ids):
+            self.calls.append('quota_get_all_by_projects')
+            return {'test_project': dict(cores=10),
+                    'other_project': dict(instances=3)}
+
+        def fake_qugabps(context, project_ids):
+            self.calls.append('quota_usage_get_all_by_projects')
+            return {'test_project': dict(project_id='test_project',
+                                         cores=dict(in_use=4, reserved=4)),
+                    'other_project': dict(project_id='other_project')}
+
+        self.stubs.Set(db, 'quota_get_all_by_projects', fake_qgabps)
+        self.stubs.Set(db, 'quota_usage_get_all_by_projects', fake_qugabps)
+        self._stub_quota_class_get_all_by_name()
+        self._stub_quota_class_get_default()
+        result = self.driver.get_projects_quotas(
+            FakeContext('test_project', 'test_class'),
+            quota.QUOTAS._resources, ['test_project', 'other_project'],
+            quota_class='test_class')
+
+        self.assertEqual(self.calls, [
+                'quota_get_all_by_projects',
+                'quota_usage_get_all_by_projects',
+                'quota_class_get_default',
+                'quota_class_get_all_by_name',
+                ])
+        self.assertEqual(['other_project', 'test_project'], sorted(result))
+        self.assertEqual(dict(limit=10, in_use=4, reserved=4),
+                         result['test_project']['cores'])
+        self.assertEqual(dict(limit=5, in_use=0, reserved=0),
+                         result['test_project']['instances'])
+        self.assertEqual(dict(limit=3, in_use=0, reserved=0),
+                         result['other_project']['instances'])
+        self.assertEqual(dict(limit=25 * 1024, in_use=0, reserved=0),
+                         result['other_project']['ram'])
+
     def test_get_project_quotas_with_remains(self):
         self.maxDiff = None
         self._stub_get_by_project()
@@ -2206,9 +2316,10 @@ class DbQuotaDriverTestCase(test.TestCase):
     def _stub_quota_reserve(self):
         def fake_quota_reserve(context, resources, quotas, user_quotas, deltas,
                                expire, until_refresh, max_age, project_id=None,
-                               user_id=None):
+                               user_id=None, sync_usages=True):
             self.calls.append(('quota_reserve', expire, until_refresh,
                                max_age))
+            self.sync_usages = sync_usages
             return ['resv-1', 'resv-2', 'resv-3']
         self.stubs.Set(db, 'quota_reserve', fake_quota_reserve)
 
@@ -2279,6 +2390,39 @@ class DbQuotaDriverTestCase(test.TestCase):
                 ])
         self.assertEqual(result, ['resv-1', 'resv-2', 'resv-3'])
 
+    def test_reserve_refresh_in_background(self):
+        self._stub_get_project_quotas()
+        self._stub_quota_reserve()
+        self.flags(quota_usage_refresh_in_background=True)
+        self.driver.reserve(FakeContext('test_project', 'test_class'),
+                            quota.QUOTAS._resources, dict(instances=2))
+
+        self.assertFalse(self.sync_usages)
+
+    def test_consume(self):
+        self._stub_get_project_quotas()
+        self.flags(until_refresh=500, max_age=86400)
+        context = FakeContext('test_project', 'test_class')
+        with mock.patch.object(db, 'quota_consume') as mock_consume:
+            self.driver.consume(context, quota.QUOTAS._resources,
+                                dict(security_groups=1))
+
+        self.assertEqual(['get_project_quotas'], self.calls)
+        mock_consume.assert_called_once_with(
+            context, quota.QUOTAS._resources, mock.ANY, mock.ANY,
+            dict(security_groups=1), 500, 86400, project_id='test_project',
+            user_id='fake_user', sync_usages=True)
+
+    @mock.patch.object(db, 'quota_usage_reconcile', return_value=2)
+    def test_usage_reconcile(self, mock_reconcile):
+        self.flags(until_refresh=5)
+        context = FakeContext('test_project', 'test_class')
+        result = self.driver.usage_reconcile(context, quota.QUOTAS._resources)
+
+        self.assertEqual(2, result)
+        mock_reconcile.assert_called_once_with(context,
+                                               quota.QUOTAS._resources, 5)
+
     def test_reserve_until_refresh(self):
         self._stub_get_project_quotas()
         self._stub_quota_reserve()
@@ -2340,6 +2484,292 @@ class DbQuotaDriverTestCase(test.TestCase):
         self.assertEqual(calls, exemplar)
 
 
+class NestedQuotaDriverTestCase(test.TestCase):
+    def setUp(self):
+        super(NestedQuotaDriverTestCase, self).setUp()
+        self.flags(reservation_expire=86400,
+                   until_refresh=0,
+                   max_age=0)
+        self.driver = quota.NestedQuotaDriver()
+        self.context = FakeContext('child', 'test_class')
+        self.expire = timeutils.utcnow() + datetime.timedelta(seconds=60)
+
+        limits = {'child': 5, 'parent': 10, 'root': 20}
+
+        def fake_get_quotas(context, resources, keys, has_sync,
+                            project_id=None, user_id=None,
+                            project_quotas=None):
+            return {k: limits[project_id] for k in keys}
+        self.stubs.Set(self.driver, '_get_quotas', fake_get_quotas)
+        self.stubs.Set(db, 'quota_get_all_by_project',
+                       lambda context, project_id: {})
+
+    @mock.patch.object(db, 'quota_reserve', return_value=['resv-1'])
+    @mock.patch.object(project_hierarchy.HIERARCHY, 'get_ancestors',
+                       return_value=['parent', 'root'])
+    def test_reserve_checks_ancestors(self, mock_ancestors, mock_reserve):
+        result = self.driver.reserve(self.context, quota.QUOTAS._resources,
+                                     dict(instances=2), expire=self.expire)
+
+        self.assertEqual(['resv-1'], result)
+        mock_ancestors.assert_called_once_with(self.context, 'child')
+        self.assertEqual([('child', 'parent', dict(instances=5)),
+                          ('parent', 'root', dict(instances=10)),
+                          ('root', None, dict(instances=20))],
+                         mock_reserve.call_args[1]['hierarchy'])
+
+    @mock.patch.object(db, 'quota_class_get_all_by_name', return_value={})
+    @mock.patch.object(db, 'quota_class_get_default', return_value={})
+    @mock.patch.object(db, 'quota_usage_get_all_by_projects',
+                       return_value={'child': dict(project_id='child'),
+                                     'parent': dict(project_id='parent')})
+    @mock.patch.object(db, 'quota_and_allocated_get_all_by_projects',
+                       return_value=({'child': dict(instances=5),
+                                      'parent': dict(instances=10)},
+                                     {'child': dict(instances=3),
+                                      'parent': {}}))
+    def test_get_projects_quotas(self, mock_get, mock_usages,
+                                 mock_defaults, mock_class):
+        result = self.driver.get_projects_quotas(
+            self.context, quota.QUOTAS._resources, ['child', 'parent'])
+
+        self.assertEqual(dict(limit=5, in_use=0, reserved=0, allocated=3),
+                         result['child']['instances'])
+        self.assertEqual(dict(limit=10, in_use=0, reserved=0, allocated=0),
+                         result['parent']['instances'])
+        mock_get.assert_called_once_with(self.context, ['child', 'parent'])
+
+    @mock.patch.object(project_hierarchy.HIERARCHY, 'get_subtree',
+                       return_value=['child', 'sibling'])
+    @mock.patch.object(db, 'quota_reserve', side_effect=[
+        exception.QuotaSubtreeUsageMissing(project_ids=['parent']),
+        ['resv-1']])
+    @mock.patch.object(project_hierarchy.HIERARCHY, 'get_ancestors',
+                       return_value=['parent', 'root'])
+    def test_reserve_gives_missing_subtrees(self, mock_ancestors,
+                                            mock_reserve, mock_subtree):
+        result = self.driver.reserve(self.context, quota.QUOTAS._resources,
+                                     dict(instances=2), expire=self.expire)
+
+        self.assertEqual(['resv-1'], result)
+        mock_subtree.assert_called_once_with(self.context, 'parent')
+        self.assertNotIn('subtrees', mock_reserve.call_args_list[0][1])
+        self.assertEqual({'parent': ['child', 'sibling']},
+                         mock_reserve.call_args_list[1][1]['subtrees'])
+
+    @mock.patch.object(project_hierarchy.HIERARCHY, 'get_subtree',
+                       side_effect=exception.Forbidden())
+    @mock.patch.object(db, 'quota_consume', side_effect=[
+        exception.QuotaSubtreeUsageMissing(project_ids=['parent']), None])
+    @mock.patch.object(project_hierarchy.HIERARCHY, 'get_ancestors',
+                       return_value=['parent', 'root'])
+    def test_consume_without_subtrees(self, mock_ancestors, mock_consume,
+                                      mock_subtree):
+        self.assertRaises(exception.Forbidden, self.driver.consume,
+                          self.context, quota.QUOTAS._resources,
+                          dict(instances=2))
+        self.assertEqual(1, mock_consume.call_count)
+
+    @mock.patch.object(db, 'quota_reserve')
+    @mock.patch.object(db, 'quota_subtree_lineage_get', return_value=[])
+    @mock.patch.object(project_hierarchy.HIERARCHY, 'get_ancestors',
+                       side_effect=exception.Forbidden())
+    def test_reserve_without_hierarchy(self, mock_ancestors, mock_lineage,
+                                       mock_reserve):
+        self.assertRaises(exception.Forbidden, self.driver.reserve,
+                          self.context, quota.QUOTAS._resources,
+                          dict(instances=2), expire=self.expire)
+        mock_lineage.assert_called_once_with(self.context, 'child')
+        self.assertFalse(mock_reserve.called)
+
+    @mock.patch.object(db, 'quota_reserve')
+    @mock.patch.object(db, 'quota_subtree_lineage_get',
+                       return_value=[('child', 'parent'),
+                                     ('parent', 'missing')])
+    @mock.patch.object(project_hierarchy.HIERARCHY, 'get_ancestors',
+                       side_effect=exception.ProjectNotFound(
+                           project_id='child'))
+    def test_reserve_with_partial_recorded_lineage(self, mock_ancestors,
+                                                   mock_lineage,
+                                                   mock_reserve):
+        self.assertRaises(exception.ProjectNotFound, self.driver.reserve,
+                          self.context, quota.QUOTAS._resources,
+                          dict(instances=2), expire=self.expire)
+        self.assertFalse(mock_reserve.called)
+
+    @mock.patch.object(db, 'quota_reserve', return_value=['resv-1'])
+    @mock.patch.object(db, 'quota_subtree_lineage_get',
+                       return_value=[('child', 'parent'),
+                                     ('parent', 'root'),
+                                     ('root', None)])
+    @mock.patch.object(project_hierarchy.HIERARCHY, 'get_ancestors',
+                       side_effect=exception.Forbidden())
+    def test_reserve_with_recorded_lineage(self, mock_ancestors,
+                                           mock_lineage, mock_reserve):
+        result = self.driver.reserve(self.context, quota.QUOTAS._resources,
+                                     dict(instances=2), expire=self.expire)
+
+        self.assertEqual(['resv-1'], result)
+        self.assertEqual([('child', 'parent', dict(instances=5)),
+                          ('parent', 'root', dict(instances=10)),
+                          ('root', None, dict(instances=20))],
+                         mock_reserve.call_args[1]['hierarchy'])
+
+    @mock.patch.object(db, 'quota_class_get_all_by_name', return_value={})
+    @mock.patch.object(db, 'quota_class_get_default', return_value={})
+    @mock.patch.object(project_hierarchy.HIERARCHY, 'get_subtree')
+    @mock.patch.object(db, 'quota_subtree_usage_get_all_by_project')
+    def test_get_subtree_quotas(self, mock_subtree_usages, mock_subtree,
+                                mock_defaults, mock_class):
+        usages = {key: dict(in_use=0, reserved=0)
+                  for key, resource in quota.QUOTAS._resources.items()
+                  if hasattr(resource, 'sync')}
+        usages['instances'] = dict(in_use=4, reserved=1)
+        usages['project_id'] = 'parent'
+        mock_subtree_usages.return_value = usages
+        result = self.driver.get_subtree_quotas(
+            self.context, quota.QUOTAS._resources, 'parent')
+
+        self.assertEqual(dict(limit=0, in_use=4, reserved=1),
+                         result['instances'])
+        self.assertFalse(mock_subtree.called)
+
+    @mock.patch.object(db, 'quota_class_get_all_by_name', return_value={})
+    @mock.patch.object(db, 'quota_class_get_default', return_value={})
+    @mock.patch.object(db, 'quota_subtree_usage_create_missing',
+                       return_value=dict(project_id='parent',
+                                         instances=dict(in_use=4,
+                                                        reserved=1)))
+    @mock.patch.object(project_hierarchy.HIERARCHY, 'get_subtree',
+                       return_value=['child'])
+    @mock.patch.object(project_hierarchy.HIERARCHY, 'get_parent',
+                       return_value='root')
+    @mock.patch.object(db, 'quota_subtree_usage_get_all_by_project',
+                       return_value=dict(project_id='parent'))
+    def test_get_subtree_quotas_creates_missing(self, mock_subtree_usages,
+                                                mock_parent, mock_subtree,
+                                                mock_create, mock_defaults,
+                                                mock_class):
+        result = self.driver.get_subtree_quotas(
+            self.context, quota.QUOTAS._resources, 'parent')
+
+        self.assertEqual(dict(limit=0, in_use=4, reserved=1),
+                         result['instances'])
+        keys = mock_create.call_args[0][4]
+        self.assertIn('instances', keys)
+        self.assertNotIn('metadata_items', keys)
+        mock_create.assert_called_once_with(self.context, 'parent', 'root',
+                                            ['child'], keys)
+
+    @mock.patch.object(db, 'quota_subtree_usage_create_missing')
+    @mock.patch.object(project_hierarchy.HIERARCHY, 'get_parent',
+                       side_effect=exception.ProjectNotFound(
+                           project_id='parent'))
+    @mock.patch.object(db, 'quota_subtree_usage_get_all_by_project',
+                       return_value=dict(project_id='parent'))
+    def test_get_subtree_quotas_hierarchy_unavailable(self,
+                                                      mock_subtree_usages,
+                                                      mock_parent,
+                                                      mock_create):
+        self.assertRaises(exception.ProjectNotFound,
+                          self.driver.get_subtree_quotas, self.context,
+                          quota.QUOTAS._resources, 'parent')
+        self.assertFalse(mock_create.called)
+
+
+class QuotaLimitsCacheTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(QuotaLimitsCacheTestCase, self).setUp()
+        self.flags(quota_limits_cache_size=2,
+                   quota_limits_cache_ttl=60,
+                   quota_limits_generation_interval=1)
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.cache = quota.QuotaLimitsCache()
+        self.context = FakeContext('test_project', 'test_class')
+        self.generation = 0
+        self.loads = []
+        self.stubs.Set(db, 'quota_generation_get',
+                       lambda context: self.generation)
+
+    def _get(self, key):
+        def loader():
+            self.loads.append(key)
+            return {'instances': len(self.loads)}
+        return self.cache.get(self.context, key, loader)
+
+    def test_hit(self):
+        self.assertEqual({'instances': 1}, self._get('a'))
+        self.assertEqual({'instances': 1}, self._get('a'))
+        self.assertEqual(['a'], self.loads)
+        self.assertEqual(1, self.cache.hits)
+        self.assertEqual(1, self.cache.misses)
+
+    def test_returns_copy(self):
+        self._get('a')['instances'] = 10
+        self.assertEqual({'instances': 1}, self._get('a'))
+
+    def test_ttl_expiry(self):
+        self._get('a')
+        timeutils.advance_time_seconds(61)
+        self.assertEqual({'instances': 2}, self._get('a'))
+        self.assertEqual(2, self.cache.misses)
+
+    def test_generation_change_invalidates(self):
+        self._get('a')
+        self.generation = 1
+        # The generation is not read again within the interval.
+        self._get('a')
+        self.assertEqual(['a'], self.loads)
+        timeutils.advance_time_seconds(1)
+        self.assertEqual({'instances': 2}, self._get('a'))
+
+    def test_hits_do_not_read_generation(self):
+        self._get('a')
+        self.stubs.Set(db, 'quota_generation_get',
+                       lambda context: self.fail('unexpected DB read'))
+        self._get('a')
+        self.assertEqual(1, self.cache.hits)
+
+    def test_lru_eviction(self):
+        self._get('a')
+        self._get('b')
+        self._get('a')
+        self._get('c')
+        self._get('a')
+        self._get('b')
+        self.assertEqual(['a', 'b', 'c', 'b'], self.loads)
+
+    def test_zero_size_disables_cache(self):
+        self.flags(quota_limits_cache_size=0)
+        self._get('a')
+        self._get('a')
+        self.assertEqual(['a', 'a'], self.loads)
+        self.assertEqual(2, self.cache.misses)
+
+    @mock.patch.object(db, 'quota_reserve', return_value=[])
+    @mock.patch.object(db, 'quota_class_get_default', return_value={})
+    @mock.patch.object(db, 'quota_class_get_all_by_name', return_value={})
+    @mock.patch.object(db, 'quota_get_all_by_project_and_user',
+                       return_value=dict(project_id='test_project',
+                                         user_id='fake_user'))
+    @mock.patch.object(db, 'quota_get_all_by_project',
+                       return_value=dict(project_id='test_project'))
+    def test_reserve_reads_limits_once(self, mock_project, mock_user,
+                                       mock_class, mock_default,
+                                       mock_reserve):
+        self.flags(quota_limits_cache_size=10)
+        self.stubs.Set(quota, 'LIMITS_CACHE', self.cache)
+        driver = quota.DbQuotaDriver()
+        for i in range(2):
+            driver.reserve(self.context, quota.QUOTAS._resources,
+                           dict(instances=2))
+
+        self.assertEqual(1, mock_project.call_count)
+        self.assertEqual(1, mock_user.call_count)
+        self.assertEqual(2, mock_reserve.call_count)
+
+
 class FakeSession(object):
     def begin(self):
         return self
@@ -2838,6 +3268,19 @@ class NoopQuotaDriverTestCase(test.TestCase):
                                                 'test_project')
         self.assertEqual(self.expected_with_usages, result)
 
+    def test_get_projects_quotas(self):
+        result = self.driver.get_projects_quotas(None,
+                                                 quota.QUOTAS._resources,
+                                                 ['test_project', 'other'])
+        self.assertEqual({'test_project': self.expected_with_usages,
+                          'other': self.expected_with_usages}, result)
+
+    def test_get_subtree_quotas(self):
+        result = self.driver.get_subtree_quotas(None,
+                                                quota.QUOTAS._resources,
+                                                'test_project')
+        self.assertEqual(self.expected_with_usages, result)
+
     def test_get_user_quotas(self):
         result = self.driver.get_user_quotas(None,
                                              quota.QUOTAS._resources,
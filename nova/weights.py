@@ -53,6 +53,25 @@ def normalize(weight_list, minval=None, maxval=None):
     return ((i - minval) / range_ for i in weight_list)
 
 
+def normalize_array(weights, minval=None, maxval=None):
+    """Normalize an array of weights between 0 and 1.0, like normalize()."""
+
+    if maxval is None:
+        maxval = weights.max()
+
+    if minval is None:
+        minval = weights.min()
+
+    maxval = float(maxval)
+    minval = float(minval)
+
+    if minval == maxval:
+        return weights * 0.0
+
+    range_ = maxval - minval
+    return (weights - minval) / range_
+
+
 class WeighedObject(object):
     """Object with weight information."""
     def __init__(self, obj, weight):
@@ -89,6 +108,33 @@ class BaseWeigher(object):
     def _weigh_object(self, obj, weight_properties):
         """Weigh an specific object."""
 
+    def _weigh_vectorized(self, table, weight_properties):
+        """Return an array with the weight of each row of a table of
+        objects, or None if the weigher cannot work on whole tables.
+        Override this in a subclass whose handler builds tables.
+        """
+        return None
+
+    def weigh_vectorized(self, table, weight_properties):
+        """Weigh a table of objects at once.
+
+        Return None if the weigher does not support tables, in which
+        case weigh_objects() has to be used.  Otherwise the minimum and
+        maximum values are recorded as weigh_objects() does.
+        """
+        weights = self._weigh_vectorized(table, weight_properties)
+        if weights is None or not len(weights):
+            return weights
+
+        lowest = weights.min()
+        highest = weights.max()
+        if self.minval is None or lowest < self.minval:
+            self.minval = lowest
+        if self.maxval is None or highest > self.maxval:
+            self.maxval = highest
+
+        return weights
+
     def weigh_objects(self, weighed_obj_list, weight_properties):
         """Weigh multiple objects.
 
@@ -121,14 +167,43 @@ class BaseWeigher(object):
 class BaseWeightHandler(loadables.BaseLoader):
     object_class = WeighedObject
 
-    def get_weighed_objects(self, weighers, obj_list, weighing_properties):
-        """Return a sorted (descending), normalized list of WeighedObjects."""
+    def _get_table(self, objs):
+        """Return a columnar table of objs to hand to the weighers'
+        weigh_vectorized(), or None to always weigh object by object.
+        Override this in a subclass.
+        """
+        return None
+
+    def _start_step(self):
+        """Return what _end_step() needs to trace the run of a weigher, or
+        None if it is not traced.  Override this in a subclass.
+        """
+        return None
+
+    def _end_step(self, step, weigher, objs):
+        """Trace the run of a weigher started by _start_step().  Override
+        this in a subclass.
+        """
+        pass
+
+    def get_weighed_objects(self, weighers, obj_list, weighing_properties,
+                            limit=None):
+        """Return a sorted (descending), normalized list of WeighedObjects.
+
+        If limit is given, only the limit heaviest objects are returned.
+        """
 
         if not obj_list:
             return []
 
+        table = self._get_table(obj_list)
+        if table is not None:
+            return self._get_weighed_table(weighers, table,
+                                           weighing_properties, limit)
+
         weighed_objs = [self.object_class(obj, 0.0) for obj in obj_list]
         for weigher in weighers:
+            step = self._start_step()
             weights = weigher.weigh_objects(weighed_objs, weighing_properties)
 
             # Normalize the weights
@@ -139,5 +214,32 @@ class BaseWeightHandler(loadables.BaseLoader):
             for i, weight in enumerate(weights):
                 obj = weighed_objs[i]
                 obj.weight += weigher.weight_multiplier() * weight
+            if step is not None:
+                self._end_step(step, weigher, obj_list)
+
+        return sorted(weighed_objs, key=lambda x: x.weight,
+                      reverse=True)[:limit]
 
-        return sorted(weighed_objs, key=lambda x: x.weight, reverse=True)
+    def _get_weighed_table(self, weighers, table, weighing_properties, limit):
+        """Weigh a table of objects, a column at a time where the weighers
+        allow it, and only build WeighedObjects for the ones returned.
+        """
+        total = table.zeros()
+        weighed_objs = None
+        for weigher in weighers:
+            step = self._start_step()
+            weights = weigher.weigh_vectorized(table, weighing_properties)
+            if weights is None:
+                if weighed_objs is None:
+                    weighed_objs = [self.object_class(obj, 0.0)
+                                    for obj in table.objects]
+                weights = table.array(
+                    weigher.weigh_objects(weighed_objs, weighing_properties))
+
+            total += weigher.weight_multiplier() * normalize_array(
+                weights, minval=weigher.minval, maxval=weigher.maxval)
+            if step is not None:
+                self._end_step(step, weigher, table.objects)
+
+        return [self.object_class(table.objects[i], float(total[i]))
+                for i in table.order(total, limit)]
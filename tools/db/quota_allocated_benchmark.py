@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# Copyright 2015 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark for the recomputation of the quotas a project allocated to its
+children.
+
+For each fan-out, a parent project and its children are seeded with a
+limit for every quota resource, then three ways of updating the parent's
+allocated quotas are timed:
+
+    per-child:   one quota_get_all_by_project per child and one UPDATE per
+                 resource, as done before quota_allocated_update became
+                 set-based.
+    set-based:   db.quota_allocated_update.
+    incremental: db.quota_child_update changing the limit of a single
+                 child, which moves the parent's allocated quota by the
+                 change.
+
+The schema is created directly from the models in an empty database, so
+the connection URL must point at a scratch database.
+
+Run like:
+
+    ./tools/db/quota_allocated_benchmark.py --children 10,1000,10000
+
+    ./tools/db/quota_allocated_benchmark.py \\
+        --connection mysql://root@localhost/quota_bench
+"""
+
+from __future__ import print_function
+
+import argparse
+import time
+
+from oslo_config import cfg
+from oslo_db import options
+
+from nova import context
+from nova import db
+from nova.db.sqlalchemy import api as sqlalchemy_api
+from nova.db.sqlalchemy import models
+
+CONF = cfg.CONF
+
+RESOURCES = ('instances', 'cores', 'ram', 'floating_ips', 'fixed_ips',
+             'security_groups', 'security_group_rules', 'server_groups')
+
+
+def per_child_allocated_update(ctxt, project_id, child_list):
+    allocated_quota = {}
+    for child_id in child_list:
+        quota_limit = db.quota_get_all_by_project(ctxt, child_id)
+        del quota_limit['project_id']
+        for resource in quota_limit:
+            allocated_quota[resource] = (allocated_quota.get(resource, 0) +
+                                         quota_limit[resource])
+    for resource, allocated in allocated_quota.items():
+        sqlalchemy_api.model_query(ctxt, models.Quota).\
+            filter_by(project_id=project_id).\
+            filter_by(resource=resource).\
+            update({'allocated': allocated})
+
+
+def seed(ctxt, parent_id, children):
+    engine = sqlalchemy_api.get_engine()
+    rows = []
+    for project_id in [parent_id] + children:
+        for resource in RESOURCES:
+            rows.append({'project_id': project_id, 'resource': resource,
+                         'hard_limit': 10, 'allocated': 0, 'deleted': 0})
+    engine.execute(models.Quota.__table__.insert(), rows)
+
+
+def timed(func, *args):
+    start = time.time()
+    func(*args)
+    return (time.time() - start) * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--connection', default='sqlite://',
+                        help='SQLAlchemy URL of a scratch database')
+    parser.add_argument('--children', default='10,1000,10000',
+                        help='Comma separated list of fan-outs to run')
+    args = parser.parse_args()
+
+    options.set_defaults(CONF, connection=args.connection)
+    CONF([], project='nova', default_config_files=[])
+    models.BASE.metadata.create_all(sqlalchemy_api.get_engine())
+    ctxt = context.get_admin_context()
+
+    print('%10s %14s %14s %14s' % ('children', 'per-child ms',
+                                   'set-based ms', 'incremental ms'))
+    for count in [int(c) for c in args.children.split(',')]:
+        parent_id = 'parent-%d' % count
+        children = ['%s-child-%d' % (parent_id, i) for i in range(count)]
+        seed(ctxt, parent_id, children)
+
+        legacy = timed(per_child_allocated_update, ctxt, parent_id, children)
+        set_based = timed(db.quota_allocated_update, ctxt, parent_id,
+                          children)
+        incremental = timed(db.quota_child_update, ctxt, parent_id,
+                            children[0], 'instances', 11)
+        print('%10d %14.1f %14.1f %14.1f' % (count, legacy, set_based,
+                                             incremental))
+
+
+if __name__ == '__main__':
+    main()
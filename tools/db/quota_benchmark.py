@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# Copyright 2015 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Microbenchmark of the quota engine with DbQuotaDriver and NestedQuotaDriver.
+
+A synthetic project tree of --depth levels below a root project, each
+project having --fanout children, is seeded with generous limits.  For
+each driver, --greenthreads greenthreads then repeatedly pick a leaf
+project and run, through a QuotaEngine:
+
+    reserve:   QuotaEngine.reserve of one instance.
+    commit:    QuotaEngine.commit of every other reservation.
+    rollback:  QuotaEngine.rollback of the others.
+    settable:  QuotaEngine.get_settable_quotas of the leaf.
+
+For every operation the number of calls, the throughput over the run,
+the p50 and p99 latencies and the number of SQL statements per call
+are reported.
+
+The schema is created directly from the models in an empty database, so
+the connection URL must point at a scratch database.  A temporary SQLite
+file is used by default.
+
+Run like:
+
+    ./tools/db/quota_benchmark.py --depth 3 --fanout 5 --greenthreads 20
+
+    ./tools/db/quota_benchmark.py \\
+        --connection mysql://root@localhost/quota_bench
+"""
+
+from __future__ import print_function
+
+import eventlet
+eventlet.monkey_patch(os=False)
+
+import argparse
+import collections
+import os
+import tempfile
+import threading
+import time
+
+from oslo_config import cfg
+from oslo_db import options
+from oslo_serialization import jsonutils
+from sqlalchemy import event
+
+from nova import context
+from nova.db.sqlalchemy import api as sqlalchemy_api
+from nova.db.sqlalchemy import models
+from nova import project_hierarchy
+from nova import quota
+
+CONF = cfg.CONF
+
+DRIVERS = ('DbQuotaDriver', 'NestedQuotaDriver')
+OPERATIONS = ('reserve', 'commit', 'rollback', 'settable')
+USER_ID = 'bench-user'
+
+_local = threading.local()
+
+
+def build_tree(depth, fanout):
+    """Return a dict mapping each project to its parent, and the leaves."""
+    tree = {'root': None}
+    level = ['root']
+    for i in range(depth):
+        children = []
+        for parent in level:
+            for j in range(fanout):
+                child = '%s.%d' % (parent, j)
+                tree[child] = parent
+                children.append(child)
+        level = children
+    return tree, level
+
+
+def seed(tree, leaves):
+    engine = sqlalchemy_api.get_engine()
+    rows = []
+    for project_id in tree:
+        for resource in quota.QUOTAS.resources:
+            rows.append({'project_id': project_id, 'resource': resource,
+                         'hard_limit': 1000000, 'allocated': 0,
+                         'deleted': 0})
+    engine.execute(models.Quota.__table__.insert(), rows)
+    # NOTE: NestedQuotaDriver gives a user no quota unless one was set
+    # for it in the project.
+    rows = []
+    for project_id in leaves:
+        for resource in quota.QUOTAS.resources:
+            rows.append({'project_id': project_id, 'user_id': USER_ID,
+                         'resource': resource, 'hard_limit': 1000000,
+                         'deleted': 0})
+    engine.execute(models.ProjectUserQuota.__table__.insert(), rows)
+
+
+def count_statements(conn, cursor, statement, parameters, context,
+                     executemany):
+    _local.statements = getattr(_local, 'statements', 0) + 1
+
+
+class Stats(object):
+    def __init__(self):
+        self.latencies = collections.defaultdict(list)
+        self.statements = collections.defaultdict(int)
+
+    def timed(self, operation, func, *args, **kwargs):
+        _local.statements = 0
+        start = time.time()
+        result = func(*args, **kwargs)
+        self.latencies[operation].append((time.time() - start) * 1000.0)
+        self.statements[operation] += _local.statements
+        return result
+
+
+def worker(engine, leaves, tree, iterations, offset, stats):
+    ctxt = context.get_admin_context()
+    for i in range(iterations):
+        project_id = leaves[(offset + i) % len(leaves)]
+        reservations = stats.timed('reserve', engine.reserve, ctxt,
+                                   project_id=project_id, user_id=USER_ID,
+                                   instances=1, cores=1, ram=512)
+        if i % 2:
+            stats.timed('commit', engine.commit, ctxt, reservations,
+                        project_id=project_id, user_id=USER_ID)
+        else:
+            stats.timed('rollback', engine.rollback, ctxt, reservations,
+                        project_id=project_id, user_id=USER_ID)
+        stats.timed('settable', engine.get_settable_quotas, ctxt,
+                    project_id, parent_id=tree[project_id])
+
+
+def run(driver, leaves, tree, args):
+    engine = quota.QuotaEngine(quota_driver_class=driver)
+    engine.register_resources(quota.QUOTAS._resources.values())
+    stats = Stats()
+    pool = eventlet.GreenPool(args.greenthreads)
+    start = time.time()
+    for offset in range(args.greenthreads):
+        pool.spawn_n(worker, engine, leaves, tree, args.iterations, offset,
+                     stats)
+    pool.waitall()
+    return stats, time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--connection',
+                        help='SQLAlchemy URL of a scratch database, a '
+                             'temporary SQLite file by default')
+    parser.add_argument('--depth', type=int, default=2,
+                        help='Number of levels below the root project')
+    parser.add_argument('--fanout', type=int, default=4,
+                        help='Number of children of every project')
+    parser.add_argument('--greenthreads', type=int, default=10,
+                        help='Number of concurrent greenthreads')
+    parser.add_argument('--iterations', type=int, default=20,
+                        help='Number of reservations made by each '
+                             'greenthread')
+    args = parser.parse_args()
+
+    tree, leaves = build_tree(args.depth, args.fanout)
+    fd, hierarchy_file = tempfile.mkstemp(suffix='.json')
+    with os.fdopen(fd, 'w') as f:
+        jsonutils.dump(tree, f)
+    connection = args.connection
+    if connection is None:
+        fd, path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        connection = 'sqlite:///%s' % path
+
+    options.set_defaults(CONF, connection=connection)
+    CONF([], project='nova', default_config_files=[])
+    CONF.set_override('project_hierarchy_driver',
+                      'nova.project_hierarchy.FileHierarchyDriver')
+    CONF.set_override('project_hierarchy_file', hierarchy_file)
+    db_engine = sqlalchemy_api.get_engine()
+    models.BASE.metadata.create_all(db_engine)
+    event.listen(db_engine, 'before_cursor_execute', count_statements)
+    seed(tree, leaves)
+
+    print('%d projects, %d leaves, %d greenthreads' %
+          (len(tree), len(leaves), args.greenthreads))
+    print('%-18s %-9s %7s %9s %9s %9s %9s' % ('driver', 'operation',
+                                              'calls', 'ops/s', 'p50 ms',
+                                              'p99 ms', 'SQL/call'))
+    for name in DRIVERS:
+        project_hierarchy.HIERARCHY.invalidate()
+        quota.LIMITS_CACHE.invalidate()
+        stats, elapsed = run(getattr(quota, name)(), leaves, tree, args)
+        for operation in OPERATIONS:
+            latencies = sorted(stats.latencies[operation])
+            if not latencies:
+                continue
+            calls = len(latencies)
+            print('%-18s %-9s %7d %9.1f %9.2f %9.2f %9.1f' %
+                  (name, operation, calls, calls / elapsed,
+                   latencies[calls // 2], latencies[int(calls * 0.99)],
+                   float(stats.statements[operation]) / calls))
+
+    os.unlink(hierarchy_file)
+    if args.connection is None:
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
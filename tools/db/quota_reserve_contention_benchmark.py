@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# Copyright 2015 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark of concurrent quota reservations against a single project.
+
+A project is seeded with a number of instances, then parallel reservers
+each make a series of reservations for one instance in that project and
+roll them back.  Two modes are timed:
+
+    in-reserve: usages are refreshed by quota_reserve itself, counting
+                the instances of the project while its usages are
+                locked, every --until-refresh reservations.
+    background: quota_reserve only marks the usages which need a
+                refresh, and db.quota_usage_reconcile refreshes them
+                afterwards, outside of any reservation.
+
+The schema is created directly from the models in an empty database, so
+the connection URL must point at a scratch database.  SQLite serializes
+all writers, so the numbers are only meaningful against MySQL or
+PostgreSQL.
+
+Run like:
+
+    ./tools/db/quota_reserve_contention_benchmark.py \\
+        --connection mysql://root@localhost/quota_bench --reservers 50
+"""
+
+from __future__ import print_function
+
+import argparse
+import datetime
+import os
+import tempfile
+import threading
+import time
+
+from oslo_config import cfg
+from oslo_db import exception as db_exc
+from oslo_db import options
+from oslo_utils import timeutils
+from sqlalchemy import exc as sqla_exc
+
+from nova import context
+from nova import db
+from nova.db.sqlalchemy import api as sqlalchemy_api
+from nova.db.sqlalchemy import models
+from nova import quota
+
+CONF = cfg.CONF
+
+PROJECT_ID = 'bench-project'
+USER_ID = 'bench-user'
+RESOURCES = ('instances', 'cores', 'ram')
+
+
+def seed(instances):
+    engine = sqlalchemy_api.get_engine()
+    rows = [{'uuid': 'bench-instance-%d' % i, 'project_id': PROJECT_ID,
+             'user_id': USER_ID, 'vcpus': 1, 'memory_mb': 512, 'deleted': 0}
+            for i in range(instances)]
+    engine.execute(models.Instance.__table__.insert(), rows)
+
+
+def reserve(ctxt, until_refresh, sync_usages):
+    resources = {name: quota.QUOTAS._resources[name] for name in RESOURCES}
+    limits = {name: -1 for name in RESOURCES}
+    expire = timeutils.utcnow() + datetime.timedelta(hours=1)
+    return db.quota_reserve(ctxt, resources, limits, limits,
+                            dict(instances=1, cores=1, ram=512), expire,
+                            until_refresh, 0, project_id=PROJECT_ID,
+                            user_id=USER_ID, sync_usages=sync_usages)
+
+
+def retried(conflicts, func, *args):
+    while True:
+        try:
+            return func(*args)
+        except (db_exc.DBError, sqla_exc.OperationalError):
+            # NOTE: Lock timeouts, and every concurrent writer on SQLite,
+            # end up here; the call is retried.
+            conflicts.append(1)
+
+
+def reserver(ctxt, count, until_refresh, sync_usages, latencies, conflicts):
+    for i in range(count):
+        start = time.time()
+        reservations = retried(conflicts, reserve, ctxt, until_refresh,
+                               sync_usages)
+        latencies.append((time.time() - start) * 1000.0)
+        retried(conflicts, db.reservation_rollback, ctxt, reservations,
+                PROJECT_ID, USER_ID)
+
+
+def run(ctxt, args, sync_usages):
+    latencies = []
+    conflicts = []
+    threads = [threading.Thread(target=reserver,
+                                args=(ctxt, args.reservations,
+                                      args.until_refresh, sync_usages,
+                                      latencies, conflicts))
+               for i in range(args.reservers)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+
+    reconcile = 0.0
+    if not sync_usages:
+        start = time.time()
+        db.quota_usage_reconcile(ctxt, quota.QUOTAS._resources,
+                                 args.until_refresh)
+        reconcile = (time.time() - start) * 1000.0
+
+    latencies.sort()
+    return (len(latencies) / elapsed,
+            latencies[len(latencies) // 2],
+            latencies[int(len(latencies) * 0.99)],
+            len(conflicts), reconcile)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--connection',
+                        help='SQLAlchemy URL of a scratch database, a '
+                             'temporary SQLite file by default')
+    parser.add_argument('--reservers', type=int, default=50,
+                        help='Number of parallel reservers')
+    parser.add_argument('--reservations', type=int, default=20,
+                        help='Number of reservations made by each reserver')
+    parser.add_argument('--instances', type=int, default=20000,
+                        help='Number of instances seeded in the project')
+    parser.add_argument('--until-refresh', type=int, default=1,
+                        help='Number of reservations between two usage '
+                             'refreshes')
+    args = parser.parse_args()
+
+    connection = args.connection
+    if connection is None:
+        fd, path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        connection = 'sqlite:///%s' % path
+    options.set_defaults(CONF, connection=connection)
+    CONF([], project='nova', default_config_files=[])
+    models.BASE.metadata.create_all(sqlalchemy_api.get_engine())
+    ctxt = context.get_admin_context()
+    seed(args.instances)
+    # Create the usage rows up front, so the reservers do not race to
+    # insert them.
+    db.reservation_rollback(ctxt, reserve(ctxt, args.until_refresh, True),
+                            PROJECT_ID, USER_ID)
+
+    print('%12s %10s %10s %10s %10s %13s' % ('mode', 'reserve/s', 'p50 ms',
+                                             'p99 ms', 'conflicts',
+                                             'reconcile ms'))
+    for mode, sync_usages in (('in-reserve', True), ('background', False)):
+        print('%12s %10.1f %10.1f %10.1f %10d %13.1f' %
+              ((mode,) + run(ctxt, args, sync_usages)))
+
+    if args.connection is None:
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
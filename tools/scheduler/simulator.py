@@ -0,0 +1,489 @@
+#!/usr/bin/env python
+# Copyright 2015 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Offline simulator and benchmark of the scheduler drivers.
+
+A synthetic fleet of --hosts compute nodes is built in memory, of mixed
+sizes, a --numa fraction of them with two NUMA cells and a --pci
+fraction with PCI devices, spread over --aggregates aggregates in --azs
+availability zones.  A trace of boot, resize and delete events is then
+replayed through the scheduler driver, FilterScheduler by default, with
+the filters and weighers of the configuration, along with the
+NUMATopologyFilter and PciPassthroughFilter the requests of NUMA
+topologies and PCI devices need unless --filters is given.  No
+database or message queue is used: the driver is given the fleet's
+HostStates, and deleted or resized instances give their resources back
+to their host at once.
+
+The trace is generated from --events, --mix and --seed, or read from a
+--trace file of JSON lines as written by --dump-trace:
+
+    {"op": "boot", "id": 1, "flavor": "m1.small", "count": 1,
+     "numa": false, "pci": false, "az": null}
+    {"op": "resize", "id": 1, "flavor": "m1.large"}
+    {"op": "delete", "id": 1}
+
+Reported are the decisions per second, the latency percentiles of
+select_destinations, the memory per host state, measured as the growth
+of the maximum resident set size while building the fleet, and the
+packing efficiency: the share of the RAM and vCPUs of the hosts in use
+which their instances take, over 100% when the allocation ratios let
+them overcommit.
+
+Run like:
+
+    ./tools/scheduler/simulator.py --hosts 10000 --events 20000
+
+    ./tools/scheduler/simulator.py --hosts 1000 \\
+        --driver nova.scheduler.caching_scheduler.CachingScheduler \\
+        --filters RamFilter,CoreFilter,NUMATopologyFilter \\
+        -- --config-file /etc/nova/nova.conf
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import random
+import resource
+import sys
+import time
+
+from oslo_config import cfg
+from oslo_serialization import jsonutils
+from oslo_utils import importutils
+from oslo_utils import timeutils
+
+from nova import config
+from nova import context
+from nova import exception
+from nova import objects
+from nova.virt import hardware
+
+CONF = cfg.CONF
+CONF.import_opt('allow_resize_to_same_host', 'nova.compute.api')
+CONF.import_opt('scheduler_host_manager', 'nova.scheduler.driver')
+CONF.import_opt('scheduler_default_filters', 'nova.scheduler.host_manager')
+CONF.import_opt('scheduler_weight_classes', 'nova.scheduler.host_manager')
+CONF.import_opt('service_down_time', 'nova.service')
+
+# vCPUs, RAM in MB and disk in GB of the compute node shapes.
+HOST_SHAPES = ((16, 65536, 500), (32, 131072, 1000), (64, 262144, 2000))
+# vCPUs, RAM in MB and root disk in GB of the flavors.
+FLAVORS = collections.OrderedDict([
+    ('m1.small', (1, 2048, 20)),
+    ('m1.medium', (2, 4096, 40)),
+    ('m1.large', (4, 8192, 80)),
+    ('m1.xlarge', (8, 16384, 160)),
+])
+PCI_VENDOR_ID = '8086'
+PCI_PRODUCT_ID = '1520'
+PCI_DEVICES_PER_HOST = 8
+
+
+def build_fleet(args, rng):
+    """Return the HostStates of a synthetic fleet."""
+    aggregates = [objects.Aggregate(id=i + 1, name='agg%d' % i, hosts=[],
+                                    metadata={'availability_zone':
+                                              'az%d' % (i % args.azs)})
+                  for i in range(args.aggregates)]
+    aggregate_lists = [[]] + [[aggregate] for aggregate in aggregates]
+    host_state_cls = importutils.import_object(
+        CONF.scheduler_host_manager).host_state_cls
+    now = timeutils.utcnow()
+    fleet = []
+    for i in range(args.hosts):
+        vcpus, memory_mb, local_gb = rng.choice(HOST_SHAPES)
+        numa_topology = None
+        if rng.random() < args.numa:
+            half = vcpus // 2
+            numa_topology = objects.NUMATopology(cells=[
+                objects.NUMACell(id=cell,
+                                 cpuset=set(range(cell * half,
+                                                  (cell + 1) * half)),
+                                 memory=memory_mb // 2, cpu_usage=0,
+                                 memory_usage=0, mempages=[], siblings=[],
+                                 pinned_cpus=set())
+                for cell in range(2)])._to_json()
+        pools = []
+        if rng.random() < args.pci:
+            pools.append(objects.PciDevicePool(
+                vendor_id=PCI_VENDOR_ID, product_id=PCI_PRODUCT_ID,
+                tags={}, count=PCI_DEVICES_PER_HOST))
+        compute = objects.ComputeNode(
+            id=i + 1, host='host%d' % i, hypervisor_hostname='node%d' % i,
+            vcpus=vcpus, vcpus_used=0, memory_mb=memory_mb,
+            free_ram_mb=memory_mb, memory_mb_used=0, local_gb=local_gb,
+            local_gb_used=0, free_disk_gb=local_gb,
+            disk_available_least=local_gb, host_ip='127.0.0.1',
+            hypervisor_type='fake', hypervisor_version=0, cpu_info='',
+            numa_topology=numa_topology, supported_hv_specs=[],
+            pci_device_pools=objects.PciDevicePoolList(objects=pools),
+            stats={}, metrics='[]', updated_at=None, running_vms=0,
+            current_workload=0)
+        host_state = host_state_cls(compute.host, compute.hypervisor_hostname,
+                                    compute=compute)
+        host_state.service = {'host': compute.host, 'disabled': False,
+                              'created_at': now, 'updated_at': now}
+        # The hosts in the same aggregates share the same list, as with
+        # HostManager._update_aggregates().
+        host_state.aggregates = aggregate_lists[0]
+        if aggregates:
+            aggregate = aggregates[i % len(aggregates)]
+            aggregate.hosts.append(compute.host)
+            host_state.aggregates = aggregate_lists[i % len(aggregates) + 1]
+        fleet.append(host_state)
+    return fleet
+
+
+def generate_trace(args, rng):
+    """Yield the events of a synthetic trace."""
+    boots, resizes, deletes = [float(weight) for weight in
+                               args.mix.split(',')]
+    total = boots + resizes + deletes
+    live = []
+    next_id = 1
+    for i in range(args.events):
+        choice = rng.random() * total
+        if choice < boots or not live:
+            count = rng.randint(1, args.max_count)
+            az = None
+            if args.azs > 1 and rng.random() < args.az_requests:
+                az = 'az%d' % rng.randrange(args.azs)
+            yield {'op': 'boot', 'id': next_id,
+                   'flavor': rng.choice(FLAVORS.keys()), 'count': count,
+                   'numa': rng.random() < args.numa_requests,
+                   'pci': rng.random() < args.pci_requests, 'az': az}
+            live.extend(range(next_id, next_id + count))
+            next_id += count
+        elif choice < boots + resizes:
+            yield {'op': 'resize', 'id': rng.choice(live),
+                   'flavor': rng.choice(FLAVORS.keys())}
+        else:
+            instance_id = live.pop(rng.randrange(len(live)))
+            yield {'op': 'delete', 'id': instance_id}
+
+
+def read_trace(path):
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield jsonutils.loads(line)
+
+
+class Instance(object):
+    """The resources an instance took from its host."""
+
+    def __init__(self, event, host_state, properties, pci_consumed):
+        self.event = event
+        self.host_state = host_state
+        self.properties = properties
+        self.pci_consumed = pci_consumed
+
+
+class Simulator(object):
+    def __init__(self, driver, fleet, build_window):
+        self.driver = driver
+        self.fleet = fleet
+        self.context = context.get_admin_context()
+        self.instances = {}
+        # Hosts of the instances being built: their I/O operation ends
+        # once build_window more instances were placed.
+        self.building = collections.deque()
+        self.build_window = build_window
+        self.latencies = []
+        self.decisions = 0
+        self.failures = collections.Counter()
+
+    def _request(self, event, flavor_name, count):
+        vcpus, memory_mb, root_gb = FLAVORS[flavor_name]
+        extra_specs = {}
+        if event.get('numa'):
+            extra_specs['hw:numa_nodes'] = '1'
+        flavor = objects.Flavor(name=flavor_name, flavorid=flavor_name,
+                                vcpus=vcpus, memory_mb=memory_mb,
+                                root_gb=root_gb, ephemeral_gb=0, swap=0,
+                                extra_specs=extra_specs)
+        pci_requests = None
+        if event.get('pci'):
+            pci_requests = objects.InstancePCIRequests(requests=[
+                objects.InstancePCIRequest(
+                    count=1, alias_name='nic',
+                    spec=[{'vendor_id': PCI_VENDOR_ID,
+                           'product_id': PCI_PRODUCT_ID}])])
+        properties = {'uuid': str(event['id']),
+                      'project_id': 'simulator',
+                      'os_type': 'linux',
+                      'vcpus': vcpus,
+                      'memory_mb': memory_mb,
+                      'root_gb': root_gb,
+                      'ephemeral_gb': 0,
+                      'availability_zone': event.get('az'),
+                      'numa_topology': hardware.numa_get_constraints(
+                          flavor, {}),
+                      'pci_requests': pci_requests}
+        request_spec = {'instance_type': flavor,
+                        'instance_properties': properties,
+                        'image': {},
+                        'num_instances': count}
+        filter_properties = {'pci_requests': pci_requests}
+        return request_spec, filter_properties
+
+    def _schedule(self, op, request_spec, filter_properties):
+        start = time.time()
+        try:
+            dests = self.driver.select_destinations(
+                self.context, request_spec, filter_properties)
+        except exception.NoValidHost:
+            self.failures[op] += 1
+            return []
+        finally:
+            self.latencies.append(time.time() - start)
+        self.decisions += len(dests)
+        return dests
+
+    def _pci_counts(self, host_state):
+        if not host_state.pci_stats:
+            return {}
+        return {(pool['vendor_id'], pool['product_id']): pool['count']
+                for pool in host_state.pci_stats.pools}
+
+    def _place(self, event, dest, properties, pci_before):
+        host_state = self.hosts[dest['host'], dest['nodename']]
+        pci_after = self._pci_counts(host_state)
+        pci_consumed = {key: count - pci_after.get(key, 0)
+                        for key, count in pci_before[host_state].items()
+                        if count > pci_after.get(key, 0)}
+        pci_before[host_state] = pci_after
+        self.building.append(host_state)
+        if len(self.building) > self.build_window:
+            self.building.popleft().num_io_ops -= 1
+        return Instance(event, host_state, dict(properties), pci_consumed)
+
+    def _release(self, instance):
+        host_state = instance.host_state
+        properties = instance.properties
+        host_state.free_ram_mb += properties['memory_mb']
+        host_state.free_disk_mb += (properties['root_gb'] +
+                                    properties['ephemeral_gb']) * 1024
+        host_state.vcpus_used -= properties['vcpus']
+        host_state.num_instances -= 1
+        if properties['numa_topology']:
+            host_state.numa_topology = (
+                hardware.get_host_numa_usage_from_instance(
+                    host_state, properties, free=True))
+        for (vendor_id, product_id), count in instance.pci_consumed.items():
+            for pool in host_state.pci_stats.pools:
+                if (pool['vendor_id'], pool['product_id']) == (vendor_id,
+                                                               product_id):
+                    pool['count'] += count
+                    break
+            else:
+                host_state.pci_stats.pools.append(
+                    {'vendor_id': vendor_id, 'product_id': product_id,
+                     'count': count})
+        if instance.pci_consumed:
+            host_state.pci_stats.pools_changed()
+
+    def replay(self, events):
+        self.hosts = {(host_state.host, host_state.nodename): host_state
+                      for host_state in self.fleet}
+        # The PCI devices left on each host, to tell which ones a new
+        # instance took.
+        pci_before = {host_state: self._pci_counts(host_state)
+                      for host_state in self.fleet}
+        for event in events:
+            op = event['op']
+            if op == 'boot':
+                request_spec, filter_properties = self._request(
+                    event, event['flavor'], event.get('count', 1))
+                properties = request_spec['instance_properties']
+                dests = self._schedule(op, request_spec, filter_properties)
+                for i, dest in enumerate(dests):
+                    self.instances[event['id'] + i] = self._place(
+                        event, dest, properties, pci_before)
+            elif op == 'resize':
+                instance = self.instances.get(event['id'])
+                if instance is None:
+                    continue
+                request_spec, filter_properties = self._request(
+                    dict(instance.event, id=event['id']), event['flavor'], 1)
+                if not CONF.allow_resize_to_same_host:
+                    filter_properties['ignore_hosts'] = [
+                        instance.host_state.host]
+                properties = request_spec['instance_properties']
+                dests = self._schedule(op, request_spec, filter_properties)
+                if dests:
+                    self._release(instance)
+                    pci_before[instance.host_state] = self._pci_counts(
+                        instance.host_state)
+                    self.instances[event['id']] = self._place(
+                        instance.event, dests[0], properties, pci_before)
+            elif op == 'delete':
+                instance = self.instances.pop(event['id'], None)
+                if instance is not None:
+                    self._release(instance)
+                    pci_before[instance.host_state] = self._pci_counts(
+                        instance.host_state)
+
+
+def packing(fleet):
+    """Return the share of the RAM and vCPUs of the hosts with instances
+    taken by the instances, and the number of those hosts.
+    """
+    used = [host_state for host_state in fleet if host_state.num_instances]
+    if not used:
+        return 0.0, 0.0, 0
+    ram_total = sum(host_state.total_usable_ram_mb for host_state in used)
+    ram_free = sum(host_state.free_ram_mb for host_state in used)
+    vcpus_total = sum(host_state.vcpus_total for host_state in used)
+    vcpus_used = sum(host_state.vcpus_used for host_state in used)
+    return (float(ram_total - ram_free) / ram_total,
+            float(vcpus_used) / vcpus_total, len(used))
+
+
+def percentile(values, fraction):
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0],
+                                     usage='%(prog)s [options] '
+                                           '[-- nova options]')
+    parser.add_argument('--hosts', type=int, default=1000,
+                        help='Number of compute nodes')
+    parser.add_argument('--numa', type=float, default=0.5,
+                        help='Fraction of the hosts with two NUMA cells')
+    parser.add_argument('--pci', type=float, default=0.1,
+                        help='Fraction of the hosts with PCI devices')
+    parser.add_argument('--aggregates', type=int, default=10,
+                        help='Number of host aggregates')
+    parser.add_argument('--azs', type=int, default=2,
+                        help='Number of availability zones the aggregates '
+                             'are spread over')
+    parser.add_argument('--events', type=int, default=5000,
+                        help='Number of events of the generated trace')
+    parser.add_argument('--mix', default='70,10,20',
+                        help='Relative weights of the boots, resizes and '
+                             'deletes of the generated trace')
+    parser.add_argument('--max-count', type=int, default=1,
+                        help='Maximum number of instances of a boot')
+    parser.add_argument('--numa-requests', type=float, default=0.1,
+                        help='Fraction of the boots asking for a NUMA '
+                             'topology')
+    parser.add_argument('--pci-requests', type=float, default=0.05,
+                        help='Fraction of the boots asking for a PCI device')
+    parser.add_argument('--az-requests', type=float, default=0.2,
+                        help='Fraction of the boots asking for an '
+                             'availability zone')
+    parser.add_argument('--build-window', type=int, default=100,
+                        help='Number of instances placed while one builds, '
+                             'for the I/O operations of the hosts')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the fleet and trace generators')
+    parser.add_argument('--trace',
+                        help='File of JSON events to replay instead of a '
+                             'generated trace')
+    parser.add_argument('--dump-trace',
+                        help='File to write the generated trace to')
+    parser.add_argument('--driver',
+                        default='nova.scheduler.filter_scheduler.'
+                                'FilterScheduler',
+                        help='Scheduler driver class')
+    parser.add_argument('--filters',
+                        help='Comma separated filter class names, '
+                             'scheduler_default_filters with '
+                             'NUMATopologyFilter and PciPassthroughFilter '
+                             'by default')
+    parser.add_argument('--weighers',
+                        help='Comma separated weigher classes, '
+                             'scheduler_weight_classes by default')
+    args, nova_args = parser.parse_known_args()
+    if nova_args[:1] == ['--']:
+        nova_args = nova_args[1:]
+
+    objects.register_all()
+    config.parse_args([sys.argv[0]] + nova_args, default_config_files=[])
+    # NOTE: The fleet never reports, its services must not look down.
+    CONF.set_override('service_down_time', sys.maxint)
+    if args.filters:
+        filters = args.filters.split(',')
+    else:
+        filters = list(CONF.scheduler_default_filters)
+        for name in ('NUMATopologyFilter', 'PciPassthroughFilter'):
+            if name not in filters:
+                filters.append(name)
+    CONF.set_override('scheduler_default_filters', filters)
+    if args.weighers:
+        CONF.set_override('scheduler_weight_classes',
+                          args.weighers.split(','))
+
+    rng = random.Random(args.seed)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    fleet = build_fleet(args, rng)
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    if args.trace:
+        events = list(read_trace(args.trace))
+    else:
+        events = list(generate_trace(args, rng))
+        if args.dump_trace:
+            with open(args.dump_trace, 'w') as f:
+                for event in events:
+                    f.write(jsonutils.dumps(event) + '\n')
+
+    driver = importutils.import_object(args.driver)
+    for host_state in fleet:
+        driver.host_manager._index_pci_pools(host_state)
+    driver.host_manager.get_all_host_states = lambda context: iter(fleet)
+    simulator = Simulator(driver, fleet, args.build_window)
+    start = time.time()
+    simulator.replay(events)
+    elapsed = time.time() - start
+
+    latencies = sorted(simulator.latencies)
+    ops = collections.Counter(event['op'] for event in events)
+    print('%d hosts, %d events (%s), driver %s' %
+          (len(fleet), len(events),
+           ', '.join('%d %ss' % (ops[op], op)
+                     for op in ('boot', 'resize', 'delete')),
+           args.driver.rsplit('.', 1)[-1]))
+    print('filters: %s' % ', '.join(CONF.scheduler_default_filters))
+    print('weighers: %s' % ', '.join(CONF.scheduler_weight_classes))
+    print('memory per host state: %.1f KB (max RSS growth)' %
+          (float(rss_after - rss_before) / max(len(fleet), 1)))
+    scheduling = sum(latencies)
+    if latencies:
+        print('%d instances placed in %d requests, %.1f decisions/s over '
+              '%.2fs of scheduling (%.2fs in total)' %
+              (simulator.decisions, len(latencies),
+               simulator.decisions / scheduling if scheduling else 0.0,
+               scheduling, elapsed))
+        print('latency ms: p50 %.2f  p90 %.2f  p99 %.2f  max %.2f' %
+              tuple(1000.0 * value for value in
+                    (percentile(latencies, 0.5),
+                     percentile(latencies, 0.9),
+                     percentile(latencies, 0.99), latencies[-1])))
+    print('no valid host: %d boots, %d resizes' %
+          (simulator.failures['boot'], simulator.failures['resize']))
+    ram, vcpus, used = packing(fleet)
+    print('packing: %d hosts in use, %.1f%% of their RAM and %.1f%% of '
+          'their vCPUs taken, %d instances' %
+          (used, ram * 100.0, vcpus * 100.0, len(simulator.instances)))
+
+
+if __name__ == '__main__':
+    main()